@@ -0,0 +1,188 @@
+"""
+Benchmark de los perfiles de base de datos (DB_PERFIL)
+Reproduce el patrón de escritura de /moodmap/analizar y /feedback/enviar:
+una sesión por petición, dos o una filas con columnas JSON y un commit
+
+Ejecutar: python benchmark_db.py --peticiones 2000 --hilos 8 [--buffer]
+Por defecto usa bases SQLite temporales; con --url se puede apuntar a una
+base de datos PostgreSQL desechable (se insertan filas de prueba).
+"""
+
+import argparse
+import os
+import random
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from sqlalchemy.orm import sessionmaker
+
+from database import Base, crear_engine, JSON_RAPIDO
+from models.db_models import MoodMapDB, FeedbackDB, HistoricoInteraccionDB, columnas_tipadas_interaccion
+from utils.buffer_escritura import BufferEscritura
+
+PERFILES = ("basico", "auto")
+
+
+def _peticion_moodmap(SessionBench, usuario_id: int, buffer: BufferEscritura = None):
+    """Escrituras de POST /moodmap/analizar"""
+    felicidad, estres, motivacion = random.random(), random.random(), random.random()
+    datos = {"felicidad": felicidad, "estres": estres, "motivacion": motivacion}
+    embedding = [random.random() for _ in range(4)]
+    microaccion = random.choice(["calmarse", "animarse", "activarse"])
+    if buffer is not None:
+        futuros = buffer.encolar_filas([
+            (MoodMapDB, dict(
+                usuario_id=usuario_id,
+                felicidad=felicidad, estres=estres, motivacion=motivacion
+            )),
+            (HistoricoInteraccionDB, dict(
+                usuario_id=usuario_id, tipo="moodmap",
+                datos=datos,
+                embedding_latente=embedding,
+                cluster_id=random.randint(0, 4),
+                microaccion_sugerida=microaccion,
+                **columnas_tipadas_interaccion(datos, embedding, microaccion)
+            ))
+        ])
+        if buffer.debe_esperar():
+            for futuro in futuros:
+                futuro.result()
+        return
+
+    db = SessionBench()
+    try:
+        db.add(MoodMapDB(
+            usuario_id=usuario_id,
+            felicidad=felicidad,
+            estres=estres,
+            motivacion=motivacion
+        ))
+        db.add(HistoricoInteraccionDB(
+            usuario_id=usuario_id,
+            tipo="moodmap",
+            datos=datos,
+            embedding_latente=embedding,
+            cluster_id=random.randint(0, 4),
+            microaccion_sugerida=microaccion,
+            **columnas_tipadas_interaccion(datos, embedding, microaccion)
+        ))
+        db.commit()
+    finally:
+        db.close()
+
+
+def _peticion_feedback(SessionBench, usuario_id: int):
+    """Escrituras de POST /feedback/enviar"""
+    db = SessionBench()
+    try:
+        db.add(FeedbackDB(
+            usuario_id=usuario_id,
+            microaccion=random.choice(["calmarse", "animarse", "activarse"]),
+            efectividad=random.randint(1, 5),
+            comodidad=random.randint(1, 5),
+            energia=random.randint(1, 5),
+            moodmap_previo={"felicidad": random.random(), "estres": random.random(), "motivacion": random.random()},
+            moodmap_posterior={"felicidad": random.random(), "estres": random.random(), "motivacion": random.random()}
+        ))
+        db.commit()
+    finally:
+        db.close()
+
+
+def medir_perfil(url: str, perfil: str, peticiones: int, hilos: int, durabilidad: str = None) -> dict:
+    """
+    Ejecuta el patrón de escritura con un perfil y mide el rendimiento
+
+    Args:
+        url: URL de la base de datos
+        perfil: Perfil de crear_engine ("basico" o "auto")
+        peticiones: Número total de peticiones simuladas
+        hilos: Peticiones concurrentes (como workers del threadpool de FastAPI)
+        durabilidad: Si se indica, los MoodMaps pasan por el buffer de
+                     escritura con esa durabilidad ("memoria" o "commit")
+
+    Returns:
+        Diccionario con peticiones/s y latencias en ms
+    """
+    engine_bench = crear_engine(url, perfil)
+    Base.metadata.create_all(bind=engine_bench)
+    SessionBench = sessionmaker(autocommit=False, autoflush=False, bind=engine_bench)
+
+    buffer = None
+    if durabilidad:
+        buffer = BufferEscritura(
+            engine_bench, modelos=(MoodMapDB, HistoricoInteraccionDB), durabilidad=durabilidad
+        )
+        buffer.iniciar()
+
+    latencias = []
+    errores = 0
+    bloqueo = threading.Lock()
+
+    def peticion(i: int):
+        nonlocal errores
+        inicio = time.perf_counter()
+        try:
+            if i % 2 == 0:
+                _peticion_moodmap(SessionBench, i % 100 + 1, buffer)
+            else:
+                _peticion_feedback(SessionBench, i % 100 + 1)
+        except Exception:
+            with bloqueo:
+                errores += 1
+            return
+        with bloqueo:
+            latencias.append((time.perf_counter() - inicio) * 1000)
+
+    inicio = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=hilos) as ejecutor:
+        list(ejecutor.map(peticion, range(peticiones)))
+    if buffer is not None:
+        buffer.detener()
+    duracion = time.perf_counter() - inicio
+
+    engine_bench.dispose()
+    latencias.sort()
+
+    return {
+        "perfil": f"{perfil}+buffer({durabilidad})" if durabilidad else perfil,
+        "peticiones_por_segundo": len(latencias) / duracion if duracion else 0.0,
+        "latencia_p50_ms": latencias[len(latencias) // 2] if latencias else 0.0,
+        "latencia_p95_ms": latencias[int(len(latencias) * 0.95)] if latencias else 0.0,
+        "errores": errores
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de perfiles de base de datos")
+    parser.add_argument("--peticiones", type=int, default=2000)
+    parser.add_argument("--hilos", type=int, default=8)
+    parser.add_argument("--url", default=None, help="Base de datos desechable (por defecto SQLite temporal)")
+    parser.add_argument("--buffer", action="store_true", help="Medir también el buffer de escritura")
+    args = parser.parse_args()
+
+    print(f"🏁 Benchmark de escritura: {args.peticiones} peticiones, {args.hilos} hilos")
+    print(f"   Serializador JSON: {'orjson' if JSON_RAPIDO else 'json (stdlib)'}")
+    print("-" * 75)
+
+    with tempfile.TemporaryDirectory() as directorio:
+        escenarios = [(perfil, None) for perfil in PERFILES]
+        if args.buffer:
+            escenarios += [("auto", "memoria"), ("auto", "commit")]
+
+        for perfil, durabilidad in escenarios:
+            nombre = f"bench_{perfil}_{durabilidad or 'directo'}.db"
+            url = args.url or f"sqlite:///{os.path.join(directorio, nombre)}"
+            resultado = medir_perfil(url, perfil, args.peticiones, args.hilos, durabilidad)
+            print(
+                f"  {resultado['perfil']:<22} {resultado['peticiones_por_segundo']:>9.0f} pet/s   "
+                f"p50 {resultado['latencia_p50_ms']:.2f} ms   "
+                f"p95 {resultado['latencia_p95_ms']:.2f} ms   "
+                f"errores {resultado['errores']}"
+            )
+
+
+if __name__ == "__main__":
+    main()
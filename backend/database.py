@@ -5,11 +5,21 @@ Soporta bases de datos separadas para producción y tests
 """
 
 from sqlalchemy import create_engine, event
+from sqlalchemy.engine import make_url
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker, Session
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
+from sqlalchemy.pool import QueuePool, AsyncAdaptedQueuePool
+from contextvars import ContextVar
+from typing import Dict, List, Optional
+import logging
 import os
+import threading
+import time
 from datetime import datetime, timedelta
 
+logger = logging.getLogger(__name__)
+
 # Detectar si estamos en modo test
 TEST_MODE = os.getenv("TEST_MODE", "false").lower() == "true"
 
@@ -21,18 +31,455 @@ if TEST_MODE:
         "sqlite:///./luz_test.db"
     )
     print("⚠️  MODO TEST: Usando base de datos de test (luz_test.db)")
+    DATABASE_READ_URL = None
 else:
     # Base de datos de producción (SQLite por defecto, o PostgreSQL)
     DATABASE_URL = os.getenv(
         "DATABASE_URL",
         "sqlite:///./luz_bienestar.db"
     )
+    # Réplica de solo lectura para investigación y estadísticas (opcional)
+    DATABASE_READ_URL = os.getenv("DATABASE_READ_URL") or None
+
+# Perfil del engine: "auto" ajusta SQLite/PostgreSQL según la URL,
+# "basico" deja la configuración por defecto de SQLAlchemy
+DB_PERFIL = os.getenv("DB_PERFIL", "auto").lower()
+
+# Serializador JSON rápido para columnas JSON (orjson es opcional)
+try:
+    import orjson
+
+    def _json_serializer(valor) -> str:
+        return orjson.dumps(
+            valor, option=orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+        ).decode()
+
+    _json_deserializer = orjson.loads
+    JSON_RAPIDO = True
+except ImportError:
+    import json
+
+    _json_serializer = json.dumps
+    _json_deserializer = json.loads
+    JSON_RAPIDO = False
+
+
+# ============================================================
+# INSTRUMENTACIÓN SQL
+# ============================================================
+# Cuenta consultas y tiempo de BD por petición (contextvar que abre el
+# middleware de main.py), registra las consultas lentas con los parámetros
+# redactados y mide la espera al pedir conexión al pool (aparte del tiempo
+# de abrir conexiones nuevas). Desactivada por defecto (SQL_METRICAS).
+
+SQL_METRICAS = os.getenv("SQL_METRICAS", "false").lower() == "true"
+SQL_LENTA_MS = float(os.getenv("SQL_LENTA_MS", "200"))
+SQL_AVISO_CONSULTAS = int(os.getenv("SQL_AVISO_CONSULTAS", "50"))
+MAX_CONSULTAS_LENTAS = 10
+
+_metricas_peticion: ContextVar[Optional[Dict]] = ContextVar("metricas_sql_peticion", default=None)
+_bloqueo_metricas = threading.Lock()
+_metricas_globales = {
+    "consultas": 0,
+    "tiempo_ms": 0.0,
+    "consultas_lentas": 0,
+    "esperas_pool": 0,
+    "espera_pool_ms": 0.0,
+    "espera_pool_max_ms": 0.0,
+    "conexiones_abiertas": 0,
+    "conexion_ms": 0.0,
+    "conexion_max_ms": 0.0,
+}
+_mas_lentas = []  # [(ms, sentencia)] de mayor a menor
+_metricas_endpoints: Dict[str, Dict] = {}
+
+
+def _redactar(parametros):
+    """Sustituye los valores de los parámetros por su tipo (nunca datos de usuario en logs)"""
+    if isinstance(parametros, dict):
+        return {clave: type(valor).__name__ for clave, valor in parametros.items()}
+    if isinstance(parametros, (list, tuple)):
+        if parametros and isinstance(parametros[0], (dict, list, tuple)):
+            return f"[{len(parametros)} filas de {_redactar(parametros[0])}]"
+        return [type(valor).__name__ for valor in parametros]
+    return type(parametros).__name__
+
+
+def _antes_de_consulta(conn, cursor, statement, parameters, context, executemany):
+    # En el contexto de ejecución, no en la conexión: si la sentencia falla,
+    # after_cursor_execute no llega y el contexto se descarta con ella
+    if context is not None:
+        context._inicio_consulta = time.perf_counter()
+
+
+def _despues_de_consulta(conn, cursor, statement, parameters, context, executemany):
+    inicio = getattr(context, "_inicio_consulta", None)
+    if inicio is None:
+        return
+    duracion_ms = (time.perf_counter() - inicio) * 1000
+    sentencia = " ".join(statement.split())[:300]
+
+    peticion = _metricas_peticion.get()
+    if peticion is not None:
+        peticion["consultas"] += 1
+        peticion["tiempo_ms"] += duracion_ms
+        if duracion_ms > peticion["mas_lenta_ms"]:
+            peticion["mas_lenta_ms"] = duracion_ms
+            peticion["mas_lenta"] = sentencia
+
+    lenta = duracion_ms >= SQL_LENTA_MS
+    with _bloqueo_metricas:
+        _metricas_globales["consultas"] += 1
+        _metricas_globales["tiempo_ms"] += duracion_ms
+        if lenta:
+            _metricas_globales["consultas_lentas"] += 1
+            _mas_lentas.append((duracion_ms, sentencia))
+            _mas_lentas.sort(key=lambda consulta: consulta[0], reverse=True)
+            del _mas_lentas[MAX_CONSULTAS_LENTAS:]
+
+    if lenta:
+        logger.warning(
+            f"🐢 Consulta lenta ({duracion_ms:.1f} ms): {sentencia} | parámetros: {_redactar(parameters)}"
+        )
+
+
+def _instrumentar(engine):
+    """Registra los eventos de medición en un engine síncrono"""
+    event.listen(engine, "before_cursor_execute", _antes_de_consulta)
+    event.listen(engine, "after_cursor_execute", _despues_de_consulta)
+
+
+def _registrar_espera_pool(espera_ms: float):
+    peticion = _metricas_peticion.get()
+    if peticion is not None:
+        peticion["espera_pool_ms"] += espera_ms
+    with _bloqueo_metricas:
+        _metricas_globales["esperas_pool"] += 1
+        _metricas_globales["espera_pool_ms"] += espera_ms
+        _metricas_globales["espera_pool_max_ms"] = max(_metricas_globales["espera_pool_max_ms"], espera_ms)
+
+
+def _registrar_conexion(conexion_ms: float):
+    peticion = _metricas_peticion.get()
+    if peticion is not None:
+        peticion["conexion_ms"] += conexion_ms
+    with _bloqueo_metricas:
+        _metricas_globales["conexiones_abiertas"] += 1
+        _metricas_globales["conexion_ms"] += conexion_ms
+        _metricas_globales["conexion_max_ms"] = max(_metricas_globales["conexion_max_ms"], conexion_ms)
+
+
+# Tiempo de abrir conexiones dentro del checkout en curso (por hilo y por tarea:
+# los checkouts del pool asíncrono se intercalan en el mismo hilo)
+_apertura_en_checkout: ContextVar[Optional[List[float]]] = ContextVar("apertura_en_checkout", default=None)
+
+
+class _EsperaMedida:
+    """
+    Mide cuánto espera un checkout a que el pool entregue una conexión.
+    Abrir una conexión nueva se mide aparte (conexion_ms) y no cuenta como espera.
+    """
+
+    def _create_connection(self):
+        inicio = time.perf_counter()
+        try:
+            return super()._create_connection()
+        finally:
+            conexion_ms = (time.perf_counter() - inicio) * 1000
+            apertura = _apertura_en_checkout.get()
+            if apertura is not None:
+                apertura[0] += conexion_ms
+            _registrar_conexion(conexion_ms)
+
+    def _do_get(self):
+        apertura = [0.0]
+        token = _apertura_en_checkout.set(apertura)
+        inicio = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            total_ms = (time.perf_counter() - inicio) * 1000
+            _apertura_en_checkout.reset(token)
+            _registrar_espera_pool(max(total_ms - apertura[0], 0.0))
+
+
+class PoolMedido(_EsperaMedida, QueuePool):
+    """QueuePool con medición de la espera de checkout"""
+
+
+class PoolMedidoAsync(_EsperaMedida, AsyncAdaptedQueuePool):
+    """AsyncAdaptedQueuePool con medición de la espera de checkout"""
+
+
+def iniciar_metricas_peticion() -> Dict:
+    """
+    Abre el contador de consultas de la petición actual (middleware)
+
+    Returns:
+        Diccionario de métricas que los eventos irán rellenando
+    """
+    metricas = {
+        "consultas": 0, "tiempo_ms": 0.0, "espera_pool_ms": 0.0, "conexion_ms": 0.0,
+        "mas_lenta_ms": 0.0, "mas_lenta": None
+    }
+    metricas["_token"] = _metricas_peticion.set(metricas)
+    return metricas
+
+
+def finalizar_metricas_peticion(metricas: Dict, endpoint: str):
+    """
+    Cierra las métricas de la petición y las acumula por endpoint
+
+    Args:
+        metricas: Diccionario devuelto por iniciar_metricas_peticion
+        endpoint: Método y ruta (plantilla) del endpoint
+    """
+    _metricas_peticion.reset(metricas.pop("_token"))
+
+    if metricas["consultas"] >= SQL_AVISO_CONSULTAS:
+        logger.warning(f"⚠️ {endpoint}: {metricas['consultas']} consultas en una petición (¿N+1?)")
+
+    with _bloqueo_metricas:
+        acumulado = _metricas_endpoints.setdefault(endpoint, {
+            "peticiones": 0, "consultas": 0, "tiempo_ms": 0.0,
+            "max_consultas": 0, "mas_lenta_ms": 0.0, "mas_lenta": None
+        })
+        acumulado["peticiones"] += 1
+        acumulado["consultas"] += metricas["consultas"]
+        acumulado["tiempo_ms"] += metricas["tiempo_ms"]
+        acumulado["max_consultas"] = max(acumulado["max_consultas"], metricas["consultas"])
+        if metricas["mas_lenta_ms"] > acumulado["mas_lenta_ms"]:
+            acumulado["mas_lenta_ms"] = metricas["mas_lenta_ms"]
+            acumulado["mas_lenta"] = metricas["mas_lenta"]
+
+
+def obtener_metricas_sql() -> Dict:
+    """
+    Métricas SQL acumuladas desde el arranque
+
+    Returns:
+        Totales, consultas más lentas, métricas por endpoint y estado de los pools
+    """
+    with _bloqueo_metricas:
+        endpoints = {
+            nombre: {
+                **datos,
+                "tiempo_ms": round(datos["tiempo_ms"], 2),
+                "mas_lenta_ms": round(datos["mas_lenta_ms"], 2),
+                "consultas_por_peticion": round(datos["consultas"] / datos["peticiones"], 2),
+                "tiempo_medio_ms": round(datos["tiempo_ms"] / datos["peticiones"], 2),
+            }
+            for nombre, datos in _metricas_endpoints.items()
+        }
+        return {
+            "activas": SQL_METRICAS,
+            "umbral_lenta_ms": SQL_LENTA_MS,
+            "totales": {
+                clave: round(valor, 2) if isinstance(valor, float) else valor
+                for clave, valor in _metricas_globales.items()
+            },
+            "mas_lentas": [{"ms": round(ms, 2), "sentencia": sentencia} for ms, sentencia in _mas_lentas],
+            "endpoints": dict(sorted(endpoints.items(), key=lambda e: e[1]["tiempo_ms"], reverse=True)),
+            "pools": {
+                "escritura": engine.pool.status(),
+                "escritura_async": async_engine.pool.status(),
+                "lectura": engine_lectura.pool.status(),
+                "lectura_async": async_engine_lectura.pool.status(),
+            }
+        }
+
+
+def _configurar_sqlite(engine, solo_lectura: bool = False):
+    """
+    PRAGMAs de rendimiento aplicados a cada conexión SQLite nueva
+
+    - WAL: los lectores no bloquean al escritor y cada commit es un append
+    - synchronous=NORMAL: en WAL solo se pierde el último commit ante un
+      corte de luz, nunca se corrompe la base de datos
+    - mmap_size / cache_size: lecturas desde memoria en lugar de read()
+    - busy_timeout: espera al bloqueo en vez de fallar con "database is locked"
+    - temp_store=MEMORY: ordenaciones e índices temporales en memoria
+    - query_only (lectores): cualquier escritura falla en lugar de bloquear
+    """
+    cache_mb = int(os.getenv("SQLITE_CACHE_MB", "64"))
+    mmap_mb = int(os.getenv("SQLITE_MMAP_MB", "256"))
+    busy_timeout_ms = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+
+    @event.listens_for(engine, "connect")
+    def _pragmas_sqlite(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        if solo_lectura:
+            cursor.execute("PRAGMA query_only=ON")
+        else:
+            cursor.execute("PRAGMA journal_mode=WAL")
+            cursor.execute("PRAGMA synchronous=NORMAL")
+        cursor.execute(f"PRAGMA mmap_size={mmap_mb * 1024 * 1024}")
+        # Valor negativo = tamaño en KiB
+        cursor.execute(f"PRAGMA cache_size=-{cache_mb * 1024}")
+        cursor.execute(f"PRAGMA busy_timeout={busy_timeout_ms}")
+        cursor.execute("PRAGMA temp_store=MEMORY")
+        cursor.close()
+
+
+def _opciones_engine(url: str, perfil: str, asincrono: bool = False, solo_lectura: bool = False) -> dict:
+    """
+    Argumentos de create_engine según dialecto y perfil
+
+    Args:
+        url: URL de la base de datos
+        perfil: "auto" o "basico"
+        asincrono: True para create_async_engine (asyncpg recibe los
+                   parámetros de sesión como server_settings)
+        solo_lectura: Transacciones de solo lectura (pool de lectores)
+
+    Returns:
+        Diccionario de argumentos para create_engine
+    """
+    es_sqlite = url.startswith("sqlite")
+    opciones = {
+        "connect_args": {"check_same_thread": False} if es_sqlite else {},
+        "echo": False  # Cambiar a True para debug SQL
+    }
+
+    # Pool con medición de espera (solo donde SQLAlchemy usaría un QueuePool)
+    if SQL_METRICAS:
+        url_parseada = make_url(url)
+        clase_pool = url_parseada.get_dialect().get_pool_class(url_parseada)
+        if clase_pool is QueuePool:
+            opciones["poolclass"] = PoolMedido
+        elif clase_pool is AsyncAdaptedQueuePool:
+            opciones["poolclass"] = PoolMedidoAsync
+
+    if perfil == "basico":
+        return opciones
+
+    opciones["json_serializer"] = _json_serializer
+    opciones["json_deserializer"] = _json_deserializer
+
+    if url.startswith("postgresql"):
+        statement_timeout_ms = int(os.getenv("DB_STATEMENT_TIMEOUT_MS", "30000"))
+        opciones.update(
+            pool_size=int(os.getenv("DB_POOL_SIZE", "10")),
+            max_overflow=int(os.getenv("DB_MAX_OVERFLOW", "20")),
+            pool_recycle=int(os.getenv("DB_POOL_RECYCLE", "1800")),
+            pool_timeout=int(os.getenv("DB_POOL_TIMEOUT", "30")),
+            pool_pre_ping=True
+        )
+        parametros = {"statement_timeout": str(statement_timeout_ms)}
+        if solo_lectura:
+            parametros["default_transaction_read_only"] = "on"
+
+        if asincrono:
+            opciones["connect_args"] = {
+                "server_settings": {**parametros, "application_name": "luz_backend"}
+            }
+        else:
+            opciones["connect_args"] = {
+                "options": " ".join(f"-c {clave}={valor}" for clave, valor in parametros.items()),
+                "application_name": "luz_backend"
+            }
+
+    return opciones
+
+
+def crear_engine(url: str, perfil: str = None, solo_lectura: bool = False):
+    """
+    Crea un engine de SQLAlchemy con el perfil de rendimiento indicado
+
+    Args:
+        url: URL de la base de datos
+        perfil: "auto" (ajustes por dialecto) o "basico". Si es None se usa DB_PERFIL.
+        solo_lectura: Engine para el pool de lectores
+
+    Returns:
+        Engine configurado
+    """
+    perfil = (perfil or DB_PERFIL).lower()
+    if perfil not in ("auto", "basico"):
+        raise ValueError(f"Perfil de base de datos desconocido: {perfil}. Opciones: auto, basico")
+
+    nuevo_engine = create_engine(url, **_opciones_engine(url, perfil, solo_lectura=solo_lectura))
+
+    if perfil == "auto" and url.startswith("sqlite"):
+        _configurar_sqlite(nuevo_engine, solo_lectura)
+    if SQL_METRICAS:
+        _instrumentar(nuevo_engine)
+
+    return nuevo_engine
+
+
+def url_asincrona(url: str) -> str:
+    """
+    Traduce una URL síncrona a su driver asyncio
+
+    sqlite → sqlite+aiosqlite, postgresql/postgresql+psycopg2 → postgresql+asyncpg
+    """
+    if url.startswith("sqlite:"):
+        return "sqlite+aiosqlite:" + url[len("sqlite:"):]
+    for prefijo in ("postgresql+psycopg2:", "postgresql:"):
+        if url.startswith(prefijo):
+            return "postgresql+asyncpg:" + url[len(prefijo):]
+    return url
+
+
+def crear_engine_async(url: str, perfil: str = None, solo_lectura: bool = False):
+    """
+    Crea un engine asyncio con el mismo perfil de rendimiento que crear_engine
+
+    Args:
+        url: URL síncrona o asíncrona de la base de datos
+        perfil: "auto" o "basico". Si es None se usa DB_PERFIL.
+        solo_lectura: Engine para el pool de lectores
+
+    Returns:
+        AsyncEngine configurado
+    """
+    perfil = (perfil or DB_PERFIL).lower()
+    url = url_asincrona(url)
+
+    nuevo_engine = create_async_engine(
+        url, **_opciones_engine(url, perfil, asincrono=True, solo_lectura=solo_lectura)
+    )
+
+    if perfil == "auto" and url.startswith("sqlite"):
+        _configurar_sqlite(nuevo_engine.sync_engine, solo_lectura)
+    if SQL_METRICAS:
+        _instrumentar(nuevo_engine.sync_engine)
+
+    return nuevo_engine
+
+
+def url_lectura(url: str) -> str:
+    """
+    URL del pool de lectores
+
+    DATABASE_READ_URL si está definida (réplica); para un archivo SQLite,
+    el mismo archivo abierto en modo solo lectura (mode=ro); en otro caso
+    la misma base de datos con un pool propio y transacciones read-only.
+    """
+    if DATABASE_READ_URL:
+        return DATABASE_READ_URL
+    if url.startswith("sqlite:///") and ":memory:" not in url and "mode=ro" not in url:
+        return f"sqlite:///file:{url[len('sqlite:///'):]}?mode=ro&uri=true"
+    return url
+
 
-# Crear engine de SQLAlchemy
-engine = create_engine(
-    DATABASE_URL,
-    connect_args={"check_same_thread": False} if "sqlite" in DATABASE_URL else {},
-    echo=False  # Cambiar a True para debug SQL
+# Crear engine de SQLAlchemy (escrituras)
+engine = crear_engine(DATABASE_URL)
+
+# Engine asyncio para endpoints que no deben bloquear el event loop
+async_engine = crear_engine_async(DATABASE_URL)
+AsyncSessionLocal = async_sessionmaker(
+    async_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False
+)
+
+# Pool de lectores: exportaciones y estadísticas no compiten con las escrituras
+DATABASE_READ_URL_EFECTIVA = url_lectura(DATABASE_URL)
+engine_lectura = crear_engine(DATABASE_READ_URL_EFECTIVA, solo_lectura=True)
+SessionLectura = sessionmaker(autocommit=False, autoflush=False, bind=engine_lectura)
+async_engine_lectura = crear_engine_async(DATABASE_READ_URL_EFECTIVA, solo_lectura=True)
+AsyncSessionLectura = async_sessionmaker(
+    async_engine_lectura, class_=AsyncSession, autoflush=False, expire_on_commit=False
 )
 
 # Crear SessionLocal para transacciones
@@ -44,7 +491,7 @@ Base = declarative_base()
 
 def get_db():
     """
-    Dependency para obtener sesión de base de datos
+    Dependency para obtener sesión de base de datos (escritura)
     Se cierra automáticamente después de cada request
     """
     db = SessionLocal()
@@ -54,6 +501,33 @@ def get_db():
         db.close()
 
 
+def get_db_lectura():
+    """
+    Dependency de solo lectura (réplica o pool de lectores)
+    Para endpoints de investigación y estadísticas
+    """
+    db = SessionLectura()
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+async def get_async_db():
+    """
+    Dependency asíncrona: sesión de AsyncSessionLocal por request
+    Las consultas se esperan con await y no bloquean el event loop
+    """
+    async with AsyncSessionLocal() as db:
+        yield db
+
+
+async def get_async_db_lectura():
+    """Dependency asíncrona de solo lectura (réplica o pool de lectores)"""
+    async with AsyncSessionLectura() as db:
+        yield db
+
+
 def crear_tablas():
     """
     Crea todas las tablas definidas en los modelos
@@ -62,6 +536,10 @@ def crear_tablas():
     Base.metadata.create_all(bind=engine)
     print("✓ Tablas de base de datos creadas correctamente")
 
+    # Índices y cambios de esquema sobre tablas ya existentes
+    from utils.migraciones import aplicar_migraciones
+    aplicar_migraciones(engine)
+
 
 def limpiar_datos_antiguos(db: Session, dias: int = 90):
     """
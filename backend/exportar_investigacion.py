@@ -0,0 +1,47 @@
+"""
+Exporta las tablas de investigación a Parquet o Arrow IPC
+Las filas se leen por lotes del cursor y cada lote es un row group:
+sirve para archivos de cualquier tamaño (requiere pyarrow)
+
+Ejecutar: python exportar_investigacion.py --tabla emocional --formato parquet --salida emocional.parquet
+Cargar:   pandas.read_parquet("emocional.parquet") / pyarrow.feather.read_table("emocional.arrow")
+"""
+
+import argparse
+import sys
+import time
+
+from utils.exportacion import consulta_alma_board, consulta_emocional, consulta_resumenes, LOTE_EXPORTACION
+from utils.exportacion_arrow import ARROW_DISPONIBLE, FORMATOS_COLUMNARES, escribir_columnar
+
+TABLAS = ("emocional", "alma_board", "resumenes")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Exportación columnar del archivo de investigación")
+    parser.add_argument("--tabla", choices=TABLAS, required=True)
+    parser.add_argument("--formato", choices=tuple(FORMATOS_COLUMNARES), default="parquet")
+    parser.add_argument("--salida", default=None, help="Fichero de salida (por defecto <tabla>.<formato>)")
+    parser.add_argument("--usuario", type=int, default=None, help="Solo este usuario")
+    parser.add_argument("--lote", type=int, default=LOTE_EXPORTACION, help="Filas por row group")
+    args = parser.parse_args()
+
+    if not ARROW_DISPONIBLE:
+        print("❌ pyarrow no está instalado: pip install pyarrow")
+        sys.exit(1)
+
+    if args.tabla == "emocional":
+        consulta = consulta_emocional(usuario_id=args.usuario)
+    elif args.tabla == "alma_board":
+        consulta = consulta_alma_board(usuario_id=args.usuario)
+    else:
+        consulta = consulta_resumenes(usuario_id=args.usuario)
+
+    salida = args.salida or f"{args.tabla}.{args.formato}"
+    inicio = time.perf_counter()
+    filas = escribir_columnar(consulta, salida, args.formato, filas_por_lote=args.lote)
+    print(f"✓ {filas} filas de {args.tabla} exportadas a {salida} ({time.perf_counter() - inicio:.1f} s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -3,15 +3,21 @@ Servidor principal FastAPI - Luz App de Bienestar
 Detección automática de ML: usa TensorFlow si está disponible, sino mocks inteligentes
 """
 
-from fastapi import FastAPI, Depends, HTTPException, BackgroundTasks
+from fastapi import FastAPI, Depends, HTTPException, BackgroundTasks, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select, text
 from contextlib import asynccontextmanager
 from typing import Optional
 import uvicorn
+import asyncio
 from datetime import datetime
 from apscheduler.schedulers.background import BackgroundScheduler
 from apscheduler.triggers.cron import CronTrigger
+from apscheduler.triggers.interval import IntervalTrigger
+import os
 import logging
 
 # Configurar logging
@@ -19,13 +25,18 @@ logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 # Importar configuración de base de datos
-from database import get_db, crear_tablas
+from database import (
+    get_db, get_async_db, get_db_lectura, get_async_db_lectura,
+    crear_tablas, async_engine, async_engine_lectura, SQL_METRICAS,
+    iniciar_metricas_peticion, finalizar_metricas_peticion, obtener_metricas_sql
+)
 
 # Importar modelos
 from models.usuario import MoodMap, Feedback, AlmaBoard, Destello
 from models.db_models import (
     UsuarioDB, MoodMapDB, FeedbackDB, HistoricoInteraccionDB,
-    EmocionLiberadaDB, GratitudDB, DestelloDB
+    EmocionLiberadaDB, GratitudDB, DestelloDB, ContadoresUsuarioDB,
+    columnas_tipadas_interaccion
 )
 
 # DETECCIÓN INTELIGENTE DE SERVICIOS ML
@@ -44,8 +55,13 @@ except ImportError as e:
 from services.ml_service import ml_service
 
 # Importar utilidades
-from utils.db_utils import limpiar_por_antigüedad, optimizar_base_datos, obtener_estadisticas_db
+from utils.db_utils import (
+    limpiar_por_antigüedad, optimizar_base_datos,
+    actualizar_instantanea_estadisticas, obtener_instantanea_estadisticas
+)
 from utils.limpieza_periodica import ejecutar_limpieza_periodica, obtener_estimacion_espacio_liberado
+from utils.buffer_escritura import crear_buffer_escritura, BufferLleno
+from utils.contadores import reconciliar_contadores
 from utils.test_users import (
     crear_usuario_test, eliminar_usuario_test, 
     listar_usuarios_test
@@ -62,12 +78,76 @@ def tarea_limpieza_mensual():
         db = next(get_db())
         resultado = ejecutar_limpieza_periodica(db)
         logger.info(f"✓ Limpieza mensual completada: {sum(resultado.values())} registros eliminados")
+        tarea_reconciliar_contadores()
     except Exception as e:
         logger.error(f"❌ Error en limpieza mensual: {e}")
     finally:
         db.close()
 
 
+def tarea_instantanea_estadisticas():
+    """Refresca en memoria las estadísticas de BD que sirve /salud"""
+    db = next(get_db_lectura())
+    try:
+        actualizar_instantanea_estadisticas(db)
+    except Exception as e:
+        logger.error(f"❌ Error actualizando estadísticas de BD: {e}")
+    finally:
+        db.close()
+
+
+def tarea_reconciliar_contadores():
+    """Corrige la desviación de contadores_usuario (borrados masivos, particiones)"""
+    try:
+        resultado = reconciliar_contadores()
+        logger.info(f"✓ Contadores reconciliados: {resultado['filas_corregidas']} filas corregidas")
+    except Exception as e:
+        logger.error(f"❌ Error reconciliando contadores: {e}")
+
+
+def tarea_particiones_mensual():
+    """Rota/crea las particiones mensuales (DB_PARTICIONES=true)"""
+    try:
+        from utils.particiones import mantener_particiones
+        logger.info("🗓️ TAREA PROGRAMADA: Mantenimiento de particiones")
+        resultado = mantener_particiones()
+        logger.info(f"✓ Particiones al día: {sum(len(p) for p in resultado.values())} creadas o rotadas")
+    except Exception as e:
+        logger.error(f"❌ Error en mantenimiento de particiones: {e}")
+
+
+def tarea_sellar_segmentos():
+    """Sella en segmentos columnares los meses antiguos del archivo (ARCHIVO_SEGMENTOS=true)"""
+    try:
+        from utils.segmentos_archivo import sellar_segmentos
+        logger.info("📦 TAREA PROGRAMADA: Sellado de segmentos de archivo")
+        resultado = sellar_segmentos()
+        logger.info(f"✓ Segmentos sellados: {sum(len(s) for s in resultado.values())}")
+    except Exception as e:
+        logger.error(f"❌ Error sellando segmentos de archivo: {e}")
+
+
+def lanzar_trabajo_archivo(trabajo_id: int):
+    """Ejecuta un trabajo de archivado en un hilo del scheduler"""
+    from utils.trabajo_archivo import ejecutar_trabajo
+    scheduler.add_job(
+        ejecutar_trabajo,
+        args=[trabajo_id],
+        id=f'archivo_{trabajo_id}',
+        name=f'Trabajo de archivado {trabajo_id}',
+        replace_existing=True
+    )
+
+
+def tarea_reanudar_archivo():
+    """Retoma los trabajos de archivado interrumpidos (proceso caído)"""
+    try:
+        from utils.trabajo_archivo import reanudar_trabajos
+        reanudar_trabajos()
+    except Exception as e:
+        logger.error(f"❌ Error reanudando trabajos de archivado: {e}")
+
+
 # Lifecycle events
 @asynccontextmanager
 async def lifespan(app: FastAPI):
@@ -82,6 +162,42 @@ async def lifespan(app: FastAPI):
     crear_tablas()
     print("✓ Tablas de base de datos creadas correctamente")
     
+    # Sembrar la Q-Table publicada por el replay offline (si existe) solo en
+    # un almacén vacío: con RL_ALMACEN=memoria/bd el resto de workers ya aprendió
+    if ML_SERVICES_AVAILABLE:
+        from services.rl_replay import cargar_q_table_publicada
+        db = next(get_db())
+        try:
+            q_table = cargar_q_table_publicada(db)
+            if q_table:
+                rl_service.inicializar_q_table(q_table)
+        finally:
+            db.close()
+    
+    # Particionado mensual de historico_interacciones y feedbacks
+    from utils.particiones import PARTICIONES_ACTIVAS
+    if PARTICIONES_ACTIVAS:
+        tarea_particiones_mensual()
+        scheduler.add_job(
+            tarea_particiones_mensual,
+            trigger=CronTrigger(day=1, hour=0, minute=5),  # Al empezar cada mes
+            id='particiones_mensual',
+            name='Rotación/creación de particiones mensuales',
+            replace_existing=True
+        )
+    
+    # Segmentos columnares de los meses antiguos del archivo
+    from utils.segmentos_archivo import SEGMENTOS_ACTIVOS
+    if SEGMENTOS_ACTIVOS:
+        scheduler.add_job(
+            tarea_sellar_segmentos,
+            trigger=CronTrigger(day=1, hour=3, minute=30),  # Tras la limpieza mensual
+            id='segmentos_archivo',
+            name='Sellado mensual de segmentos de archivo',
+            replace_existing=True,
+            max_instances=1
+        )
+    
     # Iniciar scheduler de limpieza periódica
     scheduler.add_job(
         tarea_limpieza_mensual,
@@ -90,9 +206,37 @@ async def lifespan(app: FastAPI):
         name='Limpieza mensual de datos menos útiles',
         replace_existing=True
     )
+    scheduler.add_job(
+        tarea_instantanea_estadisticas,
+        trigger=IntervalTrigger(minutes=int(os.getenv("SALUD_INTERVALO_MIN", "5"))),
+        next_run_time=datetime.now(),  # Primera instantánea al arrancar, sin bloquear el inicio
+        id='estadisticas_bd',
+        name='Instantánea de estadísticas de BD para /salud',
+        replace_existing=True
+    )
+    scheduler.add_job(
+        tarea_reconciliar_contadores,
+        trigger=CronTrigger(hour=4, minute=30),  # Cada día a las 4:30 AM
+        id='contadores_diario',
+        name='Reconciliación de contadores por usuario',
+        replace_existing=True
+    )
+    scheduler.add_job(
+        tarea_reanudar_archivo,
+        trigger=IntervalTrigger(seconds=int(os.getenv("ARCHIVO_LATIDO_S", "120"))),
+        next_run_time=datetime.now(),  # Al arrancar: retoma lo que dejó a medias el proceso anterior
+        id='reanudar_archivo',
+        name='Reanudación de trabajos de archivado interrumpidos',
+        replace_existing=True,
+        max_instances=1
+    )
     
     scheduler.start()
     print("✓ Scheduler iniciado")
+    
+    # Buffer de escritura agrupada (WRITE_BUFFER=true)
+    if buffer_escritura is not None:
+        buffer_escritura.iniciar()
     print("✓ Servidor listo para recibir conexiones")
     print("📡 API: http://localhost:8000")
     print("📖 Docs: http://localhost:8000/docs")
@@ -103,6 +247,11 @@ async def lifespan(app: FastAPI):
     print("\n🔄 Cerrando servidor...")
     scheduler.shutdown()
     print("✓ Scheduler detenido")
+    if buffer_escritura is not None:
+        buffer_escritura.detener()
+    await async_engine.dispose()
+    await async_engine_lectura.dispose()
+    print("✓ Conexiones asíncronas cerradas")
 
 
 # Crear aplicación FastAPI
@@ -122,6 +271,31 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Cabeceras X-SQL-* con las métricas de cada respuesta y /metricas/sql
+DEBUG = os.getenv("DEBUG", "false").lower() == "true"
+
+
+@app.middleware("http")
+async def medir_sql(request: Request, call_next):
+    """Consultas SQL, tiempo de BD y espera del pool por petición"""
+    if not SQL_METRICAS:
+        return await call_next(request)
+    
+    metricas = iniciar_metricas_peticion()
+    try:
+        response = await call_next(request)
+    finally:
+        ruta = request.scope.get("route")
+        endpoint = f"{request.method} {ruta.path}" if ruta else "sin ruta"
+        finalizar_metricas_peticion(metricas, endpoint)
+    
+    if DEBUG:
+        response.headers["X-SQL-Consultas"] = str(metricas["consultas"])
+        response.headers["X-SQL-Tiempo-Ms"] = f"{metricas['tiempo_ms']:.2f}"
+        response.headers["X-SQL-Espera-Pool-Ms"] = f"{metricas['espera_pool_ms']:.2f}"
+        response.headers["X-SQL-Conexion-Ms"] = f"{metricas['conexion_ms']:.2f}"
+    return response
+
 # Inicializar servicios de IA (solo si están disponibles)
 if ML_SERVICES_AVAILABLE:
     ia_service = IAService()
@@ -153,6 +327,30 @@ else:
     nlp_service = MockNLPService()
     logger.info("🎭 Usando servicios ML de fallback (mocks)")
 
+# Escritura diferida de tablas de solo inserción (None si está desactivada)
+buffer_escritura = crear_buffer_escritura()
+
+
+async def _escribir_diferido(db: AsyncSession, filas: list):
+    """
+    Escribe filas (modelo, valores) a través del buffer de escritura
+    
+    Con durabilidad "commit" espera a que el lote esté confirmado. Si el
+    buffer no tiene sitio para todas, se escriben todas con la sesión, en
+    una sola transacción (encolar nunca bloquea el bucle de eventos).
+    """
+    try:
+        futuros = buffer_escritura.encolar_filas(filas)
+    except BufferLleno:
+        logger.warning("⚠️ Buffer de escritura lleno: escritura directa")
+        for modelo, valores in filas:
+            db.add(modelo(**valores))
+        await db.commit()
+        return
+    
+    if buffer_escritura.debe_esperar():
+        await asyncio.gather(*(asyncio.wrap_future(futuro) for futuro in futuros))
+
 
 # ============================================================
 # ENDPOINTS - SALUD
@@ -171,23 +369,57 @@ async def root():
     }
 
 
+@app.get("/health")
+async def liveness():
+    """Liveness: el proceso responde (no consulta la base de datos)"""
+    return {"estado": "vivo", "timestamp": datetime.now().isoformat()}
+
+
+@app.get("/ready")
+async def readiness(db: AsyncSession = Depends(get_async_db)):
+    """Readiness: la base de datos acepta conexiones (SELECT 1)"""
+    try:
+        await db.execute(text("SELECT 1"))
+    except Exception as e:
+        raise HTTPException(status_code=503, detail=f"Base de datos no disponible: {str(e)}")
+    return {"estado": "listo", "base_datos": "conectada", "timestamp": datetime.now().isoformat()}
+
+
 @app.get("/salud")
-async def verificar_salud(db: Session = Depends(get_db)):
-    """Verifica estado del servidor y BD"""
+async def verificar_salud(db: AsyncSession = Depends(get_async_db_lectura)):
+    """
+    Verifica estado del servidor y BD.
+    Las estadísticas son la última instantánea en memoria (ver antiguedad_segundos),
+    refrescada cada SALUD_INTERVALO_MIN minutos.
+    """
     try:
-        db.execute("SELECT 1")
-        stats = obtener_estadisticas_db(db)
+        await db.execute(text("SELECT 1"))
+        instantanea = obtener_instantanea_estadisticas()
         
         return {
             "estado": "saludable",
             "base_datos": "conectada",
-            "estadisticas": stats,
+            "estadisticas": instantanea["estadisticas"],
+            "estadisticas_generadas": instantanea["generada"],
+            "antiguedad_segundos": instantanea["antiguedad_segundos"],
             "timestamp": datetime.now().isoformat()
         }
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error: {str(e)}")
 
 
+@app.get("/metricas/sql")
+async def metricas_sql():
+    """
+    Métricas SQL desde el arranque: consultas y tiempo por endpoint,
+    consultas lentas (SQL_LENTA_MS) y espera/estado de los pools de conexiones.
+    Solo con DEBUG=true (expone sentencias SQL y la forma de las consultas)
+    """
+    if not DEBUG:
+        raise HTTPException(status_code=404, detail="Métricas SQL solo disponibles con DEBUG=true")
+    return obtener_metricas_sql()
+
+
 # ============================================================
 # ENDPOINTS - MOODMAP
 # ============================================================
@@ -196,26 +428,25 @@ async def verificar_salud(db: Session = Depends(get_db)):
 async def analizar_moodmap(
     moodmap: MoodMap,
     usuario_id: int = 1,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Analiza estado emocional con IA"""
     try:
-        # Guardar en BD
-        moodmap_db = MoodMapDB(
+        # Fila del MoodMap (se guarda junto con la interacción)
+        valores_moodmap = dict(
             usuario_id=usuario_id,
             felicidad=moodmap.felicidad,
             estres=moodmap.estres,
             motivacion=moodmap.motivacion
         )
-        db.add(moodmap_db)
         
         # Análisis con IA
         clasificacion = ia_service.clasificar_estado(moodmap)
         embedding = ia_service.obtener_embedding_emocional(moodmap)
         cluster_id = ia_service.obtener_cluster(moodmap)
         
-        # RL: microacción adaptativa
-        microaccion_rl = rl_service.obtener_microaccion_adaptativa(moodmap)
+        # RL: microacción adaptativa (en el threadpool: con RL_ALMACEN=bd lee la BD)
+        microaccion_rl = await run_in_threadpool(rl_service.obtener_microaccion_adaptativa, moodmap)
         
         # Frase motivadora
         frase = nlp_service.generar_frase_motivadora(
@@ -224,16 +455,26 @@ async def analizar_moodmap(
         )
         
         # Guardar interacción
-        interaccion = HistoricoInteraccionDB(
+        datos_moodmap = moodmap.model_dump()
+        valores_interaccion = dict(
             usuario_id=usuario_id,
             tipo="moodmap",
-            datos=moodmap.model_dump(),
+            datos=datos_moodmap,
             embedding_latente=embedding.tolist(),
             cluster_id=cluster_id,
-            microaccion_sugerida=microaccion_rl['microaccion']
+            microaccion_sugerida=microaccion_rl['microaccion'],
+            **columnas_tipadas_interaccion(datos_moodmap, embedding.tolist(), microaccion_rl['microaccion'])
         )
-        db.add(interaccion)
-        db.commit()
+        
+        if buffer_escritura is not None:
+            await _escribir_diferido(db, [
+                (MoodMapDB, valores_moodmap),
+                (HistoricoInteraccionDB, valores_interaccion)
+            ])
+        else:
+            db.add(MoodMapDB(**valores_moodmap))
+            db.add(HistoricoInteraccionDB(**valores_interaccion))
+            await db.commit()
         
         return {
             "clasificacion": clasificacion,
@@ -244,7 +485,7 @@ async def analizar_moodmap(
         }
         
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         raise HTTPException(status_code=500, detail=f"Error: {str(e)}")
 
 
@@ -253,7 +494,7 @@ async def analizar_moodmap(
 # ============================================================
 
 @app.post("/feedback/enviar")
-async def enviar_feedback(feedback: Feedback, db: Session = Depends(get_db)):
+async def enviar_feedback(feedback: Feedback, db: AsyncSession = Depends(get_async_db)):
     """Recibe feedback y actualiza RL"""
     try:
         # Guardar en BD
@@ -272,8 +513,9 @@ async def enviar_feedback(feedback: Feedback, db: Session = Depends(get_db)):
         # Recompensa para RL
         recompensa = (feedback.efectividad + feedback.comodidad + feedback.energia) / 3
         
-        # Actualizar RL
-        rl_service.actualizar_politica(
+        # Actualizar RL (en el threadpool: con RL_ALMACEN=bd escribe en la BD)
+        await run_in_threadpool(
+            rl_service.actualizar_politica,
             microaccion=feedback.microaccion,
             recompensa=recompensa,
             estado_previo=feedback.moodmap_previo,
@@ -285,7 +527,7 @@ async def enviar_feedback(feedback: Feedback, db: Session = Depends(get_db)):
         if feedback.comentario_texto:
             analisis_sentimiento = nlp_service.analizar_sentimiento(feedback.comentario_texto)
         
-        db.commit()
+        await db.commit()
         
         return {
             "mensaje": "Feedback recibido ✨",
@@ -295,7 +537,7 @@ async def enviar_feedback(feedback: Feedback, db: Session = Depends(get_db)):
         }
         
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         raise HTTPException(status_code=500, detail=f"Error: {str(e)}")
 
 
@@ -380,10 +622,13 @@ async def obtener_sugerencias_personalizadas(
         usuario_id = data.get('usuario_id', 1)
         estado_actual = data.get('estado_actual')
         
-        # Obtener historial del usuario
-        historial = db.query(HistoricoInteraccionDB).filter(
-            HistoricoInteraccionDB.usuario_id == usuario_id
-        ).order_by(HistoricoInteraccionDB.timestamp.desc()).limit(10).all()
+        # Obtener historial del usuario (tabla caliente y particiones rotadas)
+        from utils.particiones import seleccionar_rango
+        interacciones = seleccionar_rango(db.connection(), "historico_interacciones", usuario_id=usuario_id)
+        historial = db.execute(
+            select(interacciones.c.id, interacciones.c.fecha, interacciones.c.microaccion)
+            .order_by(interacciones.c.fecha.desc()).limit(10)
+        ).all()
         
         from models.usuario import MoodMap
         moodmap = MoodMap(
@@ -398,7 +643,7 @@ async def obtener_sugerencias_personalizadas(
         cluster_id = ia_service.obtener_cluster(moodmap)
         
         # RL para microacciones adaptativas
-        microaccion_rl = rl_service.obtener_microaccion_adaptativa(moodmap)
+        microaccion_rl = await run_in_threadpool(rl_service.obtener_microaccion_adaptativa, moodmap)
         
         # Convertir a natural chemicals
         natural_chemicals_sugeridos = _convertir_a_natural_chemicals(
@@ -449,32 +694,19 @@ def _calcular_impacto_actividad(tipo_actividad: str, intensidad: int, estado_ant
 
 def _convertir_a_natural_chemicals(microaccion: str, estado_actual: dict) -> list:
     """Convierte microacciones a natural chemicals recomendados"""
+    from services.recomendaciones import chemicals_sugeridos
     
-    sugerencias = []
-    
-    # Análisis basado en microacción RL
-    if microaccion in ['calmarse', 'meditar']:
-        sugerencias.extend(['serotonina', 'endorfinas'])
-    elif microaccion in ['animarse', 'motivarse']:
-        sugerencias.extend(['dopamina', 'serotonina'])
-    elif microaccion in ['activarse', 'ejercitarse']:
-        sugerencias.extend(['dopamina', 'endorfinas'])
-    elif microaccion in ['conectarse', 'socializar']:
-        sugerencias.extend(['oxitocina'])
-    
-    # Análisis basado en estado actual
-    if estado_actual.get('estres', 0) > 0.7:
-        sugerencias.append('endorfinas')
-    
-    if estado_actual.get('motivacion', 0) < 0.4:
-        sugerencias.append('dopamina')
-        
-    if estado_actual.get('felicidad', 0) < 0.5:
-        sugerencias.append('serotonina')
+    # Chemicals de la microacción RL y del estado actual, precalculados por celda
+    sugerencias = chemicals_sugeridos(
+        microaccion,
+        estado_actual.get('felicidad', 0),
+        estado_actual.get('estres', 0),
+        estado_actual.get('motivacion', 0)
+    )
     
     # Crear respuesta estructurada
     chemicals_info = []
-    for chemical in list(set(sugerencias)):  # Eliminar duplicados
+    for chemical in sugerencias:
         chemicals_info.append({
             'tipo': chemical,
             'razon': _obtener_razon_sugerencia(chemical, estado_actual),
@@ -517,7 +749,7 @@ def _calcular_prioridad(chemical: str, estado: dict) -> float:
 async def liberar_emocion(
     emocion: str,
     usuario_id: int = 1,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Registra liberación de emoción tóxica"""
     try:
@@ -533,7 +765,7 @@ async def liberar_emocion(
         
         frase = nlp_service.generar_frase_liberacion(emocion)
         
-        db.commit()
+        await db.commit()
         
         return {
             "mensaje": "Emoción liberada con amor 🌊",
@@ -542,7 +774,7 @@ async def liberar_emocion(
         }
         
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         raise HTTPException(status_code=500, detail=f"Error: {str(e)}")
 
 
@@ -551,7 +783,7 @@ async def agregar_gratitud(
     texto_gratitud: str,
     usuario_id: int = 1,
     tipo: str = "escrito",
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Registra microacción de gratitud"""
     try:
@@ -567,7 +799,7 @@ async def agregar_gratitud(
         
         frase = nlp_service.generar_frase_gratitud(texto_gratitud)
         
-        db.commit()
+        await db.commit()
         
         return {
             "mensaje": "Gratitud registrada ✨",
@@ -576,7 +808,7 @@ async def agregar_gratitud(
         }
         
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         raise HTTPException(status_code=500, detail=f"Error: {str(e)}")
 
 
@@ -585,14 +817,16 @@ async def agregar_gratitud(
 # ============================================================
 
 @app.get("/estadisticas/{usuario_id}")
-async def obtener_estadisticas_usuario(usuario_id: int, db: Session = Depends(get_db)):
+async def obtener_estadisticas_usuario(usuario_id: int, db: AsyncSession = Depends(get_async_db_lectura)):
     """Obtiene estadísticas del usuario"""
     try:
-        total_feedbacks = db.query(FeedbackDB).filter(FeedbackDB.usuario_id == usuario_id).count()
-        total_emociones = db.query(EmocionLiberadaDB).filter(EmocionLiberadaDB.usuario_id == usuario_id).count()
-        total_gratitudes = db.query(GratitudDB).filter(GratitudDB.usuario_id == usuario_id).count()
+        # Una sola fila mantenida en cada escritura (ver utils/contadores.py)
+        contadores = await db.get(ContadoresUsuarioDB, usuario_id)
+        total_feedbacks = contadores.feedbacks if contadores else 0
+        total_emociones = contadores.emociones_liberadas if contadores else 0
+        total_gratitudes = contadores.gratitudes if contadores else 0
         
-        stats_rl = rl_service.obtener_estadisticas()
+        stats_rl = await run_in_threadpool(rl_service.obtener_estadisticas)
         
         return {
             "usuario_id": usuario_id,
@@ -620,7 +854,8 @@ async def ejecutar_limpieza(
         resultado = limpiar_por_antigüedad(db, dias_retencion)
         return {
             "mensaje": "Limpieza ejecutada 🧹",
-            "resultado": resultado
+            "resultado": resultado,
+            "contadores": reconciliar_contadores()
         }
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error: {str(e)}")
@@ -639,6 +874,87 @@ async def ejecutar_optimizacion(db: Session = Depends(get_db)):
         raise HTTPException(status_code=500, detail=f"Error: {str(e)}")
 
 
+@app.post("/mantenimiento/contadores/reconciliar")
+def reconciliar_contadores_usuario():
+    """
+    Recalcula contadores_usuario desde las tablas y corrige las desviaciones.
+    Se ejecuta automáticamente cada día y después de cada limpieza.
+    """
+    try:
+        resultado = reconciliar_contadores()
+        return {
+            "mensaje": "✅ Contadores reconciliados",
+            "resultado": resultado
+        }
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error: {str(e)}")
+
+
+@app.post("/mantenimiento/archivo/sellar")
+def sellar_segmentos_archivo(meses_calientes: Optional[int] = None):
+    """
+    Sella en segmentos columnares en disco los meses completos del archivo
+    más antiguos que meses_calientes y los borra de la base de datos.
+    Las exportaciones de investigación los siguen leyendo de forma transparente.
+    
+    Args:
+        meses_calientes: Meses que se quedan en la BD (por defecto ARCHIVO_SEGMENTOS_MESES)
+    """
+    try:
+        from utils.segmentos_archivo import sellar_segmentos
+        
+        if meses_calientes is not None and meses_calientes < 1:
+            raise HTTPException(status_code=400, detail="meses_calientes debe ser al menos 1")
+        creados = sellar_segmentos(meses_calientes)
+        return {
+            "mensaje": "📦 Segmentos sellados",
+            "segmentos_creados": creados
+        }
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error: {str(e)}")
+
+
+@app.post("/mantenimiento/rl/replay")
+def ejecutar_replay_rl(
+    epocas: int = 20,
+    alpha: float = 0.1,
+    gamma: float = 0.9,
+    metodo: str = "fitted_q",
+    publicar: bool = False,
+    db: Session = Depends(get_db)
+):
+    """
+    Reconstruye la política de RL desde el histórico de feedback (admin).
+    Con publicar=true la Q-Table se guarda y se carga en el servicio en marcha.
+    """
+    if not ML_SERVICES_AVAILABLE:
+        raise HTTPException(status_code=503, detail="RLService no disponible (servicios ML no cargados)")
+    
+    try:
+        from services.rl_replay import ejecutar_replay
+        
+        resultado = ejecutar_replay(
+            db,
+            epocas=epocas,
+            alpha=alpha,
+            gamma=gamma,
+            metodo=metodo,
+            publicar=publicar,
+            rl_service=rl_service
+        )
+        
+        return {
+            "mensaje": "✅ Replay de RL completado",
+            "resultado": resultado
+        }
+    except ValueError as ve:
+        raise HTTPException(status_code=400, detail=str(ve))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error: {str(e)}")
+
+
 # ============================================================
 # ENDPOINTS DE LIMPIEZA PERIÓDICA
 # ============================================================
@@ -656,6 +972,7 @@ async def ejecutar_limpieza_manual(db: Session = Depends(get_db)):
             "mensaje": "✅ Limpieza periódica ejecutada",
             "eliminados": resultado,
             "total": sum(resultado.values()),
+            "contadores": reconciliar_contadores(),
             "nota": "Esta limpieza se ejecuta automáticamente cada mes"
         }
     except Exception as e:
@@ -663,7 +980,7 @@ async def ejecutar_limpieza_manual(db: Session = Depends(get_db)):
 
 
 @app.get("/mantenimiento/estimacion-limpieza")
-async def estimar_limpieza(db: Session = Depends(get_db)):
+async def estimar_limpieza(db: Session = Depends(get_db_lectura)):
     """
     Estima cuánto espacio se liberaría con la limpieza periódica.
     Útil para decidir si ejecutarla manualmente.
@@ -836,40 +1153,90 @@ async def verificar_usuario_test(
 # ENDPOINTS DE ARCHIVO E INVESTIGACIÓN
 # ============================================================
 
-@app.post("/investigacion/archivar")
+@app.post("/investigacion/archivar", status_code=202)
 async def archivar_datos(
     dias_antiguedad: int = 30,
     db: Session = Depends(get_db)
 ):
     """
-    Archiva datos en tablas permanentes para investigación.
+    Lanza un trabajo de archivado en segundo plano (tablas permanentes para investigación).
     Los datos archivados NUNCA se borran automáticamente.
     
+    El avance se consulta en GET /investigacion/archivar/trabajos/{trabajo_id}.
+    Si ya hay un trabajo activo, se devuelve ese en lugar de crear otro.
+    
     Args:
         dias_antiguedad: Solo archivar datos más antiguos que estos días
     """
     try:
-        from utils.archivado import archivar_todo
+        from utils.trabajo_archivo import crear_trabajo, estado_trabajo
         
-        resultado = archivar_todo(db, dias_antiguedad=dias_antiguedad)
+        trabajo = crear_trabajo(db, dias_antiguedad=dias_antiguedad)
+        if trabajo.estado == "pendiente":
+            lanzar_trabajo_archivo(trabajo.id)
         
         return {
-            "mensaje": f"✅ Datos archivados para investigación",
-            "dias_antiguedad": dias_antiguedad,
-            "archivados": {
-                "emocionales": resultado.get("emocionales", 0),
-                "alma_board": resultado.get("alma_board", 0),
-                "resumenes_semanales": resultado.get("resumenes", 0)
-            },
-            "total": sum(resultado.values()),
-            "nota": "Estos datos están ahora en tablas permanentes y NO se borrarán"
+            "mensaje": "📦 Archivado en curso",
+            "trabajo": estado_trabajo(trabajo),
+            "nota": "Los datos archivados van a tablas permanentes y NO se borrarán"
         }
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error archivando: {str(e)}")
 
 
+@app.get("/investigacion/archivar/trabajos")
+async def listar_trabajos_archivo(limite: int = 20, db: Session = Depends(get_db)):
+    """Últimos trabajos de archivado con su estado"""
+    try:
+        from models.db_models import TrabajoArchivoDB
+        from utils.trabajo_archivo import estado_trabajo
+        
+        trabajos = db.query(TrabajoArchivoDB).order_by(TrabajoArchivoDB.id.desc()).limit(limite).all()
+        return {"trabajos": [estado_trabajo(trabajo) for trabajo in trabajos]}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error: {str(e)}")
+
+
+@app.get("/investigacion/archivar/trabajos/{trabajo_id}")
+async def obtener_trabajo_archivo(trabajo_id: int, db: Session = Depends(get_db)):
+    """Estado de un trabajo de archivado: filas/s y tiempo restante estimado"""
+    from models.db_models import TrabajoArchivoDB
+    from utils.trabajo_archivo import estado_trabajo
+    
+    trabajo = db.get(TrabajoArchivoDB, trabajo_id)
+    if trabajo is None:
+        raise HTTPException(status_code=404, detail="Trabajo de archivado no encontrado")
+    return estado_trabajo(trabajo)
+
+
+@app.get("/investigacion/segmentos")
+async def listar_segmentos_archivo():
+    """Segmentos sellados del archivo por tabla: meses, filas y tamaño en disco"""
+    try:
+        from utils.segmentos_archivo import listar_segmentos, TABLAS_SEGMENTADAS
+        
+        return {
+            tabla: [
+                {
+                    "segmento": segmento.nombre,
+                    "mes": segmento.mes,
+                    "filas": segmento.indice["filas"],
+                    "id_min": segmento.indice["id_min"],
+                    "id_max": segmento.indice["id_max"],
+                    "fecha_min": segmento.indice["fecha_min"],
+                    "fecha_max": segmento.indice["fecha_max"],
+                    "sellado": segmento.indice["sellado"]
+                }
+                for segmento in listar_segmentos(tabla)
+            ]
+            for tabla in TABLAS_SEGMENTADAS
+        }
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error: {str(e)}")
+
+
 @app.get("/investigacion/estadisticas")
-async def obtener_stats_investigacion(db: Session = Depends(get_db)):
+async def obtener_stats_investigacion(db: Session = Depends(get_db_lectura)):
     """
     Obtiene estadísticas de datos archivados para investigación.
     """
@@ -886,69 +1253,102 @@ async def obtener_stats_investigacion(db: Session = Depends(get_db)):
         raise HTTPException(status_code=500, detail=f"Error: {str(e)}")
 
 
+def validar_formato_exportacion(formato: str):
+    """400 si el formato no existe, 501 si es columnar y falta pyarrow"""
+    from utils.exportacion import FORMATOS
+    from utils.exportacion_arrow import ARROW_DISPONIBLE, FORMATOS_COLUMNARES
+    
+    if formato not in FORMATOS and formato not in FORMATOS_COLUMNARES:
+        opciones = ", ".join([*FORMATOS, *FORMATOS_COLUMNARES])
+        raise HTTPException(status_code=400, detail=f"Formato no válido. Opciones: {opciones}")
+    if formato in FORMATOS_COLUMNARES and not ARROW_DISPONIBLE:
+        raise HTTPException(status_code=501, detail="Exportación columnar no disponible: instala pyarrow")
+
+
+def validar_pagina(limit: Optional[int], fields: Optional[str] = None, embeddings: str = "json") -> Optional[list]:
+    """
+    Valida la paginación y la proyección de los endpoints de investigación
+    
+    Returns:
+        Lista de campos pedidos (None = todos)
+    """
+    from utils.exportacion import CODIFICACIONES_EMBEDDING, LIMITE_MAX_PAGINA
+    
+    if limit is not None and not 1 <= limit <= LIMITE_MAX_PAGINA:
+        raise HTTPException(status_code=400, detail=f"limit debe estar entre 1 y {LIMITE_MAX_PAGINA}")
+    if embeddings not in CODIFICACIONES_EMBEDDING:
+        raise HTTPException(status_code=400, detail=f"embeddings no válido. Opciones: {', '.join(CODIFICACIONES_EMBEDDING)}")
+    if not fields:
+        return None
+    return [campo.strip() for campo in fields.split(",") if campo.strip()]
+
+
+def respuesta_exportacion(
+    consulta, nombre: str, formato: str, gzip: bool, filtros: dict,
+    embeddings: str = "json", limite: Optional[int] = None
+):
+    """StreamingResponse de un export de archivo (ver utils/exportacion.py)"""
+    from fastapi.responses import StreamingResponse
+    from utils.exportacion import FORMATOS, generar_exportacion
+    from utils.exportacion_arrow import FORMATOS_COLUMNARES, generar_columnar
+    
+    cabeceras = {"Content-Disposition": f'attachment; filename="{nombre}.{formato}"'}
+    if formato in FORMATOS_COLUMNARES:
+        # Parquet y Arrow ya van comprimidos (zstd) por columna
+        return StreamingResponse(
+            generar_columnar(consulta, formato),
+            media_type=FORMATOS_COLUMNARES[formato],
+            headers=cabeceras
+        )
+    
+    if gzip:
+        cabeceras["Content-Encoding"] = "gzip"
+    return StreamingResponse(
+        generar_exportacion(consulta, formato, comprimir=gzip, filtros=filtros, embeddings=embeddings, limite=limite),
+        media_type=FORMATOS[formato],
+        headers=cabeceras
+    )
+
+
 @app.get("/investigacion/exportar/emocional")
 async def exportar_datos_emocionales(
     usuario_id: Optional[int] = None,
     fecha_inicio: Optional[str] = None,
     fecha_fin: Optional[str] = None,
-    db: Session = Depends(get_db)
+    formato: str = "json",
+    gzip: bool = False,
+    after_id: Optional[int] = None,
+    limit: Optional[int] = None,
+    fields: Optional[str] = None,
+    embeddings: str = "json"
 ):
     """
     Exporta datos emocionales archivados para investigación.
-    Formato: JSON limpio listo para análisis.
+    Las filas se envían en streaming según se leen de la base de datos.
+    Con after_id/limit se pagina por id (siguiente página: after_id = último id recibido).
     
     Args:
         usuario_id: ID de usuario específico (opcional)
         fecha_inicio: Fecha inicio en formato YYYY-MM-DD (opcional)
         fecha_fin: Fecha fin en formato YYYY-MM-DD (opcional)
+        formato: "json" (documento con filtros y datos), "ndjson", "csv",
+                 "parquet" o "arrow" (columnares, requieren pyarrow)
+        gzip: Comprimir la respuesta con gzip (formatos de texto)
+        after_id: Devolver solo filas con id mayor (paginación por clave)
+        limit: Filas por página
+        fields: Campos separados por comas (el id siempre se incluye)
+        embeddings: "json" (listas) o "base64" (float32 little-endian)
     """
+    from utils.exportacion import consulta_emocional
+    
+    validar_formato_exportacion(formato)
+    campos = validar_pagina(limit, fields, embeddings)
     try:
-        from models.db_models import ArchivoEmocionalDB
-        from datetime import datetime
-        
-        query = db.query(ArchivoEmocionalDB)
-        
-        if usuario_id:
-            query = query.filter(ArchivoEmocionalDB.usuario_id == usuario_id)
-        
-        if fecha_inicio:
-            fecha = datetime.fromisoformat(fecha_inicio)
-            query = query.filter(ArchivoEmocionalDB.fecha_registro >= fecha)
-        
-        if fecha_fin:
-            fecha = datetime.fromisoformat(fecha_fin)
-            query = query.filter(ArchivoEmocionalDB.fecha_registro <= fecha)
-        
-        registros = query.order_by(ArchivoEmocionalDB.fecha_registro).all()
-        
-        datos = []
-        for r in registros:
-            datos.append({
-                "id": r.id,
-                "usuario_id": r.usuario_id,
-                "felicidad": r.felicidad,
-                "estres": r.estres,
-                "motivacion": r.motivacion,
-                "embedding_latente": r.embedding_latente,
-                "cluster_id": r.cluster_id,
-                "microaccion": r.microaccion_recomendada,
-                "feedback_efectividad": r.feedback_efectividad,
-                "feedback_comodidad": r.feedback_comodidad,
-                "feedback_energia": r.feedback_energia,
-                "fecha_registro": r.fecha_registro.isoformat(),
-                "semana_anio": r.semana_anio,
-                "datos_extra": r.datos_extra
-            })
-        
-        return {
-            "total_registros": len(datos),
-            "filtros": {
-                "usuario_id": usuario_id,
-                "fecha_inicio": fecha_inicio,
-                "fecha_fin": fecha_fin
-            },
-            "datos": datos
-        }
+        consulta = consulta_emocional(usuario_id, fecha_inicio, fecha_fin, campos, after_id, limit)
+        filtros = {"usuario_id": usuario_id, "fecha_inicio": fecha_inicio, "fecha_fin": fecha_fin}
+        return respuesta_exportacion(consulta, "archivo_emocional", formato, gzip, filtros, embeddings, limit)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error: {str(e)}")
 
@@ -957,52 +1357,98 @@ async def exportar_datos_emocionales(
 async def exportar_datos_alma_board(
     usuario_id: Optional[int] = None,
     tipo: Optional[str] = None,
-    db: Session = Depends(get_db)
+    formato: str = "json",
+    gzip: bool = False,
+    after_id: Optional[int] = None,
+    limit: Optional[int] = None,
+    fields: Optional[str] = None,
+    embeddings: str = "json"
 ):
     """
-    Exporta datos del Alma Board archivados.
+    Exporta datos del Alma Board archivados (en streaming).
+    Con after_id/limit se pagina por id (siguiente página: after_id = último id recibido).
     
     Args:
         usuario_id: ID de usuario (opcional)
         tipo: "emocion" o "gratitud" (opcional)
+        formato: "json" (documento con filtros y datos), "ndjson", "csv",
+                 "parquet" o "arrow" (columnares, requieren pyarrow)
+        gzip: Comprimir la respuesta con gzip (formatos de texto)
+        after_id: Devolver solo filas con id mayor (paginación por clave)
+        limit: Filas por página
+        fields: Campos separados por comas (el id siempre se incluye)
+        embeddings: "json" (listas) o "base64" (float32 little-endian)
     """
+    from utils.exportacion import consulta_alma_board
+    
+    validar_formato_exportacion(formato)
+    campos = validar_pagina(limit, fields, embeddings)
     try:
-        from models.db_models import ArchivoAlmaBoardDB
-        
-        query = db.query(ArchivoAlmaBoardDB)
-        
-        if usuario_id:
-            query = query.filter(ArchivoAlmaBoardDB.usuario_id == usuario_id)
-        
-        if tipo:
-            query = query.filter(ArchivoAlmaBoardDB.tipo == tipo)
-        
-        registros = query.order_by(ArchivoAlmaBoardDB.fecha_registro).all()
-        
-        datos = []
-        for r in registros:
-            datos.append({
-                "id": r.id,
-                "usuario_id": r.usuario_id,
-                "tipo": r.tipo,
-                "emocion": r.emocion,
-                "categoria": r.categoria,
-                "intensidad": r.intensidad,
-                "texto": r.texto,
-                "embedding_texto": r.embedding_texto,
-                "fecha_registro": r.fecha_registro.isoformat(),
-                "semana_anio": r.semana_anio,
-                "mes_anio": r.mes_anio,
-                "datos_extra": r.datos_extra
-            })
+        consulta = consulta_alma_board(usuario_id, tipo, campos, after_id, limit)
+        filtros = {"usuario_id": usuario_id, "tipo": tipo}
+        return respuesta_exportacion(consulta, "archivo_alma_board", formato, gzip, filtros, embeddings, limit)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error: {str(e)}")
+
+
+@app.get("/investigacion/exportar/resumenes_semanales")
+async def exportar_resumenes_semanales(
+    usuario_id: Optional[int] = None,
+    anio: Optional[int] = None,
+    formato: str = "parquet",
+    gzip: bool = False,
+    after_id: Optional[int] = None,
+    limit: Optional[int] = None,
+    fields: Optional[str] = None
+):
+    """
+    Exporta los resúmenes semanales en streaming (por defecto en Parquet).
+    
+    Args:
+        usuario_id: ID de usuario (opcional)
+        anio: Año (opcional)
+        formato: "parquet", "arrow", "json", "ndjson" o "csv"
+        gzip: Comprimir la respuesta con gzip (formatos de texto)
+        after_id: Devolver solo filas con id mayor (paginación por clave)
+        limit: Filas por página
+        fields: Campos separados por comas (el id siempre se incluye)
+    """
+    from utils.exportacion import consulta_resumenes
+    
+    validar_formato_exportacion(formato)
+    campos = validar_pagina(limit, fields)
+    try:
+        consulta = consulta_resumenes(usuario_id, anio, campos, after_id, limit)
+        filtros = {"usuario_id": usuario_id, "anio": anio}
+        return respuesta_exportacion(consulta, "resumen_semanal", formato, gzip, filtros, limite=limit)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error: {str(e)}")
+
+
+@app.post("/investigacion/resumenes_semanales/reconstruir")
+def reconstruir_resumenes_semanales(
+    usuario_id: Optional[int] = None,
+    db: Session = Depends(get_db)
+):
+    """
+    Recalcula todos los resúmenes semanales (operación de administración).
+    El archivado normal solo recalcula las semanas con datos nuevos.
+    
+    Args:
+        usuario_id: Reconstruir solo los de este usuario
+    """
+    try:
+        from utils.archivado import generar_resumen_semanal
         
+        resumenes = generar_resumen_semanal(db, usuario_id=usuario_id)
         return {
-            "total_registros": len(datos),
-            "filtros": {
-                "usuario_id": usuario_id,
-                "tipo": tipo
-            },
-            "datos": datos
+            "mensaje": "✅ Resúmenes semanales reconstruidos",
+            "usuario_id": usuario_id,
+            "resumenes": resumenes
         }
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error: {str(e)}")
@@ -1012,11 +1458,15 @@ async def exportar_datos_alma_board(
 async def obtener_resumenes_semanales(
     usuario_id: Optional[int] = None,
     anio: Optional[int] = None,
-    db: Session = Depends(get_db)
+    after_id: Optional[int] = None,
+    limit: Optional[int] = None,
+    db: Session = Depends(get_db_lectura)
 ):
     """
     Obtiene resúmenes semanales consolidados para análisis.
+    Con after_id/limit se pagina por id (siguiente página en siguiente_after_id).
     """
+    validar_pagina(limit)
     try:
         from models.db_models import ResumenSemanalDB
         
@@ -1028,14 +1478,18 @@ async def obtener_resumenes_semanales(
         if anio:
             query = query.filter(ResumenSemanalDB.anio == anio)
         
-        resumenes = query.order_by(
-            ResumenSemanalDB.anio,
-            ResumenSemanalDB.semana
-        ).all()
+        if after_id is None and limit is None:
+            query = query.order_by(ResumenSemanalDB.anio, ResumenSemanalDB.semana)
+        else:
+            if after_id is not None:
+                query = query.filter(ResumenSemanalDB.id > after_id)
+            query = query.order_by(ResumenSemanalDB.id).limit(limit)
+        resumenes = query.all()
         
         datos = []
         for r in resumenes:
             datos.append({
+                "id": r.id,
                 "semana_anio": r.semana_anio,
                 "usuario_id": r.usuario_id,
                 "num_registros": r.num_registros,
@@ -1065,7 +1519,82 @@ async def obtener_resumenes_semanales(
                 "usuario_id": usuario_id,
                 "anio": anio
             },
-            "resumenes": datos
+            "resumenes": datos,
+            "siguiente_after_id": resumenes[-1].id if limit and len(resumenes) == limit else None
+        }
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error: {str(e)}")
+
+
+@app.get("/investigacion/cubo")
+async def consultar_cubo_investigacion(
+    agrupar: str = "microaccion",
+    cluster_id: Optional[int] = None,
+    estado: Optional[str] = None,
+    microaccion: Optional[str] = None,
+    semana_desde: Optional[str] = None,
+    semana_hasta: Optional[str] = None,
+    min_registros: int = 1,
+    ordenar: Optional[str] = None,
+    limit: Optional[int] = None,
+    db: Session = Depends(get_db_lectura)
+):
+    """
+    Efectividad, comodidad y energía del feedback (n, media, desviación) por
+    cualquier combinación de cluster_id, estado, microaccion y semana_anio.
+    Lee el cubo precalculado por el archivado, no el archivo completo.
+
+    Args:
+        agrupar: Dimensiones separadas por comas (vacío = total)
+        cluster_id: Cluster (-1 = sin cluster)
+        estado: Estado discretizado, p. ej. "bajo_alto_medio" (felicidad_estres_motivacion)
+        microaccion: Microacción recomendada ("" = ninguna)
+        semana_desde: Primera semana "2026-W02" (inclusive)
+        semana_hasta: Última semana (inclusive)
+        min_registros: Mínimo de valoraciones de la medida ordenada (o de registros)
+        ordenar: "efectividad", "comodidad" o "energia" (media descendente)
+        limit: Máximo de grupos
+    """
+    validar_pagina(limit)
+    try:
+        from utils.cubo_investigacion import consultar_cubo
+
+        dimensiones = [dimension.strip() for dimension in agrupar.split(",") if dimension.strip()]
+        grupos = consultar_cubo(
+            db, dimensiones, cluster_id, estado, microaccion,
+            semana_desde, semana_hasta, min_registros, ordenar, limit
+        )
+        return {
+            "agrupado_por": dimensiones,
+            "filtros": {
+                "cluster_id": cluster_id,
+                "estado": estado,
+                "microaccion": microaccion,
+                "semana_desde": semana_desde,
+                "semana_hasta": semana_hasta
+            },
+            "total_grupos": len(grupos),
+            "grupos": grupos
+        }
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error: {str(e)}")
+
+
+@app.post("/investigacion/cubo/reconstruir")
+def reconstruir_cubo_investigacion():
+    """
+    Recalcula el cubo desde archivo_emocional y sus segmentos (operación de administración).
+    El archivado normal solo suma las filas nuevas.
+    """
+    try:
+        from utils.cubo_investigacion import reconstruir_cubo
+
+        resultado = reconstruir_cubo()
+        return {
+            "mensaje": "✅ Cubo de investigación reconstruido",
+            "resultado": resultado
         }
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error: {str(e)}")
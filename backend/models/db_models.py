@@ -3,9 +3,10 @@ Modelos de base de datos con SQLAlchemy
 Definición de tablas que se crearán automáticamente
 """
 
-from sqlalchemy import Column, Integer, String, Float, DateTime, Text, JSON, ForeignKey
+from sqlalchemy import Boolean, Column, Integer, String, Float, DateTime, Text, JSON, ForeignKey, UniqueConstraint, Index
 from sqlalchemy.orm import relationship
 from datetime import datetime
+from typing import Optional
 from database import Base
 
 
@@ -28,6 +29,10 @@ class UsuarioDB(Base):
 class MoodMapDB(Base):
     """Tabla de estados emocionales (MoodMap)"""
     __tablename__ = "moodmaps"
+    __table_args__ = (
+        # Consultas por usuario en un rango de fechas
+        Index("ix_moodmaps_usuario_timestamp", "usuario_id", "timestamp"),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     usuario_id = Column(Integer, ForeignKey("usuarios.id"), nullable=False)
@@ -43,6 +48,12 @@ class MoodMapDB(Base):
 class FeedbackDB(Base):
     """Tabla de feedback de microacciones"""
     __tablename__ = "feedbacks"
+    __table_args__ = (
+        # Consultas por usuario en un rango de fechas
+        Index("ix_feedbacks_usuario_timestamp", "usuario_id", "timestamp"),
+        # Ids crecientes aunque la tabla se rote por meses (utils/particiones.py)
+        {"sqlite_autoincrement": True},
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     usuario_id = Column(Integer, ForeignKey("usuarios.id"), nullable=False)
@@ -70,6 +81,12 @@ class FeedbackDB(Base):
 class HistoricoInteraccionDB(Base):
     """Tabla de histórico de interacciones del usuario"""
     __tablename__ = "historico_interacciones"
+    __table_args__ = (
+        # Consultas por usuario en un rango de fechas
+        Index("ix_historico_interacciones_usuario_fecha", "usuario_id", "fecha"),
+        # Ids crecientes aunque la tabla se rote por meses (utils/particiones.py)
+        {"sqlite_autoincrement": True},
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     usuario_id = Column(Integer, ForeignKey("usuarios.id"), nullable=False)
@@ -85,6 +102,17 @@ class HistoricoInteraccionDB(Base):
     cluster_id = Column(Integer, nullable=True)
     microaccion_sugerida = Column(String(50), nullable=True)
     
+    # Campos de datos/embedding_latente como columnas tipadas, para agregar
+    # en SQL sin decodificar JSON (ver columnas_tipadas_interaccion)
+    felicidad = Column(Float, nullable=True)
+    estres = Column(Float, nullable=True)
+    motivacion = Column(Float, nullable=True)
+    microaccion = Column(String(50), nullable=True)
+    embedding_0 = Column(Float, nullable=True)
+    embedding_1 = Column(Float, nullable=True)
+    embedding_2 = Column(Float, nullable=True)
+    embedding_3 = Column(Float, nullable=True)
+    
     # Metadata
     fecha = Column(DateTime, default=datetime.now, index=True)
     
@@ -92,9 +120,44 @@ class HistoricoInteraccionDB(Base):
     usuario = relationship("UsuarioDB", back_populates="interacciones")
 
 
+# Componentes de embedding_latente con columna propia
+DIMENSIONES_EMBEDDING_TIPADAS = 4
+
+
+def columnas_tipadas_interaccion(datos: dict, embedding_latente=None, microaccion: Optional[str] = None) -> dict:
+    """
+    Valores de las columnas tipadas de HistoricoInteraccionDB
+    
+    Args:
+        datos: JSON de la interacción (MoodMap, microacción...)
+        embedding_latente: Vector latente (lista de floats) o None
+        microaccion: Microacción sugerida (por defecto datos["microaccion"])
+    
+    Returns:
+        Diccionario listo para añadir a los valores de la fila
+    """
+    datos = datos or {}
+    embedding = list(embedding_latente or [])[:DIMENSIONES_EMBEDDING_TIPADAS]
+    embedding += [None] * (DIMENSIONES_EMBEDDING_TIPADAS - len(embedding))
+    
+    valores = {
+        "felicidad": datos.get("felicidad"),
+        "estres": datos.get("estres"),
+        "motivacion": datos.get("motivacion"),
+        "microaccion": microaccion if microaccion is not None else datos.get("microaccion"),
+    }
+    for i, componente in enumerate(embedding):
+        valores[f"embedding_{i}"] = float(componente) if componente is not None else None
+    return valores
+
+
 class EmocionLiberadaDB(Base):
     """Tabla de emociones tóxicas liberadas en Alma Board"""
     __tablename__ = "emociones_liberadas"
+    __table_args__ = (
+        # Consultas por usuario en un rango de fechas
+        Index("ix_emociones_liberadas_usuario_fecha_liberacion", "usuario_id", "fecha_liberacion"),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     usuario_id = Column(Integer, ForeignKey("usuarios.id"), nullable=False)
@@ -107,6 +170,10 @@ class EmocionLiberadaDB(Base):
 class GratitudDB(Base):
     """Tabla de microacciones de gratitud"""
     __tablename__ = "gratitudes"
+    __table_args__ = (
+        # Consultas por usuario en un rango de fechas
+        Index("ix_gratitudes_usuario_fecha_creacion", "usuario_id", "fecha_creacion"),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     usuario_id = Column(Integer, ForeignKey("usuarios.id"), nullable=False)
@@ -119,6 +186,10 @@ class GratitudDB(Base):
 class DestelloDB(Base):
     """Tabla de destellos de luz generados"""
     __tablename__ = "destellos"
+    __table_args__ = (
+        # Consultas por usuario en un rango de fechas
+        Index("ix_destellos_usuario_fecha_creacion", "usuario_id", "fecha_creacion"),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     usuario_id = Column(Integer, ForeignKey("usuarios.id"), nullable=False)
@@ -140,6 +211,24 @@ class ConfiguracionRLDB(Base):
     ultima_actualizacion = Column(DateTime, default=datetime.now, onupdate=datetime.now)
 
 
+class QValorRLDB(Base):
+    """
+    Q-values compartidos entre workers/nodos (RL_ALMACEN=bd)
+    Una fila por (estado, acción) para poder incrementar de forma atómica
+    """
+    __tablename__ = "q_valores_rl"
+    __table_args__ = (
+        UniqueConstraint("estado_discretizado", "microaccion", name="uq_q_valores_rl_estado_accion"),
+    )
+    
+    id = Column(Integer, primary_key=True, index=True)
+    estado_discretizado = Column(String(100), nullable=False)
+    microaccion = Column(String(50), nullable=False)
+    valor = Column(Float, nullable=False, default=0.0)
+    actualizaciones = Column(Integer, nullable=False, default=0)
+    ultima_actualizacion = Column(DateTime, default=datetime.now, onupdate=datetime.now)
+
+
 # ==========================================
 # TABLA DE USUARIOS DE TEST (POSTMAN)
 # ==========================================
@@ -175,6 +264,8 @@ class ArchivoEmocionalDB(Base):
     NUNCA se borra automáticamente - Los datos se preservan indefinidamente.
     """
     __tablename__ = "archivo_emocional"
+    # Los ids no se reutilizan aunque se borren las filas selladas en segmentos
+    __table_args__ = {"sqlite_autoincrement": True}
     
     id = Column(Integer, primary_key=True, index=True)
     usuario_id = Column(Integer, nullable=True)  # Puede ser NULL si se elimina el usuario
@@ -207,6 +298,8 @@ class ArchivoAlmaBoardDB(Base):
     NUNCA se borra automáticamente - Datos valiosos para investigación.
     """
     __tablename__ = "archivo_alma_board"
+    # Los ids no se reutilizan aunque se borren las filas selladas en segmentos
+    __table_args__ = {"sqlite_autoincrement": True}
     
     id = Column(Integer, primary_key=True, index=True)
     usuario_id = Column(Integer, nullable=True)  # Puede ser NULL
@@ -234,6 +327,10 @@ class ResumenSemanalDB(Base):
     NUNCA se borra automáticamente.
     """
     __tablename__ = "resumen_semanal"
+    __table_args__ = (
+        # Un resumen por usuario y semana (upsert de generar_resumen_semanal)
+        Index("uq_resumen_semanal_usuario_semana", "usuario_id", "semana_anio", unique=True),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     usuario_id = Column(Integer, nullable=True)
@@ -263,3 +360,151 @@ class ResumenSemanalDB(Base):
     # Metadata
     fecha_creacion = Column(DateTime, default=datetime.now)
     fecha_actualizacion = Column(DateTime, default=datetime.now, onupdate=datetime.now)
+
+
+class SemanaPendienteResumenDB(Base):
+    """
+    Semanas con datos archivados nuevos cuyo resumen hay que recalcular.
+    El archivado las marca y generar_resumen_semanal(solo_pendientes=True) las consume.
+    """
+    __tablename__ = "semanas_pendientes_resumen"
+    
+    usuario_id = Column(Integer, primary_key=True)
+    semana_anio = Column(String(10), primary_key=True)
+    fecha_marcada = Column(DateTime, nullable=False, default=datetime.now)
+
+
+class CuboInvestigacionDB(Base):
+    """
+    Cubo de agregados de archivo_emocional por (cluster, estado, microacción, semana).
+    Guarda conteos, sumas y sumas de cuadrados del feedback para calcular media y
+    desviación de cualquier corte sumando celdas. Lo mantiene el archivado (ver
+    utils/cubo_investigacion.py). Sin cluster se guarda -1 y sin microacción "".
+    """
+    __tablename__ = "cubo_investigacion"
+    __table_args__ = (
+        Index("uq_cubo_investigacion_celda", "cluster_id", "estado", "microaccion", "semana_anio", unique=True),
+    )
+    
+    id = Column(Integer, primary_key=True, index=True)
+    cluster_id = Column(Integer, nullable=False)
+    estado = Column(String(20), nullable=False)  # "bajo_medio_alto" (felicidad_estres_motivacion)
+    microaccion = Column(String(50), nullable=False)
+    semana_anio = Column(String(10), nullable=False)
+    
+    num_registros = Column(Integer, nullable=False, default=0)
+    num_efectividad = Column(Integer, nullable=False, default=0)
+    suma_efectividad = Column(Float, nullable=False, default=0.0)
+    suma_cuadrados_efectividad = Column(Float, nullable=False, default=0.0)
+    num_comodidad = Column(Integer, nullable=False, default=0)
+    suma_comodidad = Column(Float, nullable=False, default=0.0)
+    suma_cuadrados_comodidad = Column(Float, nullable=False, default=0.0)
+    num_energia = Column(Integer, nullable=False, default=0)
+    suma_energia = Column(Float, nullable=False, default=0.0)
+    suma_cuadrados_energia = Column(Float, nullable=False, default=0.0)
+    
+    fecha_actualizacion = Column(DateTime, default=datetime.now, onupdate=datetime.now)
+
+
+class MarcaCuboDB(Base):
+    """
+    Marca de agua del cubo de investigación: último id de archivo_emocional
+    ya sumado (una sola fila, id=1). Aparte de progreso_archivo, que solo
+    guarda marcas de tablas de origen del archivado
+    """
+    __tablename__ = "marca_cubo_investigacion"
+    
+    id = Column(Integer, primary_key=True)
+    ultimo_id = Column(Integer, nullable=False, default=0)  # Último id de archivo_emocional sumado (inclusive)
+    filas_sumadas = Column(Integer, nullable=False, default=0)
+    fecha_actualizacion = Column(DateTime, default=datetime.now, onupdate=datetime.now)
+
+
+class MigracionEsquemaDB(Base):
+    """Migraciones de esquema ya aplicadas (ver utils/migraciones.py)"""
+    __tablename__ = "schema_migraciones"
+    
+    id = Column(String(100), primary_key=True)
+    descripcion = Column(String(255))
+    fecha_aplicacion = Column(DateTime, default=datetime.now)
+
+
+class ParticionTiempoDB(Base):
+    """
+    Catálogo de particiones mensuales (ver utils/particiones.py)
+    Rango real de fechas de cada partición, para podar consultas y
+    aplicar la retención borrando particiones completas
+    """
+    __tablename__ = "particiones_tiempo"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    tabla = Column(String(100), nullable=False, index=True)
+    particion = Column(String(100), nullable=False, unique=True)
+    desde = Column(DateTime, nullable=True)  # Inclusive (None = sin límite)
+    hasta = Column(DateTime, nullable=False)  # Exclusivo
+    filas = Column(Integer, nullable=True)
+    fecha_creacion = Column(DateTime, default=datetime.now)
+
+
+class ContadoresUsuarioDB(Base):
+    """
+    Contadores de registros por usuario (ver utils/contadores.py)
+    Se actualizan en la misma transacción que cada inserción o borrado;
+    una tarea de reconciliación corrige cualquier desviación
+    """
+    __tablename__ = "contadores_usuario"
+    
+    usuario_id = Column(Integer, ForeignKey("usuarios.id", ondelete="CASCADE"), primary_key=True)
+    moodmaps = Column(Integer, nullable=False, default=0)
+    feedbacks = Column(Integer, nullable=False, default=0)
+    interacciones = Column(Integer, nullable=False, default=0)
+    emociones_liberadas = Column(Integer, nullable=False, default=0)
+    gratitudes = Column(Integer, nullable=False, default=0)
+    destellos = Column(Integer, nullable=False, default=0)
+    fecha_actualizacion = Column(DateTime, default=datetime.now, onupdate=datetime.now)
+
+
+class ProgresoArchivoDB(Base):
+    """
+    Marca de agua del archivado incremental (ver utils/archivado.py)
+    Cada ejecución solo procesa las filas con id mayor que ultimo_id
+    """
+    __tablename__ = "progreso_archivo"
+    
+    tabla = Column(String(100), primary_key=True)  # Tabla de origen
+    ultimo_id = Column(Integer, nullable=False, default=0)  # Último id procesado (inclusive)
+    filas_archivadas = Column(Integer, nullable=False, default=0)
+    fecha_actualizacion = Column(DateTime, default=datetime.now, onupdate=datetime.now)
+
+
+class TrabajoArchivoDB(Base):
+    """
+    Trabajos de archivado en segundo plano (ver utils/trabajo_archivo.py)
+    El avance se guarda con cada lote confirmado, en su misma transacción
+    """
+    __tablename__ = "trabajos_archivo"
+    __table_args__ = (
+        # Un único trabajo activo: activo es TRUE mientras está pendiente o en
+        # curso y NULL al terminar (los NULL no chocan en un índice único)
+        Index("ix_trabajos_archivo_activo", "activo", unique=True),
+    )
+    
+    id = Column(Integer, primary_key=True, index=True)
+    estado = Column(String(20), nullable=False, default="pendiente", index=True)  # pendiente, en_curso, completado, error
+    activo = Column(Boolean, nullable=True, default=True)
+    propietario = Column(String(32), nullable=True)  # Token de quien lo ejecuta: cada actualización lo comprueba
+    fase = Column(String(30), nullable=True)  # Fase en curso
+    dias_antiguedad = Column(Integer, nullable=False)
+    fecha_limite = Column(DateTime, nullable=False)  # Fija para que una reanudación archive lo mismo
+    
+    filas_estimadas = Column(Integer, nullable=False, default=0)
+    filas_archivadas = Column(Integer, nullable=False, default=0)
+    lotes = Column(Integer, nullable=False, default=0)
+    resultado = Column(JSON, nullable=False, default=dict)  # {fase: filas} de las fases terminadas
+    error = Column(Text, nullable=True)
+    reanudaciones = Column(Integer, nullable=False, default=0)
+    
+    fecha_creacion = Column(DateTime, default=datetime.now)
+    fecha_inicio = Column(DateTime, nullable=True)
+    fecha_actualizacion = Column(DateTime, default=datetime.now)  # Latido: se renueva con cada lote
+    fecha_fin = Column(DateTime, nullable=True)
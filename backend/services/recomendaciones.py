@@ -0,0 +1,166 @@
+"""
+Tabla precalculada de recomendaciones por celda emocional
+Evita recalcular en cada petición la discretización, la urgencia y la
+lista de natural chemicals sugeridos
+
+Todas las reglas (discretización de RLService, urgencia y natural
+chemicals) son comparaciones contra umbrales fijos. Partiendo cada
+dimensión por esos umbrales se obtienen 6 x 9 x 5 = 270 celdas dentro de
+las cuales todas las reglas dan el mismo resultado, así que cada celda se
+calcula una sola vez y después es una consulta a una lista.
+"""
+
+from bisect import bisect_left, bisect_right
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+NIVELES = ("bajo", "medio", "alto")
+
+# Umbrales de las reglas con "<" (discretización, urgencia, chemicals)
+CORTES_FELICIDAD = (0.3, 0.33, 0.4, 0.5, 0.67)
+CORTES_MOTIVACION = (0.3, 0.33, 0.4, 0.67)
+CORTES_ESTRES_MENOR = (0.33, 0.67)
+# Umbrales de las reglas con ">" (urgencia, chemicals)
+CORTES_ESTRES_MAYOR = (0.5, 0.7)
+
+_BANDAS_ESTRES = (len(CORTES_ESTRES_MENOR) + 1) * (len(CORTES_ESTRES_MAYOR) + 1)
+_BANDAS_MOTIVACION = len(CORTES_MOTIVACION) + 1
+NUM_CELDAS = (len(CORTES_FELICIDAD) + 1) * _BANDAS_ESTRES * _BANDAS_MOTIVACION
+
+# Natural chemicals asociados a cada microacción
+CHEMICALS_POR_MICROACCION = {
+    "calmarse": ("serotonina", "endorfinas"),
+    "meditar": ("serotonina", "endorfinas"),
+    "animarse": ("dopamina", "serotonina"),
+    "motivarse": ("dopamina", "serotonina"),
+    "activarse": ("dopamina", "endorfinas"),
+    "ejercitarse": ("dopamina", "endorfinas"),
+    "conectarse": ("oxitocina",),
+    "socializar": ("oxitocina",),
+}
+
+
+class InfoCelda(NamedTuple):
+    """Datos derivados de una celda emocional"""
+    estado_idx: int
+    estado_discretizado: str
+    nivel_urgencia: str
+    tipo_respuesta: str
+    chemicals_estado: Tuple[str, ...]
+
+
+def indice_celda(felicidad: float, estres: float, motivacion: float) -> int:
+    """
+    Índice 0-269 de la celda que contiene el estado emocional
+
+    Args:
+        felicidad: Nivel de felicidad 0-1
+        estres: Nivel de estrés 0-1
+        motivacion: Nivel de motivación 0-1
+
+    Returns:
+        Índice de la celda
+    """
+    banda_f = bisect_right(CORTES_FELICIDAD, felicidad)
+    banda_e = (
+        bisect_right(CORTES_ESTRES_MENOR, estres) * (len(CORTES_ESTRES_MAYOR) + 1)
+        + bisect_left(CORTES_ESTRES_MAYOR, estres)
+    )
+    banda_m = bisect_right(CORTES_MOTIVACION, motivacion)
+    return (banda_f * _BANDAS_ESTRES + banda_e) * _BANDAS_MOTIVACION + banda_m
+
+
+def _categorizar(valor: float) -> int:
+    if valor < 0.33:
+        return 0
+    elif valor < 0.67:
+        return 1
+    return 2
+
+
+def calcular_urgencia(felicidad: float, estres: float, motivacion: float) -> str:
+    """
+    Calcula el nivel de urgencia según el estado emocional
+
+    Returns:
+        Nivel de urgencia: "baja", "media", "alta"
+    """
+    # Urgencia alta si el estrés es alto y felicidad/motivación bajas
+    if estres > 0.7 and (felicidad < 0.3 or motivacion < 0.3):
+        return "alta"
+
+    # Urgencia media si hay desequilibrio moderado
+    elif estres > 0.5 or (felicidad < 0.4 and motivacion < 0.4):
+        return "media"
+
+    # Urgencia baja en otros casos
+    else:
+        return "baja"
+
+
+def _chemicals_por_estado(felicidad: float, estres: float, motivacion: float) -> Tuple[str, ...]:
+    """Natural chemicals sugeridos por el estado actual (independientes de la microacción)"""
+    sugerencias = []
+
+    if estres > 0.7:
+        sugerencias.append("endorfinas")
+
+    if motivacion < 0.4:
+        sugerencias.append("dopamina")
+
+    if felicidad < 0.5:
+        sugerencias.append("serotonina")
+
+    return tuple(sugerencias)
+
+
+def _calcular_celda(felicidad: float, estres: float, motivacion: float) -> InfoCelda:
+    """Evalúa todas las reglas en un punto; vale para toda su celda"""
+    f, e, m = _categorizar(felicidad), _categorizar(estres), _categorizar(motivacion)
+    urgencia = calcular_urgencia(felicidad, estres, motivacion)
+
+    return InfoCelda(
+        estado_idx=f * 9 + e * 3 + m,
+        estado_discretizado=f"{NIVELES[f]}_{NIVELES[e]}_{NIVELES[m]}",
+        nivel_urgencia=urgencia,
+        tipo_respuesta="larga" if urgencia == "alta" else "corta",
+        chemicals_estado=_chemicals_por_estado(felicidad, estres, motivacion)
+    )
+
+
+# Se rellenan bajo demanda: la primera visita a cada celda la calcula
+_celdas: List[Optional[InfoCelda]] = [None] * NUM_CELDAS
+_chemicals: Dict[Tuple[int, str], Tuple[str, ...]] = {}
+
+
+def obtener_celda(felicidad: float, estres: float, motivacion: float) -> InfoCelda:
+    """
+    Datos precalculados de la celda del estado emocional
+
+    Returns:
+        InfoCelda con estado discretizado, urgencia, tipo de respuesta y
+        chemicals sugeridos por el estado
+    """
+    celda = indice_celda(felicidad, estres, motivacion)
+    info = _celdas[celda]
+    if info is None:
+        info = _celdas[celda] = _calcular_celda(felicidad, estres, motivacion)
+    return info
+
+
+def chemicals_sugeridos(microaccion: str, felicidad: float, estres: float, motivacion: float) -> Tuple[str, ...]:
+    """
+    Natural chemicals sugeridos (sin duplicados) para la microacción y el estado
+
+    Returns:
+        Tupla ordenada de natural chemicals
+    """
+    celda = indice_celda(felicidad, estres, motivacion)
+    clave = (celda, microaccion)
+    sugeridos = _chemicals.get(clave)
+    if sugeridos is None:
+        info = obtener_celda(felicidad, estres, motivacion)
+        sugeridos = tuple(sorted(
+            set(CHEMICALS_POR_MICROACCION.get(microaccion, ())) | set(info.chemicals_estado)
+        ))
+        _chemicals[clave] = sugeridos
+    return sugeridos
@@ -0,0 +1,419 @@
+"""
+Almacenes de Q-values para RLService
+Permiten que varios workers (o nodos) compartan una misma política
+
+- local: matriz en memoria del proceso (comportamiento histórico)
+- memoria: memoria compartida del sistema, para workers de un mismo nodo
+- bd: tabla q_valores_rl en la base de datos, para varios nodos
+
+Los almacenes compartidos aplican incrementos atómicos y mantienen una
+caché local de lectura con TTL corto: cada worker ve las actualizaciones
+del resto con un retraso máximo de RL_CACHE_TTL segundos.
+"""
+
+import os
+import tempfile
+import time
+from abc import ABC, abstractmethod
+from typing import Optional
+
+import numpy as np
+
+NUM_ESTADOS = 27
+NUM_ACCIONES = 3
+FORMA = (NUM_ESTADOS, NUM_ACCIONES)
+
+
+class AlmacenQ(ABC):
+    """Interfaz común de los almacenes de Q-values (matriz 27 x 3)"""
+
+    nombre = "base"
+
+    def __init__(self, ttl: float = 1.0):
+        """
+        Args:
+            ttl: Segundos que se reutiliza la copia local antes de releer
+        """
+        self.ttl = ttl
+        self._cache: Optional[np.ndarray] = None
+        self._leido_en = 0.0
+        # Aumenta cada vez que cambia la matriz que devuelve leer()
+        self.version = 0
+
+    def leer(self) -> np.ndarray:
+        """
+        Devuelve la matriz Q (copia local, con una antigüedad máxima de ttl)
+
+        No se debe modificar el array devuelto.
+        """
+        ahora = time.monotonic()
+        if self._cache is None or ahora - self._leido_en > self.ttl:
+            self._cache = self._leer()
+            self._leido_en = ahora
+            self.version += 1
+        return self._cache
+
+    def incrementar(self, celdas: np.ndarray, deltas: np.ndarray):
+        """
+        Suma deltas a las celdas indicadas de forma atómica
+
+        Args:
+            celdas: Índices planos estado * 3 + acción
+            deltas: Incremento de cada celda (se acumulan repetidas)
+        """
+        celdas = np.asarray(celdas, dtype=np.int64).ravel()
+        deltas = np.asarray(deltas, dtype=np.float64).ravel()
+        suma = np.bincount(celdas, weights=deltas, minlength=NUM_ESTADOS * NUM_ACCIONES)
+
+        self._incrementar(suma)
+
+        # El propio worker ve sus escrituras sin esperar al TTL
+        if self._cache is not None:
+            self._cache = self._cache + suma.reshape(FORMA)
+            self.version += 1
+
+    def reemplazar(self, q: np.ndarray):
+        """Sustituye la matriz completa (p. ej. al publicar un replay)"""
+        q = np.asarray(q, dtype=np.float64).reshape(FORMA)
+        self._reemplazar(q)
+        self._cache = q.copy()
+        self._leido_en = time.monotonic()
+        self.version += 1
+
+    def inicializar_si_vacio(self, q: np.ndarray) -> bool:
+        """
+        Siembra la matriz (p. ej. con la Q-Table publicada) solo donde el
+        almacén sigue vacío. Cada worker lo llama al arrancar: con un almacén
+        compartido, reiniciar o añadir workers no pisa lo aprendido online.
+
+        Returns:
+            True si se sembró algo
+        """
+        q = np.asarray(q, dtype=np.float64).reshape(FORMA)
+        sembrado = self._inicializar_si_vacio(q)
+        if sembrado:
+            # Releer en la próxima lectura: puede haberse sembrado solo una parte
+            self._cache = None
+        return sembrado
+
+    @abstractmethod
+    def _leer(self) -> np.ndarray:
+        """Matriz completa del almacén"""
+
+    @abstractmethod
+    def _incrementar(self, suma: np.ndarray):
+        """Suma atómica de la matriz plana suma (81 valores)"""
+
+    @abstractmethod
+    def _reemplazar(self, q: np.ndarray):
+        """Sustituye la matriz completa"""
+
+    @abstractmethod
+    def _inicializar_si_vacio(self, q: np.ndarray) -> bool:
+        """Escribe q solo si el almacén está vacío; True si escribió"""
+
+
+class AlmacenQLocal(AlmacenQ):
+    """Q-values en memoria del proceso, sin caché ni bloqueos"""
+
+    nombre = "local"
+
+    def __init__(self):
+        super().__init__(ttl=0.0)
+        self._q = np.zeros(FORMA)
+
+    def leer(self) -> np.ndarray:
+        return self._q
+
+    def incrementar(self, celdas: np.ndarray, deltas: np.ndarray):
+        np.add.at(self._q.ravel(), np.asarray(celdas).ravel(), np.asarray(deltas, dtype=np.float64).ravel())
+        self.version += 1
+
+    def reemplazar(self, q: np.ndarray):
+        self._reemplazar(np.asarray(q, dtype=np.float64).reshape(FORMA))
+        self.version += 1
+
+    def inicializar_si_vacio(self, q: np.ndarray) -> bool:
+        sembrado = self._inicializar_si_vacio(np.asarray(q, dtype=np.float64).reshape(FORMA))
+        if sembrado:
+            self.version += 1
+        return sembrado
+
+    def _leer(self) -> np.ndarray:
+        return self._q
+
+    def _incrementar(self, suma: np.ndarray):
+        self._q += suma.reshape(FORMA)
+
+    def _reemplazar(self, q: np.ndarray):
+        self._q = q.copy()
+
+    def _inicializar_si_vacio(self, q: np.ndarray) -> bool:
+        if self._q.any():
+            return False
+        self._reemplazar(q)
+        return True
+
+
+class _BloqueoArchivo:
+    """Bloqueo exclusivo entre procesos sobre un archivo (Linux/Mac y Windows)"""
+
+    def __init__(self, ruta: str):
+        self._archivo = open(ruta, "a+b")
+
+    def __enter__(self):
+        if os.name == "nt":
+            import msvcrt
+            self._archivo.seek(0)
+            msvcrt.locking(self._archivo.fileno(), msvcrt.LK_LOCK, 1)
+        else:
+            import fcntl
+            fcntl.flock(self._archivo.fileno(), fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, *exc):
+        if os.name == "nt":
+            import msvcrt
+            self._archivo.seek(0)
+            msvcrt.locking(self._archivo.fileno(), msvcrt.LK_UNLCK, 1)
+        else:
+            import fcntl
+            fcntl.flock(self._archivo.fileno(), fcntl.LOCK_UN)
+
+
+class AlmacenQMemoriaCompartida(AlmacenQ):
+    """
+    Q-values en memoria compartida del sistema operativo
+
+    Todos los workers de uvicorn del mismo nodo abren el mismo bloque por
+    nombre. Las escrituras se serializan con un bloqueo de archivo.
+    """
+
+    nombre = "memoria"
+
+    def __init__(self, nombre: str = "luz_rl_q", ttl: float = 1.0):
+        super().__init__(ttl=ttl)
+        from multiprocessing import shared_memory
+
+        tamano = NUM_ESTADOS * NUM_ACCIONES * 8
+        self._bloqueo = _BloqueoArchivo(os.path.join(tempfile.gettempdir(), f"{nombre}.lock"))
+
+        with self._bloqueo:
+            try:
+                self._memoria = shared_memory.SharedMemory(name=nombre, create=True, size=tamano)
+                creada = True
+            except FileExistsError:
+                self._memoria = shared_memory.SharedMemory(name=nombre)
+                creada = False
+
+            self._vista = np.ndarray(FORMA, dtype=np.float64, buffer=self._memoria.buf)
+            if creada:
+                self._vista[:] = 0.0
+
+        # El bloque debe sobrevivir a cualquier worker concreto: que el
+        # resource_tracker de este proceso no lo borre al terminar
+        try:
+            from multiprocessing import resource_tracker
+            resource_tracker.unregister(self._memoria._name, "shared_memory")
+        except Exception:
+            pass
+
+    def _leer(self) -> np.ndarray:
+        return self._vista.copy()
+
+    def _incrementar(self, suma: np.ndarray):
+        with self._bloqueo:
+            self._vista += suma.reshape(FORMA)
+
+    def _reemplazar(self, q: np.ndarray):
+        with self._bloqueo:
+            self._vista[:] = q
+
+    def _inicializar_si_vacio(self, q: np.ndarray) -> bool:
+        # Bajo el bloqueo: ningún incremento se cuela entre la comprobación y la escritura
+        with self._bloqueo:
+            if self._vista.any():
+                return False
+            self._vista[:] = q
+            return True
+
+
+class AlmacenQBaseDatos(AlmacenQ):
+    """
+    Q-values en la tabla q_valores_rl, compartidos entre nodos
+
+    Los incrementos son UPDATE ... SET valor = valor + :delta, atómicos
+    por fila en SQLite y PostgreSQL. Un KV externo puede sustituir a esta
+    clase implementando los mismos métodos abstractos.
+    """
+
+    nombre = "bd"
+
+    def __init__(self, session_factory=None, ttl: float = 1.0):
+        super().__init__(ttl=ttl)
+        if session_factory is None:
+            from database import SessionLocal
+            session_factory = SessionLocal
+        self._session_factory = session_factory
+        self._inicializar()
+
+    def _inicializar(self):
+        """Crea la tabla si no existe y siembra las 81 filas a 0"""
+        from sqlalchemy.exc import IntegrityError
+        from models.db_models import QValorRLDB
+        from services.rl_service import ESTADOS, ACCIONES
+
+        db = self._session_factory()
+        try:
+            QValorRLDB.__table__.create(bind=db.get_bind(), checkfirst=True)
+            existentes = {
+                (estado, accion)
+                for estado, accion in db.query(QValorRLDB.estado_discretizado, QValorRLDB.microaccion).all()
+            }
+            for estado in ESTADOS:
+                for accion in ACCIONES:
+                    if (estado, accion) not in existentes:
+                        db.add(QValorRLDB(estado_discretizado=estado, microaccion=accion, valor=0.0))
+            db.commit()
+        except IntegrityError:
+            # Otro worker sembró las mismas filas a la vez; cualquier otro
+            # error se propaga: sin filas los UPDATE no actualizarían nada
+            db.rollback()
+        finally:
+            db.close()
+
+    def _leer(self) -> np.ndarray:
+        from models.db_models import QValorRLDB
+        from services.rl_service import ESTADOS, ACCIONES
+
+        indice_estado = {estado: i for i, estado in enumerate(ESTADOS)}
+        indice_accion = {accion: j for j, accion in enumerate(ACCIONES)}
+        q = np.zeros(FORMA)
+
+        db = self._session_factory()
+        try:
+            filas = db.query(
+                QValorRLDB.estado_discretizado, QValorRLDB.microaccion, QValorRLDB.valor
+            ).all()
+        finally:
+            db.close()
+
+        for estado, accion, valor in filas:
+            if estado in indice_estado and accion in indice_accion:
+                q[indice_estado[estado], indice_accion[accion]] = valor
+        return q
+
+    def _incrementar(self, suma: np.ndarray):
+        from sqlalchemy import update, bindparam
+        from models.db_models import QValorRLDB
+        from services.rl_service import ESTADOS, ACCIONES
+
+        parametros = [
+            {
+                "p_estado": ESTADOS[celda // NUM_ACCIONES],
+                "p_accion": ACCIONES[celda % NUM_ACCIONES],
+                "p_delta": float(suma[celda])
+            }
+            for celda in np.flatnonzero(suma)
+        ]
+        if not parametros:
+            return
+
+        sentencia = update(QValorRLDB.__table__).where(
+            QValorRLDB.__table__.c.estado_discretizado == bindparam("p_estado"),
+            QValorRLDB.__table__.c.microaccion == bindparam("p_accion")
+        ).values(
+            valor=QValorRLDB.__table__.c.valor + bindparam("p_delta"),
+            actualizaciones=QValorRLDB.__table__.c.actualizaciones + 1
+        )
+
+        db = self._session_factory()
+        try:
+            db.execute(sentencia, parametros)
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+    def _reemplazar(self, q: np.ndarray):
+        from sqlalchemy import update, bindparam
+        from models.db_models import QValorRLDB
+        from services.rl_service import ESTADOS, ACCIONES
+
+        parametros = [
+            {"p_estado": estado, "p_accion": accion, "p_valor": float(q[i, j])}
+            for i, estado in enumerate(ESTADOS)
+            for j, accion in enumerate(ACCIONES)
+        ]
+        sentencia = update(QValorRLDB.__table__).where(
+            QValorRLDB.__table__.c.estado_discretizado == bindparam("p_estado"),
+            QValorRLDB.__table__.c.microaccion == bindparam("p_accion")
+        ).values(valor=bindparam("p_valor"))
+
+        db = self._session_factory()
+        try:
+            db.execute(sentencia, parametros)
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+
+    def _inicializar_si_vacio(self, q: np.ndarray) -> bool:
+        from sqlalchemy import update, bindparam
+        from models.db_models import QValorRLDB
+        from services.rl_service import ESTADOS, ACCIONES
+
+        tabla = QValorRLDB.__table__
+        parametros = [
+            {"p_estado": estado, "p_accion": accion, "p_valor": float(q[i, j])}
+            for i, estado in enumerate(ESTADOS)
+            for j, accion in enumerate(ACCIONES)
+        ]
+        # Fila a fila y en el mismo UPDATE: solo las celdas que nadie ha
+        # tocado (ni incrementos online ni una siembra anterior)
+        sentencia = update(tabla).where(
+            tabla.c.estado_discretizado == bindparam("p_estado"),
+            tabla.c.microaccion == bindparam("p_accion"),
+            tabla.c.actualizaciones == 0,
+            tabla.c.valor == 0.0
+        ).values(valor=bindparam("p_valor"))
+
+        db = self._session_factory()
+        try:
+            sembradas = db.execute(sentencia, parametros).rowcount
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+        return sembradas > 0
+
+
+def crear_almacen(nombre: Optional[str] = None) -> AlmacenQ:
+    """
+    Crea el almacén configurado
+
+    Args:
+        nombre: "local", "memoria" o "bd". Si es None se lee RL_ALMACEN.
+                El TTL de la caché se lee de RL_CACHE_TTL (segundos).
+
+    Returns:
+        Instancia del almacén
+    """
+    nombre = (nombre or os.getenv("RL_ALMACEN", "local")).lower()
+    ttl = float(os.getenv("RL_CACHE_TTL", "1.0"))
+
+    if nombre == "local":
+        return AlmacenQLocal()
+    if nombre == "memoria":
+        return AlmacenQMemoriaCompartida(os.getenv("RL_MEMORIA_NOMBRE", "luz_rl_q"), ttl=ttl)
+    if nombre == "bd":
+        return AlmacenQBaseDatos(ttl=ttl)
+
+    raise ValueError(f"Almacén RL desconocido: {nombre}. Opciones: local, memoria, bd")
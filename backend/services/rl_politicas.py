@@ -0,0 +1,195 @@
+"""
+Políticas intercambiables para RLService
+Permiten sustituir la Q-Table discretizada por un bandit contextual
+que usa directamente los valores continuos del MoodMap
+"""
+
+import os
+from abc import ABC, abstractmethod
+from typing import Optional, Sequence
+
+import numpy as np
+
+
+class PoliticaRL(ABC):
+    """
+    Interfaz común de las políticas de selección de microacciones
+
+    El contexto es el MoodMap continuo como array (felicidad, estres,
+    motivacion); las recompensas llegan normalizadas a 0-1.
+    """
+
+    nombre = "base"
+
+    def __init__(self, acciones: Sequence[str]):
+        self.acciones = list(acciones)
+
+    @abstractmethod
+    def valores(self, contextos: np.ndarray) -> np.ndarray:
+        """
+        Valor estimado de cada acción para cada contexto
+
+        Args:
+            contextos: Array (N, 3)
+
+        Returns:
+            Array (N, acciones)
+        """
+
+    @abstractmethod
+    def seleccionar_lote(self, contextos: np.ndarray, rng=None) -> np.ndarray:
+        """
+        Elige una acción para cada contexto
+
+        Args:
+            contextos: Array (N, 3)
+            rng: Generador de NumPy (opcional)
+
+        Returns:
+            Índices de acción (N,)
+        """
+
+    @abstractmethod
+    def actualizar(self, contexto: np.ndarray, accion: int, recompensa: float):
+        """
+        Aprende de una única recompensa
+
+        Args:
+            contexto: Array (3,)
+            accion: Índice de la acción ejecutada
+            recompensa: Recompensa normalizada 0-1
+        """
+
+    def actualizar_lote(self, contextos: np.ndarray, acciones: np.ndarray, recompensas: np.ndarray):
+        """Aprende de un lote de recompensas (por defecto, una a una)"""
+        for contexto, accion, recompensa in zip(contextos, acciones, recompensas):
+            self.actualizar(contexto, int(accion), float(recompensa))
+
+    def seleccionar(self, contexto: np.ndarray, rng=None) -> int:
+        """Elige la acción para un único contexto"""
+        return int(self.seleccionar_lote(np.atleast_2d(contexto), rng)[0])
+
+
+def caracteristicas(contextos: np.ndarray) -> np.ndarray:
+    """
+    Vector de características del bandit: sesgo, valores y sus interacciones
+
+    Args:
+        contextos: Array (N, 3) o (3,) con felicidad, estres, motivacion
+
+    Returns:
+        Array (N, 7)
+    """
+    x = np.atleast_2d(np.asarray(contextos, dtype=np.float64))
+    f, e, m = x[:, 0], x[:, 1], x[:, 2]
+    return np.column_stack([np.ones(len(x)), f, e, m, f * e, f * m, e * m])
+
+
+DIMENSION = 7
+
+
+class PoliticaLinUCB(PoliticaRL):
+    """
+    Bandit contextual LinUCB (un modelo lineal por acción)
+
+    Se mantiene directamente A⁻¹ de cada acción. Cada recompensa aplica
+    una actualización de rango 1 con Sherman–Morrison, O(d²) y sin
+    invertir matrices:
+
+        A⁻¹ ← A⁻¹ - (A⁻¹x)(A⁻¹x)ᵀ / (1 + xᵀA⁻¹x)
+    """
+
+    nombre = "linucb"
+
+    def __init__(self, acciones: Sequence[str], alpha: float = 0.5, regularizacion: float = 1.0):
+        """
+        Args:
+            acciones: Nombres de las microacciones
+            alpha: Peso de la cota de confianza (exploración)
+            regularizacion: λ de la regularización ridge (A = λI al inicio)
+        """
+        super().__init__(acciones)
+        k = len(self.acciones)
+        self.alpha = alpha
+        self.A = np.repeat(np.eye(DIMENSION)[None] * regularizacion, k, axis=0)
+        self.A_inv = np.repeat(np.eye(DIMENSION)[None] / regularizacion, k, axis=0)
+        self.b = np.zeros((k, DIMENSION))
+        self.theta = np.zeros((k, DIMENSION))
+        self.actualizaciones = 0
+
+    def valores(self, contextos: np.ndarray) -> np.ndarray:
+        return caracteristicas(contextos) @ self.theta.T
+
+    def puntuaciones(self, contextos: np.ndarray) -> np.ndarray:
+        """Media estimada + alpha · desviación (cota superior de confianza)"""
+        x = caracteristicas(contextos)
+        media = x @ self.theta.T
+        varianza = np.einsum("nd,kde,ne->nk", x, self.A_inv, x)
+        return media + self.alpha * np.sqrt(np.maximum(varianza, 0.0))
+
+    def seleccionar_lote(self, contextos: np.ndarray, rng=None) -> np.ndarray:
+        return self.puntuaciones(contextos).argmax(axis=1)
+
+    def actualizar(self, contexto: np.ndarray, accion: int, recompensa: float):
+        x = caracteristicas(contexto)[0]
+        a_inv = self.A_inv[accion]
+
+        u = a_inv @ x
+        a_inv -= np.outer(u, u) / (1.0 + x @ u)
+        self.A[accion] += np.outer(x, x)
+        self.b[accion] += recompensa * x
+        self.theta[accion] = a_inv @ self.b[accion]
+        self.actualizaciones += 1
+
+    def actualizar_lote(self, contextos: np.ndarray, acciones: np.ndarray, recompensas: np.ndarray):
+        """
+        Actualización en lote (simulador, replay)
+
+        Aplica las mismas actualizaciones de rango 1 que actualizar, en orden,
+        sin invertir A: invertir A acumulada pierde precisión cuando está mal
+        condicionada. b y θ se recalculan una vez por acción.
+        """
+        x = caracteristicas(contextos)
+        acciones = np.asarray(acciones)
+        recompensas = np.asarray(recompensas, dtype=np.float64)
+
+        for j in np.unique(acciones):
+            mascara = acciones == j
+            xj = x[mascara]
+            a_inv = self.A_inv[j]
+            for fila in xj:
+                u = a_inv @ fila
+                a_inv -= np.outer(u, u) / (1.0 + fila @ u)
+            self.A[j] += xj.T @ xj
+            self.b[j] += xj.T @ recompensas[mascara]
+            self.theta[j] = a_inv @ self.b[j]
+
+        self.actualizaciones += len(x)
+
+POLITICAS = {
+    PoliticaLinUCB.nombre: PoliticaLinUCB,
+}
+
+
+def crear_politica(nombre: Optional[str], acciones: Sequence[str]) -> Optional[PoliticaRL]:
+    """
+    Crea la política configurada
+
+    Args:
+        nombre: "qlearning" (Q-Table propia de RLService) o "linucb".
+                Si es None se lee de la variable de entorno RL_POLITICA.
+        acciones: Microacciones disponibles
+
+    Returns:
+        Instancia de la política, o None para usar la Q-Table de RLService
+    """
+    nombre = (nombre or os.getenv("RL_POLITICA", "qlearning")).lower()
+
+    if nombre == "qlearning":
+        return None
+
+    if nombre not in POLITICAS:
+        opciones = ", ".join(["qlearning", *POLITICAS])
+        raise ValueError(f"Política RL desconocida: {nombre}. Opciones: {opciones}")
+
+    return POLITICAS[nombre](acciones)
@@ -0,0 +1,415 @@
+"""
+Replay offline de Q-Learning a partir del histórico de feedback
+Reconstruye la política de RLService desde FeedbackDB sin pasar por la API
+
+Uso:
+    python -m services.rl_replay --epocas 20 --salida q_table.json
+    python -m services.rl_replay --metodo q_learning --publicar
+"""
+
+import argparse
+import json
+import sys
+import time
+from datetime import datetime
+from typing import Dict, Iterator, Optional
+
+import numpy as np
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from models.db_models import ConfiguracionRLDB
+from services.rl_service import (
+    ACCIONES, ESTADOS, indices_estado, matriz_a_q_table
+)
+
+NUM_ESTADOS = len(ESTADOS)
+NUM_ACCIONES = len(ACCIONES)
+# Índice extra para transiciones sin moodmap_posterior (estado terminal)
+TERMINAL = NUM_ESTADOS
+
+METODOS = ("fitted_q", "q_learning")
+
+
+class EstadisticasTransiciones:
+    """
+    Estadísticos suficientes de las transiciones (s, a, r, s')
+
+    El objetivo r + γ·max Q(s') solo depende de s', así que basta con
+    acumular por par (estado, acción): número de muestras, suma de
+    recompensas y conteo de estados siguientes. Cada época de entrenamiento
+    cuesta O(estados² × acciones) sin importar cuántas transiciones haya.
+    """
+
+    def __init__(self):
+        self.conteos = np.zeros((NUM_ESTADOS, NUM_ACCIONES), dtype=np.int64)
+        self.suma_recompensas = np.zeros((NUM_ESTADOS, NUM_ACCIONES))
+        self.siguientes = np.zeros((NUM_ESTADOS, NUM_ACCIONES, NUM_ESTADOS + 1), dtype=np.int64)
+        # Filas de feedback mal formadas que no entraron en los estadísticos
+        self.descartadas = 0
+
+    @property
+    def total(self) -> int:
+        return int(self.conteos.sum())
+
+    def acumular(
+        self,
+        estados: np.ndarray,
+        acciones: np.ndarray,
+        recompensas: np.ndarray,
+        siguientes: np.ndarray,
+        descartadas: int = 0
+    ):
+        """
+        Acumula un lote de transiciones vectorizado
+
+        Args:
+            estados: Índices de estado previo (0-26)
+            acciones: Índices de acción sobre ACCIONES
+            recompensas: Recompensas normalizadas 0-1
+            siguientes: Índices de estado posterior, TERMINAL si no hay
+            descartadas: Filas mal formadas del lote (solo se cuentan)
+        """
+        self.descartadas += descartadas
+        celdas = estados * NUM_ACCIONES + acciones
+        total_celdas = NUM_ESTADOS * NUM_ACCIONES
+
+        self.conteos += np.bincount(celdas, minlength=total_celdas).reshape(self.conteos.shape)
+        self.suma_recompensas += np.bincount(
+            celdas, weights=recompensas, minlength=total_celdas
+        ).reshape(self.suma_recompensas.shape)
+        self.siguientes += np.bincount(
+            celdas * (NUM_ESTADOS + 1) + siguientes,
+            minlength=total_celdas * (NUM_ESTADOS + 1)
+        ).reshape(self.siguientes.shape)
+
+
+def _valores_moodmap(moodmap) -> Optional[tuple]:
+    """
+    (felicidad, estres, motivacion) de un MoodMap guardado como JSON
+
+    Returns:
+        Tupla de floats, o None si el JSON no tiene la forma esperada
+    """
+    try:
+        valores = (
+            float(moodmap["felicidad"]),
+            float(moodmap["estres"]),
+            float(moodmap["motivacion"])
+        )
+    except (KeyError, TypeError, ValueError):
+        return None
+    return valores if all(np.isfinite(valores)) else None
+
+
+def lote_a_transiciones(filas) -> Dict[str, np.ndarray]:
+    """
+    Convierte filas de FeedbackDB en arrays de transición
+
+    Las filas con un MoodMap (previo o posterior) o unas valoraciones mal
+    formadas se descartan y se cuentan en lugar de abortar el replay.
+
+    Args:
+        filas: Filas (microaccion, efectividad, comodidad, energia,
+               moodmap_previo, moodmap_posterior)
+
+    Returns:
+        Diccionario con arrays estados, acciones, recompensas, siguientes
+        y el número de filas descartadas
+    """
+    indice_accion = {accion: i for i, accion in enumerate(ACCIONES)}
+    acciones, valoraciones, previos, posteriores, tiene_posterior = [], [], [], [], []
+    descartadas = 0
+
+    for f in filas:
+        previo = _valores_moodmap(f[4])
+        posterior = _valores_moodmap(f[5]) if f[5] else (0.0, 0.0, 0.0)
+        try:
+            valoracion = (float(f[1]), float(f[2]), float(f[3]))
+        except (TypeError, ValueError):
+            valoracion = None
+        if previo is None or posterior is None or valoracion is None or f[0] not in indice_accion:
+            descartadas += 1
+            continue
+        acciones.append(indice_accion[f[0]])
+        valoraciones.append(valoracion)
+        previos.append(previo)
+        posteriores.append(posterior)
+        tiene_posterior.append(bool(f[5]))
+
+    n = len(acciones)
+    acciones = np.array(acciones, dtype=np.int64)
+    valoraciones = np.array(valoraciones, dtype=np.float64).reshape(n, 3)
+    previos = np.array(previos, dtype=np.float64).reshape(n, 3)
+    posteriores = np.array(posteriores, dtype=np.float64).reshape(n, 3)
+    tiene_posterior = np.array(tiene_posterior, dtype=bool)
+
+    # Misma recompensa que /feedback/enviar, normalizada igual que actualizar_politica
+    recompensas = (valoraciones.mean(axis=1) - 1) / 4.0
+
+    siguientes = np.where(
+        tiene_posterior,
+        indices_estado(posteriores[:, 0], posteriores[:, 1], posteriores[:, 2]),
+        TERMINAL
+    )
+
+    return {
+        "estados": indices_estado(previos[:, 0], previos[:, 1], previos[:, 2]),
+        "acciones": acciones,
+        "recompensas": recompensas,
+        "siguientes": siguientes,
+        "descartadas": descartadas
+    }
+
+
+def iterar_lotes_feedback(db: Session, tamano_lote: int = 50_000) -> Iterator[Dict[str, np.ndarray]]:
+    """
+    Recorre FeedbackDB en lotes con un cursor de servidor
+
+    Solo se usan feedbacks de microacciones conocidas por RLService
+    (los de /feedback/procesar-actividad tienen otro formato).
+
+    Args:
+        db: Sesión de base de datos
+        tamano_lote: Filas por lote
+
+    Yields:
+        Arrays de transición de cada lote
+    """
+    from utils.particiones import seleccionar_rango
+    
+    # Tabla caliente y particiones mensuales rotadas (DB_PARTICIONES en SQLite)
+    feedbacks = seleccionar_rango(db.connection(), "feedbacks")
+    consulta = select(
+        feedbacks.c.microaccion,
+        feedbacks.c.efectividad,
+        feedbacks.c.comodidad,
+        feedbacks.c.energia,
+        feedbacks.c.moodmap_previo,
+        feedbacks.c.moodmap_posterior
+    ).where(
+        feedbacks.c.microaccion.in_(ACCIONES),
+        feedbacks.c.moodmap_previo.isnot(None)
+    ).order_by(feedbacks.c.id).execution_options(yield_per=tamano_lote)
+    
+    for filas in db.execute(consulta).partitions():
+        yield lote_a_transiciones(filas)
+
+
+def cargar_estadisticas(db: Session, tamano_lote: int = 50_000) -> EstadisticasTransiciones:
+    """
+    Lee todo el feedback en lotes y acumula sus estadísticos
+
+    Args:
+        db: Sesión de base de datos
+        tamano_lote: Filas por lote
+
+    Returns:
+        Estadísticos de transición acumulados
+    """
+    estadisticas = EstadisticasTransiciones()
+    for lote in iterar_lotes_feedback(db, tamano_lote):
+        estadisticas.acumular(**lote)
+    return estadisticas
+
+
+def entrenar_q(
+    estadisticas: EstadisticasTransiciones,
+    epocas: int = 20,
+    alpha: float = 0.1,
+    gamma: float = 0.9,
+    metodo: str = "fitted_q",
+    q_inicial: Optional[np.ndarray] = None
+) -> np.ndarray:
+    """
+    Entrena la Q-Table en lote sobre las transiciones acumuladas
+
+    - fitted_q: en cada época Q(s,a) pasa a ser el objetivo medio
+      r + γ·max Q(s') de sus transiciones.
+    - q_learning: equivale a aplicar las n actualizaciones secuenciales
+      de RLService.actualizar_politica con el objetivo congelado en la
+      época, es decir Q ← Q + (1 - (1-α)^n)·(objetivo - Q).
+
+    Args:
+        estadisticas: Estadísticos de transición
+        epocas: Número de pasadas sobre los datos
+        alpha: Tasa de aprendizaje (solo q_learning)
+        gamma: Factor de descuento
+        metodo: "fitted_q" o "q_learning"
+        q_inicial: Q-Table inicial (27 x 3), ceros por defecto
+
+    Returns:
+        Matriz Q de forma (27, 3)
+    """
+    if metodo not in METODOS:
+        raise ValueError(f"Método desconocido: {metodo}. Opciones: {', '.join(METODOS)}")
+
+    q = np.zeros((NUM_ESTADOS, NUM_ACCIONES)) if q_inicial is None else q_inicial.astype(np.float64).copy()
+
+    conteos = estadisticas.conteos
+    visitados = conteos > 0
+    divisor = np.maximum(conteos, 1)
+    recompensa_media = estadisticas.suma_recompensas / divisor
+    # P(s' | s, a), sin la columna terminal (su valor futuro es 0)
+    transicion = estadisticas.siguientes[:, :, :NUM_ESTADOS] / divisor[:, :, None]
+    paso = 1.0 - (1.0 - alpha) ** conteos
+
+    for _ in range(epocas):
+        valor_futuro = transicion @ q.max(axis=1)
+        objetivo = recompensa_media + gamma * valor_futuro
+
+        if metodo == "fitted_q":
+            q = np.where(visitados, objetivo, q)
+        else:
+            q = q + paso * (objetivo - q)
+
+    return q
+
+
+def publicar_q_table(db: Session, q_table: Dict[str, Dict[str, float]], rl_service=None) -> int:
+    """
+    Guarda la Q-Table en ConfiguracionRLDB y la carga en el servicio en marcha
+
+    Args:
+        db: Sesión de base de datos
+        q_table: Q-Table a publicar
+        rl_service: Instancia de RLService a actualizar (opcional)
+
+    Returns:
+        Número de estados guardados
+    """
+    existentes = {
+        config.estado_discretizado: config
+        for config in db.query(ConfiguracionRLDB).filter(
+            ConfiguracionRLDB.estado_discretizado.in_(list(q_table.keys()))
+        ).all()
+    }
+
+    for estado, q_values in q_table.items():
+        config = existentes.get(estado)
+        if config:
+            config.q_values = q_values
+            config.ultima_actualizacion = datetime.now()
+        else:
+            db.add(ConfiguracionRLDB(estado_discretizado=estado, q_values=q_values))
+
+    db.commit()
+
+    if rl_service is not None and hasattr(rl_service, "cargar_q_table"):
+        rl_service.cargar_q_table(q_table)
+
+    return len(q_table)
+
+
+def cargar_q_table_publicada(db: Session) -> Dict[str, Dict[str, float]]:
+    """
+    Lee la Q-Table publicada en ConfiguracionRLDB
+
+    Returns:
+        Q-Table con los estados conocidos (vacía si no hay ninguna)
+    """
+    configs = db.query(ConfiguracionRLDB).filter(
+        ConfiguracionRLDB.estado_discretizado.in_(ESTADOS)
+    ).all()
+    return {config.estado_discretizado: config.q_values for config in configs}
+
+
+def ejecutar_replay(
+    db: Session,
+    epocas: int = 20,
+    alpha: float = 0.1,
+    gamma: float = 0.9,
+    metodo: str = "fitted_q",
+    tamano_lote: int = 50_000,
+    publicar: bool = False,
+    rl_service=None
+) -> Dict:
+    """
+    Ejecuta el replay completo: lectura en lotes, entrenamiento y publicación
+
+    Args:
+        db: Sesión de base de datos
+        epocas: Número de épocas de entrenamiento
+        alpha: Tasa de aprendizaje
+        gamma: Factor de descuento
+        metodo: "fitted_q" o "q_learning"
+        tamano_lote: Filas de feedback por lote
+        publicar: Si True, guarda la Q-Table y la carga en rl_service
+        rl_service: Instancia de RLService en marcha (opcional)
+
+    Returns:
+        Diccionario con la Q-Table y métricas del replay
+    """
+    inicio = time.perf_counter()
+    estadisticas = cargar_estadisticas(db, tamano_lote)
+    tiempo_lectura = time.perf_counter() - inicio
+
+    inicio = time.perf_counter()
+    q = entrenar_q(estadisticas, epocas=epocas, alpha=alpha, gamma=gamma, metodo=metodo)
+    tiempo_entrenamiento = time.perf_counter() - inicio
+
+    q_table = matriz_a_q_table(q)
+    estados_publicados = publicar_q_table(db, q_table, rl_service) if publicar else 0
+
+    return {
+        "metodo": metodo,
+        "epocas": epocas,
+        "transiciones": estadisticas.total,
+        "descartadas": estadisticas.descartadas,
+        "estados_visitados": int((estadisticas.conteos.sum(axis=1) > 0).sum()),
+        "tiempo_lectura_s": round(tiempo_lectura, 3),
+        "tiempo_entrenamiento_s": round(tiempo_entrenamiento, 3),
+        "publicada": publicar,
+        "estados_publicados": estados_publicados,
+        "q_table": q_table
+    }
+
+
+def main(argv=None) -> int:
+    """CLI del replay offline"""
+    parser = argparse.ArgumentParser(description="Replay offline de Q-Learning desde FeedbackDB")
+    parser.add_argument("--epocas", type=int, default=20)
+    parser.add_argument("--alpha", type=float, default=0.1)
+    parser.add_argument("--gamma", type=float, default=0.9)
+    parser.add_argument("--metodo", choices=METODOS, default="fitted_q")
+    parser.add_argument("--lote", type=int, default=50_000, help="Filas por lote de lectura")
+    parser.add_argument("--salida", help="Ruta del JSON con la Q-Table resultante")
+    parser.add_argument("--publicar", action="store_true", help="Guardar la Q-Table en configuracion_rl")
+    args = parser.parse_args(argv)
+
+    from database import SessionLocal
+
+    db = SessionLocal()
+    try:
+        resultado = ejecutar_replay(
+            db,
+            epocas=args.epocas,
+            alpha=args.alpha,
+            gamma=args.gamma,
+            metodo=args.metodo,
+            tamano_lote=args.lote,
+            publicar=args.publicar
+        )
+    finally:
+        db.close()
+
+    print(f"✓ Replay {resultado['metodo']} completado")
+    print(f"  - Transiciones: {resultado['transiciones']}")
+    if resultado["descartadas"]:
+        print(f"⚠️ Feedbacks mal formados descartados: {resultado['descartadas']}")
+    print(f"  - Estados visitados: {resultado['estados_visitados']}/{NUM_ESTADOS}")
+    print(f"  - Lectura: {resultado['tiempo_lectura_s']}s, entrenamiento: {resultado['tiempo_entrenamiento_s']}s")
+
+    if args.salida:
+        with open(args.salida, "w", encoding="utf-8") as f:
+            json.dump(resultado["q_table"], f, indent=2, ensure_ascii=False)
+        print(f"✓ Q-Table guardada en {args.salida}")
+
+    if args.publicar:
+        print(f"✓ Q-Table publicada en configuracion_rl ({resultado['estados_publicados']} estados)")
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -4,11 +4,58 @@ Política adaptativa para seleccionar microacciones óptimas
 """
 
 import numpy as np
-from typing import Dict, List
+from typing import Dict, List, Optional
 from collections import defaultdict
 import random
 
 from models.usuario import MoodMap
+from services.rl_politicas import PoliticaRL, crear_politica
+from services.rl_almacen import AlmacenQ, crear_almacen
+from services.recomendaciones import obtener_celda, calcular_urgencia
+
+
+# Discretización compartida: 3 niveles por dimensión → 27 estados posibles
+NIVELES = ("bajo", "medio", "alto")
+UMBRALES = (0.33, 0.67)
+ESTADOS = [f"{f}_{e}_{m}" for f in NIVELES for e in NIVELES for m in NIVELES]
+ACCIONES = ["calmarse", "animarse", "activarse"]
+INDICE_ESTADO = {estado: i for i, estado in enumerate(ESTADOS)}
+
+
+def indices_estado(felicidad, estres, motivacion) -> np.ndarray:
+    """
+    Discretiza MoodMaps (escalares o arrays) en índices de estado;
+    RLService._discretizar_estado la usa para el caso de uno
+
+    Args:
+        felicidad: Valores de felicidad (escalar o array)
+        estres: Valores de estrés (escalar o array)
+        motivacion: Valores de motivación (escalar o array)
+
+    Returns:
+        Array de índices 0-26 sobre ESTADOS
+    """
+    f = np.digitize(felicidad, UMBRALES)
+    e = np.digitize(estres, UMBRALES)
+    m = np.digitize(motivacion, UMBRALES)
+    return f * 9 + e * 3 + m
+
+
+def matriz_a_q_table(q: np.ndarray) -> Dict[str, Dict[str, float]]:
+    """Convierte una matriz Q (27, 3) en el formato de RLService.q_table"""
+    return {
+        estado: {accion: float(q[i, j]) for j, accion in enumerate(ACCIONES)}
+        for i, estado in enumerate(ESTADOS)
+    }
+
+
+def q_table_a_matriz(q_table: Dict[str, Dict[str, float]]) -> np.ndarray:
+    """Convierte una Q-Table en diccionario a matriz (27, 3)"""
+    q = np.zeros((len(ESTADOS), len(ACCIONES)))
+    for i, estado in enumerate(ESTADOS):
+        if estado in q_table:
+            q[i] = [q_table[estado].get(accion, 0.0) for accion in ACCIONES]
+    return q
 
 
 class RLService:
@@ -17,14 +64,26 @@ class RLService:
     Aprende qué microacciones son más efectivas según el estado emocional
     """
     
-    def __init__(self):
-        """Inicializa el agente de RL"""
+    def __init__(self, politica: Optional[str] = None, almacen: Optional[str] = None):
+        """
+        Inicializa el agente de RL
+        
+        Args:
+            politica: "qlearning" (Q-Table, por defecto) o un backend de
+                      rl_politicas como "linucb". Si es None se usa RL_POLITICA.
+            almacen: Dónde viven los Q-values: "local" (por defecto),
+                     "memoria" o "bd" (ver rl_almacen). Si es None se usa RL_ALMACEN.
+        """
         # Microacciones disponibles
-        self.acciones = ["calmarse", "animarse", "activarse"]
+        self.acciones = list(ACCIONES)
+        
+        # Backend alternativo a la Q-Table (None = Q-Learning discretizado)
+        self.politica: Optional[PoliticaRL] = crear_politica(politica, self.acciones)
         
-        # Q-Table: almacena valores Q(estado, acción)
+        # Q-Table: almacena valores Q(estado, acción) como matriz (27, 3)
         # Estado se discretiza en rangos: bajo, medio, alto
-        self.q_table = defaultdict(lambda: {accion: 0.0 for accion in self.acciones})
+        # Con un almacén compartido todos los workers ven la misma tabla
+        self.almacen: AlmacenQ = crear_almacen(almacen)
         
         # Hiperparámetros
         self.alpha = 0.1  # Tasa de aprendizaje
@@ -33,6 +92,16 @@ class RLService:
         
         # Historial de recompensas por acción
         self.historial_recompensas = defaultdict(list)
+        # Sumas y conteos acumulados para la efectividad media sin recorrer el historial
+        self._suma_recompensas = defaultdict(float)
+        self._num_recompensas = defaultdict(int)
+        
+        # Tabla derivada por estado: mejor acción y Q-values ya convertidos.
+        # Solo se reconstruyen las filas cuyos Q-values cambian
+        self._version_tabla = -1
+        self._q_tabla = np.full((len(ESTADOS), len(self.acciones)), np.nan)
+        self._mejor_accion = [self.acciones[0]] * len(ESTADOS)
+        self._q_values_tabla: List[Dict[str, float]] = [{} for _ in ESTADOS]
     
     def _discretizar_estado(self, moodmap: MoodMap) -> str:
         """
@@ -44,19 +113,57 @@ class RLService:
         Returns:
             String que representa el estado discretizado
         """
-        def categorizar(valor: float) -> str:
-            if valor < 0.33:
-                return "bajo"
-            elif valor < 0.67:
-                return "medio"
-            else:
-                return "alto"
+        # Misma discretización que el camino en lote (indices_estado)
+        return ESTADOS[int(indices_estado(moodmap.felicidad, moodmap.estres, moodmap.motivacion))]
+    
+    @property
+    def q_table(self) -> Dict[str, Dict[str, float]]:
+        """Vista {estado: {accion: q_value}} de los estados con algún valor aprendido"""
+        q = self.almacen.leer()
+        return {
+            estado: {accion: float(q[i, j]) for j, accion in enumerate(self.acciones)}
+            for i, estado in enumerate(ESTADOS)
+            if q[i].any()
+        }
+    
+    def _q_values_estado(self, estado: str) -> Dict[str, float]:
+        """Q-values de un estado discretizado"""
+        self._sincronizar_tabla()
+        return dict(self._q_values_tabla[INDICE_ESTADO[estado]])
+    
+    def _sincronizar_tabla(self):
+        """
+        Pone al día la tabla derivada por estado
         
-        felicidad_cat = categorizar(moodmap.felicidad)
-        estres_cat = categorizar(moodmap.estres)
-        motivacion_cat = categorizar(moodmap.motivacion)
+        Compara la matriz del almacén con la última copia y recalcula solo
+        los estados cuyos Q-values han cambiado.
+        """
+        q = self.almacen.leer()
+        if self.almacen.version == self._version_tabla:
+            return
+        
+        for i in np.flatnonzero((q != self._q_tabla).any(axis=1)):
+            self._mejor_accion[i] = self.acciones[int(np.argmax(q[i]))]
+            self._q_values_tabla[i] = {accion: float(v) for accion, v in zip(self.acciones, q[i])}
         
-        return f"{felicidad_cat}_{estres_cat}_{motivacion_cat}"
+        self._q_tabla = q.copy()
+        self._version_tabla = self.almacen.version
+    
+    def _registrar_recompensa(self, microaccion: str, recompensa: float):
+        """Guarda la recompensa en el historial y en los acumulados"""
+        self.historial_recompensas[microaccion].append(recompensa)
+        self._suma_recompensas[microaccion] += recompensa
+        self._num_recompensas[microaccion] += 1
+    
+    def _efectividad_promedio(self, microaccion: str) -> float:
+        """Media de recompensas de la acción (3.0 neutral si no hay datos)"""
+        n = self._num_recompensas[microaccion]
+        return self._suma_recompensas[microaccion] / n if n else 3.0
+    
+    @staticmethod
+    def _contexto(moodmap: MoodMap) -> np.ndarray:
+        """Contexto continuo para los backends de rl_politicas"""
+        return np.array([moodmap.felicidad, moodmap.estres, moodmap.motivacion])
     
     def seleccionar_microaccion(self, moodmap: MoodMap) -> str:
         """
@@ -68,17 +175,18 @@ class RLService:
         Returns:
             Nombre de la microacción seleccionada
         """
-        estado = self._discretizar_estado(moodmap)
+        if self.politica is not None:
+            return self.acciones[self.politica.seleccionar(self._contexto(moodmap))]
+        
+        estado_idx = obtener_celda(moodmap.felicidad, moodmap.estres, moodmap.motivacion).estado_idx
         
         # Exploración: selección aleatoria
         if random.random() < self.epsilon:
             return random.choice(self.acciones)
         
         # Explotación: seleccionar la mejor acción según Q-values
-        q_values = self.q_table[estado]
-        mejor_accion = max(q_values, key=q_values.get)
-        
-        return mejor_accion
+        self._sincronizar_tabla()
+        return self._mejor_accion[estado_idx]
     
     def actualizar_politica(
         self,
@@ -101,29 +209,140 @@ class RLService:
         # Normalizar recompensa a escala 0-1
         recompensa_norm = (recompensa - 1) / 4.0
         
-        # Obtener Q-value actual
-        q_actual = self.q_table[estado_str][microaccion]
+        if self.politica is not None:
+            self.politica.actualizar(
+                self._contexto(estado_previo),
+                self.acciones.index(microaccion),
+                recompensa_norm
+            )
+            self._registrar_recompensa(microaccion, recompensa)
+            print(f"✓ RL ({self.politica.nombre}) actualizado: {microaccion} en estado {estado_str}")
+            return
         
-        # Calcular nuevo Q-value
+        # Misma regla que actualizar_politica_lote, con un lote de una transición
+        q = self.almacen.leer()
+        estado_idx = INDICE_ESTADO[estado_str]
+        accion_idx = self.acciones.index(microaccion)
+        q_actual = float(q[estado_idx, accion_idx])
+        estados_nuevos = None
         if estado_nuevo:
-            estado_nuevo_str = self._discretizar_estado(estado_nuevo)
-            max_q_futuro = max(self.q_table[estado_nuevo_str].values())
-        else:
-            max_q_futuro = 0
+            estados_nuevos = np.array([INDICE_ESTADO[self._discretizar_estado(estado_nuevo)]])
         
-        # Actualización Q-Learning
-        q_nuevo = q_actual + self.alpha * (
-            recompensa_norm + self.gamma * max_q_futuro - q_actual
+        celdas, deltas = self._deltas_q(
+            q, np.array([accion_idx]), np.array([recompensa_norm]), np.array([estado_idx]), estados_nuevos
         )
-        
-        self.q_table[estado_str][microaccion] = q_nuevo
+        self.almacen.incrementar(celdas, deltas)
+        q_nuevo = q_actual + float(deltas[0])
         
         # Guardar en historial
-        self.historial_recompensas[microaccion].append(recompensa)
+        self._registrar_recompensa(microaccion, recompensa)
         
         print(f"✓ RL actualizado: {microaccion} en estado {estado_str}")
         print(f"  Q-value: {q_actual:.3f} → {q_nuevo:.3f}")
     
+    def seleccionar_microacciones_lote(
+        self,
+        estados: np.ndarray,
+        rng=None,
+        contextos: np.ndarray = None
+    ) -> np.ndarray:
+        """
+        Versión vectorizada de seleccionar_microaccion (ε-greedy)
+        
+        Args:
+            estados: Índices de estado discretizado (ver indices_estado)
+            rng: Generador de NumPy (opcional)
+            contextos: MoodMaps continuos (N, 3), necesarios con self.politica
+            
+        Returns:
+            Índices de acción sobre self.acciones
+        """
+        rng = rng if rng is not None else np.random.default_rng()
+        
+        if self.politica is not None:
+            return self.politica.seleccionar_lote(contextos, rng)
+        
+        q = self.almacen.leer()
+        
+        acciones = q[estados].argmax(axis=1)
+        explorar = rng.random(len(estados)) < self.epsilon
+        acciones[explorar] = rng.integers(0, len(self.acciones), int(explorar.sum()))
+        
+        return acciones
+    
+    def actualizar_politica_lote(
+        self,
+        acciones: np.ndarray,
+        recompensas: np.ndarray,
+        estados_previos: np.ndarray,
+        estados_nuevos: np.ndarray = None,
+        registrar_historial: bool = True,
+        contextos: np.ndarray = None
+    ):
+        """
+        Versión vectorizada de actualizar_politica para un lote de transiciones
+        
+        Los objetivos se calculan con la Q-Table previa al lote. Para cada par
+        (estado, acción) con n muestras se aplica el equivalente a n
+        actualizaciones secuenciales: Q ← Q + (1 - (1-α)^n)·(objetivo_medio - Q).
+        
+        Args:
+            acciones: Índices de acción ejecutada
+            recompensas: Recompensas recibidas (1-5)
+            estados_previos: Índices de estado antes de la acción
+            estados_nuevos: Índices de estado después de la acción (opcional)
+            registrar_historial: Si False no guarda cada recompensa en el historial
+            contextos: MoodMaps previos continuos (N, 3), necesarios con self.politica
+        """
+        recompensas = np.asarray(recompensas, dtype=np.float64)
+        recompensas_norm = (recompensas - 1) / 4.0
+        
+        if registrar_historial:
+            for j, accion in enumerate(self.acciones):
+                de_accion = recompensas[acciones == j]
+                self.historial_recompensas[accion].extend(de_accion.tolist())
+                self._suma_recompensas[accion] += float(de_accion.sum())
+                self._num_recompensas[accion] += len(de_accion)
+        
+        if self.politica is not None:
+            self.politica.actualizar_lote(contextos, acciones, recompensas_norm)
+            return
+        
+        celdas, deltas = self._deltas_q(
+            self.almacen.leer(), acciones, recompensas_norm, estados_previos, estados_nuevos
+        )
+        self.almacen.incrementar(celdas, deltas)
+    
+    def _deltas_q(
+        self,
+        q: np.ndarray,
+        acciones: np.ndarray,
+        recompensas_norm: np.ndarray,
+        estados_previos: np.ndarray,
+        estados_nuevos: Optional[np.ndarray]
+    ):
+        """
+        Regla de actualización Q-Learning, única para el camino por petición
+        y el de lote: incrementos por celda a partir de la Q-Table previa
+        
+        Returns:
+            (celdas planas visitadas, incremento de cada una)
+        """
+        if estados_nuevos is not None:
+            max_q_futuro = q.max(axis=1)[estados_nuevos]
+        else:
+            max_q_futuro = 0.0
+        
+        objetivo = recompensas_norm + self.gamma * max_q_futuro
+        
+        celdas = np.asarray(estados_previos) * len(self.acciones) + np.asarray(acciones)
+        conteos = np.bincount(celdas, minlength=q.size)
+        objetivo_medio = np.bincount(celdas, weights=objetivo, minlength=q.size) / np.maximum(conteos, 1)
+        paso = 1.0 - (1.0 - self.alpha) ** conteos
+        
+        visitadas = np.flatnonzero(conteos)
+        return visitadas, paso[visitadas] * (objetivo_medio[visitadas] - q.ravel()[visitadas])
+    
     def obtener_microaccion_adaptativa(self, moodmap: MoodMap) -> Dict:
         """
         Obtiene microacción con análisis detallado
@@ -134,26 +353,29 @@ class RLService:
         Returns:
             Diccionario con microacción y justificación
         """
-        estado = self._discretizar_estado(moodmap)
-        microaccion = self.seleccionar_microaccion(moodmap)
-        
-        # Determinar tipo de respuesta según urgencia
-        nivel_urgencia = self._calcular_urgencia(moodmap)
-        tipo_respuesta = "larga" if nivel_urgencia == "alta" else "corta"
+        # Estado discretizado, urgencia y tipo de respuesta precalculados por celda
+        celda = obtener_celda(moodmap.felicidad, moodmap.estres, moodmap.motivacion)
         
-        # Obtener promedio de efectividad de esta acción
-        if microaccion in self.historial_recompensas and self.historial_recompensas[microaccion]:
-            efectividad_promedio = np.mean(self.historial_recompensas[microaccion])
+        # Con un backend contextual, "q_values" son sus valores estimados
+        if self.politica is not None:
+            microaccion = self.seleccionar_microaccion(moodmap)
+            valores = self.politica.valores(self._contexto(moodmap))[0]
+            q_values = {accion: float(v) for accion, v in zip(self.acciones, valores)}
         else:
-            efectividad_promedio = 3.0  # Neutral por defecto
+            self._sincronizar_tabla()
+            if random.random() < self.epsilon:
+                microaccion = random.choice(self.acciones)
+            else:
+                microaccion = self._mejor_accion[celda.estado_idx]
+            q_values = dict(self._q_values_tabla[celda.estado_idx])
         
         return {
             "microaccion": microaccion,
-            "estado_discretizado": estado,
-            "tipo_respuesta": tipo_respuesta,
-            "nivel_urgencia": nivel_urgencia,
-            "efectividad_promedio": float(efectividad_promedio),
-            "q_values": dict(self.q_table[estado])
+            "estado_discretizado": celda.estado_discretizado,
+            "tipo_respuesta": celda.tipo_respuesta,
+            "nivel_urgencia": celda.nivel_urgencia,
+            "efectividad_promedio": self._efectividad_promedio(microaccion),
+            "q_values": q_values
         }
     
     def _calcular_urgencia(self, moodmap: MoodMap) -> str:
@@ -166,17 +388,44 @@ class RLService:
         Returns:
             Nivel de urgencia: "baja", "media", "alta"
         """
-        # Urgencia alta si el estrés es alto y felicidad/motivación bajas
-        if moodmap.estres > 0.7 and (moodmap.felicidad < 0.3 or moodmap.motivacion < 0.3):
-            return "alta"
+        return calcular_urgencia(moodmap.felicidad, moodmap.estres, moodmap.motivacion)
+    
+    def exportar_q_table(self) -> Dict[str, Dict[str, float]]:
+        """
+        Exporta la Q-Table actual como diccionario serializable
+
+        Returns:
+            Diccionario {estado: {accion: q_value}}
+        """
+        return matriz_a_q_table(self.almacen.leer())
+    
+    def cargar_q_table(self, q_table: Dict[str, Dict[str, float]]):
+        """
+        Reemplaza la Q-Table (p. ej. con una entrenada offline por rl_replay)
         
-        # Urgencia media si hay desequilibrio moderado
-        elif moodmap.estres > 0.5 or (moodmap.felicidad < 0.4 and moodmap.motivacion < 0.4):
-            return "media"
+        Args:
+            q_table: Diccionario {estado: {accion: q_value}}
+        """
+        self.almacen.reemplazar(q_table_a_matriz(q_table))
+        print(f"✓ Q-Table cargada: {len(q_table)} estados (almacén {self.almacen.nombre})")
+    
+    def inicializar_q_table(self, q_table: Dict[str, Dict[str, float]]) -> bool:
+        """
+        Siembra la Q-Table publicada al arrancar, solo si el almacén está vacío
+        (un worker nuevo no sobrescribe lo aprendido online por el resto)
         
-        # Urgencia baja en otros casos
+        Args:
+            q_table: Diccionario {estado: {accion: q_value}}
+            
+        Returns:
+            True si se sembró
+        """
+        sembrada = self.almacen.inicializar_si_vacio(q_table_a_matriz(q_table))
+        if sembrada:
+            print(f"✓ Q-Table publicada sembrada: {len(q_table)} estados (almacén {self.almacen.nombre})")
         else:
-            return "baja"
+            print(f"✓ Almacén {self.almacen.nombre} ya inicializado: se conserva su Q-Table")
+        return sembrada
     
     def obtener_estadisticas(self) -> Dict:
         """
@@ -186,16 +435,18 @@ class RLService:
             Diccionario con estadísticas de aprendizaje
         """
         estadisticas = {
+            "politica": self.politica.nombre if self.politica is not None else "qlearning",
+            "almacen": self.almacen.nombre,
             "total_estados_aprendidos": len(self.q_table),
             "microacciones": self.acciones,
             "promedios_recompensa": {}
         }
         
         for accion in self.acciones:
-            if accion in self.historial_recompensas and self.historial_recompensas[accion]:
+            if self._num_recompensas[accion]:
                 estadisticas["promedios_recompensa"][accion] = {
-                    "promedio": float(np.mean(self.historial_recompensas[accion])),
-                    "total_ejecuciones": len(self.historial_recompensas[accion])
+                    "promedio": self._efectividad_promedio(accion),
+                    "total_ejecuciones": self._num_recompensas[accion]
                 }
             else:
                 estadisticas["promedios_recompensa"][accion] = {
@@ -0,0 +1,332 @@
+"""
+Simulador de usuarios sintéticos para evaluar RLService
+Mide regret, curvas de convergencia y actualizaciones por segundo
+sin tener que desplegar los cambios de hiperparámetros
+
+Uso:
+    python -m services.rl_simulador --usuarios 10000 --pasos 200
+    python -m services.rl_simulador --epsilon 0.1 --alpha 0.2 --salida informe.json
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import sys
+import time
+from typing import Dict, Optional
+
+import numpy as np
+
+from models.usuario import MoodMap
+from services.rl_service import RLService, ACCIONES, indices_estado
+from services.recomendaciones import CHEMICALS_POR_MICROACCION
+
+# Mismo cuadro de impactos que _calcular_impacto_actividad en main.py
+# (felicidad, estres, motivacion) por natural chemical
+IMPACTOS_NATURAL_CHEMICALS = {
+    "serotonina": (0.15, -0.10, 0.05),
+    "dopamina": (0.10, -0.05, 0.20),
+    "endorfinas": (0.12, -0.15, 0.08),
+    "oxitocina": (0.18, -0.12, 0.10),
+}
+
+# Chemicals asociados a cada microacción del agente
+CHEMICALS_POR_ACCION = {accion: CHEMICALS_POR_MICROACCION[accion] for accion in ACCIONES}
+
+
+class ModeloRespuesta:
+    """
+    Modelo de cómo cambia el estado de ánimo tras cada microacción
+
+    El efecto medio de una acción es el promedio de los impactos de sus
+    natural chemicals, escalado por la intensidad (1-5) y por la
+    sensibilidad propia de cada usuario en cada dimensión.
+    """
+
+    def __init__(
+        self,
+        impactos: Optional[Dict[str, tuple]] = None,
+        chemicals_por_accion: Optional[Dict[str, tuple]] = None,
+        ruido: float = 0.05,
+        escala_valoracion: float = 8.0
+    ):
+        """
+        Args:
+            impactos: Impacto (felicidad, estres, motivacion) por chemical
+            chemicals_por_accion: Chemicals que activa cada microacción
+            ruido: Desviación típica del ruido en la respuesta
+            escala_valoracion: Puntos de valoración (1-5) por unidad de mejora
+        """
+        impactos = impactos or IMPACTOS_NATURAL_CHEMICALS
+        chemicals_por_accion = chemicals_por_accion or CHEMICALS_POR_ACCION
+
+        # Matriz (acciones, 3) con el efecto medio de cada acción
+        self.efectos = np.array([
+            np.mean([impactos[c] for c in chemicals_por_accion[accion]], axis=0)
+            for accion in ACCIONES
+        ])
+        self.ruido = ruido
+        self.escala_valoracion = escala_valoracion
+
+    def aplicar(
+        self,
+        estados: np.ndarray,
+        acciones: np.ndarray,
+        intensidades: np.ndarray,
+        sensibilidad: np.ndarray,
+        rng: np.random.Generator
+    ) -> np.ndarray:
+        """
+        Calcula el estado tras ejecutar las acciones
+
+        Args:
+            estados: Estados actuales (N, 3)
+            acciones: Índices de acción (N,)
+            intensidades: Intensidad 1-5 de cada ejecución (N,)
+            sensibilidad: Sensibilidad de cada usuario por dimensión (N, 3)
+            rng: Generador de NumPy
+
+        Returns:
+            Nuevos estados (N, 3) en el rango 0-1
+        """
+        delta = self.efectos[acciones] * sensibilidad * (intensidades / 5.0)[:, None]
+        delta += rng.normal(0.0, self.ruido, delta.shape)
+        return np.clip(estados + delta, 0.0, 1.0)
+
+    def valoracion(self, previos: np.ndarray, nuevos: np.ndarray) -> np.ndarray:
+        """
+        Valoración 1-5 que daría el usuario según su mejora
+
+        Más felicidad y motivación y menos estrés suben la valoración.
+        """
+        delta = nuevos - previos
+        mejora = delta[:, 0] - delta[:, 1] + delta[:, 2]
+        return np.clip(3.0 + self.escala_valoracion * mejora, 1.0, 5.0)
+
+    def valoracion_esperada(self, estados: np.ndarray, sensibilidad: np.ndarray, intensidades: np.ndarray) -> np.ndarray:
+        """
+        Valoración esperada (sin ruido) de cada acción para cada usuario
+
+        Returns:
+            Matriz (N, acciones) con valoraciones 1-5
+        """
+        esperadas = np.empty((len(estados), len(ACCIONES)))
+        for j in range(len(ACCIONES)):
+            delta = self.efectos[j] * sensibilidad * (intensidades / 5.0)[:, None]
+            nuevos = np.clip(estados + delta, 0.0, 1.0)
+            esperadas[:, j] = self.valoracion(estados, nuevos)
+        return esperadas
+
+
+def simular(
+    rl_service: Optional[RLService] = None,
+    modelo: Optional[ModeloRespuesta] = None,
+    usuarios: int = 10_000,
+    pasos: int = 100,
+    heterogeneidad: float = 0.5,
+    deriva: float = 0.3,
+    ruido_animo: float = 0.1,
+    puntos_curva: int = 20,
+    semilla: int = 0
+) -> Dict:
+    """
+    Simula usuarios sintéticos usando la política de RLService en lote
+
+    En cada paso todos los usuarios reciben una microacción elegida por
+    seleccionar_microacciones_lote, responden según el modelo y la
+    valoración resultante alimenta actualizar_politica_lote. Entre pasos
+    el ánimo deriva hacia la línea base de cada usuario con algo de ruido,
+    para que los estados visitados no se estanquen.
+
+    Args:
+        rl_service: Servicio a evaluar (uno nuevo por defecto)
+        modelo: Modelo de respuesta (ModeloRespuesta() por defecto)
+        usuarios: Número de usuarios simulados en paralelo
+        pasos: Número de pasos por usuario
+        heterogeneidad: Dispersión de la sensibilidad entre usuarios
+        deriva: Fracción de retorno a la línea base por paso
+        ruido_animo: Ruido del ánimo entre pasos
+        puntos_curva: Número de puntos de las curvas de convergencia
+        semilla: Semilla aleatoria
+
+    Returns:
+        Informe con regret, curvas de convergencia y rendimiento
+    """
+    rl = rl_service or RLService(almacen="local")
+    modelo = modelo or ModeloRespuesta()
+    rng = np.random.default_rng(semilla)
+
+    base = rng.uniform(0.0, 1.0, (usuarios, 3))
+    estados = base.copy()
+    sensibilidad = np.clip(1.0 + heterogeneidad * rng.standard_normal((usuarios, 3)), 0.0, None)
+
+    ventana = max(1, pasos // max(1, puntos_curva))
+    curva = []
+    acumulado = {"valoracion": 0.0, "regret": 0.0, "optimas": 0}
+    ventana_actual = {"valoracion": 0.0, "regret": 0.0, "optimas": 0, "pasos": 0}
+    filas = np.arange(usuarios)
+    tiempo_politica = 0.0
+
+    for paso in range(pasos):
+        idx = indices_estado(estados[:, 0], estados[:, 1], estados[:, 2])
+        intensidades = rng.integers(1, 6, usuarios).astype(np.float64)
+
+        inicio = time.perf_counter()
+        acciones = rl.seleccionar_microacciones_lote(idx, rng, contextos=estados)
+        tiempo_politica += time.perf_counter() - inicio
+
+        nuevos = modelo.aplicar(estados, acciones, intensidades, sensibilidad, rng)
+        valoraciones = modelo.valoracion(estados, nuevos)
+
+        esperadas = modelo.valoracion_esperada(estados, sensibilidad, intensidades)
+        elegidas = esperadas[filas, acciones]
+        regret = esperadas.max(axis=1) - elegidas
+        optimas = int((elegidas >= esperadas.max(axis=1)).sum())
+
+        inicio = time.perf_counter()
+        rl.actualizar_politica_lote(
+            acciones, valoraciones, idx,
+            indices_estado(nuevos[:, 0], nuevos[:, 1], nuevos[:, 2]),
+            registrar_historial=False,
+            contextos=estados
+        )
+        tiempo_politica += time.perf_counter() - inicio
+
+        # Deriva hacia la línea base del usuario
+        estados = np.clip(
+            nuevos + deriva * (base - nuevos) + rng.normal(0.0, ruido_animo, nuevos.shape),
+            0.0, 1.0
+        )
+
+        for clave, valor in (("valoracion", float(valoraciones.sum())), ("regret", float(regret.sum())), ("optimas", optimas)):
+            acumulado[clave] += valor
+            ventana_actual[clave] += valor
+        ventana_actual["pasos"] += 1
+
+        if ventana_actual["pasos"] == ventana or paso == pasos - 1:
+            n = ventana_actual["pasos"] * usuarios
+            curva.append({
+                "paso": paso + 1,
+                "valoracion_media": round(ventana_actual["valoracion"] / n, 4),
+                "regret_medio": round(ventana_actual["regret"] / n, 4),
+                "tasa_accion_optima": round(ventana_actual["optimas"] / n, 4),
+                "regret_acumulado": round(acumulado["regret"], 2)
+            })
+            ventana_actual = {"valoracion": 0.0, "regret": 0.0, "optimas": 0, "pasos": 0}
+
+    total = usuarios * pasos
+    return {
+        "usuarios": usuarios,
+        "pasos": pasos,
+        "actualizaciones": total,
+        "politica": rl.politica.nombre if rl.politica is not None else "qlearning",
+        "hiperparametros": {"alpha": rl.alpha, "gamma": rl.gamma, "epsilon": rl.epsilon},
+        "valoracion_media": round(acumulado["valoracion"] / total, 4),
+        "regret_total": round(acumulado["regret"], 2),
+        "regret_medio": round(acumulado["regret"] / total, 4),
+        "tasa_accion_optima": round(acumulado["optimas"] / total, 4),
+        "actualizaciones_por_segundo": round(total / tiempo_politica) if tiempo_politica > 0 else None,
+        "curva_convergencia": curva,
+        "q_table": rl.exportar_q_table()
+    }
+
+
+def medir_rendimiento_escalar(rl_service: Optional[RLService] = None, pasos: int = 2_000, semilla: int = 0) -> float:
+    """
+    Mide actualizaciones por segundo del camino por petición
+    (seleccionar_microaccion + actualizar_politica), como referencia
+
+    Returns:
+        Actualizaciones por segundo
+    """
+    rl = rl_service or RLService(almacen="local")
+    rng = np.random.default_rng(semilla)
+    valores = rng.uniform(0.0, 1.0, (pasos, 6))
+    recompensas = rng.uniform(1.0, 5.0, pasos)
+
+    inicio = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        for i in range(pasos):
+            previo = MoodMap(felicidad=valores[i, 0], estres=valores[i, 1], motivacion=valores[i, 2])
+            nuevo = MoodMap(felicidad=valores[i, 3], estres=valores[i, 4], motivacion=valores[i, 5])
+            accion = rl.seleccionar_microaccion(previo)
+            rl.actualizar_politica(accion, float(recompensas[i]), previo, nuevo)
+    return pasos / (time.perf_counter() - inicio)
+
+
+def crear_servicio(
+    politica: Optional[str] = None,
+    alpha: Optional[float] = None,
+    gamma: Optional[float] = None,
+    epsilon: Optional[float] = None
+) -> RLService:
+    """
+    RLService para simular, siempre con almacén local: nunca escribe en la
+    Q-Table compartida aunque RL_ALMACEN sea memoria o bd
+
+    Args:
+        politica: qlearning o linucb
+        alpha, gamma, epsilon: Hiperparámetros (None = los del servicio)
+    """
+    rl = RLService(politica=politica, almacen="local")
+    for nombre, valor in (("alpha", alpha), ("gamma", gamma), ("epsilon", epsilon)):
+        if valor is not None:
+            setattr(rl, nombre, valor)
+    return rl
+
+
+def main(argv=None) -> int:
+    """CLI del simulador"""
+    parser = argparse.ArgumentParser(description="Simulador y benchmark de la política RL")
+    parser.add_argument("--politica", default="qlearning", help="qlearning o linucb")
+    parser.add_argument("--usuarios", type=int, default=10_000)
+    parser.add_argument("--pasos", type=int, default=100)
+    parser.add_argument("--alpha", type=float, default=None)
+    parser.add_argument("--gamma", type=float, default=None)
+    parser.add_argument("--epsilon", type=float, default=None)
+    parser.add_argument("--ruido", type=float, default=0.05, help="Ruido de la respuesta a las microacciones")
+    parser.add_argument("--heterogeneidad", type=float, default=0.5)
+    parser.add_argument("--semilla", type=int, default=0)
+    parser.add_argument("--escalar", action="store_true", help="Medir también el camino escalar por petición")
+    parser.add_argument("--salida", help="Ruta del JSON con el informe completo")
+    args = parser.parse_args(argv)
+
+    hiperparametros = dict(politica=args.politica, alpha=args.alpha, gamma=args.gamma, epsilon=args.epsilon)
+    rl = crear_servicio(**hiperparametros)
+
+    informe = simular(
+        rl,
+        modelo=ModeloRespuesta(ruido=args.ruido),
+        usuarios=args.usuarios,
+        pasos=args.pasos,
+        heterogeneidad=args.heterogeneidad,
+        semilla=args.semilla
+    )
+
+    print(f"🧪 Simulación RL ({informe['politica']}): {informe['usuarios']} usuarios × {informe['pasos']} pasos")
+    print(f"  - Hiperparámetros: {informe['hiperparametros']}")
+    print(f"  - Valoración media: {informe['valoracion_media']}")
+    print(f"  - Regret medio: {informe['regret_medio']} (total {informe['regret_total']})")
+    print(f"  - Acción óptima: {informe['tasa_accion_optima']:.1%}")
+    print(f"  - Actualizaciones/s (lote): {informe['actualizaciones_por_segundo']:,}")
+    print("  Curva de convergencia (paso: regret medio, acción óptima):")
+    for punto in informe["curva_convergencia"]:
+        print(f"    {punto['paso']:>6}: {punto['regret_medio']:.4f}  {punto['tasa_accion_optima']:.1%}")
+
+    if args.escalar:
+        informe["actualizaciones_por_segundo_escalar"] = round(
+            medir_rendimiento_escalar(crear_servicio(**hiperparametros), semilla=args.semilla)
+        )
+        print(f"  - Actualizaciones/s (escalar): {informe['actualizaciones_por_segundo_escalar']:,}")
+
+    if args.salida:
+        with open(args.salida, "w", encoding="utf-8") as f:
+            json.dump(informe, f, indent=2, ensure_ascii=False)
+        print(f"✓ Informe guardado en {args.salida}")
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
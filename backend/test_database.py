@@ -115,6 +115,1064 @@ def test_limpieza_datos():
         return False
 
 
+def test_planes_consulta():
+    """Verifica que las consultas por usuario y fecha usan los índices compuestos"""
+    print("\n🧪 Test 5: Planes de consulta")
+    print("-" * 50)
+    
+    from datetime import datetime, timedelta
+    from sqlalchemy import text
+    from database import engine
+    
+    # (consulta, índice que debe aparecer en el plan)
+    consultas = [
+        (
+            "SELECT * FROM historico_interacciones WHERE usuario_id = :u "
+            "ORDER BY fecha DESC LIMIT 10",
+            "ix_historico_interacciones_usuario_fecha"
+        ),
+        (
+            "SELECT * FROM feedbacks WHERE usuario_id = :u AND timestamp >= :desde AND timestamp <= :hasta",
+            "ix_feedbacks_usuario_timestamp"
+        ),
+        (
+            "SELECT count(*) FROM moodmaps WHERE usuario_id = :u",
+            "ix_moodmaps_usuario_timestamp"
+        ),
+        (
+            "SELECT count(*) FROM gratitudes WHERE usuario_id = :u",
+            "ix_gratitudes_usuario_fecha_creacion"
+        ),
+    ]
+    parametros = {"u": 1, "desde": datetime.now() - timedelta(hours=2), "hasta": datetime.now()}
+    
+    try:
+        if engine.dialect.name != "sqlite":
+            print("⚠ Test solo disponible con SQLite (EXPLAIN QUERY PLAN)")
+            return True
+        
+        with engine.connect() as conexion:
+            for consulta, indice in consultas:
+                plan = " ".join(
+                    str(fila[-1]) for fila in conexion.execute(text(f"EXPLAIN QUERY PLAN {consulta}"), parametros)
+                )
+                if indice not in plan:
+                    print(f"✗ No usa {indice}: {plan}")
+                    return False
+                print(f"✓ {indice}: {plan}")
+        
+        return True
+        
+    except Exception as e:
+        print(f"✗ Error: {e}")
+        return False
+
+
+def _bd_temporal():
+    """
+    Base de datos SQLite desechable para los tests que rotan particiones o
+    sellan segmentos (no tocan luz_test.db)
+
+    Returns:
+        (engine, fábrica de sesiones, directorio temporal)
+    """
+    import tempfile
+    from sqlalchemy import create_engine
+    from sqlalchemy.orm import sessionmaker
+    from database import Base
+
+    directorio = tempfile.mkdtemp(prefix="luz_test_")
+    engine = create_engine(f"sqlite:///{os.path.join(directorio, 'luz.db')}")
+    Base.metadata.create_all(bind=engine)
+    return engine, sessionmaker(bind=engine), directorio
+
+
+def test_particiones_rotadas():
+    """Tras rotar los meses cerrados a particiones, borrado, replay y conteos las siguen viendo"""
+    print("\n🧪 Test 6: Lecturas sobre particiones rotadas")
+    print("-" * 50)
+    
+    import shutil
+    from datetime import datetime, timedelta
+    from models.db_models import HistoricoInteraccionDB, UsuarioTestDB
+    from services.rl_replay import iterar_lotes_feedback
+    from utils import particiones
+    from utils.test_users import eliminar_usuario_test
+    
+    engine, SessionTemporal, directorio = _bd_temporal()
+    activas = particiones.PARTICIONES_ACTIVAS
+    particiones.PARTICIONES_ACTIVAS = True
+    try:
+        db = SessionTemporal()
+        db.add_all([UsuarioDB(id=1, nombre="test"), UsuarioDB(id=2, nombre="real"), UsuarioTestDB(usuario_id=1)])
+        ahora = datetime.now()
+        estado = {"felicidad": 0.5, "estres": 0.5, "motivacion": 0.5}
+        for dias in (0, 40, 70, 100):
+            for usuario_id in (1, 2):
+                fecha = ahora - timedelta(days=dias)
+                db.add(FeedbackDB(
+                    usuario_id=usuario_id, microaccion="calmarse", efectividad=4, comodidad=4, energia=4,
+                    moodmap_previo=estado, timestamp=fecha
+                ))
+                db.add(HistoricoInteraccionDB(usuario_id=usuario_id, tipo="moodmap", datos=estado, fecha=fecha))
+        db.commit()
+        
+        rotadas = particiones.mantener_particiones(engine)
+        assert rotadas["feedbacks"] and rotadas["historico_interacciones"], rotadas
+        assert db.query(FeedbackDB).count() < 8, "La rotación no movió ningún mes"
+        print(f"✓ Particiones: {rotadas}")
+        
+        estadisticas = obtener_estadisticas_db(db)
+        assert estadisticas["feedbacks_total"] == 8, estadisticas
+        assert estadisticas["interacciones_total"] == 8, estadisticas
+        print(f"✓ Conteos con particiones: {estadisticas['feedbacks_total']} feedbacks")
+        
+        transiciones = sum(len(lote["acciones"]) for lote in iterar_lotes_feedback(db))
+        assert transiciones == 8, transiciones
+        print(f"✓ Replay RL: {transiciones} transiciones")
+        
+        resultado = eliminar_usuario_test(db, 1)
+        assert resultado["feedbacks"] == 4 and resultado["interacciones"] == 4, resultado
+        conexion = db.connection()
+        for tabla in particiones.TABLAS_PARTICIONADAS:
+            assert particiones.contar_filas(conexion, tabla, usuario_id=1) == 0, tabla
+            assert particiones.contar_filas(conexion, tabla, usuario_id=2) == 4, tabla
+        print("✓ Usuario de test borrado también de las particiones")
+        
+        db.close()
+        return True
+    finally:
+        particiones.PARTICIONES_ACTIVAS = activas
+        engine.dispose()
+        shutil.rmtree(directorio, ignore_errors=True)
+
+
+def test_trabajo_archivo():
+    """Un único trabajo activo, token de propietario y errores de la fase de resúmenes"""
+    print("\n🧪 Test 7: Trabajos de archivado")
+    print("-" * 50)
+    
+    import shutil
+    from sqlalchemy import text
+    from sqlalchemy.exc import IntegrityError
+    from models.db_models import SemanaPendienteResumenDB, TrabajoArchivoDB
+    from utils import trabajo_archivo
+    
+    engine, SessionTemporal, directorio = _bd_temporal()
+    try:
+        db = SessionTemporal()
+        trabajo = trabajo_archivo.crear_trabajo(db, dias_antiguedad=30)
+        assert trabajo_archivo.crear_trabajo(db, dias_antiguedad=30).id == trabajo.id
+        db.add(TrabajoArchivoDB(estado="pendiente", dias_antiguedad=30, fecha_limite=trabajo.fecha_limite, activo=True))
+        try:
+            db.commit()
+            raise AssertionError("Se crearon dos trabajos activos")
+        except IntegrityError:
+            db.rollback()
+        print("✓ Un único trabajo activo")
+        
+        # Reclamado por otro proceso con el latido vivo: ni se reclama ni se actualiza
+        assert trabajo_archivo._reclamar(db, trabajo.id, "otro")
+        assert not trabajo_archivo._reclamar(db, trabajo.id, "este")
+        try:
+            trabajo_archivo._actualizar(db, trabajo.id, "este", lotes=99)
+            raise AssertionError("Se actualizó un trabajo ajeno")
+        except trabajo_archivo.TrabajoReclamado:
+            db.rollback()
+        trabajo_archivo.ejecutar_trabajo(trabajo.id, SessionTemporal)
+        db.refresh(trabajo)
+        assert trabajo.estado == "en_curso" and trabajo.propietario == "otro" and trabajo.lotes == 0
+        print("✓ Trabajo con latido vivo no se ejecuta dos veces")
+        
+        # Un error en los resúmenes acaba el trabajo en error, no en 0 resúmenes
+        trabajo.estado, trabajo.activo, trabajo.propietario = "error", None, None
+        db.commit()
+        with engine.begin() as conexion:
+            conexion.execute(text("DROP TABLE semanas_pendientes_resumen"))
+        fallido = trabajo_archivo.crear_trabajo(db, dias_antiguedad=30)
+        trabajo_archivo.ejecutar_trabajo(fallido.id, SessionTemporal)
+        db.refresh(fallido)
+        assert fallido.estado == "error" and fallido.activo is None, fallido.estado
+        assert "resumenes" not in fallido.resultado, fallido.resultado
+        print(f"✓ Error de resúmenes propagado: {fallido.error[:60]}")
+        
+        SemanaPendienteResumenDB.__table__.create(bind=engine)
+        completo = trabajo_archivo.crear_trabajo(db, dias_antiguedad=30)
+        assert completo.id != fallido.id
+        trabajo_archivo.ejecutar_trabajo(completo.id, SessionTemporal)
+        db.refresh(completo)
+        assert completo.estado == "completado" and completo.activo is None
+        assert set(completo.resultado) == set(trabajo_archivo.FASES), completo.resultado
+        print("✓ Trabajo completado")
+        
+        db.close()
+        return True
+    finally:
+        engine.dispose()
+        shutil.rmtree(directorio, ignore_errors=True)
+
+
+def test_buffer_escritura():
+    """Las filas de una petición entran todas en el buffer o ninguna, sin bloquear"""
+    print("\n🧪 Test 8: Buffer de escritura")
+    print("-" * 50)
+    
+    import shutil
+    import time
+    from models.db_models import HistoricoInteraccionDB, MoodMapDB
+    from utils.buffer_escritura import BufferEscritura, BufferLleno
+    
+    engine, SessionTemporal, directorio = _bd_temporal()
+    try:
+        db = SessionTemporal()
+        db.add(UsuarioDB(id=1, nombre="test"))
+        db.commit()
+        
+        def peticion():
+            return [
+                (MoodMapDB, {"usuario_id": 1, "felicidad": 0.5, "estres": 0.5, "motivacion": 0.5}),
+                (HistoricoInteraccionDB, {"usuario_id": 1, "tipo": "moodmap", "datos": {}})
+            ]
+        
+        buffer = BufferEscritura(engine, modelos=(MoodMapDB, HistoricoInteraccionDB), capacidad=3, durabilidad="commit")
+        futuros = buffer.encolar_filas(peticion())
+        inicio = time.perf_counter()
+        try:
+            buffer.encolar_filas(peticion())
+            raise AssertionError("Se encoló una petición que no cabía entera")
+        except BufferLleno:
+            pass
+        assert time.perf_counter() - inicio < 0.1, "encolar_filas bloqueó con la cola llena"
+        assert buffer.estadisticas()["en_cola"] == 2, buffer.estadisticas()
+        print("✓ Petición que no cabe entera: BufferLleno sin encolar nada ni bloquear")
+        
+        buffer.iniciar()
+        for futuro in futuros:
+            futuro.result(timeout=5)
+        buffer.detener()
+        assert db.query(MoodMapDB).count() == 1 and db.query(HistoricoInteraccionDB).count() == 1
+        print("✓ Petición encolada escrita en un lote")
+        
+        db.close()
+        return True
+    finally:
+        engine.dispose()
+        shutil.rmtree(directorio, ignore_errors=True)
+
+
+def test_segmentos_archivo():
+    """Sellar y exportar devuelve las mismas filas; recuperación tras caída; cubo reconstruido igual"""
+    print("\n🧪 Test 9: Segmentos del archivo")
+    print("-" * 50)
+    
+    import random
+    import shutil
+    from datetime import datetime, timedelta
+    from sqlalchemy import insert, select
+    from models.db_models import ArchivoEmocionalDB, CuboInvestigacionDB
+    from utils import segmentos_archivo
+    from utils.cubo_investigacion import actualizar_cubo, reconstruir_cubo
+    from utils.exportacion import consulta_emocional
+    
+    engine, SessionTemporal, directorio = _bd_temporal()
+    directorio_segmentos = segmentos_archivo.DIRECTORIO_SEGMENTOS
+    segmentos_archivo.DIRECTORIO_SEGMENTOS = os.path.join(directorio, "segmentos")
+    try:
+        # Ids en distinto orden que las fechas; embeddings exactos en float32
+        ahora = datetime.now().replace(microsecond=0)
+        fechas = [ahora - timedelta(days=5 * i, minutes=i) for i in range(40)]
+        random.Random(7).shuffle(fechas)
+        filas = [{
+            "id": i + 1,
+            "usuario_id": (1, 2, None)[i % 3],
+            "felicidad": (i % 10) / 10, "estres": (i % 7) / 7, "motivacion": (i % 5) / 5,
+            "embedding_latente": [0.5, 0.25, float(i), -1.0] if i % 4 else None,
+            "cluster_id": i % 3 if i % 5 else None,
+            "microaccion_recomendada": ("calmarse", "animarse", None)[i % 3],
+            "feedback_efectividad": float(i % 5 + 1) if i % 2 else None,
+            "feedback_comodidad": 3.0, "feedback_energia": float(i % 4 + 1),
+            "fecha_registro": fecha, "fecha_archivo": ahora,
+            "semana_anio": f"{fecha.isocalendar()[0]}-W{fecha.isocalendar()[1]:02d}",
+            "datos_extra": {"moodmap_id": i + 1}
+        } for i, fecha in enumerate(fechas)]
+        with engine.begin() as conexion:
+            conexion.execute(insert(ArchivoEmocionalDB.__table__), filas)
+            actualizar_cubo(conexion)
+        
+        def celdas_cubo():
+            cubo = CuboInvestigacionDB.__table__
+            with engine.connect() as conexion:
+                return {
+                    (fila.cluster_id, fila.estado, fila.microaccion, fila.semana_anio): (
+                        fila.num_registros, fila.num_efectividad, round(fila.suma_efectividad, 6),
+                        round(fila.suma_cuadrados_efectividad, 6), fila.num_energia, round(fila.suma_energia, 6)
+                    )
+                    for fila in conexion.execute(select(cubo))
+                }
+        
+        def exportar(**pagina):
+            db = SessionTemporal()
+            try:
+                return list(consulta_emocional(**pagina).registros(db))
+            finally:
+                db.close()
+        
+        def exportar_paginado(limite: int = 7):
+            registros, after_id = [], None
+            while True:
+                pagina = exportar(after_id=after_id, limite=limite)
+                if not pagina:
+                    return registros
+                registros += pagina
+                after_id = pagina[-1]["id"]
+        
+        por_fecha = exportar()
+        por_id = exportar_paginado()
+        cubo_incremental = celdas_cubo()
+        assert [r["fecha_registro"] for r in por_fecha] == sorted(fechas)
+        assert [r["id"] for r in por_id] == list(range(1, 41))
+        
+        creados = segmentos_archivo.sellar_segmentos(meses_calientes=1, engine=engine)
+        db = SessionTemporal()
+        en_bd = db.query(ArchivoEmocionalDB).count()
+        db.close()
+        assert creados["archivo_emocional"] and en_bd < 40, (creados, en_bd)
+        print(f"✓ Sellados {len(creados['archivo_emocional'])} segmentos, {en_bd} filas siguen en la BD")
+        
+        assert exportar() == por_fecha, "El export por fecha cambió tras sellar"
+        assert exportar_paginado() == por_id, "El export paginado por id cambió tras sellar"
+        print("✓ Export por fecha y paginado (after_id/limit) iguales antes y después de sellar")
+        
+        # Caída entre el renombrado y el borrado: las filas selladas siguen en la BD
+        segmento = segmentos_archivo.listar_segmentos("archivo_emocional")[0]
+        sin_borrar = [
+            fila for fila in filas
+            if segmento.indice["id_min"] <= fila["id"] <= segmento.indice["id_max"]
+            and f"{fila['fecha_registro']:%Y-%m}" == segmento.mes
+        ]
+        with engine.begin() as conexion:
+            conexion.execute(insert(ArchivoEmocionalDB.__table__), sin_borrar)
+        creados = segmentos_archivo.sellar_segmentos(meses_calientes=1, engine=engine)
+        db = SessionTemporal()
+        assert db.query(ArchivoEmocionalDB).count() == en_bd
+        db.close()
+        assert not creados["archivo_emocional"], creados
+        assert exportar() == por_fecha and exportar_paginado() == por_id
+        print(f"✓ Recuperación tras caída: {len(sin_borrar)} filas ya selladas borradas sin duplicar")
+        
+        reconstruir_cubo(engine)
+        assert celdas_cubo() == cubo_incremental, "El cubo reconstruido difiere del incremental"
+        print(f"✓ Cubo reconstruido con segmentos igual al incremental ({len(cubo_incremental)} celdas)")
+        
+        return True
+    finally:
+        segmentos_archivo.DIRECTORIO_SEGMENTOS = directorio_segmentos
+        engine.dispose()
+        shutil.rmtree(directorio, ignore_errors=True)
+
+
+def test_almacen_q():
+    """Almacenes compartidos: incrementos y reemplazos visibles entre instancias; la siembra no pisa"""
+    print("\n🧪 Test 10: Almacenes de Q-values")
+    print("-" * 50)
+    
+    import shutil
+    import uuid
+    import numpy as np
+    from services.rl_almacen import (
+        AlmacenQ, AlmacenQBaseDatos, AlmacenQLocal, AlmacenQMemoriaCompartida, FORMA
+    )
+    
+    class AlmacenIncompleto(AlmacenQ):
+        def _leer(self):
+            return np.zeros(FORMA)
+    try:
+        AlmacenIncompleto()
+        raise AssertionError("Se instanció un almacén sin todos sus métodos")
+    except TypeError:
+        pass
+    print("✓ AlmacenQ abstracto: un backend incompleto falla al instanciarse")
+    
+    publicada = np.arange(81, dtype=np.float64).reshape(FORMA) / 100
+    engine, SessionTemporal, directorio = _bd_temporal()
+    nombre_memoria = f"luz_test_{uuid.uuid4().hex[:8]}"
+    almacenes = []
+    try:
+        for nombre, crear in (
+            ("memoria", lambda: AlmacenQMemoriaCompartida(nombre_memoria, ttl=0.0)),
+            ("bd", lambda: AlmacenQBaseDatos(SessionTemporal, ttl=0.0)),
+        ):
+            a, b = crear(), crear()
+            almacenes += [a, b]
+            
+            assert a.inicializar_si_vacio(publicada)
+            assert np.allclose(b.leer(), publicada)
+            
+            a.incrementar([0, 0, 5], [1.0, 0.5, -2.0])
+            b.incrementar([5], [1.0])
+            esperado = publicada.copy()
+            esperado.flat[0] += 1.5
+            esperado.flat[5] -= 1.0
+            assert np.allclose(a.leer(), esperado) and np.allclose(b.leer(), esperado), nombre
+            
+            # Un worker que arranca después no pisa lo aprendido online
+            assert not crear().inicializar_si_vacio(np.zeros(FORMA) + 9)
+            assert np.allclose(b.leer(), esperado), nombre
+            
+            a.reemplazar(publicada * 2)
+            assert np.allclose(b.leer(), publicada * 2), nombre
+            print(f"✓ Almacén {nombre}: incrementar/reemplazar compartidos entre instancias")
+        
+        local = AlmacenQLocal()
+        assert local.inicializar_si_vacio(publicada) and not local.inicializar_si_vacio(publicada * 2)
+        assert np.allclose(local.leer(), publicada)
+        print("✓ Almacén local sembrado una sola vez")
+        return True
+    finally:
+        for almacen in almacenes:
+            if isinstance(almacen, AlmacenQMemoriaCompartida):
+                almacen._memoria.close()
+        if almacenes:
+            # El almacén se desregistra del resource_tracker para sobrevivir
+            # a los workers: se vuelve a registrar para poder borrarlo
+            from multiprocessing import resource_tracker
+            resource_tracker.register(almacenes[0]._memoria._name, "shared_memory")
+            almacenes[0]._memoria.unlink()
+        engine.dispose()
+        shutil.rmtree(directorio, ignore_errors=True)
+
+
+def test_regla_rl_unica():
+    """Test: el camino por petición y el de lote comparten discretización y regla Q"""
+    print("\n🧪 Test 11: Regla RL única (escalar vs lote)")
+    print("-" * 50)
+
+    import numpy as np
+    from models.usuario import MoodMap
+    from services.rl_service import RLService, ESTADOS, indices_estado, INDICE_ESTADO
+    from services.rl_simulador import crear_servicio
+
+    escalar = RLService(almacen="local")
+    lote = RLService(almacen="local")
+    escalar.epsilon = lote.epsilon = 0.0
+
+    for valor in (0.0, 0.329, 0.33, 0.5, 0.669, 0.67, 1.0):
+        mm = MoodMap(felicidad=valor, estres=1 - valor, motivacion=valor)
+        assert escalar._discretizar_estado(mm) == ESTADOS[int(indices_estado(valor, 1 - valor, valor))]
+    print("  ✓ _discretizar_estado coincide con indices_estado en los umbrales")
+
+    transiciones = [
+        (MoodMap(felicidad=0.2, estres=0.8, motivacion=0.3), 5, MoodMap(felicidad=0.5, estres=0.5, motivacion=0.5)),
+        (MoodMap(felicidad=0.5, estres=0.5, motivacion=0.5), 2, MoodMap(felicidad=0.7, estres=0.2, motivacion=0.9)),
+        (MoodMap(felicidad=0.7, estres=0.2, motivacion=0.9), 4, None),
+    ]
+    for i, (previo, recompensa, nuevo) in enumerate(transiciones):
+        accion = escalar.acciones[i % len(escalar.acciones)]
+        escalar.actualizar_politica(accion, recompensa, previo, nuevo)
+        lote.actualizar_politica_lote(
+            np.array([escalar.acciones.index(accion)]),
+            np.array([recompensa]),
+            np.array([INDICE_ESTADO[escalar._discretizar_estado(previo)]]),
+            None if nuevo is None else np.array([INDICE_ESTADO[escalar._discretizar_estado(nuevo)]]),
+        )
+    assert np.allclose(escalar.almacen.leer(), lote.almacen.leer())
+    assert escalar.almacen.leer().any()
+    print("  ✓ actualizar_politica == actualizar_politica_lote con lotes de 1")
+
+    servicio = crear_servicio(politica="linucb", alpha=0.2, gamma=0.5, epsilon=0.0)
+    assert type(servicio.almacen).__name__ == "AlmacenQLocal"
+    assert servicio.politica is not None and servicio.alpha == 0.2 and servicio.gamma == 0.5
+    print("  ✓ El simulador usa almacén local y respeta política e hiperparámetros")
+    return True
+
+
+def test_linucb():
+    """Test: LinUCB mantiene A⁻¹ y θ iguales a la solución directa"""
+    print("\n🧪 Test 12: LinUCB (Sherman–Morrison)")
+    print("-" * 50)
+
+    import numpy as np
+    from services.rl_politicas import PoliticaRL, PoliticaLinUCB, caracteristicas
+
+    try:
+        PoliticaRL(["a"])
+        assert False, "PoliticaRL no debería instanciarse"
+    except TypeError:
+        pass
+    print("  ✓ PoliticaRL es abstracta")
+
+    rng = np.random.default_rng(7)
+    acciones = ["respirar", "caminar", "escribir"]
+    contextos = rng.random((300, 3))
+    elegidas = rng.integers(0, len(acciones), 300)
+    recompensas = rng.random(300)
+
+    def directa(x, a, r, j, regularizacion=1.0):
+        xj = caracteristicas(x[a == j])
+        A = np.eye(xj.shape[1]) * regularizacion + xj.T @ xj
+        return np.linalg.inv(A), np.linalg.solve(A, xj.T @ r[a == j])
+
+    una_a_una = PoliticaLinUCB(acciones)
+    for contexto, accion, recompensa in zip(contextos, elegidas, recompensas):
+        una_a_una.actualizar(contexto, int(accion), float(recompensa))
+
+    en_lote = PoliticaLinUCB(acciones)
+    en_lote.actualizar_lote(contextos[:150], elegidas[:150], recompensas[:150])
+    en_lote.actualizar_lote(contextos[150:], elegidas[150:], recompensas[150:])
+
+    for politica in (una_a_una, en_lote):
+        for j in range(len(acciones)):
+            a_inv, theta = directa(contextos, elegidas, recompensas, j)
+            assert np.allclose(politica.A_inv[j], a_inv, atol=1e-8)
+            assert np.allclose(politica.theta[j], theta, atol=1e-8)
+        assert politica.actualizaciones == 300
+    print("  ✓ actualizar y actualizar_lote coinciden con la inversa directa")
+    return True
+
+
+def test_replay_rl():
+    """Estadísticos suficientes, convergencia de fitted-Q, filas mal formadas y publicación"""
+    print("\n🧪 Test 13: Replay offline de RL")
+    print("-" * 50)
+    
+    import shutil
+    import numpy as np
+    from services.rl_replay import (
+        NUM_ACCIONES, NUM_ESTADOS, TERMINAL, EstadisticasTransiciones,
+        cargar_q_table_publicada, ejecutar_replay, entrenar_q, publicar_q_table
+    )
+    from services.rl_service import ESTADOS, INDICE_ESTADO, RLService, indices_estado, q_table_a_matriz
+    
+    rng = np.random.default_rng(3)
+    n = 2000
+    estados = rng.integers(0, NUM_ESTADOS, n)
+    acciones = rng.integers(0, NUM_ACCIONES, n)
+    recompensas = rng.random(n)
+    siguientes = rng.integers(0, NUM_ESTADOS + 1, n)
+    
+    por_lotes = EstadisticasTransiciones()
+    for inicio in range(0, n, 300):
+        fin = inicio + 300
+        por_lotes.acumular(estados[inicio:fin], acciones[inicio:fin], recompensas[inicio:fin], siguientes[inicio:fin])
+    
+    conteos = np.zeros((NUM_ESTADOS, NUM_ACCIONES))
+    sumas = np.zeros((NUM_ESTADOS, NUM_ACCIONES))
+    transiciones = np.zeros((NUM_ESTADOS, NUM_ACCIONES, NUM_ESTADOS + 1))
+    for s, a, r, s2 in zip(estados, acciones, recompensas, siguientes):
+        conteos[s, a] += 1
+        sumas[s, a] += r
+        transiciones[s, a, s2] += 1
+    assert por_lotes.total == n
+    assert np.array_equal(por_lotes.conteos, conteos)
+    assert np.allclose(por_lotes.suma_recompensas, sumas)
+    assert np.array_equal(por_lotes.siguientes, transiciones)
+    print("✓ Estadísticos por lotes == recuento transición a transición")
+    
+    # Un estado que vuelve a sí mismo con recompensa 1: Q* = 1 / (1 - γ)
+    bucle = EstadisticasTransiciones()
+    bucle.acumular(np.array([4, 4]), np.array([1, 1]), np.array([1.0, 1.0]), np.array([4, 4]))
+    bucle.acumular(np.array([7]), np.array([0]), np.array([0.5]), np.array([TERMINAL]))
+    for metodo in ("fitted_q", "q_learning"):
+        q = entrenar_q(bucle, epocas=400, alpha=0.3, gamma=0.9, metodo=metodo)
+        assert abs(q[4, 1] - 10.0) < 1e-6, (metodo, q[4, 1])
+        assert abs(q[7, 0] - 0.5) < 1e-6, (metodo, q[7, 0])
+        assert np.count_nonzero(q) == 2, metodo
+    print("✓ fitted_q y q_learning convergen al punto fijo de Bellman")
+    
+    engine, SessionTemporal, directorio = _bd_temporal()
+    try:
+        db = SessionTemporal()
+        db.add(UsuarioDB(id=1, nombre="replay"))
+        calmado = {"felicidad": 0.8, "estres": 0.1, "motivacion": 0.7}
+        for previo, posterior in (
+            ({"felicidad": 0.2, "estres": 0.9, "motivacion": 0.3}, calmado),
+            (calmado, None),
+            ({"felicidad": 0.5}, None),
+            ("roto", None),
+            (calmado, {"estres": "mucho"}),
+        ):
+            db.add(FeedbackDB(
+                usuario_id=1, microaccion="calmarse", efectividad=5, comodidad=5, energia=5,
+                moodmap_previo=previo, moodmap_posterior=posterior
+            ))
+        db.commit()
+        
+        rl = RLService(almacen="local")
+        resultado = ejecutar_replay(db, epocas=50, publicar=True, rl_service=rl)
+        assert resultado["transiciones"] == 2, resultado
+        assert resultado["descartadas"] == 3, resultado
+        print(f"✓ Replay: {resultado['transiciones']} transiciones, {resultado['descartadas']} filas mal formadas descartadas")
+        
+        publicada = cargar_q_table_publicada(db)
+        assert publicada == resultado["q_table"] and len(publicada) == len(ESTADOS)
+        assert np.array_equal(rl.almacen.leer(), q_table_a_matriz(publicada))
+        estado_calmado = ESTADOS[int(indices_estado(0.8, 0.1, 0.7))]
+        assert publicada[estado_calmado]["calmarse"] == 1.0
+        
+        publicada[estado_calmado]["calmarse"] = 0.25
+        assert publicar_q_table(db, publicada) == len(ESTADOS)
+        assert cargar_q_table_publicada(db)[estado_calmado]["calmarse"] == 0.25
+        assert rl.almacen.leer()[INDICE_ESTADO[estado_calmado]].max() == 1.0
+        print("✓ Q-Table publicada, recargada y cargada en el servicio")
+        
+        db.close()
+        return True
+    finally:
+        engine.dispose()
+        shutil.rmtree(directorio, ignore_errors=True)
+
+
+def test_segmentos_ids():
+    """AUTOINCREMENT tras la migración, recuperación por ids del segmento y semanas selladas sin recalcular"""
+    print("\n🧪 Test 14: Ids y resúmenes del archivo sellado")
+    print("-" * 50)
+    
+    import shutil
+    from datetime import datetime
+    from sqlalchemy import MetaData, insert, select, text
+    from models.db_models import ArchivoEmocionalDB, ResumenSemanalDB
+    from utils import segmentos_archivo
+    from utils.archivado import generar_resumen_semanal, obtener_semana_anio
+    from utils.migraciones import _archivo_autoincrement
+    
+    engine, SessionTemporal, directorio = _bd_temporal()
+    directorio_segmentos = segmentos_archivo.DIRECTORIO_SEGMENTOS
+    segmentos_archivo.DIRECTORIO_SEGMENTOS = os.path.join(directorio, "segmentos")
+    tabla = ArchivoEmocionalDB.__table__
+    try:
+        # Tabla creada antes de sqlite_autoincrement
+        sin_autoincrement = tabla.to_metadata(MetaData())
+        sin_autoincrement.dialect_options["sqlite"]["autoincrement"] = False
+        tabla.drop(bind=engine)
+        sin_autoincrement.create(bind=engine)
+        
+        hoy = datetime.now()
+        indice_mes = hoy.year * 12 + hoy.month - 1 - 3
+        dias = [datetime(indice_mes // 12, indice_mes % 12 + 1, 10 + i, 12) for i in range(10)]
+        def fila(id_fila, fecha, felicidad=0.5):
+            return {
+                "id": id_fila, "usuario_id": 1, "felicidad": felicidad, "estres": 0.4, "motivacion": 0.6,
+                "microaccion_recomendada": "calmarse", "fecha_registro": fecha,
+                "semana_anio": obtener_semana_anio(fecha)
+            }
+        # Hueco en el id 5: dentro del rango del segmento pero no sellado en él
+        filas = [fila(i + 1, fecha) for i, fecha in enumerate(dias) if i + 1 != 5]
+        with engine.begin() as conexion:
+            conexion.execute(insert(tabla), filas)
+        
+        db = SessionTemporal()
+        db.add(UsuarioDB(id=1, nombre="archivo"))
+        db.commit()
+        assert generar_resumen_semanal(db) > 0
+        resumenes = {r.semana_anio: r.num_registros for r in db.query(ResumenSemanalDB)}
+        db.close()
+        
+        creados = segmentos_archivo.sellar_segmentos(meses_calientes=1, engine=engine)
+        assert len(creados["archivo_emocional"]) == 1, creados
+        with engine.begin() as conexion:
+            nuevo = conexion.execute(insert(tabla).values(**{**fila(None, hoy), "id": None})).inserted_primary_key[0]
+            conexion.execute(text("DELETE FROM archivo_emocional WHERE id = :id"), {"id": nuevo})
+        assert nuevo == 1, f"Sin AUTOINCREMENT SQLite reutiliza los ids sellados ({nuevo})"
+        
+        _archivo_autoincrement(engine)
+        _archivo_autoincrement(engine)
+        with engine.begin() as conexion:
+            definicion = conexion.execute(text(
+                "SELECT sql FROM sqlite_master WHERE name = 'archivo_emocional'"
+            )).scalar()
+            indices = set(conexion.execute(text(
+                "SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = 'archivo_emocional'"
+            )).scalars())
+            nuevo = conexion.execute(insert(tabla).values(**{**fila(None, hoy), "id": None})).inserted_primary_key[0]
+            conexion.execute(text("DELETE FROM archivo_emocional WHERE id = :id"), {"id": nuevo})
+        assert "AUTOINCREMENT" in definicion.upper()
+        assert {indice.name for indice in tabla.indexes} <= indices, indices
+        assert nuevo == 11, nuevo
+        print(f"✓ Migración idempotente: AUTOINCREMENT, índices conservados, siguiente id {nuevo}")
+        
+        # Caída tras renombrar (el 3 sigue en la BD) y una fila tardía con el id 5
+        with engine.begin() as conexion:
+            conexion.execute(insert(tabla), [fila(3, dias[2]), fila(5, dias[4], felicidad=0.9)])
+        
+        semanas = segmentos_archivo.semanas_selladas()
+        assert {f["semana_anio"] for f in filas} <= semanas, semanas
+        db = SessionTemporal()
+        generar_resumen_semanal(db)
+        assert {r.semana_anio: r.num_registros for r in db.query(ResumenSemanalDB)} == resumenes
+        db.close()
+        print(f"✓ {len(semanas)} semanas selladas conservan su resumen")
+        
+        creados = segmentos_archivo.sellar_segmentos(meses_calientes=1, engine=engine)
+        assert len(creados["archivo_emocional"]) == 1, creados
+        sellados = sorted(
+            r["id"] for r in segmentos_archivo.leer_segmentos("archivo_emocional", {"id": "id"})
+        )
+        assert sellados == list(range(1, 11)), sellados
+        with engine.connect() as conexion:
+            assert conexion.execute(select(tabla.c.id)).first() is None
+        print("✓ La recuperación solo borra los ids del segmento: la fila tardía se sella aparte")
+        return True
+    finally:
+        segmentos_archivo.DIRECTORIO_SEGMENTOS = directorio_segmentos
+        engine.dispose()
+        shutil.rmtree(directorio, ignore_errors=True)
+
+
+def test_metricas_sql():
+    """Consultas por petición y espera de checkout del pool medida aparte de abrir conexiones"""
+    print("\n🧪 Test 15: Métricas SQL")
+    print("-" * 50)
+    
+    import shutil
+    import sqlite3
+    import tempfile
+    import threading
+    import time
+    from sqlalchemy import create_engine, text
+    import database
+    
+    directorio = tempfile.mkdtemp(prefix="luz_test_")
+    ruta = os.path.join(directorio, "metricas.db")
+    
+    def conectar_lento():
+        time.sleep(0.2)
+        return sqlite3.connect(ruta, check_same_thread=False)
+    
+    engine = create_engine(
+        "sqlite://", creator=conectar_lento, poolclass=database.PoolMedido, pool_size=1, max_overflow=0
+    )
+    database._instrumentar(engine)
+    totales = database._metricas_globales
+    try:
+        antes = dict(totales)
+        metricas = database.iniciar_metricas_peticion()
+        with engine.connect() as conexion:
+            for _ in range(3):
+                conexion.execute(text("SELECT 1"))
+        database.finalizar_metricas_peticion(metricas, "GET /test")
+        assert metricas["consultas"] == 3, metricas
+        assert metricas["conexion_ms"] >= 190, metricas
+        assert metricas["espera_pool_ms"] < 100, metricas
+        assert totales["conexiones_abiertas"] == antes["conexiones_abiertas"] + 1
+        print(f"✓ Conexión nueva: {metricas['conexion_ms']:.0f} ms de apertura, {metricas['espera_pool_ms']:.1f} ms de espera")
+        
+        # Con el único slot ocupado, el segundo checkout espera sin abrir conexión
+        ocupada = engine.connect()
+        threading.Timer(0.3, ocupada.close).start()
+        metricas = database.iniciar_metricas_peticion()
+        with engine.connect() as conexion:
+            conexion.execute(text("SELECT 1"))
+        database.finalizar_metricas_peticion(metricas, "GET /test")
+        assert metricas["espera_pool_ms"] >= 200, metricas
+        assert metricas["conexion_ms"] == 0, metricas
+        assert totales["conexiones_abiertas"] == antes["conexiones_abiertas"] + 1
+        print(f"✓ Pool lleno: {metricas['espera_pool_ms']:.0f} ms de espera, sin conexión nueva")
+        
+        endpoint = database.obtener_metricas_sql()["endpoints"]["GET /test"]
+        assert endpoint["peticiones"] >= 2 and endpoint["max_consultas"] >= 3, endpoint
+        print("✓ Métricas acumuladas por endpoint")
+        return True
+    finally:
+        engine.dispose()
+        database._metricas_endpoints.pop("GET /test", None)
+        shutil.rmtree(directorio, ignore_errors=True)
+
+
+def test_marca_archivo():
+    """Repetir el archivado con la marca de agua (o sin ella) no duplica filas"""
+    print("\n🧪 Test 16: Marca de agua del archivado")
+    print("-" * 50)
+    
+    import shutil
+    from datetime import datetime, timedelta
+    from models.db_models import ArchivoEmocionalDB, ArchivoAlmaBoardDB, EmocionLiberadaDB, ProgresoArchivoDB
+    from utils import archivado
+    
+    engine, SessionTemporal, directorio = _bd_temporal()
+    lote = archivado.LOTE_ARCHIVO
+    archivado.LOTE_ARCHIVO = 3
+    try:
+        db = SessionTemporal()
+        db.add(UsuarioDB(id=1, nombre="archivo"))
+        ahora = datetime.now()
+        viejo, reciente = ahora - timedelta(days=60), ahora - timedelta(days=1)
+        # Ids 7 y 8 recientes entre filas antiguas: la marca se queda en 6
+        fechas = [viejo + timedelta(minutes=i) for i in range(6)] + [reciente, reciente + timedelta(minutes=1), viejo + timedelta(minutes=9)]
+        for i, fecha in enumerate(fechas):
+            db.add(MoodMapDB(id=i + 1, usuario_id=1, felicidad=0.5, estres=0.3, motivacion=0.7, timestamp=fecha))
+            db.add(EmocionLiberadaDB(id=i + 1, usuario_id=1, emocion="ira", categoria="toxica",
+                                     intensidad_estimada=0.4, fecha_liberacion=fecha))
+        db.commit()
+        
+        def estado():
+            db.expire_all()
+            marca = db.get(ProgresoArchivoDB, "moodmaps")
+            return (
+                db.query(ArchivoEmocionalDB).count(), db.query(ArchivoAlmaBoardDB).count(),
+                marca.ultimo_id if marca else None
+            )
+        
+        assert archivado.archivar_datos_emocionales(db, 30) == 7
+        assert archivado.archivar_datos_alma_board(db, 30) == 7
+        primero = estado()
+        assert primero == (7, 7, 6), primero
+        print(f"✓ Primera ejecución: 7 + 7 filas, marca en {primero[2]} (antes del primer id reciente)")
+        
+        assert archivado.archivar_datos_emocionales(db, 30) == 0
+        assert archivado.archivar_datos_alma_board(db, 30) == 0
+        assert estado() == primero
+        print("✓ Segunda ejecución: 0 filas, marca sin cambios")
+        
+        db.query(ProgresoArchivoDB).delete()
+        db.commit()
+        assert archivado.archivar_datos_emocionales(db, 30) == 0
+        assert archivado.archivar_datos_alma_board(db, 30) == 0
+        assert estado() == primero
+        print("✓ Sin marca de agua: NOT EXISTS evita duplicados y la marca se reconstruye")
+        
+        db.query(MoodMapDB).filter(MoodMapDB.id == 7).update(
+            {"timestamp": viejo - timedelta(minutes=7)}, synchronize_session=False
+        )
+        db.query(MoodMapDB).filter(MoodMapDB.id == 8).update({"timestamp": viejo}, synchronize_session=False)
+        db.query(EmocionLiberadaDB).filter(EmocionLiberadaDB.id == 7).update(
+            {"fecha_liberacion": viejo - timedelta(minutes=7)}, synchronize_session=False
+        )
+        db.commit()
+        # El 8 tiene el mismo usuario y fecha que el 1: ya está archivado
+        assert archivado.archivar_datos_emocionales(db, 30) == 1
+        assert archivado.archivar_datos_alma_board(db, 30) == 1
+        assert estado() == (8, 8, 9), estado()
+        print("✓ Las filas que envejecen se archivan en la siguiente ejecución")
+        
+        db.close()
+        return True
+    finally:
+        archivado.LOTE_ARCHIVO = lote
+        engine.dispose()
+        shutil.rmtree(directorio, ignore_errors=True)
+
+
+def test_resumenes_incrementales():
+    """Recalcular solo las semanas pendientes deja los mismos resúmenes que reconstruirlos todos"""
+    print("\n🧪 Test 17: Resúmenes semanales incrementales")
+    print("-" * 50)
+    
+    import shutil
+    from datetime import datetime, timedelta
+    from models.db_models import EmocionLiberadaDB, GratitudDB, ResumenSemanalDB, SemanaPendienteResumenDB
+    from utils import archivado
+    
+    engine, SessionTemporal, directorio = _bd_temporal()
+    try:
+        db = SessionTemporal()
+        db.add_all([UsuarioDB(id=1, nombre="uno"), UsuarioDB(id=2, nombre="dos")])
+        inicio = datetime.now() - timedelta(days=120)
+        
+        def agregar(desde: int, hasta: int, minutos: int = 0):
+            for i in range(desde, hasta):
+                fecha = inicio + timedelta(days=i * 2, minutes=i + minutos)
+                usuario_id = 1 + i % 2
+                db.add(MoodMapDB(usuario_id=usuario_id, felicidad=(i % 10) / 10, estres=(i % 7) / 7,
+                                 motivacion=(i % 4) / 4, timestamp=fecha))
+                db.add(EmocionLiberadaDB(usuario_id=usuario_id, emocion="ira",
+                                         categoria=("toxica", "constructiva", "neutral")[i % 3],
+                                         intensidad_estimada=0.5, fecha_liberacion=fecha))
+                if i % 3 == 0:
+                    db.add(GratitudDB(usuario_id=usuario_id, texto_gratitud=f"gracias {i}", fecha_creacion=fecha))
+            db.commit()
+        
+        def resumenes():
+            db.expire_all()
+            return {
+                (r.usuario_id, r.semana_anio): (
+                    r.num_registros, r.felicidad_promedio, r.estres_max, r.num_microacciones,
+                    r.microacciones_mas_usadas, r.num_emociones_liberadas, r.num_gratitudes,
+                    r.emociones_mas_frecuentes
+                )
+                for r in db.query(ResumenSemanalDB)
+            }
+        
+        def archivar_y_comparar():
+            archivado.archivar_datos_emocionales(db, 30)
+            archivado.archivar_datos_alma_board(db, 30)
+            pendientes = db.query(SemanaPendienteResumenDB).count()
+            assert pendientes > 0
+            recalculadas = archivado.generar_resumen_semanal(db, solo_pendientes=True, propagar_errores=True)
+            assert recalculadas == pendientes, (recalculadas, pendientes)
+            assert db.query(SemanaPendienteResumenDB).count() == 0
+            incremental = resumenes()
+            
+            db.query(ResumenSemanalDB).delete()
+            db.commit()
+            archivado.generar_resumen_semanal(db, propagar_errores=True)
+            assert resumenes() == incremental
+            return recalculadas, len(incremental)
+        
+        agregar(0, 20)
+        recalculadas, total = archivar_y_comparar()
+        print(f"✓ Primer archivado: {recalculadas} semanas pendientes == reconstrucción completa ({total})")
+        
+        # Filas nuevas en semanas ya resumidas y en semanas nuevas
+        agregar(5, 25, minutos=30)
+        recalculadas, total = archivar_y_comparar()
+        assert recalculadas < total, (recalculadas, total)
+        print(f"✓ Segundo archivado: {recalculadas} de {total} semanas recalculadas, iguales a reconstruir")
+        
+        db.close()
+        return True
+    finally:
+        engine.dispose()
+        shutil.rmtree(directorio, ignore_errors=True)
+
+
+def _llenar_archivo_emocional(engine, filas: int = 25) -> list:
+    """Filas de archivo_emocional con embeddings, JSON y nulos para los tests de exportación"""
+    from datetime import datetime, timedelta
+    from sqlalchemy import insert
+    from models.db_models import ArchivoEmocionalDB
+    
+    ahora = datetime.now().replace(microsecond=0)
+    with engine.begin() as conexion:
+        conexion.execute(insert(ArchivoEmocionalDB.__table__), [{
+            "id": i,
+            "usuario_id": (1, 2, None)[i % 3],
+            "felicidad": (i % 10) / 10, "estres": (i % 7) / 7, "motivacion": (i % 5) / 5,
+            "embedding_latente": [0.5, 0.25, float(i), -1.0] if i % 4 else None,
+            "cluster_id": i % 3,
+            "microaccion_recomendada": ("calmarse", "animarse", None)[i % 3],
+            "feedback_efectividad": float(i % 5 + 1) if i % 2 else None,
+            "fecha_registro": ahora - timedelta(days=filas - i),
+            "semana_anio": "2026-W01",
+            "datos_extra": {"moodmap_id": i, "texto": "ñ, \"comillas\""}
+        } for i in range(1, filas + 1)])
+    return list(range(1, filas + 1))
+
+
+def test_exportacion_texto():
+    """NDJSON, CSV y JSON: mismas filas completas y paginadas por after_id, también con gzip"""
+    print("\n🧪 Test 18: Exportación NDJSON/CSV/JSON")
+    print("-" * 50)
+    
+    import csv
+    import gzip
+    import io
+    import json
+    import shutil
+    from utils.exportacion import consulta_emocional, generar_exportacion
+    
+    engine, SessionTemporal, directorio = _bd_temporal()
+    try:
+        ids = _llenar_archivo_emocional(engine)
+        
+        def exportar(formato: str, comprimir: bool = False, after_id=None, limite=None):
+            """(registros, cursor de la siguiente página o None)"""
+            cuerpo = b"".join(generar_exportacion(
+                consulta_emocional(after_id=after_id, limite=limite), formato, comprimir,
+                limite=limite, SessionFactory=SessionTemporal
+            ))
+            texto = (gzip.decompress(cuerpo) if comprimir else cuerpo).decode()
+            if formato == "json":
+                documento = json.loads(texto)
+                assert documento["total_registros"] == len(documento["datos"])
+                return documento["datos"], documento["siguiente_after_id"]
+            if formato == "ndjson":
+                registros = [json.loads(linea) for linea in texto.splitlines()]
+            else:
+                registros = list(csv.DictReader(io.StringIO(texto)))
+                for registro in registros:
+                    registro["id"] = int(registro["id"])
+                    registro["datos_extra"] = json.loads(registro["datos_extra"])
+            lleno = limite and len(registros) == limite
+            return registros, registros[-1]["id"] if lleno else None
+        
+        for formato in ("json", "ndjson", "csv"):
+            for comprimir in (False, True):
+                registros, siguiente = exportar(formato, comprimir)
+                assert sorted(r["id"] for r in registros) == ids, formato
+                assert siguiente is None
+                assert registros[0]["datos_extra"] == {"moodmap_id": registros[0]["id"], "texto": "ñ, \"comillas\""}
+            
+            paginas, recibidos, cursor = 0, [], None
+            while True:
+                registros, cursor = exportar(formato, after_id=cursor, limite=7)
+                paginas += 1
+                recibidos += [r["id"] for r in registros]
+                if cursor is None:
+                    break
+            assert recibidos == ids, (formato, recibidos)
+            assert paginas == 4, (formato, paginas)
+            print(f"✓ {formato}: {len(ids)} filas (también con gzip) y {paginas} páginas por after_id sin huecos ni duplicados")
+        
+        return True
+    finally:
+        engine.dispose()
+        shutil.rmtree(directorio, ignore_errors=True)
+
+
+def test_exportacion_columnar():
+    """Parquet y Arrow: mismas filas, embeddings N x D en float32 y paginación por after_id"""
+    print("\n🧪 Test 19: Exportación Parquet/Arrow")
+    print("-" * 50)
+    
+    import io
+    import shutil
+    from utils.exportacion import consulta_emocional
+    from utils.exportacion_arrow import ARROW_DISPONIBLE, escribir_columnar, generar_columnar
+    
+    if not ARROW_DISPONIBLE:
+        print("⚠️ pyarrow no está instalado: test omitido")
+        return True
+    
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    
+    def leer(formato: str, datos: bytes):
+        if formato == "parquet":
+            return pq.read_table(io.BytesIO(datos))
+        return pa.ipc.open_file(pa.BufferReader(datos)).read_all()
+    
+    engine, SessionTemporal, directorio = _bd_temporal()
+    try:
+        ids = _llenar_archivo_emocional(engine)
+        
+        for formato in ("parquet", "arrow"):
+            tabla = leer(formato, b"".join(generar_columnar(
+                consulta_emocional(), formato, SessionTemporal, filas_por_lote=10
+            )))
+            assert tabla.num_rows == len(ids)
+            assert sorted(tabla.column("id").to_pylist()) == ids
+            embedding = tabla.schema.field("embedding_latente").type
+            assert pa.types.is_fixed_size_list(embedding) and embedding.list_size == 4, embedding
+            assert embedding.value_type == pa.float32()
+            fila = tabla.column("id").to_pylist().index(5)
+            assert tabla.column("embedding_latente")[fila].as_py() == [0.5, 0.25, 5.0, -1.0]
+            assert tabla.column("embedding_latente")[ids.index(4)].as_py() is None
+            assert tabla.schema.field("fecha_registro").type == pa.timestamp("us")
+            
+            destino = io.BytesIO()
+            assert escribir_columnar(consulta_emocional(), destino, formato, SessionTemporal) == len(ids)
+            assert leer(formato, destino.getvalue()).equals(tabla)
+            
+            recibidos, cursor, paginas = [], None, 0
+            while True:
+                pagina = leer(formato, b"".join(generar_columnar(
+                    consulta_emocional(campos=["felicidad"], after_id=cursor, limite=7), formato, SessionTemporal
+                )))
+                assert pagina.column_names == ["id", "felicidad"]
+                recibidos += pagina.column("id").to_pylist()
+                paginas += 1
+                if pagina.num_rows < 7:
+                    break
+                cursor = recibidos[-1]
+            assert recibidos == ids, (formato, recibidos)
+            print(f"✓ {formato}: {tabla.num_rows} filas, embedding fixed_size_list<float32>[4], {paginas} páginas por after_id")
+        
+        return True
+    finally:
+        engine.dispose()
+        shutil.rmtree(directorio, ignore_errors=True)
+
+
 def limpiar_bd_test():
     """Limpia la base de datos de prueba"""
     print("\n🧹 Limpiando base de datos de prueba...")
@@ -127,6 +1185,15 @@ def limpiar_bd_test():
         print(f"✗ Error: {e}")
 
 
+def _ejecutar(test) -> bool:
+    """Ejecuta un test basado en asserts como los demás: True/False"""
+    try:
+        return test()
+    except Exception as e:
+        print(f"✗ Error: {e!r}")
+        return False
+
+
 def main():
     """Ejecuta todos los tests"""
     print("\n" + "=" * 50)
@@ -147,6 +1214,51 @@ def main():
     # Test 4: Limpieza
     resultados.append(("Limpieza datos", test_limpieza_datos()))
     
+    # Test 5: Planes de consulta
+    resultados.append(("Planes de consulta", test_planes_consulta()))
+    
+    # Test 6: Particiones rotadas
+    resultados.append(("Particiones rotadas", _ejecutar(test_particiones_rotadas)))
+    
+    # Test 7: Trabajos de archivado
+    resultados.append(("Trabajos de archivado", _ejecutar(test_trabajo_archivo)))
+    
+    # Test 8: Buffer de escritura
+    resultados.append(("Buffer de escritura", _ejecutar(test_buffer_escritura)))
+    
+    # Test 9: Segmentos del archivo
+    resultados.append(("Segmentos del archivo", _ejecutar(test_segmentos_archivo)))
+    
+    # Test 10: Almacenes de Q-values
+    resultados.append(("Almacenes de Q-values", _ejecutar(test_almacen_q)))
+    
+    # Test 11: Regla RL única
+    resultados.append(("Regla RL única", _ejecutar(test_regla_rl_unica)))
+    
+    # Test 12: LinUCB
+    resultados.append(("LinUCB", _ejecutar(test_linucb)))
+    
+    # Test 13: Replay RL
+    resultados.append(("Replay RL", _ejecutar(test_replay_rl)))
+    
+    # Test 14: Ids del archivo sellado
+    resultados.append(("Ids del archivo sellado", _ejecutar(test_segmentos_ids)))
+    
+    # Test 15: Métricas SQL
+    resultados.append(("Métricas SQL", _ejecutar(test_metricas_sql)))
+    
+    # Test 16: Marca de agua del archivado
+    resultados.append(("Marca de agua del archivado", _ejecutar(test_marca_archivo)))
+    
+    # Test 17: Resúmenes semanales incrementales
+    resultados.append(("Resúmenes semanales incrementales", _ejecutar(test_resumenes_incrementales)))
+    
+    # Test 18: Exportación NDJSON/CSV/JSON
+    resultados.append(("Exportación NDJSON/CSV/JSON", _ejecutar(test_exportacion_texto)))
+    
+    # Test 19: Exportación Parquet/Arrow
+    resultados.append(("Exportación Parquet/Arrow", _ejecutar(test_exportacion_columnar)))
+    
     # Resumen
     print("\n" + "=" * 50)
     print("📊 Resumen de Tests")
@@ -7,15 +7,17 @@ Fecha: 2026-01-11
 """
 
 from sqlalchemy.orm import Session
+from sqlalchemy import DateTime, Integer, and_, case, cast, delete, func, insert, literal, select, tuple_, update
 from datetime import datetime, timedelta
-from typing import Dict, List, Optional
+from typing import Dict, List, Optional, Tuple
 import logging
-from collections import Counter
+import os
 
 from models.db_models import (
     MoodMapDB, FeedbackDB, HistoricoInteraccionDB,
     EmocionLiberadaDB, GratitudDB,
-    ArchivoEmocionalDB, ArchivoAlmaBoardDB, ResumenSemanalDB
+    ArchivoEmocionalDB, ArchivoAlmaBoardDB, ResumenSemanalDB, ProgresoArchivoDB,
+    SemanaPendienteResumenDB, DIMENSIONES_EMBEDDING_TIPADAS
 )
 
 logger = logging.getLogger(__name__)
@@ -48,12 +50,277 @@ def obtener_mes_anio(fecha: datetime) -> str:
     return f"{fecha.year}-{fecha.month:02d}"
 
 
+# ============================================================
+# ARCHIVADO SET-BASED (INSERT ... SELECT POR LOTES DE ID)
+# ============================================================
+# Cada lote es una sola sentencia: la base de datos empareja cada MoodMap
+# con su feedback e interacción más cercanos (ROW_NUMBER sobre la ventana
+# de VENTANA_EMPAREJADO) y escribe el archivo sin pasar filas por Python.
+
+LOTE_ARCHIVO = int(os.getenv("ARCHIVO_LOTE", "5000"))
+VENTANA_EMPAREJADO = timedelta(hours=2)
+
+
+def _sumar_intervalo(dialecto: str, columna, intervalo: timedelta):
+    """columna + intervalo en SQL (SQLite guarda las fechas como texto)"""
+    if dialecto == "sqlite":
+        return func.strftime("%Y-%m-%d %H:%M:%f", columna, f"+{int(intervalo.total_seconds())} seconds")
+    return columna + intervalo
+
+
+def _semana_iso_sql(dialecto: str, columna):
+    """Equivalente SQL de obtener_semana_anio: "2026-W02" """
+    if dialecto == "sqlite":
+        # El jueves de la semana ISO decide el año y el número de semana
+        jueves = func.date(columna, "-3 days", "weekday 4")
+        semana = (cast(func.strftime("%j", jueves), Integer) - 1) // 7 + 1
+        return func.printf("%s-W%02d", func.strftime("%Y", jueves), semana)
+    return func.to_char(columna, 'IYYY-"W"IW')
+
+
+def _mes_anio_sql(dialecto: str, columna):
+    """Equivalente SQL de obtener_mes_anio: "2026-01" """
+    if dialecto == "sqlite":
+        return func.strftime("%Y-%m", columna)
+    return func.to_char(columna, "YYYY-MM")
+
+
+def _objeto_json(dialecto: str, **pares):
+    """Objeto JSON construido en SQL (datos_extra)"""
+    funcion = func.json_object if dialecto == "sqlite" else func.json_build_object
+    argumentos = []
+    for clave, valor in pares.items():
+        argumentos += [literal(clave), valor]
+    return funcion(*argumentos)
+
+
+def _arreglo_json(dialecto: str, *valores):
+    """Array JSON construido en SQL (embedding desde las columnas tipadas), NULL si falta el primero"""
+    funcion = func.json_array if dialecto == "sqlite" else func.json_build_array
+    return case((valores[0].is_(None), None), else_=funcion(*valores))
+
+
+def _fecha(valor) -> datetime:
+    """Las agregaciones sobre fechas devuelven texto en SQLite"""
+    return valor if isinstance(valor, datetime) else datetime.fromisoformat(valor)
+
+
+def _avanzar_marca(conexion, tabla: str, ultimo_id: int, filas: int):
+    """Guarda la marca de agua en la misma transacción que el lote archivado"""
+    progreso = ProgresoArchivoDB.__table__
+    ahora = datetime.now()
+    actualizada = conexion.execute(
+        update(progreso).where(progreso.c.tabla == tabla).values(
+            ultimo_id=ultimo_id,
+            filas_archivadas=progreso.c.filas_archivadas + filas,
+            fecha_actualizacion=ahora
+        )
+    ).rowcount
+    if not actualizada:
+        conexion.execute(insert(progreso).values(
+            tabla=tabla, ultimo_id=ultimo_id, filas_archivadas=filas, fecha_actualizacion=ahora
+        ))
+
+
+def _marcar_semanas(conexion, tabla, columna_fecha, id_desde: int, id_hasta: int, fecha_limite: datetime):
+    """
+    Marca como pendientes de resumen las semanas (usuario_id, semana_anio)
+    de las filas del lote, en la misma transacción que el archivado
+    """
+    pendientes = SemanaPendienteResumenDB.__table__
+    dialecto = conexion.dialect.name
+    ahora = datetime.now()
+    
+    semanas = select(
+        tabla.c.usuario_id,
+        _semana_iso_sql(dialecto, columna_fecha).label("semana_anio"),
+        literal(ahora, DateTime).label("fecha_marcada")
+    ).where(
+        tabla.c.id >= id_desde, tabla.c.id < id_hasta,
+        columna_fecha < fecha_limite, tabla.c.usuario_id.isnot(None)
+    ).distinct()
+    columnas = ["usuario_id", "semana_anio", "fecha_marcada"]
+    
+    if dialecto in ("postgresql", "sqlite"):
+        if dialecto == "postgresql":
+            from sqlalchemy.dialects.postgresql import insert as insert_dialecto
+        else:
+            from sqlalchemy.dialects.sqlite import insert as insert_dialecto
+        # Una semana ya marcada se vuelve a fechar: no se pierde si se está resumiendo ahora
+        sentencia = insert_dialecto(pendientes).from_select(columnas, semanas)
+        conexion.execute(sentencia.on_conflict_do_update(
+            index_elements=[pendientes.c.usuario_id, pendientes.c.semana_anio],
+            set_={"fecha_marcada": sentencia.excluded.fecha_marcada}
+        ))
+        return
+    
+    semana = semanas.subquery()
+    conexion.execute(insert(pendientes).from_select(columnas, select(semana).where(
+        ~select(pendientes.c.usuario_id).where(
+            pendientes.c.usuario_id == semana.c.usuario_id,
+            pendientes.c.semana_anio == semana.c.semana_anio
+        ).exists()
+    )))
+
+
+def _archivar_por_lotes(
+    db: Session, tabla, columna_fecha, fecha_limite: datetime, archivar_lote, progreso=None
+) -> int:
+    """
+    Archiva de forma incremental las filas anteriores a fecha_limite,
+    en lotes de LOTE_ARCHIVO ids a partir de la marca de agua de la tabla
+    
+    La marca avanza con cada lote confirmado, en su misma transacción, pero
+    nunca pasa del primer id que aún no tiene la antigüedad necesaria: las
+    filas por encima de ella se vuelven a mirar en la siguiente ejecución
+    (la comprobación NOT EXISTS de cada lote evita duplicarlas).
+    
+    Args:
+        db: Sesión de base de datos
+        tabla: Tabla de origen (Core)
+        columna_fecha: Columna de fecha de la tabla
+        fecha_limite: Solo filas anteriores a esta fecha
+        archivar_lote: función(conexion, id_desde, id_hasta) -> filas archivadas
+        progreso: función(filas) llamada antes de confirmar cada lote, para
+                  guardar el avance de un trabajo en la misma transacción
+        
+    Returns:
+        Total de filas archivadas
+    """
+    marca = db.get(ProgresoArchivoDB, tabla.name)
+    ultimo_id = marca.ultimo_id if marca is not None else 0
+    frontera = db.execute(
+        select(func.min(tabla.c.id)).where(columna_fecha >= fecha_limite)
+    ).scalar()
+    
+    id_min, id_max = db.execute(
+        select(func.min(tabla.c.id), func.max(tabla.c.id))
+        .where(columna_fecha < fecha_limite, tabla.c.id > ultimo_id)
+    ).one()
+    if id_min is None:
+        return 0
+    
+    archivados = 0
+    for id_desde in range(id_min, id_max + 1, LOTE_ARCHIVO):
+        id_hasta = min(id_desde + LOTE_ARCHIVO, id_max + 1)
+        conexion = db.connection()
+        filas = archivar_lote(conexion, id_desde, id_hasta)
+        if filas:
+            _marcar_semanas(conexion, tabla, columna_fecha, id_desde, id_hasta, fecha_limite)
+        
+        nueva_marca = id_hasta - 1 if frontera is None else min(id_hasta, frontera) - 1
+        if nueva_marca > ultimo_id or filas:
+            ultimo_id = max(ultimo_id, nueva_marca)
+            _avanzar_marca(conexion, tabla.name, ultimo_id, filas)
+        if progreso is not None:
+            progreso(filas)
+        db.commit()
+        archivados += filas
+    return archivados
+
+
+def _archivar_lote_emocional(conexion, id_desde: int, id_hasta: int, fecha_limite: datetime) -> int:
+    """Un INSERT ... SELECT para los MoodMaps con id en [id_desde, id_hasta)"""
+    from utils.particiones import seleccionar_rango
+    
+    dialecto = conexion.dialect.name
+    moodmap = MoodMapDB.__table__
+    archivo = ArchivoEmocionalDB.__table__
+    
+    en_lote = and_(moodmap.c.id >= id_desde, moodmap.c.id < id_hasta, moodmap.c.timestamp < fecha_limite)
+    fecha_min, fecha_max = conexion.execute(
+        select(func.min(moodmap.c.timestamp), func.max(moodmap.c.timestamp)).where(en_lote)
+    ).one()
+    if fecha_min is None:
+        return 0
+    
+    ya_archivado = select(archivo.c.id).where(
+        archivo.c.usuario_id == moodmap.c.usuario_id,
+        archivo.c.fecha_registro == moodmap.c.timestamp
+    ).exists()
+    moodmaps = select(
+        moodmap.c.id, moodmap.c.usuario_id, moodmap.c.felicidad,
+        moodmap.c.estres, moodmap.c.motivacion, moodmap.c.timestamp
+    ).where(en_lote, ~ya_archivado).cte("moodmaps_lote")
+    fin_ventana = _sumar_intervalo(dialecto, moodmaps.c.timestamp, VENTANA_EMPAREJADO)
+    
+    # Solo las particiones que solapan el lote + la ventana de emparejado
+    hasta = _fecha(fecha_max) + VENTANA_EMPAREJADO + timedelta(seconds=1)
+    feedbacks = seleccionar_rango(conexion, "feedbacks", _fecha(fecha_min), hasta)
+    interacciones = seleccionar_rango(conexion, "historico_interacciones", _fecha(fecha_min), hasta)
+    
+    # Primer feedback del usuario dentro de la ventana
+    feedback = select(
+        moodmaps.c.id.label("moodmap_id"), feedbacks.c.id, feedbacks.c.efectividad,
+        feedbacks.c.comodidad, feedbacks.c.energia,
+        func.row_number().over(
+            partition_by=moodmaps.c.id, order_by=(feedbacks.c.timestamp, feedbacks.c.id)
+        ).label("orden")
+    ).select_from(moodmaps).join(feedbacks, and_(
+        feedbacks.c.usuario_id == moodmaps.c.usuario_id,
+        feedbacks.c.timestamp >= moodmaps.c.timestamp,
+        feedbacks.c.timestamp <= fin_ventana
+    )).subquery("feedback_cercano")
+    
+    # Interacción "moodmap" guardada con el MoodMap (embedding, cluster y microacción),
+    # desde las columnas tipadas: sin leer ni decodificar los JSON de la fila
+    embedding = [interacciones.c[f"embedding_{i}"] for i in range(DIMENSIONES_EMBEDDING_TIPADAS)]
+    interaccion = select(
+        moodmaps.c.id.label("moodmap_id"), interacciones.c.id, *embedding,
+        interacciones.c.cluster_id, interacciones.c.microaccion,
+        func.row_number().over(
+            partition_by=moodmaps.c.id, order_by=(interacciones.c.fecha, interacciones.c.id)
+        ).label("orden")
+    ).select_from(moodmaps).join(interacciones, and_(
+        interacciones.c.usuario_id == moodmaps.c.usuario_id,
+        interacciones.c.tipo == "moodmap",
+        interacciones.c.fecha >= moodmaps.c.timestamp,
+        interacciones.c.fecha <= fin_ventana
+    )).subquery("interaccion_cercana")
+    
+    consulta = select(
+        moodmaps.c.usuario_id, moodmaps.c.felicidad, moodmaps.c.estres, moodmaps.c.motivacion,
+        _arreglo_json(dialecto, *(interaccion.c[columna.name] for columna in embedding)),
+        interaccion.c.cluster_id, interaccion.c.microaccion,
+        feedback.c.efectividad, feedback.c.comodidad, feedback.c.energia,
+        moodmaps.c.timestamp, _semana_iso_sql(dialecto, moodmaps.c.timestamp),
+        _objeto_json(
+            dialecto, moodmap_id=moodmaps.c.id,
+            feedback_id=feedback.c.id, interaccion_id=interaccion.c.id
+        )
+    ).select_from(moodmaps).outerjoin(
+        feedback, and_(feedback.c.moodmap_id == moodmaps.c.id, feedback.c.orden == 1)
+    ).outerjoin(
+        interaccion, and_(interaccion.c.moodmap_id == moodmaps.c.id, interaccion.c.orden == 1)
+    )
+    
+    resultado = conexion.execute(insert(archivo).from_select([
+        "usuario_id", "felicidad", "estres", "motivacion",
+        "embedding_latente", "cluster_id", "microaccion_recomendada",
+        "feedback_efectividad", "feedback_comodidad", "feedback_energia",
+        "fecha_registro", "semana_anio", "datos_extra"
+    ], consulta))
+    if dialecto == "sqlite":
+        # sqlite3 no informa rowcount de las sentencias que empiezan por WITH
+        filas = conexion.execute(select(func.changes())).scalar()
+    else:
+        filas = resultado.rowcount
+    
+    if filas:
+        # Cubo de investigación al día, en la misma transacción que el lote
+        from utils.cubo_investigacion import actualizar_cubo
+        actualizar_cubo(conexion)
+    return filas
+
+
 def archivar_datos_emocionales(db: Session, dias_antiguedad: int = 30) -> int:
     """
     Archiva datos emocionales (MoodMaps + Feedbacks) en la tabla de archivo permanente.
     
     Los datos archivados NUNCA se borran automáticamente.
     Solo archiva datos que tengan al menos 'dias_antiguedad' días.
+    Cada MoodMap se empareja con el primer feedback y la primera interacción
+    del usuario en las 2 horas siguientes, en SQL y por lotes de ids.
     
     Args:
         db: Sesión de base de datos
@@ -63,65 +330,9 @@ def archivar_datos_emocionales(db: Session, dias_antiguedad: int = 30) -> int:
         Número de registros archivados
     """
     try:
-        fecha_limite = datetime.utcnow() - timedelta(days=dias_antiguedad)
-        
-        # Obtener MoodMaps antiguos que no estén archivados
-        moodmaps = db.query(MoodMapDB).filter(
-            MoodMapDB.fecha_creacion < fecha_limite
-        ).all()
+        fecha_limite = datetime.now() - timedelta(days=dias_antiguedad)
+        archivados = archivar_fase(db, "emocionales", fecha_limite)
         
-        archivados = 0
-        
-        for moodmap in moodmaps:
-            # Verificar si ya está archivado
-            existe = db.query(ArchivoEmocionalDB).filter(
-                ArchivoEmocionalDB.usuario_id == moodmap.usuario_id,
-                ArchivoEmocionalDB.fecha_registro == moodmap.fecha_creacion
-            ).first()
-            
-            if existe:
-                continue
-            
-            # Buscar feedback asociado (si existe)
-            feedback = db.query(FeedbackDB).filter(
-                FeedbackDB.usuario_id == moodmap.usuario_id,
-                FeedbackDB.fecha_creacion >= moodmap.fecha_creacion,
-                FeedbackDB.fecha_creacion <= moodmap.fecha_creacion + timedelta(hours=2)
-            ).first()
-            
-            # Buscar interacción asociada
-            interaccion = db.query(HistoricoInteraccionDB).filter(
-                HistoricoInteraccionDB.usuario_id == moodmap.usuario_id,
-                HistoricoInteraccionDB.fecha >= moodmap.fecha_creacion,
-                HistoricoInteraccionDB.fecha <= moodmap.fecha_creacion + timedelta(hours=2),
-                HistoricoInteraccionDB.tipo == "microaccion"
-            ).first()
-            
-            # Crear registro de archivo
-            archivo = ArchivoEmocionalDB(
-                usuario_id=moodmap.usuario_id,
-                alegria=moodmap.alegria,
-                tristeza=moodmap.tristeza,
-                ansiedad=moodmap.ansiedad,
-                embedding_latente=moodmap.embedding_latente,
-                estado_clasificado=moodmap.estado_clasificado,
-                microaccion_recomendada=interaccion.datos.get("microaccion") if interaccion and interaccion.datos else None,
-                feedback_efectividad=feedback.efectividad if feedback else None,
-                feedback_comodidad=feedback.comodidad if feedback else None,
-                feedback_energia=feedback.energia if feedback else None,
-                fecha_registro=moodmap.fecha_creacion,
-                semana_anio=obtener_semana_anio(moodmap.fecha_creacion),
-                datos_extra={
-                    "moodmap_id": moodmap.id,
-                    "feedback_id": feedback.id if feedback else None,
-                    "interaccion_id": interaccion.id if interaccion else None
-                }
-            )
-            
-            db.add(archivo)
-            archivados += 1
-        
-        db.commit()
         logger.info(f"✓ Archivados {archivados} registros emocionales")
         return archivados
         
@@ -131,6 +342,62 @@ def archivar_datos_emocionales(db: Session, dias_antiguedad: int = 30) -> int:
         return 0
 
 
+def _archivar_lote_emociones(conexion, id_desde: int, id_hasta: int, fecha_limite: datetime) -> int:
+    """Emociones liberadas con id en [id_desde, id_hasta)"""
+    dialecto = conexion.dialect.name
+    emocion = EmocionLiberadaDB.__table__
+    archivo = ArchivoAlmaBoardDB.__table__
+    
+    ya_archivado = select(archivo.c.id).where(
+        archivo.c.usuario_id == emocion.c.usuario_id,
+        archivo.c.tipo == "emocion",
+        archivo.c.fecha_registro == emocion.c.fecha_liberacion
+    ).exists()
+    consulta = select(
+        emocion.c.usuario_id, literal("emocion"), emocion.c.emocion, emocion.c.categoria,
+        emocion.c.intensidad_estimada, emocion.c.fecha_liberacion,
+        _semana_iso_sql(dialecto, emocion.c.fecha_liberacion),
+        _mes_anio_sql(dialecto, emocion.c.fecha_liberacion),
+        _objeto_json(dialecto, emocion_id=emocion.c.id)
+    ).where(
+        emocion.c.id >= id_desde, emocion.c.id < id_hasta,
+        emocion.c.fecha_liberacion < fecha_limite, ~ya_archivado
+    )
+    
+    return conexion.execute(insert(archivo).from_select([
+        "usuario_id", "tipo", "emocion", "categoria", "intensidad",
+        "fecha_registro", "semana_anio", "mes_anio", "datos_extra"
+    ], consulta)).rowcount
+
+
+def _archivar_lote_gratitudes(conexion, id_desde: int, id_hasta: int, fecha_limite: datetime) -> int:
+    """Gratitudes con id en [id_desde, id_hasta)"""
+    dialecto = conexion.dialect.name
+    gratitud = GratitudDB.__table__
+    archivo = ArchivoAlmaBoardDB.__table__
+    
+    ya_archivado = select(archivo.c.id).where(
+        archivo.c.usuario_id == gratitud.c.usuario_id,
+        archivo.c.tipo == "gratitud",
+        archivo.c.fecha_registro == gratitud.c.fecha_creacion
+    ).exists()
+    consulta = select(
+        gratitud.c.usuario_id, literal("gratitud"), gratitud.c.texto_gratitud,
+        gratitud.c.embedding_texto, gratitud.c.fecha_creacion,
+        _semana_iso_sql(dialecto, gratitud.c.fecha_creacion),
+        _mes_anio_sql(dialecto, gratitud.c.fecha_creacion),
+        _objeto_json(dialecto, gratitud_id=gratitud.c.id)
+    ).where(
+        gratitud.c.id >= id_desde, gratitud.c.id < id_hasta,
+        gratitud.c.fecha_creacion < fecha_limite, ~ya_archivado
+    )
+    
+    return conexion.execute(insert(archivo).from_select([
+        "usuario_id", "tipo", "texto", "embedding_texto",
+        "fecha_registro", "semana_anio", "mes_anio", "datos_extra"
+    ], consulta)).rowcount
+
+
 def archivar_datos_alma_board(db: Session, dias_antiguedad: int = 30) -> int:
     """
     Archiva datos del Alma Board (emociones liberadas y gratitudes).
@@ -143,70 +410,9 @@ def archivar_datos_alma_board(db: Session, dias_antiguedad: int = 30) -> int:
         Número de registros archivados
     """
     try:
-        fecha_limite = datetime.utcnow() - timedelta(days=dias_antiguedad)
-        archivados = 0
-        
-        # Archivar emociones liberadas
-        emociones = db.query(EmocionLiberadaDB).filter(
-            EmocionLiberadaDB.fecha_liberacion < fecha_limite
-        ).all()
-        
-        for emocion in emociones:
-            # Verificar si ya está archivado
-            existe = db.query(ArchivoAlmaBoardDB).filter(
-                ArchivoAlmaBoardDB.usuario_id == emocion.usuario_id,
-                ArchivoAlmaBoardDB.tipo == "emocion",
-                ArchivoAlmaBoardDB.fecha_registro == emocion.fecha_liberacion
-            ).first()
-            
-            if existe:
-                continue
-            
-            archivo = ArchivoAlmaBoardDB(
-                usuario_id=emocion.usuario_id,
-                tipo="emocion",
-                categoria=emocion.categoria,
-                intensidad=emocion.intensidad,
-                fecha_registro=emocion.fecha_liberacion,
-                semana_anio=obtener_semana_anio(emocion.fecha_liberacion),
-                mes_anio=obtener_mes_anio(emocion.fecha_liberacion),
-                datos_extra={"emocion_id": emocion.id}
-            )
-            
-            db.add(archivo)
-            archivados += 1
-        
-        # Archivar gratitudes
-        gratitudes = db.query(GratitudDB).filter(
-            GratitudDB.fecha_creacion < fecha_limite
-        ).all()
-        
-        for gratitud in gratitudes:
-            # Verificar si ya está archivado
-            existe = db.query(ArchivoAlmaBoardDB).filter(
-                ArchivoAlmaBoardDB.usuario_id == gratitud.usuario_id,
-                ArchivoAlmaBoardDB.tipo == "gratitud",
-                ArchivoAlmaBoardDB.fecha_registro == gratitud.fecha_creacion
-            ).first()
-            
-            if existe:
-                continue
-            
-            archivo = ArchivoAlmaBoardDB(
-                usuario_id=gratitud.usuario_id,
-                tipo="gratitud",
-                texto=gratitud.texto,
-                embedding_texto=gratitud.embedding_texto,
-                fecha_registro=gratitud.fecha_creacion,
-                semana_anio=obtener_semana_anio(gratitud.fecha_creacion),
-                mes_anio=obtener_mes_anio(gratitud.fecha_creacion),
-                datos_extra={"gratitud_id": gratitud.id}
-            )
-            
-            db.add(archivo)
-            archivados += 1
+        fecha_limite = datetime.now() - timedelta(days=dias_antiguedad)
+        archivados = archivar_fase(db, "alma_board", fecha_limite)
         
-        db.commit()
         logger.info(f"✓ Archivados {archivados} registros de Alma Board")
         return archivados
         
@@ -216,117 +422,272 @@ def archivar_datos_alma_board(db: Session, dias_antiguedad: int = 30) -> int:
         return 0
 
 
-def generar_resumen_semanal(db: Session, usuario_id: Optional[int] = None) -> int:
+def _fuentes_fase(fase: str) -> List[Tuple]:
+    """(tabla, columna de fecha, función de lote) de cada tabla de origen de la fase"""
+    if fase == "emocionales":
+        moodmap = MoodMapDB.__table__
+        return [(moodmap, moodmap.c.timestamp, _archivar_lote_emocional)]
+    if fase == "alma_board":
+        emocion = EmocionLiberadaDB.__table__
+        gratitud = GratitudDB.__table__
+        return [
+            (emocion, emocion.c.fecha_liberacion, _archivar_lote_emociones),
+            (gratitud, gratitud.c.fecha_creacion, _archivar_lote_gratitudes)
+        ]
+    raise ValueError(f"Fase de archivado desconocida: {fase}")
+
+
+def archivar_fase(db: Session, fase: str, fecha_limite: datetime, progreso=None) -> int:
+    """
+    Archiva una fase ("emocionales" o "alma_board") hasta fecha_limite.
+    A diferencia de archivar_datos_*, propaga los errores (trabajos de archivado).
+    
+    Args:
+        db: Sesión de base de datos
+        fase: Fase de archivado
+        fecha_limite: Solo filas anteriores a esta fecha
+        progreso: función(filas) llamada antes de confirmar cada lote
+        
+    Returns:
+        Número de registros archivados
+    """
+    archivados = 0
+    for tabla, columna_fecha, archivar_lote in _fuentes_fase(fase):
+        archivados += _archivar_por_lotes(
+            db, tabla, columna_fecha, fecha_limite,
+            lambda conexion, desde, hasta: archivar_lote(conexion, desde, hasta, fecha_limite),
+            progreso
+        )
+    return archivados
+
+
+def estimar_pendientes(db: Session, fase: str, fecha_limite: datetime) -> int:
+    """
+    Filas pendientes de la fase por encima de la marca de agua
+    (estimación: incluye las que el NOT EXISTS acabe descartando)
+    """
+    total = 0
+    for tabla, columna_fecha, _ in _fuentes_fase(fase):
+        marca = db.get(ProgresoArchivoDB, tabla.name)
+        total += db.execute(
+            select(func.count()).select_from(tabla).where(
+                columna_fecha < fecha_limite,
+                tabla.c.id > (marca.ultimo_id if marca is not None else 0)
+            )
+        ).scalar()
+    return total
+
+
+# Microacciones y categorías de emoción guardadas por resumen semanal
+TOP_RESUMEN = 5
+
+
+def _top_por_semana(db: Session, tabla, columna, filtros: List) -> Dict[Tuple, List[Tuple]]:
+    """
+    Los TOP_RESUMEN valores más frecuentes de una columna por (usuario_id, semana_anio),
+    con ROW_NUMBER() sobre un GROUP BY: una sola consulta para todas las semanas
+    
+    Returns:
+        {(usuario_id, semana_anio): [(valor, veces), ...]} en orden de frecuencia
+    """
+    conteo = select(
+        tabla.c.usuario_id, tabla.c.semana_anio,
+        columna.label("valor"), func.count().label("veces")
+    ).where(*filtros, columna.isnot(None)).group_by(
+        tabla.c.usuario_id, tabla.c.semana_anio, columna
+    ).subquery("conteo")
+    
+    ranking = select(
+        conteo,
+        func.row_number().over(
+            partition_by=(conteo.c.usuario_id, conteo.c.semana_anio),
+            order_by=(conteo.c.veces.desc(), conteo.c.valor)
+        ).label("puesto")
+    ).subquery("ranking")
+    
+    top: Dict[Tuple, List[Tuple]] = {}
+    for usuario, semana_anio, valor, veces in db.execute(
+        select(ranking.c.usuario_id, ranking.c.semana_anio, ranking.c.valor, ranking.c.veces)
+        .where(ranking.c.puesto <= TOP_RESUMEN)
+        .order_by(ranking.c.usuario_id, ranking.c.semana_anio, ranking.c.puesto)
+    ):
+        top.setdefault((usuario, semana_anio), []).append((valor, veces))
+    return top
+
+
+def _upsert_resumenes(conexion, filas: List[Dict]):
+    """
+    INSERT ... ON CONFLICT (usuario_id, semana_anio) DO UPDATE por lotes
+    (actualización + inserción fila a fila en otros motores)
+    """
+    tabla = ResumenSemanalDB.__table__
+    actualizables = [columna for columna in filas[0] if columna not in ("usuario_id", "semana_anio")]
+    
+    if conexion.dialect.name in ("postgresql", "sqlite"):
+        if conexion.dialect.name == "postgresql":
+            from sqlalchemy.dialects.postgresql import insert as insert_dialecto
+        else:
+            from sqlalchemy.dialects.sqlite import insert as insert_dialecto
+        sentencia = insert_dialecto(tabla)
+        sentencia = sentencia.on_conflict_do_update(
+            index_elements=[tabla.c.usuario_id, tabla.c.semana_anio],
+            set_={columna: sentencia.excluded[columna] for columna in actualizables}
+        )
+        for inicio in range(0, len(filas), LOTE_ARCHIVO):
+            conexion.execute(sentencia, filas[inicio:inicio + LOTE_ARCHIVO])
+        return
+    
+    for fila in filas:
+        actualizada = conexion.execute(
+            update(tabla).where(
+                tabla.c.usuario_id == fila["usuario_id"],
+                tabla.c.semana_anio == fila["semana_anio"]
+            ).values(**{columna: fila[columna] for columna in actualizables})
+        ).rowcount
+        if not actualizada:
+            conexion.execute(insert(tabla).values(**fila))
+
+
+def generar_resumen_semanal(
+    db: Session, usuario_id: Optional[int] = None, solo_pendientes: bool = False,
+    propagar_errores: bool = False
+) -> int:
     """
     Genera resúmenes semanales consolidados de datos de usuarios.
     
+    Las semanas se agregan en SQL (GROUP BY usuario_id, semana_anio), los
+    top 5 salen de funciones de ventana y los resúmenes se guardan con un
+    upsert por lotes. Las filas archivadas sin usuario (usuario eliminado)
+    no generan resumen.
+    
+    El archivado marca las semanas que toca en semanas_pendientes_resumen;
+    con solo_pendientes=True solo se recalculan esas (cada semana se vuelve
+    a agregar entera: medias y top 5 no se pueden combinar sin los recuentos
+    por valor, y una semana de un usuario son pocas filas).
+    
+    Las semanas que tocan un mes sellado en segmentos (ARCHIVO_SEGMENTOS)
+    nunca se recalculan: parte de sus filas ya no está en la base de datos
+    y se conserva el resumen calculado antes del sellado.
+    
     Args:
         db: Sesión de base de datos
         usuario_id: ID de usuario específico, o None para todos
+        solo_pendientes: Recalcular solo las semanas marcadas por el archivado
+        propagar_errores: Relanzar los errores en vez de devolver 0
+                          (trabajos de archivado, como archivar_fase)
         
     Returns:
         Número de resúmenes generados/actualizados
     """
     try:
-        # Obtener todas las semanas únicas del archivo emocional
+        emocional = ArchivoEmocionalDB.__table__
+        alma = ArchivoAlmaBoardDB.__table__
+        pendientes = SemanaPendienteResumenDB.__table__
+        inicio = datetime.now()
+        
+        filtros_emocional = [emocional.c.usuario_id.isnot(None), emocional.c.semana_anio.isnot(None)]
+        filtros_alma = [alma.c.usuario_id.isnot(None), alma.c.semana_anio.isnot(None)]
+        marcas_atendidas = [pendientes.c.fecha_marcada <= inicio]
         if usuario_id:
-            semanas = db.query(
-                ArchivoEmocionalDB.usuario_id,
-                ArchivoEmocionalDB.semana_anio
-            ).filter(
-                ArchivoEmocionalDB.usuario_id == usuario_id
-            ).distinct().all()
-        else:
-            semanas = db.query(
-                ArchivoEmocionalDB.usuario_id,
-                ArchivoEmocionalDB.semana_anio
-            ).distinct().all()
+            filtros_emocional.append(emocional.c.usuario_id == usuario_id)
+            filtros_alma.append(alma.c.usuario_id == usuario_id)
+            marcas_atendidas.append(pendientes.c.usuario_id == usuario_id)
+        from utils.segmentos_archivo import semanas_selladas
+        selladas = semanas_selladas()
+        if selladas:
+            filtros_emocional.append(emocional.c.semana_anio.notin_(selladas))
+            filtros_alma.append(alma.c.semana_anio.notin_(selladas))
+        if solo_pendientes:
+            semanas = select(pendientes.c.usuario_id, pendientes.c.semana_anio).where(*marcas_atendidas)
+            filtros_emocional.append(tuple_(emocional.c.usuario_id, emocional.c.semana_anio).in_(semanas))
+            filtros_alma.append(tuple_(alma.c.usuario_id, alma.c.semana_anio).in_(semanas))
         
-        resumenes_generados = 0
+        # Estadísticas emocionales y de microacciones
+        emocionales = {
+            (fila.usuario_id, fila.semana_anio): fila
+            for fila in db.execute(
+                select(
+                    emocional.c.usuario_id, emocional.c.semana_anio,
+                    func.count().label("num_registros"),
+                    func.avg(emocional.c.felicidad).label("felicidad_promedio"),
+                    func.avg(emocional.c.estres).label("estres_promedio"),
+                    func.avg(emocional.c.motivacion).label("motivacion_promedio"),
+                    func.max(emocional.c.felicidad).label("felicidad_max"),
+                    func.max(emocional.c.estres).label("estres_max"),
+                    func.max(emocional.c.motivacion).label("motivacion_max"),
+                    func.count(emocional.c.microaccion_recomendada).label("num_microacciones"),
+                    func.avg(emocional.c.feedback_efectividad).label("efectividad_promedio")
+                ).where(*filtros_emocional).group_by(emocional.c.usuario_id, emocional.c.semana_anio)
+            )
+        }
         
-        for usuario_id, semana_anio in semanas:
-            if not semana_anio:
-                continue
-                
-            # Extraer año y semana
+        # Recuentos del Alma Board
+        alma_board = {
+            (fila.usuario_id, fila.semana_anio): fila
+            for fila in db.execute(
+                select(
+                    alma.c.usuario_id, alma.c.semana_anio,
+                    func.sum(case((alma.c.tipo == "emocion", 1), else_=0)).label("num_emociones_liberadas"),
+                    func.sum(case((alma.c.tipo == "gratitud", 1), else_=0)).label("num_gratitudes")
+                ).where(*filtros_alma).group_by(alma.c.usuario_id, alma.c.semana_anio)
+            )
+        }
+        
+        microacciones = _top_por_semana(db, emocional, emocional.c.microaccion_recomendada, filtros_emocional)
+        categorias = _top_por_semana(db, alma, alma.c.categoria, filtros_alma + [alma.c.tipo == "emocion"])
+        
+        ahora = datetime.now()
+        filas = []
+        for clave in sorted(emocionales.keys() | alma_board.keys()):
+            usuario, semana_anio = clave
             try:
-                año, semana = semana_anio.split('-W')
-                año = int(año)
-                semana = int(semana)
-            except:
+                año, semana = (int(parte) for parte in semana_anio.split('-W'))
+            except ValueError:
                 continue
             
-            # Verificar si ya existe el resumen
-            resumen = db.query(ResumenSemanalDB).filter(
-                ResumenSemanalDB.usuario_id == usuario_id,
-                ResumenSemanalDB.semana_anio == semana_anio
-            ).first()
-            
-            if not resumen:
-                resumen = ResumenSemanalDB(
-                    usuario_id=usuario_id,
-                    semana_anio=semana_anio,
-                    anio=año,
-                    semana=semana
-                )
-                db.add(resumen)
-            
-            # Calcular estadísticas de datos emocionales
-            datos_emocionales = db.query(ArchivoEmocionalDB).filter(
-                ArchivoEmocionalDB.usuario_id == usuario_id,
-                ArchivoEmocionalDB.semana_anio == semana_anio
-            ).all()
-            
-            if datos_emocionales:
-                resumen.num_registros = len(datos_emocionales)
-                resumen.alegria_promedio = sum(d.alegria for d in datos_emocionales) / len(datos_emocionales)
-                resumen.tristeza_promedio = sum(d.tristeza for d in datos_emocionales) / len(datos_emocionales)
-                resumen.ansiedad_promedio = sum(d.ansiedad for d in datos_emocionales) / len(datos_emocionales)
-                resumen.alegria_max = max(d.alegria for d in datos_emocionales)
-                resumen.tristeza_max = max(d.tristeza for d in datos_emocionales)
-                resumen.ansiedad_max = max(d.ansiedad for d in datos_emocionales)
-                
-                # Microacciones más usadas
-                microacciones = [d.microaccion_recomendada for d in datos_emocionales if d.microaccion_recomendada]
-                if microacciones:
-                    contador = Counter(microacciones)
-                    resumen.microacciones_mas_usadas = [{"microaccion": m, "count": c} for m, c in contador.most_common(5)]
-                    resumen.num_microacciones = len(microacciones)
-                
-                # Efectividad promedio
-                efectividades = [d.feedback_efectividad for d in datos_emocionales if d.feedback_efectividad]
-                if efectividades:
-                    resumen.efectividad_promedio = sum(efectividades) / len(efectividades)
-            
-            # Estadísticas de Alma Board
-            datos_alma = db.query(ArchivoAlmaBoardDB).filter(
-                ArchivoAlmaBoardDB.usuario_id == usuario_id,
-                ArchivoAlmaBoardDB.semana_anio == semana_anio
-            ).all()
-            
-            if datos_alma:
-                emociones = [d for d in datos_alma if d.tipo == "emocion"]
-                gratitudes = [d for d in datos_alma if d.tipo == "gratitud"]
-                
-                resumen.num_emociones_liberadas = len(emociones)
-                resumen.num_gratitudes = len(gratitudes)
-                
-                # Emociones más frecuentes
-                if emociones:
-                    categorias = [e.categoria for e in emociones if e.categoria]
-                    contador = Counter(categorias)
-                    resumen.emociones_mas_frecuentes = [{"categoria": c, "count": cnt} for c, cnt in contador.most_common(5)]
-            
-            resumen.fecha_actualizacion = datetime.utcnow()
-            resumenes_generados += 1
+            emocion = emocionales.get(clave)
+            tablero = alma_board.get(clave)
+            top_microacciones = microacciones.get(clave)
+            top_categorias = categorias.get(clave)
+            filas.append({
+                "usuario_id": usuario,
+                "semana_anio": semana_anio,
+                "anio": año,
+                "semana": semana,
+                "num_registros": emocion.num_registros if emocion else 0,
+                "felicidad_promedio": emocion.felicidad_promedio if emocion else None,
+                "estres_promedio": emocion.estres_promedio if emocion else None,
+                "motivacion_promedio": emocion.motivacion_promedio if emocion else None,
+                "felicidad_max": emocion.felicidad_max if emocion else None,
+                "estres_max": emocion.estres_max if emocion else None,
+                "motivacion_max": emocion.motivacion_max if emocion else None,
+                "num_microacciones": emocion.num_microacciones if emocion else 0,
+                "microacciones_mas_usadas": [
+                    {"microaccion": m, "count": c} for m, c in top_microacciones
+                ] if top_microacciones else None,
+                "efectividad_promedio": emocion.efectividad_promedio if emocion else None,
+                "num_emociones_liberadas": tablero.num_emociones_liberadas if tablero else 0,
+                "num_gratitudes": tablero.num_gratitudes if tablero else 0,
+                "emociones_mas_frecuentes": [
+                    {"categoria": c, "count": cnt} for c, cnt in top_categorias
+                ] if top_categorias else None,
+                "fecha_actualizacion": ahora
+            })
         
+        if filas:
+            _upsert_resumenes(db.connection(), filas)
+        # Las semanas marcadas después de empezar siguen pendientes
+        db.execute(delete(pendientes).where(*marcas_atendidas))
         db.commit()
-        logger.info(f"✓ Generados/actualizados {resumenes_generados} resúmenes semanales")
-        return resumenes_generados
+        
+        logger.info(f"✓ Generados/actualizados {len(filas)} resúmenes semanales")
+        return len(filas)
         
     except Exception as e:
         logger.error(f"Error generando resúmenes semanales: {e}")
         db.rollback()
+        if propagar_errores:
+            raise
         return 0
 
 
@@ -359,7 +720,7 @@ def archivar_todo(db: Session, dias_antiguedad: int = 30) -> Dict[str, int]:
         resultado["alma_board"] = archivar_datos_alma_board(db, dias_antiguedad)
         
         # 3. Generar resúmenes semanales
-        resultado["resumenes"] = generar_resumen_semanal(db)
+        resultado["resumenes"] = generar_resumen_semanal(db, solo_pendientes=True)
         
         total = sum(resultado.values())
         logger.info(f"✓ Archivado completado: {total} registros totales")
@@ -400,9 +761,25 @@ def obtener_estadisticas_archivo(db: Session) -> Dict:
                 "total_resumenes": db.query(ResumenSemanalDB).count(),
                 "usuarios_unicos": db.query(ResumenSemanalDB.usuario_id).distinct().count(),
                 "semanas_cubiertas": db.query(ResumenSemanalDB.semana_anio).distinct().count()
+            },
+            "progreso": {
+                marca.tabla: {
+                    "ultimo_id": marca.ultimo_id,
+                    "filas_archivadas": marca.filas_archivadas,
+                    "fecha_actualizacion": marca.fecha_actualizacion.isoformat() if marca.fecha_actualizacion else None
+                }
+                for marca in db.query(ProgresoArchivoDB).all()
             }
         }
         
+        # Marca del cubo de investigación (tabla propia, no es una tabla de origen)
+        from utils.cubo_investigacion import marca_cubo
+        stats["cubo_investigacion"] = marca_cubo(db.connection())
+        
+        # Filas selladas en segmentos en disco (ya no están en la BD)
+        from utils.segmentos_archivo import estadisticas_segmentos
+        stats["segmentos"] = estadisticas_segmentos()
+        
         # Fechas
         primera = db.query(ArchivoEmocionalDB).order_by(ArchivoEmocionalDB.fecha_registro).first()
         ultima = db.query(ArchivoEmocionalDB).order_by(ArchivoEmocionalDB.fecha_registro.desc()).first()
@@ -0,0 +1,287 @@
+"""
+Buffer de escritura con group commit para tablas de solo inserción
+(MoodMapDB, HistoricoInteraccionDB, DestelloDB)
+
+Las peticiones encolan filas en memoria y un hilo escritor las vuelca cada
+pocos milisegundos como un INSERT multi-fila por tabla dentro de una única
+transacción: un solo commit (un fsync en SQLite) para cientos de peticiones.
+
+Durabilidad (WRITE_BUFFER_DURABILIDAD):
+- memoria: la petición responde al encolar. Ante una caída del proceso se
+  pierden como mucho las filas de los últimos WRITE_BUFFER_INTERVALO_MS.
+- commit: la petición espera a que su lote esté confirmado en la base de
+  datos (misma garantía que un commit directo, con commits agrupados).
+
+Las filas encoladas no son visibles para las lecturas hasta el siguiente
+volcado.
+"""
+
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import insert
+import logging
+
+from utils.contadores import sumar_filas
+
+logger = logging.getLogger(__name__)
+
+DURABILIDADES = ("memoria", "commit")
+
+
+class BufferLleno(Exception):
+    """La cola no tiene sitio para todas las filas de la petición"""
+
+
+class BufferEscritura:
+    """
+    Cola acotada + hilo escritor que agrupa inserciones en transacciones
+    """
+
+    def __init__(
+        self,
+        engine,
+        modelos: Tuple = (),
+        capacidad: int = 10000,
+        intervalo_ms: float = 5.0,
+        max_lote: int = 500,
+        durabilidad: str = "memoria"
+    ):
+        """
+        Args:
+            engine: Engine síncrono donde se escriben los lotes
+            modelos: Modelos permitidos (tablas de solo inserción)
+            capacidad: Filas máximas en cola (contrapresión al llenarse)
+            intervalo_ms: Tiempo máximo que una fila espera a su lote
+            max_lote: Filas máximas por transacción
+            durabilidad: "memoria" o "commit"
+        """
+        if durabilidad not in DURABILIDADES:
+            raise ValueError(f"Durabilidad desconocida: {durabilidad}. Opciones: {', '.join(DURABILIDADES)}")
+
+        self.engine = engine
+        self.modelos = {modelo.__tablename__ for modelo in modelos}
+        self.intervalo = intervalo_ms / 1000.0
+        self.max_lote = max_lote
+        self.durabilidad = durabilidad
+
+        self._cola: "queue.Queue" = queue.Queue(maxsize=capacidad)
+        # Solo los productores añaden filas, y bajo este cerrojo: el hueco
+        # comprobado no puede encoger antes de encolarlas
+        self._cerrojo_encolar = threading.Lock()
+        self._hilo: Optional[threading.Thread] = None
+        self._detener = threading.Event()
+
+        # Estadísticas
+        self.filas_escritas = 0
+        self.lotes_escritos = 0
+        self.errores = 0
+
+    # ------------------------------------------------------------
+    # API para los endpoints
+    # ------------------------------------------------------------
+
+    def encolar(self, modelo, **valores) -> Future:
+        """
+        Encola una fila para el siguiente lote (ver encolar_filas)
+
+        Args:
+            modelo: Clase del modelo (debe estar en self.modelos)
+            **valores: Valores de las columnas
+
+        Returns:
+            Future que se completa cuando el lote se ha confirmado
+            (en modo "memoria" no hace falta esperarlo)
+
+        Raises:
+            BufferLleno: si la cola está llena
+        """
+        return self.encolar_filas([(modelo, valores)])[0]
+
+    def encolar_filas(self, filas: List[Tuple]) -> List[Future]:
+        """
+        Encola todas las filas (modelo, valores) de una petición o ninguna
+
+        Nunca bloquea (se llama desde el bucle de eventos): si no caben
+        todas, lanza BufferLleno sin encolar nada, para que la petición las
+        escriba enteras por su cuenta y no repartidas entre dos transacciones.
+
+        Las columnas con default de Python (p. ej. timestamp=datetime.now)
+        se evalúan aquí, para que la fila conserve la hora de la petición.
+
+        Args:
+            filas: Lista de (modelo, valores); los modelos deben estar en self.modelos
+
+        Returns:
+            Un Future por fila, que se completa cuando su lote se ha confirmado
+            (en modo "memoria" no hace falta esperarlos)
+
+        Raises:
+            BufferLleno: si la cola no tiene sitio para todas las filas
+        """
+        elementos = []
+        for modelo, valores in filas:
+            tabla = modelo.__table__
+            if tabla.name not in self.modelos:
+                raise ValueError(f"{modelo.__name__} no admite escritura diferida")
+
+            valores = dict(valores)
+            for columna in tabla.columns:
+                if columna.name not in valores and columna.default is not None and not columna.primary_key:
+                    if columna.default.is_callable:
+                        valores[columna.name] = columna.default.arg(None)
+                    elif columna.default.is_scalar:
+                        valores[columna.name] = columna.default.arg
+            elementos.append((tabla, valores, Future()))
+
+        with self._cerrojo_encolar:
+            if self._cola.maxsize - self._cola.qsize() < len(elementos):
+                raise BufferLleno(f"Buffer de escritura lleno ({self._cola.maxsize} filas)")
+            for elemento in elementos:
+                self._cola.put_nowait(elemento)
+        return [futuro for _, _, futuro in elementos]
+
+    def debe_esperar(self) -> bool:
+        """True si la petición debe esperar al commit de su lote"""
+        return self.durabilidad == "commit"
+
+    # ------------------------------------------------------------
+    # Ciclo de vida
+    # ------------------------------------------------------------
+
+    def iniciar(self):
+        """Arranca el hilo escritor"""
+        if self._hilo is not None and self._hilo.is_alive():
+            return
+        self._detener.clear()
+        self._hilo = threading.Thread(target=self._bucle, name="buffer-escritura", daemon=True)
+        self._hilo.start()
+        print(f"✓ Buffer de escritura activo ({self.durabilidad}, {self.intervalo * 1000:.0f} ms)")
+
+    def detener(self, timeout: float = 30.0):
+        """
+        Vacía la cola y detiene el escritor (llamar al apagar el servidor)
+
+        Args:
+            timeout: Segundos máximos de espera para el vaciado
+        """
+        if self._hilo is None:
+            return
+        self._detener.set()
+        self._hilo.join(timeout)
+        pendientes = self._cola.qsize()
+        if pendientes:
+            logger.error(f"❌ Buffer de escritura detenido con {pendientes} filas sin escribir")
+        else:
+            print(f"✓ Buffer de escritura vaciado ({self.filas_escritas} filas en {self.lotes_escritos} lotes)")
+        self._hilo = None
+
+    def estadisticas(self) -> Dict:
+        """Estado actual del buffer"""
+        return {
+            "activo": self._hilo is not None and self._hilo.is_alive(),
+            "durabilidad": self.durabilidad,
+            "en_cola": self._cola.qsize(),
+            "capacidad": self._cola.maxsize,
+            "filas_escritas": self.filas_escritas,
+            "lotes_escritos": self.lotes_escritos,
+            "filas_por_lote": self.filas_escritas / self.lotes_escritos if self.lotes_escritos else 0.0,
+            "errores": self.errores
+        }
+
+    # ------------------------------------------------------------
+    # Hilo escritor
+    # ------------------------------------------------------------
+
+    def _bucle(self):
+        while True:
+            lote = self._recoger_lote()
+            if lote:
+                self._escribir(lote)
+            elif self._detener.is_set():
+                return
+
+    def _recoger_lote(self) -> List:
+        """Espera la primera fila y añade las que lleguen durante el intervalo"""
+        try:
+            lote = [self._cola.get(timeout=0.1)]
+        except queue.Empty:
+            return []
+
+        limite = time.monotonic() + self.intervalo
+        while len(lote) < self.max_lote:
+            restante = limite - time.monotonic()
+            try:
+                if restante > 0 and not self._detener.is_set():
+                    lote.append(self._cola.get(timeout=restante))
+                else:
+                    lote.append(self._cola.get_nowait())
+            except queue.Empty:
+                break
+        return lote
+
+    def _escribir(self, lote: List):
+        """Un INSERT multi-fila por tabla (y juego de columnas) en una transacción"""
+        grupos: Dict[Tuple, List[Dict]] = {}
+        for tabla, valores, _ in lote:
+            grupos.setdefault((tabla, tuple(sorted(valores))), []).append(valores)
+
+        try:
+            with self.engine.begin() as conexion:
+                for (tabla, _), filas in grupos.items():
+                    conexion.execute(insert(tabla).values(filas))
+                    sumar_filas(conexion, tabla.name, filas)
+            self._completar(lote)
+        except Exception as e:
+            logger.error(f"❌ Error escribiendo lote de {len(lote)} filas, reintentando una a una: {e}")
+            self._escribir_individual(lote)
+
+        self.lotes_escritos += 1
+
+    def _escribir_individual(self, lote: List):
+        """Reintento fila a fila para que una fila inválida no descarte el lote"""
+        for tabla, valores, futuro in lote:
+            try:
+                with self.engine.begin() as conexion:
+                    conexion.execute(insert(tabla).values(**valores))
+                    sumar_filas(conexion, tabla.name, [valores])
+                self.filas_escritas += 1
+                futuro.set_result(True)
+            except Exception as e:
+                self.errores += 1
+                logger.error(f"❌ Fila descartada en {tabla.name}: {e}")
+                futuro.set_exception(e)
+
+    def _completar(self, lote: List):
+        self.filas_escritas += len(lote)
+        for _, _, futuro in lote:
+            futuro.set_result(True)
+
+
+def crear_buffer_escritura(engine=None) -> Optional[BufferEscritura]:
+    """
+    Crea el buffer si WRITE_BUFFER=true
+
+    Returns:
+        BufferEscritura (sin iniciar) o None si está desactivado
+    """
+    if os.getenv("WRITE_BUFFER", "false").lower() != "true":
+        return None
+
+    from models.db_models import MoodMapDB, HistoricoInteraccionDB, DestelloDB
+
+    if engine is None:
+        from database import engine
+
+    return BufferEscritura(
+        engine,
+        modelos=(MoodMapDB, HistoricoInteraccionDB, DestelloDB),
+        capacidad=int(os.getenv("WRITE_BUFFER_CAPACIDAD", "10000")),
+        intervalo_ms=float(os.getenv("WRITE_BUFFER_INTERVALO_MS", "5")),
+        max_lote=int(os.getenv("WRITE_BUFFER_LOTE", "500")),
+        durabilidad=os.getenv("WRITE_BUFFER_DURABILIDAD", "memoria").lower()
+    )
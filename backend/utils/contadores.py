@@ -0,0 +1,201 @@
+"""
+Contadores de registros por usuario (tabla contadores_usuario)
+
+/estadisticas/{usuario_id} y /test/listar hacían un COUNT(*) por tabla en
+cada petición, con un coste que crece con el historial del usuario. Ahora
+leen una sola fila, que se mantiene así:
+
+- Sesiones ORM (síncronas y asíncronas): evento after_flush sobre las filas
+  nuevas y borradas, en la misma transacción que el INSERT/DELETE.
+- Buffer de escritura: sumar_filas() dentro de la transacción de cada lote.
+- Borrados masivos (retención, particiones, usuarios de test) no pasan por
+  el ORM: reconciliar_contadores() recalcula los totales y corrige las filas
+  desviadas (tarea diaria y después de cada limpieza).
+"""
+
+from datetime import datetime
+from typing import Dict, Iterable
+
+from sqlalchemy import event, func, select, text, update
+from sqlalchemy.orm import Session
+import logging
+
+from models.db_models import ContadoresUsuarioDB, UsuarioDB
+
+logger = logging.getLogger(__name__)
+
+# Tabla contada → columna de contadores_usuario
+TABLAS_CONTADAS = {
+    "moodmaps": "moodmaps",
+    "feedbacks": "feedbacks",
+    "historico_interacciones": "interacciones",
+    "emociones_liberadas": "emociones_liberadas",
+    "gratitudes": "gratitudes",
+    "destellos": "destellos",
+}
+COLUMNAS = tuple(TABLAS_CONTADAS.values())
+
+
+def _insert_dialecto(conexion):
+    """INSERT con ON CONFLICT (SQLite y PostgreSQL) o None si no hay soporte"""
+    if conexion.dialect.name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert as insert_dialecto
+    elif conexion.dialect.name == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert as insert_dialecto
+    else:
+        return None
+    return insert_dialecto(ContadoresUsuarioDB.__table__)
+
+
+def incrementar(conexion, deltas: Dict[int, Dict[str, int]]):
+    """
+    Suma deltas a los contadores, creando la fila del usuario si no existe
+
+    Args:
+        conexion: Conexión dentro de la transacción de la escritura
+        deltas: {usuario_id: {columna: delta}}
+    """
+    tabla = ContadoresUsuarioDB.__table__
+    ahora = datetime.now()
+
+    for usuario_id, cambios in deltas.items():
+        cambios = {columna: delta for columna, delta in cambios.items() if delta}
+        if usuario_id is None or not cambios:
+            continue
+
+        sumas = {columna: tabla.c[columna] + delta for columna, delta in cambios.items()}
+        sentencia = _insert_dialecto(conexion)
+        if sentencia is not None:
+            conexion.execute(
+                sentencia.values(
+                    usuario_id=usuario_id,
+                    fecha_actualizacion=ahora,
+                    **{columna: max(delta, 0) for columna, delta in cambios.items()}
+                ).on_conflict_do_update(
+                    index_elements=[tabla.c.usuario_id],
+                    set_={**sumas, "fecha_actualizacion": ahora}
+                )
+            )
+        else:
+            resultado = conexion.execute(
+                update(tabla).where(tabla.c.usuario_id == usuario_id).values(**sumas, fecha_actualizacion=ahora)
+            )
+            if resultado.rowcount == 0:
+                conexion.execute(tabla.insert().values(
+                    usuario_id=usuario_id,
+                    fecha_actualizacion=ahora,
+                    **{columna: max(delta, 0) for columna, delta in cambios.items()}
+                ))
+
+
+def sumar_filas(conexion, tabla: str, filas: Iterable[Dict]):
+    """
+    Contabiliza filas insertadas con Core (buffer de escritura)
+
+    Args:
+        conexion: Conexión dentro de la transacción del lote
+        tabla: Nombre de la tabla
+        filas: Valores insertados (con usuario_id)
+    """
+    columna = TABLAS_CONTADAS.get(tabla)
+    if columna is None:
+        return
+
+    deltas: Dict[int, Dict[str, int]] = {}
+    for fila in filas:
+        cambios = deltas.setdefault(fila.get("usuario_id"), {columna: 0})
+        cambios[columna] += 1
+    incrementar(conexion, deltas)
+
+
+@event.listens_for(Session, "after_flush")
+def _tras_flush(session, flush_context):
+    """Actualiza los contadores con las filas de este flush (misma transacción)"""
+    deltas: Dict[int, Dict[str, int]] = {}
+    for objetos, signo in ((session.new, 1), (session.deleted, -1)):
+        for objeto in objetos:
+            columna = TABLAS_CONTADAS.get(getattr(objeto, "__tablename__", None))
+            if columna is None:
+                continue
+            cambios = deltas.setdefault(objeto.usuario_id, {})
+            cambios[columna] = cambios.get(columna, 0) + signo
+
+    if deltas:
+        incrementar(session.connection(), deltas)
+
+
+def _bloquear_contadores(conexion):
+    """
+    Bloquea las escrituras de contadores durante la reconciliación, para que
+    ningún incremento concurrente quede pisado por los totales recalculados
+    """
+    if conexion.dialect.name == "postgresql":
+        conexion.execute(text("LOCK TABLE contadores_usuario IN SHARE ROW EXCLUSIVE MODE"))
+    elif conexion.dialect.name == "sqlite":
+        # Un UPDATE vacío toma el bloqueo de escritura de SQLite
+        conexion.execute(text("UPDATE contadores_usuario SET usuario_id = usuario_id WHERE 0"))
+
+
+def reconciliar_contadores(engine=None) -> Dict[str, int]:
+    """
+    Recalcula los contadores con COUNT(*) ... GROUP BY y corrige las desviaciones
+
+    Args:
+        engine: Engine de SQLAlchemy (por defecto el de database.py)
+
+    Returns:
+        Diccionario con usuarios revisados y filas corregidas
+    """
+    from database import Base
+    from utils.particiones import TABLAS_PARTICIONADAS, seleccionar_rango
+
+    if engine is None:
+        from database import engine
+
+    tabla = ContadoresUsuarioDB.__table__
+
+    with engine.begin() as conexion:
+        _bloquear_contadores(conexion)
+
+        reales: Dict[int, Dict[str, int]] = {}
+        for nombre, columna in TABLAS_CONTADAS.items():
+            # Las tablas particionadas se cuentan con sus particiones rotadas
+            if nombre in TABLAS_PARTICIONADAS:
+                origen = seleccionar_rango(conexion, nombre)
+            else:
+                origen = Base.metadata.tables[nombre]
+
+            consulta = select(origen.c.usuario_id, func.count()).where(
+                origen.c.usuario_id.in_(select(UsuarioDB.id))
+            ).group_by(origen.c.usuario_id)
+            for usuario_id, total in conexion.execute(consulta):
+                reales.setdefault(usuario_id, dict.fromkeys(COLUMNAS, 0))[columna] = total
+
+        actuales = {
+            fila["usuario_id"]: {columna: fila[columna] for columna in COLUMNAS}
+            for fila in conexion.execute(select(tabla)).mappings()
+        }
+
+        # Usuarios sin registros que conservan contadores antiguos
+        for usuario_id in actuales.keys() - reales.keys():
+            if any(actuales[usuario_id].values()):
+                reales[usuario_id] = dict.fromkeys(COLUMNAS, 0)
+
+        ahora = datetime.now()
+        corregidas = 0
+        for usuario_id, totales in reales.items():
+            if actuales.get(usuario_id) == totales:
+                continue
+            if usuario_id in actuales:
+                conexion.execute(
+                    update(tabla).where(tabla.c.usuario_id == usuario_id).values(**totales, fecha_actualizacion=ahora)
+                )
+            else:
+                conexion.execute(tabla.insert().values(usuario_id=usuario_id, fecha_actualizacion=ahora, **totales))
+            corregidas += 1
+
+    if corregidas:
+        logger.warning(f"⚠️ Contadores por usuario corregidos: {corregidas} de {len(reales)} usuarios")
+
+    return {"usuarios_revisados": len(reales), "filas_corregidas": corregidas}
+
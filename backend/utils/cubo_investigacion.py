@@ -0,0 +1,329 @@
+"""
+Cubo de investigación: efectividad de las microacciones por cluster y estado
+
+"¿Qué microacción funciona mejor para qué cluster emocional y semana?"
+obligaba a exportar todo archivo_emocional y agregarlo fuera. cubo_investigacion
+guarda, por celda (cluster_id, estado, microaccion, semana_anio):
+- num_registros
+- num_*, suma_* y suma_cuadrados_* de efectividad, comodidad y energía
+
+Son agregados sumables: cualquier corte (por microacción, por cluster y
+estado, un rango de semanas...) se obtiene sumando celdas, y de n, Σx y Σx²
+salen la media y la desviación típica.
+
+El estado se discretiza como en services/rl_service.py: felicidad_estres_motivacion
+con niveles bajo/medio/alto (umbrales 0.33 y 0.67).
+
+Mantenimiento incremental: cada lote de _archivar_lote_emocional llama a
+actualizar_cubo en su misma transacción. marca_cubo_investigacion guarda el
+último id de archivo_emocional ya sumado, así que cada fila entra en el cubo
+exactamente una vez (el archivo es de solo inserción).
+"""
+
+import math
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from sqlalchemy import case, delete, func, insert, literal, select, update
+import logging
+
+from models.db_models import ArchivoEmocionalDB, CuboInvestigacionDB, MarcaCuboDB
+
+logger = logging.getLogger(__name__)
+
+ID_MARCA = 1
+DIMENSIONES = ("cluster_id", "estado", "microaccion", "semana_anio")
+MEDIDAS = ("efectividad", "comodidad", "energia")
+SIN_CLUSTER = -1
+SIN_MICROACCION = ""
+
+# Misma discretización que services/rl_service.py (NIVELES, UMBRALES)
+NIVELES = ("bajo", "medio", "alto")
+UMBRALES = (0.33, 0.67)
+
+CONTADORES = ["num_registros"] + [
+    f"{prefijo}_{medida}" for medida in MEDIDAS for prefijo in ("num", "suma", "suma_cuadrados")
+]
+
+
+def _nivel_sql(columna):
+    return case(
+        (columna < UMBRALES[0], literal(NIVELES[0])),
+        (columna < UMBRALES[1], literal(NIVELES[1])),
+        else_=literal(NIVELES[2])
+    )
+
+
+def _nivel(valor: float) -> str:
+    return NIVELES[0] if valor < UMBRALES[0] else NIVELES[1] if valor < UMBRALES[1] else NIVELES[2]
+
+
+def estado_discretizado(felicidad: float, estres: float, motivacion: float) -> str:
+    """Estado "felicidad_estres_motivacion" de una fila (p. ej. "bajo_alto_medio")"""
+    return f"{_nivel(felicidad)}_{_nivel(estres)}_{_nivel(motivacion)}"
+
+
+def _agregado_archivo(*condiciones):
+    """GROUP BY de archivo_emocional por celda del cubo"""
+    archivo = ArchivoEmocionalDB.__table__
+    celda = [
+        func.coalesce(archivo.c.cluster_id, SIN_CLUSTER).label("cluster_id"),
+        (
+            _nivel_sql(archivo.c.felicidad) + "_" + _nivel_sql(archivo.c.estres)
+            + "_" + _nivel_sql(archivo.c.motivacion)
+        ).label("estado"),
+        func.coalesce(archivo.c.microaccion_recomendada, SIN_MICROACCION).label("microaccion"),
+        func.coalesce(archivo.c.semana_anio, "").label("semana_anio"),
+    ]
+    medidas = [func.count().label("num_registros")]
+    for medida in MEDIDAS:
+        columna = archivo.c[f"feedback_{medida}"]
+        medidas += [
+            func.count(columna).label(f"num_{medida}"),
+            func.coalesce(func.sum(columna), 0.0).label(f"suma_{medida}"),
+            func.coalesce(func.sum(columna * columna), 0.0).label(f"suma_cuadrados_{medida}"),
+        ]
+    return select(*celda, *medidas).where(*condiciones).group_by(*celda)
+
+
+def _sumar_en_cubo(conexion, filas: List[Dict]):
+    """
+    Suma los contadores de cada fila a su celda: INSERT ... ON CONFLICT DO UPDATE
+    con incremento (actualización + inserción fila a fila en otros motores)
+    """
+    if not filas:
+        return
+    tabla = CuboInvestigacionDB.__table__
+    ahora = datetime.now()
+    filas = [{**fila, "fecha_actualizacion": ahora} for fila in filas]
+
+    if conexion.dialect.name in ("postgresql", "sqlite"):
+        if conexion.dialect.name == "postgresql":
+            from sqlalchemy.dialects.postgresql import insert as insert_dialecto
+        else:
+            from sqlalchemy.dialects.sqlite import insert as insert_dialecto
+        sentencia = insert_dialecto(tabla)
+        sentencia = sentencia.on_conflict_do_update(
+            index_elements=[tabla.c[dimension] for dimension in DIMENSIONES],
+            set_={
+                **{contador: tabla.c[contador] + sentencia.excluded[contador] for contador in CONTADORES},
+                "fecha_actualizacion": sentencia.excluded.fecha_actualizacion
+            }
+        )
+        conexion.execute(sentencia, filas)
+        return
+
+    for fila in filas:
+        actualizada = conexion.execute(
+            update(tabla).where(*(tabla.c[dimension] == fila[dimension] for dimension in DIMENSIONES)).values(
+                **{contador: tabla.c[contador] + fila[contador] for contador in CONTADORES},
+                fecha_actualizacion=ahora
+            )
+        ).rowcount
+        if not actualizada:
+            conexion.execute(insert(tabla).values(**fila))
+
+
+def actualizar_cubo(conexion) -> int:
+    """
+    Suma al cubo las filas de archivo_emocional posteriores a su marca de agua
+    (en la transacción de la conexión: se confirma junto con el lote archivado)
+
+    Args:
+        conexion: Conexión de la transacción en curso
+
+    Returns:
+        Filas de archivo sumadas
+    """
+    archivo = ArchivoEmocionalDB.__table__
+    tabla_marca = MarcaCuboDB.__table__
+    marca = conexion.execute(
+        select(tabla_marca.c.ultimo_id).where(tabla_marca.c.id == ID_MARCA)
+    ).scalar() or 0
+    hasta = conexion.execute(select(func.max(archivo.c.id))).scalar()
+    if hasta is None or hasta <= marca:
+        return 0
+
+    filas = [dict(fila._mapping) for fila in conexion.execute(
+        _agregado_archivo(archivo.c.id > marca, archivo.c.id <= hasta)
+    )]
+    _sumar_en_cubo(conexion, filas)
+    sumadas = sum(fila["num_registros"] for fila in filas)
+    _avanzar_marca_cubo(conexion, hasta, sumadas)
+    return sumadas
+
+
+def _avanzar_marca_cubo(conexion, ultimo_id: int, filas: int):
+    """Guarda la marca de agua del cubo en la misma transacción que sus sumas"""
+    tabla_marca = MarcaCuboDB.__table__
+    ahora = datetime.now()
+    actualizada = conexion.execute(
+        update(tabla_marca).where(tabla_marca.c.id == ID_MARCA).values(
+            ultimo_id=ultimo_id,
+            filas_sumadas=tabla_marca.c.filas_sumadas + filas,
+            fecha_actualizacion=ahora
+        )
+    ).rowcount
+    if not actualizada:
+        conexion.execute(insert(tabla_marca).values(
+            id=ID_MARCA, ultimo_id=ultimo_id, filas_sumadas=filas, fecha_actualizacion=ahora
+        ))
+
+
+def marca_cubo(conexion) -> Optional[Dict]:
+    """Marca de agua del cubo (para las estadísticas del archivo), o None si aún no existe"""
+    fila = conexion.execute(
+        select(MarcaCuboDB.__table__).where(MarcaCuboDB.__table__.c.id == ID_MARCA)
+    ).first()
+    if fila is None:
+        return None
+    return {
+        "ultimo_id": fila.ultimo_id,
+        "filas_sumadas": fila.filas_sumadas,
+        "fecha_actualizacion": fila.fecha_actualizacion.isoformat() if fila.fecha_actualizacion else None
+    }
+
+
+def _agregado_segmentos() -> List[Dict]:
+    """Celdas de las filas ya selladas en segmentos (utils/segmentos_archivo.py)"""
+    from utils.segmentos_archivo import leer_segmentos
+
+    columnas = ["cluster_id", "felicidad", "estres", "motivacion", "microaccion_recomendada", "semana_anio"]
+    columnas += [f"feedback_{medida}" for medida in MEDIDAS]
+    celdas: Dict[tuple, Dict] = {}
+    for fila in leer_segmentos("archivo_emocional", {columna: columna for columna in columnas}):
+        clave = (
+            fila["cluster_id"] if fila["cluster_id"] is not None else SIN_CLUSTER,
+            estado_discretizado(fila["felicidad"], fila["estres"], fila["motivacion"]),
+            fila["microaccion_recomendada"] if fila["microaccion_recomendada"] is not None else SIN_MICROACCION,
+            fila["semana_anio"] or "",
+        )
+        celda = celdas.setdefault(clave, {
+            **dict(zip(DIMENSIONES, clave)), **{contador: 0 for contador in CONTADORES}
+        })
+        celda["num_registros"] += 1
+        for medida in MEDIDAS:
+            valor = fila[f"feedback_{medida}"]
+            if valor is not None:
+                celda[f"num_{medida}"] += 1
+                celda[f"suma_{medida}"] += valor
+                celda[f"suma_cuadrados_{medida}"] += valor * valor
+    return list(celdas.values())
+
+
+def reconstruir_cubo(engine=None) -> Dict:
+    """
+    Recalcula el cubo desde cero: archivo_emocional más sus segmentos sellados.
+    Para la carga inicial o tras corregir datos del archivo; no debe coincidir
+    con un sellado de segmentos (las filas cambiarían de sitio a mitad).
+
+    Args:
+        engine: Engine de SQLAlchemy (por defecto el de database.py)
+
+    Returns:
+        Celdas y filas sumadas
+    """
+    if engine is None:
+        from database import engine
+
+    tabla = CuboInvestigacionDB.__table__
+    archivo = ArchivoEmocionalDB.__table__
+    selladas = _agregado_segmentos()
+
+    with engine.begin() as conexion:
+        conexion.execute(delete(tabla))
+        conexion.execute(delete(MarcaCuboDB.__table__))
+        hasta = conexion.execute(select(func.max(archivo.c.id))).scalar() or 0
+        filas = [dict(fila._mapping) for fila in conexion.execute(_agregado_archivo(archivo.c.id <= hasta))]
+        _sumar_en_cubo(conexion, selladas)
+        _sumar_en_cubo(conexion, filas)
+        sumadas = sum(fila["num_registros"] for fila in filas + selladas)
+        _avanzar_marca_cubo(conexion, hasta, sumadas)
+        celdas = conexion.execute(select(func.count()).select_from(tabla)).scalar()
+
+    logger.info(f"✓ Cubo de investigación reconstruido: {celdas} celdas, {sumadas} filas")
+    return {"celdas": celdas, "filas": sumadas}
+
+
+def _estadisticos(n: int, suma: float, suma_cuadrados: float) -> Dict:
+    """Media y desviación típica muestral a partir de n, Σx y Σx²"""
+    if not n:
+        return {"n": 0, "media": None, "desviacion": None}
+    media = suma / n
+    desviacion = math.sqrt(max(suma_cuadrados - suma * media, 0.0) / (n - 1)) if n > 1 else None
+    return {
+        "n": n,
+        "media": round(media, 4),
+        "desviacion": round(desviacion, 4) if desviacion is not None else None
+    }
+
+
+def consultar_cubo(
+    db,
+    agrupar: List[str],
+    cluster_id: Optional[int] = None,
+    estado: Optional[str] = None,
+    microaccion: Optional[str] = None,
+    semana_desde: Optional[str] = None,
+    semana_hasta: Optional[str] = None,
+    min_registros: int = 1,
+    ordenar: Optional[str] = None,
+    limite: Optional[int] = None
+) -> List[Dict]:
+    """
+    Corte del cubo: suma las celdas que cumplen los filtros agrupadas por las dimensiones pedidas
+
+    Args:
+        db: Sesión de base de datos
+        agrupar: Dimensiones del resultado (subconjunto de DIMENSIONES; vacío = total)
+        cluster_id, estado, microaccion: Filtros exactos
+        semana_desde, semana_hasta: Rango de semanas "2026-W02" (inclusive)
+        min_registros: Descarta grupos con menos feedback de la medida ordenada (o registros)
+        ordenar: Medida por cuya media descendente ordenar (si no, por dimensiones)
+        limite: Máximo de grupos
+
+    Returns:
+        Lista de grupos con num_registros y {n, media, desviacion} por medida
+    """
+    desconocidas = [dimension for dimension in agrupar if dimension not in DIMENSIONES]
+    if desconocidas:
+        raise ValueError(f"Dimensiones desconocidas: {', '.join(desconocidas)}. Opciones: {', '.join(DIMENSIONES)}")
+    if ordenar is not None and ordenar not in MEDIDAS:
+        raise ValueError(f"Medida no válida para ordenar. Opciones: {', '.join(MEDIDAS)}")
+
+    tabla = CuboInvestigacionDB.__table__
+    grupos = [tabla.c[dimension] for dimension in dict.fromkeys(agrupar)]
+    consulta = select(*grupos, *(func.sum(tabla.c[contador]).label(contador) for contador in CONTADORES))
+
+    if cluster_id is not None:
+        consulta = consulta.where(tabla.c.cluster_id == cluster_id)
+    if estado:
+        consulta = consulta.where(tabla.c.estado == estado)
+    if microaccion is not None:
+        consulta = consulta.where(tabla.c.microaccion == microaccion)
+    if semana_desde:
+        consulta = consulta.where(tabla.c.semana_anio >= semana_desde)
+    if semana_hasta:
+        consulta = consulta.where(tabla.c.semana_anio <= semana_hasta)
+
+    umbral = func.sum(tabla.c[f"num_{ordenar}"] if ordenar else tabla.c.num_registros)
+    consulta = consulta.group_by(*grupos).having(umbral >= max(min_registros, 1))
+    if ordenar:
+        media = func.sum(tabla.c[f"suma_{ordenar}"]) / func.sum(tabla.c[f"num_{ordenar}"])
+        consulta = consulta.order_by(media.desc(), *grupos)
+    else:
+        consulta = consulta.order_by(*grupos)
+    if limite:
+        consulta = consulta.limit(limite)
+
+    resultado = []
+    for fila in db.execute(consulta):
+        grupo = {dimension: fila._mapping[dimension] for dimension in dict.fromkeys(agrupar)}
+        grupo["num_registros"] = fila.num_registros
+        for medida in MEDIDAS:
+            grupo[medida] = _estadisticos(
+                fila._mapping[f"num_{medida}"], fila._mapping[f"suma_{medida}"],
+                fila._mapping[f"suma_cuadrados_{medida}"]
+            )
+        resultado.append(grupo)
+    return resultado
@@ -6,6 +6,7 @@ IMPORTANTE: Ahora incluye archivado antes de borrar datos
 
 from sqlalchemy.orm import Session
 from datetime import datetime, timedelta
+from typing import Dict
 from models.db_models import (
     FeedbackDB,
     HistoricoInteraccionDB,
@@ -18,6 +19,9 @@ import logging
 
 logger = logging.getLogger(__name__)
 
+# Última instantánea de obtener_estadisticas_db (la sirve /salud desde memoria)
+_instantanea_estadisticas: Dict = {"estadisticas": None, "generada": None}
+
 
 def limpiar_datos_duplicados(db: Session):
     """
@@ -67,8 +71,20 @@ def limpiar_por_antigüedad(db: Session, dias_retencion: int = 90, archivar_prim
     
     print(f"🧹 Limpiando datos anteriores a {fecha_limite.strftime('%Y-%m-%d')}")
     
+    # Con particiones (DB_PARTICIONES=true) los meses completos se borran
+    # como tablas; los DELETE de abajo solo tocan las filas restantes
+    filas_particiones = {"feedbacks": 0, "historico_interacciones": 0}
+    particiones_eliminadas = []
+    from utils.particiones import PARTICIONES_ACTIVAS, eliminar_particiones_antiguas
+    if PARTICIONES_ACTIVAS:
+        db.commit()
+        for tabla in filas_particiones:
+            resultado = eliminar_particiones_antiguas(tabla, fecha_limite, engine=db.get_bind())
+            filas_particiones[tabla] = resultado["filas"]
+            particiones_eliminadas.extend(resultado["particiones"])
+    
     # Contar y eliminar feedbacks antiguos
-    feedbacks_count = db.query(FeedbackDB).filter(
+    feedbacks_count = filas_particiones["feedbacks"] + db.query(FeedbackDB).filter(
         FeedbackDB.timestamp < fecha_limite
     ).count()
     
@@ -77,7 +93,7 @@ def limpiar_por_antigüedad(db: Session, dias_retencion: int = 90, archivar_prim
     ).delete()
     
     # Eliminar interacciones antiguas
-    interacciones_count = db.query(HistoricoInteraccionDB).filter(
+    interacciones_count = filas_particiones["historico_interacciones"] + db.query(HistoricoInteraccionDB).filter(
         HistoricoInteraccionDB.fecha < fecha_limite
     ).count()
     
@@ -122,6 +138,7 @@ def limpiar_por_antigüedad(db: Session, dias_retencion: int = 90, archivar_prim
         "emociones_eliminadas": emociones_count,
         "gratitudes_eliminadas": gratitudes_count,
         "destellos_eliminados": destellos_count,
+        "particiones_eliminadas": particiones_eliminadas,
         "fecha_limite": fecha_limite.isoformat()
     }
     
@@ -183,11 +200,14 @@ def obtener_estadisticas_db(db: Session):
         Diccionario con estadísticas
     """
     from models.db_models import UsuarioDB
+    from utils.particiones import contar_filas
     
+    # Feedbacks e interacciones: también las particiones mensuales rotadas
+    conexion = db.connection()
     estadisticas = {
         "usuarios_total": db.query(UsuarioDB).count(),
-        "feedbacks_total": db.query(FeedbackDB).count(),
-        "interacciones_total": db.query(HistoricoInteraccionDB).count(),
+        "feedbacks_total": contar_filas(conexion, "feedbacks"),
+        "interacciones_total": contar_filas(conexion, "historico_interacciones"),
         "emociones_liberadas_total": db.query(EmocionLiberadaDB).count(),
         "gratitudes_total": db.query(GratitudDB).count(),
         "destellos_total": db.query(DestelloDB).count(),
@@ -197,12 +217,42 @@ def obtener_estadisticas_db(db: Session):
     # Estadísticas de los últimos 30 días
     fecha_30_dias = datetime.now() - timedelta(days=30)
     
-    estadisticas["feedbacks_ultimos_30_dias"] = db.query(FeedbackDB).filter(
-        FeedbackDB.timestamp >= fecha_30_dias
-    ).count()
+    estadisticas["feedbacks_ultimos_30_dias"] = contar_filas(conexion, "feedbacks", desde=fecha_30_dias)
+    estadisticas["interacciones_ultimas_30_dias"] = contar_filas(
+        conexion, "historico_interacciones", desde=fecha_30_dias
+    )
     
-    estadisticas["interacciones_ultimas_30_dias"] = db.query(HistoricoInteraccionDB).filter(
-        HistoricoInteraccionDB.fecha >= fecha_30_dias
-    ).count()
+    return estadisticas
+
+
+def actualizar_instantanea_estadisticas(db: Session) -> Dict:
+    """
+    Recalcula las estadísticas de la base de datos y las guarda en memoria
+    Se ejecuta al arrancar y periódicamente desde el scheduler
+    
+    Args:
+        db: Sesión de base de datos (lectura)
     
+    Returns:
+        Diccionario con estadísticas
+    """
+    estadisticas = obtener_estadisticas_db(db)
+    _instantanea_estadisticas["estadisticas"] = estadisticas
+    _instantanea_estadisticas["generada"] = datetime.now()
     return estadisticas
+
+
+def obtener_instantanea_estadisticas() -> Dict:
+    """
+    Última instantánea de estadísticas, sin consultar la base de datos
+    
+    Returns:
+        Diccionario con estadísticas, fecha de generación y antigüedad en segundos
+        (None si todavía no se ha generado)
+    """
+    generada = _instantanea_estadisticas["generada"]
+    return {
+        "estadisticas": _instantanea_estadisticas["estadisticas"],
+        "generada": generada.isoformat() if generada else None,
+        "antiguedad_segundos": round((datetime.now() - generada).total_seconds(), 1) if generada else None
+    }
@@ -0,0 +1,374 @@
+"""
+Exportación en streaming de las tablas de archivo (/investigacion/exportar/*)
+
+Los endpoints cargaban todo el archivo con .all() y montaban un único JSON:
+varias veces el tamaño del export en memoria y nada enviado hasta el final.
+Aquí las filas se leen con yield_per (cursor de servidor en PostgreSQL) y se
+escriben según llegan, en bloques de ~64 KB, opcionalmente comprimidos con
+gzip. La memoria no depende del tamaño del export.
+
+Formatos:
+- json: el mismo documento de siempre ({"filtros", "datos", "total_registros"})
+- ndjson: un objeto JSON por línea
+- csv: cabecera + una fila por registro (columnas JSON como texto JSON)
+
+Paginación por clave (after_id + limit): las páginas se ordenan por id y
+cada una empieza donde acabó la anterior, con coste constante por página
+(sin OFFSET). fields= proyecta en SQL solo las columnas pedidas (más el
+id), y embeddings="base64" envía los vectores como float32 little-endian
+en base64 en lugar de listas de números.
+
+Las tablas de archivo también incluyen las filas selladas en segmentos en
+disco (ARCHIVO_SEGMENTOS, utils/segmentos_archivo.py): ConsultaExportacion
+las mezcla con las de la base de datos sin que el cliente note la diferencia.
+
+Los generadores abren su propia sesión de lectura: la del endpoint ya está
+cerrada cuando StreamingResponse empieza a enviar el cuerpo.
+"""
+
+import base64
+import csv
+import heapq
+import io
+import os
+import sys
+import zlib
+from array import array
+from datetime import datetime
+from itertools import chain, islice
+from typing import Dict, Iterator, List, Optional
+
+from sqlalchemy import select
+
+from models.db_models import ArchivoEmocionalDB, ArchivoAlmaBoardDB, ResumenSemanalDB
+
+try:
+    import orjson
+
+    def serializar_json(valor) -> bytes:
+        return orjson.dumps(valor, option=orjson.OPT_NON_STR_KEYS)
+except ImportError:
+    import json
+
+    def serializar_json(valor) -> bytes:
+        return json.dumps(valor, ensure_ascii=False).encode()
+
+
+FORMATOS = {
+    "json": "application/json",
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv; charset=utf-8",
+}
+LOTE_EXPORTACION = int(os.getenv("EXPORTACION_LOTE", "1000"))
+LIMITE_MAX_PAGINA = int(os.getenv("EXPORTACION_LIMITE_MAX", "10000"))
+CODIFICACIONES_EMBEDDING = ("json", "base64")
+CAMPOS_EMBEDDING = ("embedding_latente", "embedding_texto")
+TAMANO_BLOQUE = 64 * 1024
+
+# Nombre en el export → columna de origen
+CAMPOS_EMOCIONAL = {
+    "id": ArchivoEmocionalDB.id,
+    "usuario_id": ArchivoEmocionalDB.usuario_id,
+    "felicidad": ArchivoEmocionalDB.felicidad,
+    "estres": ArchivoEmocionalDB.estres,
+    "motivacion": ArchivoEmocionalDB.motivacion,
+    "embedding_latente": ArchivoEmocionalDB.embedding_latente,
+    "cluster_id": ArchivoEmocionalDB.cluster_id,
+    "microaccion": ArchivoEmocionalDB.microaccion_recomendada,
+    "feedback_efectividad": ArchivoEmocionalDB.feedback_efectividad,
+    "feedback_comodidad": ArchivoEmocionalDB.feedback_comodidad,
+    "feedback_energia": ArchivoEmocionalDB.feedback_energia,
+    "fecha_registro": ArchivoEmocionalDB.fecha_registro,
+    "semana_anio": ArchivoEmocionalDB.semana_anio,
+    "datos_extra": ArchivoEmocionalDB.datos_extra,
+}
+CAMPOS_ALMA_BOARD = {
+    "id": ArchivoAlmaBoardDB.id,
+    "usuario_id": ArchivoAlmaBoardDB.usuario_id,
+    "tipo": ArchivoAlmaBoardDB.tipo,
+    "emocion": ArchivoAlmaBoardDB.emocion,
+    "categoria": ArchivoAlmaBoardDB.categoria,
+    "intensidad": ArchivoAlmaBoardDB.intensidad,
+    "texto": ArchivoAlmaBoardDB.texto,
+    "embedding_texto": ArchivoAlmaBoardDB.embedding_texto,
+    "fecha_registro": ArchivoAlmaBoardDB.fecha_registro,
+    "semana_anio": ArchivoAlmaBoardDB.semana_anio,
+    "mes_anio": ArchivoAlmaBoardDB.mes_anio,
+    "datos_extra": ArchivoAlmaBoardDB.datos_extra,
+}
+CAMPOS_RESUMENES = {
+    "id": ResumenSemanalDB.id,
+    "usuario_id": ResumenSemanalDB.usuario_id,
+    "semana_anio": ResumenSemanalDB.semana_anio,
+    "anio": ResumenSemanalDB.anio,
+    "semana": ResumenSemanalDB.semana,
+    "num_registros": ResumenSemanalDB.num_registros,
+    "felicidad_promedio": ResumenSemanalDB.felicidad_promedio,
+    "estres_promedio": ResumenSemanalDB.estres_promedio,
+    "motivacion_promedio": ResumenSemanalDB.motivacion_promedio,
+    "felicidad_max": ResumenSemanalDB.felicidad_max,
+    "estres_max": ResumenSemanalDB.estres_max,
+    "motivacion_max": ResumenSemanalDB.motivacion_max,
+    "num_microacciones": ResumenSemanalDB.num_microacciones,
+    "microacciones_mas_usadas": ResumenSemanalDB.microacciones_mas_usadas,
+    "efectividad_promedio": ResumenSemanalDB.efectividad_promedio,
+    "num_emociones_liberadas": ResumenSemanalDB.num_emociones_liberadas,
+    "num_gratitudes": ResumenSemanalDB.num_gratitudes,
+    "emociones_mas_frecuentes": ResumenSemanalDB.emociones_mas_frecuentes,
+    "fecha_actualizacion": ResumenSemanalDB.fecha_actualizacion,
+}
+
+
+def _nombres(disponibles: Dict, campos: Optional[List[str]]) -> List[str]:
+    """Campos pedidos (todos si no se indican); el id siempre va incluido"""
+    if not campos:
+        return list(disponibles)
+
+    desconocidos = [campo for campo in campos if campo not in disponibles]
+    if desconocidos:
+        raise ValueError(f"Campos desconocidos: {', '.join(desconocidos)}. Opciones: {', '.join(disponibles)}")
+    return ["id"] + [campo for campo in dict.fromkeys(campos) if campo != "id"]
+
+
+def _ordenar(consulta, columna_id, orden: List, after_id: Optional[int], limite: Optional[int]):
+    """Orden natural del export o, si se pagina, por id a partir de after_id"""
+    if after_id is None and limite is None:
+        return consulta.order_by(*orden)
+    if after_id is not None:
+        consulta = consulta.where(columna_id > after_id)
+    consulta = consulta.order_by(columna_id)
+    return consulta.limit(limite) if limite else consulta
+
+
+class ConsultaExportacion:
+    """
+    Export de una tabla: el SELECT de la base de datos más, para las tablas
+    de archivo, las filas ya selladas en segmentos (utils/segmentos_archivo.py)
+    """
+
+    def __init__(
+        self,
+        disponibles: Dict,
+        campos: Optional[List[str]],
+        columna_id,
+        orden: List,
+        condiciones: List,
+        tabla: Optional[str] = None,
+        filtros_segmentos: Optional[Dict] = None,
+        after_id: Optional[int] = None,
+        limite: Optional[int] = None
+    ):
+        nombres = _nombres(disponibles, campos)
+        consulta = select(*(disponibles[nombre].label(nombre) for nombre in nombres)).where(*condiciones)
+        self.select = _ordenar(consulta, columna_id, orden, after_id, limite)
+        self.tabla = tabla
+        self.columnas_segmento = {nombre: disponibles[nombre].key for nombre in nombres}
+        self.filtros_segmentos = filtros_segmentos or {}
+        self.after_id = after_id
+        self.limite = limite
+
+    @property
+    def columnas(self) -> List:
+        return list(self.select.selected_columns)
+
+    def registros(self, db, filas_por_lote: int = None) -> Iterator[Dict]:
+        """
+        Filas del export como diccionarios {campo: valor}
+
+        Paginado: segmentos y base de datos mezclados por id hasta el límite.
+        Si no, primero los segmentos (meses antiguos, por fecha) y después la BD.
+        """
+        resultado = db.execute(self.select.execution_options(yield_per=filas_por_lote or LOTE_EXPORTACION))
+        filas = (dict(fila._mapping) for fila in resultado)
+        if self.tabla is None:
+            return filas
+
+        from utils.segmentos_archivo import leer_segmentos
+
+        paginado = self.after_id is not None or self.limite is not None
+        selladas = leer_segmentos(
+            self.tabla, self.columnas_segmento, self.filtros_segmentos, self.after_id, por_id=paginado
+        )
+        if not paginado:
+            return chain(selladas, filas)
+        mezcla = heapq.merge(selladas, filas, key=lambda registro: registro["id"])
+        return islice(mezcla, self.limite) if self.limite else mezcla
+
+
+def consulta_emocional(
+    usuario_id: Optional[int] = None,
+    fecha_inicio: Optional[str] = None,
+    fecha_fin: Optional[str] = None,
+    campos: Optional[List[str]] = None,
+    after_id: Optional[int] = None,
+    limite: Optional[int] = None
+) -> ConsultaExportacion:
+    """Archivo emocional con los filtros, la proyección y la página del endpoint"""
+    filtros = {
+        "usuario_id": usuario_id,
+        "fecha_desde": datetime.fromisoformat(fecha_inicio) if fecha_inicio else None,
+        "fecha_hasta": datetime.fromisoformat(fecha_fin) if fecha_fin else None,
+    }
+    condiciones = []
+    if usuario_id:
+        condiciones.append(ArchivoEmocionalDB.usuario_id == usuario_id)
+    if fecha_inicio:
+        condiciones.append(ArchivoEmocionalDB.fecha_registro >= filtros["fecha_desde"])
+    if fecha_fin:
+        condiciones.append(ArchivoEmocionalDB.fecha_registro <= filtros["fecha_hasta"])
+    return ConsultaExportacion(
+        CAMPOS_EMOCIONAL, campos, ArchivoEmocionalDB.id, [ArchivoEmocionalDB.fecha_registro], condiciones,
+        "archivo_emocional", filtros, after_id, limite
+    )
+
+
+def consulta_alma_board(
+    usuario_id: Optional[int] = None,
+    tipo: Optional[str] = None,
+    campos: Optional[List[str]] = None,
+    after_id: Optional[int] = None,
+    limite: Optional[int] = None
+) -> ConsultaExportacion:
+    """Archivo del Alma Board con los filtros, la proyección y la página del endpoint"""
+    condiciones = []
+    if usuario_id:
+        condiciones.append(ArchivoAlmaBoardDB.usuario_id == usuario_id)
+    if tipo:
+        condiciones.append(ArchivoAlmaBoardDB.tipo == tipo)
+    return ConsultaExportacion(
+        CAMPOS_ALMA_BOARD, campos, ArchivoAlmaBoardDB.id, [ArchivoAlmaBoardDB.fecha_registro], condiciones,
+        "archivo_alma_board", {"usuario_id": usuario_id, "tipo": tipo}, after_id, limite
+    )
+
+
+def consulta_resumenes(
+    usuario_id: Optional[int] = None,
+    anio: Optional[int] = None,
+    campos: Optional[List[str]] = None,
+    after_id: Optional[int] = None,
+    limite: Optional[int] = None
+) -> ConsultaExportacion:
+    """Resúmenes semanales con los filtros, la proyección y la página del endpoint (no se sellan)"""
+    condiciones = []
+    if usuario_id:
+        condiciones.append(ResumenSemanalDB.usuario_id == usuario_id)
+    if anio:
+        condiciones.append(ResumenSemanalDB.anio == anio)
+    orden = [ResumenSemanalDB.anio, ResumenSemanalDB.semana, ResumenSemanalDB.usuario_id]
+    return ConsultaExportacion(
+        CAMPOS_RESUMENES, campos, ResumenSemanalDB.id, orden, condiciones, after_id=after_id, limite=limite
+    )
+
+
+def embedding_base64(valores: List[float]) -> str:
+    """Vector → float32 little-endian en base64 (numpy.frombuffer(..., "<f4"))"""
+    vector = array("f", valores)
+    if sys.byteorder == "big":
+        vector.byteswap()
+    return base64.b64encode(vector.tobytes()).decode()
+
+
+def _registro(fila: Dict, embeddings: str = "json") -> Dict:
+    """Fila → diccionario del export (fechas en ISO 8601)"""
+    registro = {
+        campo: valor.isoformat() if isinstance(valor, datetime) else valor
+        for campo, valor in fila.items()
+    }
+    if embeddings == "base64":
+        for campo in CAMPOS_EMBEDDING:
+            if isinstance(registro.get(campo), list):
+                registro[campo] = embedding_base64(registro[campo])
+    return registro
+
+
+def _filas_texto(
+    consulta, formato: str, filtros: Dict, embeddings: str, limite: Optional[int], SessionFactory
+) -> Iterator[bytes]:
+    """Serializa las filas según el formato, leyéndolas por lotes"""
+    db = SessionFactory()
+    try:
+        campos = [columna.name for columna in consulta.columnas]
+
+        if formato == "json":
+            yield b'{"filtros":' + serializar_json(filtros) + b',"datos":['
+        elif formato == "csv":
+            salida = io.StringIO()
+            escritor = csv.writer(salida)
+            escritor.writerow(campos)
+            yield salida.getvalue().encode()
+            salida.seek(0)
+            salida.truncate()
+
+        total = 0
+        ultimo_id = None
+        for fila in consulta.registros(db):
+            registro = _registro(fila, embeddings)
+            ultimo_id = registro["id"]
+            if formato == "json":
+                yield (b"," if total else b"") + serializar_json(registro)
+            elif formato == "ndjson":
+                yield serializar_json(registro) + b"\n"
+            else:
+                escritor.writerow([
+                    serializar_json(valor).decode() if isinstance(valor, (dict, list)) else valor
+                    for valor in registro.values()
+                ])
+                yield salida.getvalue().encode()
+                salida.seek(0)
+                salida.truncate()
+            total += 1
+
+        if formato == "json":
+            # Página llena: puede haber más filas a partir del último id
+            siguiente = ultimo_id if limite and total == limite else None
+            yield (
+                b'],"total_registros":' + str(total).encode()
+                + b',"siguiente_after_id":' + serializar_json(siguiente) + b"}"
+            )
+    finally:
+        db.close()
+
+
+def generar_exportacion(
+    consulta,
+    formato: str = "json",
+    comprimir: bool = False,
+    filtros: Optional[Dict] = None,
+    embeddings: str = "json",
+    limite: Optional[int] = None,
+    SessionFactory=None
+) -> Iterator[bytes]:
+    """
+    Generador para StreamingResponse: bloques de ~64 KB del export
+
+    Args:
+        consulta: ConsultaExportacion (consulta_emocional / consulta_alma_board / ...)
+        formato: "json", "ndjson" o "csv"
+        comprimir: Comprimir con gzip
+        filtros: Filtros aplicados (se incluyen en el formato json)
+        embeddings: "json" (listas de números) o "base64" (float32)
+        limite: Tamaño de página, para calcular siguiente_after_id (formato json)
+        SessionFactory: Fábrica de sesiones (por defecto SessionLectura)
+
+    Yields:
+        Bytes del cuerpo de la respuesta
+    """
+    if SessionFactory is None:
+        from database import SessionLectura as SessionFactory
+
+    compresor = zlib.compressobj(6, zlib.DEFLATED, 31) if comprimir else None  # 31: cabecera gzip
+    bloque = bytearray()
+
+    for parte in _filas_texto(consulta, formato, filtros or {}, embeddings, limite, SessionFactory):
+        bloque += parte
+        if len(bloque) >= TAMANO_BLOQUE:
+            datos = compresor.compress(bytes(bloque)) if compresor else bytes(bloque)
+            bloque.clear()
+            if datos:
+                yield datos
+
+    datos = bytes(bloque)
+    if compresor:
+        datos = compresor.compress(datos) + compresor.flush()
+    if datos:
+        yield datos
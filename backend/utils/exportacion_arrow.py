@@ -0,0 +1,213 @@
+"""
+Exportación columnar (Parquet / Arrow IPC) de las tablas de investigación
+
+Para cargar el archivo en pandas/polars sin parsear JSON:
+- Una columna tipada por campo; las fechas como timestamp[us].
+- Los embeddings (embedding_latente, embedding_texto) como listas de tamaño
+  fijo de float32: se leen directamente como una matriz N x D.
+- Otras columnas JSON (datos_extra, top 5) como texto JSON.
+
+Las filas se leen del cursor con yield_per (y de los segmentos sellados,
+ver utils/segmentos_archivo.py) y cada lote se escribe como un row group
+(Parquet) o un record batch (Arrow), así que la memoria depende de
+EXPORTACION_LOTE y no del tamaño del export.
+
+pyarrow es opcional (requirements-ml.txt): sin él ARROW_DISPONIBLE es False.
+"""
+
+import io
+import logging
+from itertools import islice
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from sqlalchemy import DateTime, Float, Integer, JSON, select
+
+from utils.exportacion import LOTE_EXPORTACION, serializar_json
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    ARROW_DISPONIBLE = True
+except ImportError:
+    ARROW_DISPONIBLE = False
+
+logger = logging.getLogger(__name__)
+
+FORMATOS_COLUMNARES = {
+    "parquet": "application/vnd.apache.parquet",
+    "arrow": "application/vnd.apache.arrow.file",
+}
+COLUMNAS_EMBEDDING = ("embedding_latente", "embedding_texto")
+COMPRESION = "zstd"
+
+
+def _dimension(db, consulta, nombre: str, primeras: List[Dict]) -> Optional[int]:
+    """Dimensión del embedding: longitud del primer valor no nulo"""
+    for registro in primeras:
+        valor = registro.get(nombre)
+        if isinstance(valor, list) and valor:
+            return len(valor)
+    subconsulta = consulta.select.order_by(None).subquery()
+    for (valor,) in db.execute(select(subconsulta.c[nombre]).limit(100)):
+        if isinstance(valor, list) and valor:
+            return len(valor)
+    return None
+
+
+def _tipo_arrow(columna, dimension: Optional[int]):
+    """Tipo Arrow de una columna del SELECT"""
+    if columna.name in COLUMNAS_EMBEDDING:
+        return pa.list_(pa.float32(), dimension) if dimension else pa.list_(pa.float32())
+    if isinstance(columna.type, Integer):
+        return pa.int64()
+    if isinstance(columna.type, Float):
+        return pa.float64()
+    if isinstance(columna.type, DateTime):
+        return pa.timestamp("us")
+    return pa.string()
+
+
+def _array(valores, columna, tipo):
+    """Valores de una columna de un lote → array Arrow"""
+    if columna.name in COLUMNAS_EMBEDDING:
+        dimension = tipo.list_size if pa.types.is_fixed_size_list(tipo) else None
+        validos = [
+            valor if isinstance(valor, list) and (dimension is None or len(valor) == dimension) else None
+            for valor in valores
+        ]
+        descartados = sum(1 for valor, valido in zip(valores, validos) if valor is not None and valido is None)
+        if descartados:
+            logger.warning(f"⚠️ {descartados} embeddings de {columna.name} con otra dimensión exportados como nulos")
+        return pa.array(validos, type=tipo)
+    if isinstance(columna.type, JSON):
+        return pa.array([serializar_json(valor).decode() if valor is not None else None for valor in valores], type=tipo)
+    return pa.array(list(valores), type=tipo)
+
+
+def _lotes(db, consulta, filas_por_lote: int) -> Tuple["pa.Schema", Iterator["pa.RecordBatch"]]:
+    """Esquema del export y generador de record batches"""
+    registros = consulta.registros(db, filas_por_lote)
+    primeras = list(islice(registros, filas_por_lote))
+    columnas = consulta.columnas
+    tipos = [
+        _tipo_arrow(columna, _dimension(db, consulta, columna.name, primeras) if columna.name in COLUMNAS_EMBEDDING else None)
+        for columna in columnas
+    ]
+    esquema = pa.schema([pa.field(columna.name, tipo) for columna, tipo in zip(columnas, tipos)])
+
+    def generar():
+        particion = primeras
+        while particion:
+            yield pa.RecordBatch.from_arrays(
+                [_array([registro[columna.name] for registro in particion], columna, tipo) for columna, tipo in zip(columnas, tipos)],
+                schema=esquema
+            )
+            particion = list(islice(registros, filas_por_lote))
+
+    return esquema, generar()
+
+
+def _escritor(destino, esquema, formato: str):
+    if formato == "parquet":
+        return pq.ParquetWriter(destino, esquema, compression=COMPRESION)
+    return pa.ipc.new_file(destino, esquema, options=pa.ipc.IpcWriteOptions(compression=COMPRESION))
+
+
+def escribir_columnar(
+    consulta,
+    destino,
+    formato: str = "parquet",
+    SessionFactory=None,
+    filas_por_lote: int = LOTE_EXPORTACION
+) -> int:
+    """
+    Escribe el resultado de una consulta de utils/exportacion.py en un fichero
+
+    Args:
+        consulta: ConsultaExportacion (consulta_emocional, ...)
+        destino: Ruta o fichero binario de salida
+        formato: "parquet" o "arrow"
+        SessionFactory: Fábrica de sesiones (por defecto SessionLectura)
+        filas_por_lote: Filas por row group / record batch
+
+    Returns:
+        Número de filas escritas
+    """
+    if not ARROW_DISPONIBLE:
+        raise RuntimeError("pyarrow no está instalado (pip install pyarrow)")
+    if SessionFactory is None:
+        from database import SessionLectura as SessionFactory
+
+    db = SessionFactory()
+    try:
+        esquema, lotes = _lotes(db, consulta, filas_por_lote)
+        filas = 0
+        with _escritor(destino, esquema, formato) as escritor:
+            for lote in lotes:
+                escritor.write_batch(lote)
+                filas += lote.num_rows
+        return filas
+    finally:
+        db.close()
+
+
+class _Salida(io.RawIOBase):
+    """Fichero de solo escritura que acumula bytes hasta que se vacían"""
+
+    def __init__(self):
+        self._bloque = bytearray()
+        self._posicion = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, datos) -> int:
+        self._bloque += datos
+        self._posicion += len(datos)
+        return len(datos)
+
+    def tell(self) -> int:
+        return self._posicion
+
+    def vaciar(self) -> bytes:
+        datos = bytes(self._bloque)
+        self._bloque.clear()
+        return datos
+
+
+def generar_columnar(
+    consulta,
+    formato: str = "parquet",
+    SessionFactory=None,
+    filas_por_lote: int = LOTE_EXPORTACION
+) -> Iterator[bytes]:
+    """
+    Generador para StreamingResponse: envía cada row group según se escribe
+
+    Args:
+        consulta: ConsultaExportacion
+        formato: "parquet" o "arrow"
+        SessionFactory: Fábrica de sesiones (por defecto SessionLectura)
+        filas_por_lote: Filas por row group / record batch
+
+    Yields:
+        Bytes del fichero
+    """
+    if SessionFactory is None:
+        from database import SessionLectura as SessionFactory
+
+    db = SessionFactory()
+    try:
+        salida = _Salida()
+        esquema, lotes = _lotes(db, consulta, filas_por_lote)
+        with _escritor(salida, esquema, formato) as escritor:
+            for lote in lotes:
+                escritor.write_batch(lote)
+                datos = salida.vaciar()
+                if datos:
+                    yield datos
+        datos = salida.vaciar()
+        if datos:
+            yield datos
+    finally:
+        db.close()
@@ -0,0 +1,345 @@
+"""
+Migraciones de esquema ligeras
+create_all solo crea tablas nuevas: nunca añade índices ni columnas a
+tablas que ya existen. Este módulo aplica esos cambios a bases de datos
+existentes, una sola vez cada uno, registrándolos en schema_migraciones.
+
+Cada migración debe ser idempotente (p. ej. CREATE INDEX IF NOT EXISTS):
+si dos workers arrancan a la vez, ambos pueden ejecutarla.
+"""
+
+from datetime import datetime
+from typing import Callable, List, Tuple
+
+from sqlalchemy import Index, insert, select, text
+from sqlalchemy.exc import IntegrityError
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def crear_indice(engine, indice: Index):
+    """
+    Crea un índice sin bloquear las escrituras más de lo necesario
+
+    En PostgreSQL usa CREATE INDEX CONCURRENTLY (fuera de transacción);
+    en SQLite un CREATE INDEX IF NOT EXISTS normal.
+
+    Args:
+        engine: Engine de SQLAlchemy
+        indice: Índice definido en los modelos
+    """
+    columnas = ", ".join(columna.name for columna in indice.columns)
+    tabla = indice.table.name
+    tipo = "UNIQUE INDEX" if indice.unique else "INDEX"
+
+    if engine.dialect.name == "postgresql":
+        sentencia = f"CREATE {tipo} CONCURRENTLY IF NOT EXISTS {indice.name} ON {tabla} ({columnas})"
+        with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conexion:
+            conexion.execute(text(sentencia))
+    else:
+        sentencia = f"CREATE {tipo} IF NOT EXISTS {indice.name} ON {tabla} ({columnas})"
+        with engine.begin() as conexion:
+            conexion.execute(text(sentencia))
+
+    print(f"  ✓ Índice {indice.name} ({tabla}: {columnas})")
+
+
+def _indices_usuario_fecha(engine):
+    """Índices compuestos (usuario_id, fecha) de las tablas por usuario"""
+    from models.db_models import (
+        MoodMapDB, FeedbackDB, HistoricoInteraccionDB,
+        EmocionLiberadaDB, GratitudDB, DestelloDB
+    )
+
+    for modelo in (MoodMapDB, FeedbackDB, HistoricoInteraccionDB, EmocionLiberadaDB, GratitudDB, DestelloDB):
+        for indice in modelo.__table__.indexes:
+            if len(indice.columns) > 1 and indice.columns[0].name == "usuario_id":
+                crear_indice(engine, indice)
+
+
+def _contadores_usuario(engine):
+    """Rellena contadores_usuario con los totales actuales"""
+    from utils.contadores import reconciliar_contadores
+    resultado = reconciliar_contadores(engine)
+    print(f"  ✓ Contadores de {resultado['usuarios_revisados']} usuarios")
+
+
+# Columnas tipadas de historico_interacciones: (columna, JSON de origen, ruta)
+COLUMNAS_TIPADAS_INTERACCION = [
+    ("felicidad", "datos", "felicidad"),
+    ("estres", "datos", "estres"),
+    ("motivacion", "datos", "motivacion"),
+    ("microaccion", "datos", "microaccion"),
+    ("embedding_0", "embedding_latente", 0),
+    ("embedding_1", "embedding_latente", 1),
+    ("embedding_2", "embedding_latente", 2),
+    ("embedding_3", "embedding_latente", 3),
+]
+LOTE_RELLENO = 5000
+
+
+def _extraer_json(dialecto: str, origen: str, ruta, numerico: bool) -> str:
+    """Expresión SQL que lee un campo del JSON sin pasar por Python"""
+    if dialecto == "postgresql":
+        clave = str(ruta) if isinstance(ruta, int) else f"'{ruta}'"
+        valor = f"({origen} ->> {clave})"
+        return f"CAST({valor} AS DOUBLE PRECISION)" if numerico else valor
+    ruta_sqlite = f"$[{ruta}]" if isinstance(ruta, int) else f"$.{ruta}"
+    return f"json_extract({origen}, '{ruta_sqlite}')"
+
+
+def _columnas_tipadas_interaccion(engine):
+    """Columnas tipadas en historico_interacciones y relleno desde el JSON"""
+    from utils.particiones import agregar_columnas, particiones
+
+    nombres = [columna for columna, _, _ in COLUMNAS_TIPADAS_INTERACCION]
+    for fisica in agregar_columnas("historico_interacciones", nombres, engine):
+        print(f"  ✓ Columnas tipadas en {fisica}")
+
+    dialecto = engine.dialect.name
+    asignaciones = ", ".join(
+        f"{columna} = {_extraer_json(dialecto, origen, ruta, columna != 'microaccion')}"
+        for columna, origen, ruta in COLUMNAS_TIPADAS_INTERACCION
+    )
+
+    # En SQLite también las particiones rotadas; en PostgreSQL basta el padre
+    fisicas = ["historico_interacciones"]
+    if dialecto == "sqlite":
+        with engine.connect() as conexion:
+            fisicas += [particion["particion"] for particion in particiones(conexion, "historico_interacciones")]
+
+    for fisica in fisicas:
+        with engine.connect() as conexion:
+            minimo, maximo = conexion.execute(text(f"SELECT min(id), max(id) FROM {fisica}")).one()
+        if minimo is None:
+            continue
+
+        # Lotes por rango de id: transacciones cortas que no bloquean las escrituras
+        filas = 0
+        for desde in range(minimo, maximo + 1, LOTE_RELLENO):
+            with engine.begin() as conexion:
+                filas += conexion.execute(
+                    text(f"UPDATE {fisica} SET {asignaciones} WHERE id >= :desde AND id < :hasta"),
+                    {"desde": desde, "hasta": desde + LOTE_RELLENO}
+                ).rowcount
+        print(f"  ✓ {fisica}: {filas} filas rellenadas")
+
+
+def _resumen_semanal_unico(engine):
+    """Elimina resúmenes semanales duplicados y crea el índice único (usuario_id, semana_anio)"""
+    from models.db_models import ResumenSemanalDB
+
+    with engine.begin() as conexion:
+        borrados = conexion.execute(text(
+            "DELETE FROM resumen_semanal WHERE id NOT IN ("
+            "SELECT max(id) FROM resumen_semanal GROUP BY usuario_id, semana_anio)"
+        )).rowcount
+    print(f"  ✓ {borrados} resúmenes duplicados eliminados")
+
+    for indice in ResumenSemanalDB.__table__.indexes:
+        if indice.unique:
+            crear_indice(engine, indice)
+
+
+def _semanas_pendientes_resumen(engine):
+    """Marca todas las semanas ya archivadas para que se resuman en el próximo archivado"""
+    with engine.begin() as conexion:
+        marcadas = conexion.execute(text(
+            "INSERT INTO semanas_pendientes_resumen (usuario_id, semana_anio, fecha_marcada) "
+            "SELECT usuario_id, semana_anio, :ahora FROM ("
+            "SELECT usuario_id, semana_anio FROM archivo_emocional "
+            "UNION SELECT usuario_id, semana_anio FROM archivo_alma_board"
+            ") semanas WHERE usuario_id IS NOT NULL AND semana_anio IS NOT NULL "
+            "AND NOT EXISTS (SELECT 1 FROM semanas_pendientes_resumen p "
+            "WHERE p.usuario_id = semanas.usuario_id AND p.semana_anio = semanas.semana_anio)"
+        ), {"ahora": datetime.now()}).rowcount
+    print(f"  ✓ {marcadas} semanas pendientes de resumen")
+
+
+def _cubo_investigacion(engine):
+    """Índice único de las celdas del cubo y carga inicial desde el archivo"""
+    from models.db_models import CuboInvestigacionDB
+    from utils.cubo_investigacion import reconstruir_cubo
+    
+    for indice in CuboInvestigacionDB.__table__.indexes:
+        if indice.unique:
+            crear_indice(engine, indice)
+    resultado = reconstruir_cubo(engine)
+    print(f"  ✓ Cubo de investigación: {resultado['celdas']} celdas")
+
+
+def _trabajo_archivo_unico(engine):
+    """Columnas activo/propietario en trabajos_archivo e índice único del trabajo activo"""
+    from models.db_models import TrabajoArchivoDB
+    from utils.particiones import agregar_columnas
+
+    if agregar_columnas("trabajos_archivo", ["activo", "propietario"], engine):
+        print("  ✓ Columnas activo y propietario en trabajos_archivo")
+
+    # Solo el último trabajo activo sigue siéndolo; los anteriores se cierran
+    with engine.begin() as conexion:
+        conexion.execute(text(
+            "UPDATE trabajos_archivo SET activo = NULL WHERE estado NOT IN ('pendiente', 'en_curso')"
+        ))
+        ultimo = conexion.execute(text(
+            "SELECT max(id) FROM trabajos_archivo WHERE estado IN ('pendiente', 'en_curso')"
+        )).scalar()
+        if ultimo is not None:
+            duplicados = conexion.execute(text(
+                "UPDATE trabajos_archivo SET estado = 'error', activo = NULL, "
+                "error = 'Duplicado de un trabajo activo posterior' "
+                "WHERE estado IN ('pendiente', 'en_curso') AND id < :ultimo"
+            ), {"ultimo": ultimo}).rowcount
+            conexion.execute(text("UPDATE trabajos_archivo SET activo = :activo WHERE id = :ultimo"),
+                             {"activo": True, "ultimo": ultimo})
+            print(f"  ✓ {duplicados} trabajos activos duplicados cerrados")
+
+    for indice in TrabajoArchivoDB.__table__.indexes:
+        if indice.unique:
+            crear_indice(engine, indice)
+
+
+def _microaccion_interaccion(engine):
+    """Rellena historico_interacciones.microaccion con microaccion_sugerida (0003 la leía del JSON, donde no está)"""
+    from utils.particiones import particiones
+
+    fisicas = ["historico_interacciones"]
+    if engine.dialect.name == "sqlite":
+        with engine.connect() as conexion:
+            fisicas += [particion["particion"] for particion in particiones(conexion, "historico_interacciones")]
+
+    for fisica in fisicas:
+        with engine.connect() as conexion:
+            minimo, maximo = conexion.execute(text(f"SELECT min(id), max(id) FROM {fisica}")).one()
+        if minimo is None:
+            continue
+
+        filas = 0
+        for desde in range(minimo, maximo + 1, LOTE_RELLENO):
+            with engine.begin() as conexion:
+                filas += conexion.execute(text(
+                    f"UPDATE {fisica} SET microaccion = microaccion_sugerida "
+                    "WHERE microaccion IS NULL AND id >= :desde AND id < :hasta"
+                ), {"desde": desde, "hasta": desde + LOTE_RELLENO}).rowcount
+        print(f"  ✓ {fisica}: {filas} microacciones rellenadas")
+
+
+def _marca_cubo_propia(engine):
+    """Mueve la marca del cubo de progreso_archivo (fila "cubo_investigacion") a su tabla"""
+    from models.db_models import MarcaCuboDB
+
+    MarcaCuboDB.__table__.create(bind=engine, checkfirst=True)
+    with engine.begin() as conexion:
+        movidas = conexion.execute(text(
+            "INSERT INTO marca_cubo_investigacion (id, ultimo_id, filas_sumadas, fecha_actualizacion) "
+            "SELECT 1, ultimo_id, filas_archivadas, fecha_actualizacion FROM progreso_archivo "
+            "WHERE tabla = 'cubo_investigacion' "
+            "AND NOT EXISTS (SELECT 1 FROM marca_cubo_investigacion WHERE id = 1)"
+        )).rowcount
+        conexion.execute(text("DELETE FROM progreso_archivo WHERE tabla = 'cubo_investigacion'"))
+    print(f"  ✓ Marca del cubo en marca_cubo_investigacion ({movidas} movida)")
+
+
+def _archivo_autoincrement(engine):
+    """
+    Reconstruye archivo_emocional y archivo_alma_board con AUTOINCREMENT (SQLite)
+
+    Sin él SQLite reutiliza los ids más altos cuando se borran, y el sellado
+    de segmentos borra filas del archivo. La secuencia arranca después del
+    mayor id ya sellado en disco.
+    """
+    if engine.dialect.name != "sqlite":
+        print("  ✓ Sin cambios: las secuencias de este motor no reutilizan ids")
+        return
+
+    from utils.segmentos_archivo import TABLAS_SEGMENTADAS, listar_segmentos
+
+    for nombre, modelo in TABLAS_SEGMENTADAS.items():
+        tabla = modelo.__table__
+        antigua = f"{nombre}_sin_autoincrement"
+        with engine.begin() as conexion:
+            definicion = conexion.execute(text(
+                "SELECT sql FROM sqlite_master WHERE type = 'table' AND name = :nombre"
+            ), {"nombre": nombre}).scalar() or ""
+            if "AUTOINCREMENT" not in definicion.upper():
+                existentes = {fila[1] for fila in conexion.execute(text(f"PRAGMA table_info({nombre})"))}
+                columnas = ", ".join(columna.name for columna in tabla.columns if columna.name in existentes)
+                indices = conexion.execute(text(
+                    "SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = :nombre AND sql IS NOT NULL"
+                ), {"nombre": nombre}).scalars().all()
+                for indice in indices:
+                    conexion.execute(text(f"DROP INDEX {indice}"))
+                conexion.execute(text(f"ALTER TABLE {nombre} RENAME TO {antigua}"))
+                tabla.create(bind=conexion)
+                conexion.execute(text(
+                    f"INSERT INTO {nombre} ({columnas}) SELECT {columnas} FROM {antigua}"
+                ))
+                conexion.execute(text(f"DROP TABLE {antigua}"))
+                print(f"  ✓ {nombre} reconstruida con AUTOINCREMENT")
+
+            tope = max([segmento.indice["id_max"] or 0 for segmento in listar_segmentos(nombre)], default=0)
+            tope = max(tope, conexion.execute(text(f"SELECT coalesce(max(id), 0) FROM {nombre}")).scalar())
+            if not conexion.execute(text(
+                "UPDATE sqlite_sequence SET seq = max(seq, :tope) WHERE name = :nombre"
+            ), {"tope": tope, "nombre": nombre}).rowcount:
+                conexion.execute(text(
+                    "INSERT INTO sqlite_sequence (name, seq) VALUES (:nombre, :tope)"
+                ), {"tope": tope, "nombre": nombre})
+        print(f"  ✓ {nombre}: ids nuevos a partir de {tope + 1}")
+
+
+# Lista ordenada: (id, descripción, función(engine)). Añadir siempre al final
+MIGRACIONES: List[Tuple[str, str, Callable]] = [
+    ("0001_indices_usuario_fecha", "Índices compuestos (usuario_id, fecha)", _indices_usuario_fecha),
+    ("0002_contadores_usuario", "Contadores de registros por usuario", _contadores_usuario),
+    ("0003_columnas_tipadas_interaccion", "Columnas tipadas de MoodMap en historico_interacciones", _columnas_tipadas_interaccion),
+    ("0004_resumen_semanal_unico", "Índice único (usuario_id, semana_anio) en resumen_semanal", _resumen_semanal_unico),
+    ("0005_semanas_pendientes_resumen", "Semanas archivadas pendientes de resumen", _semanas_pendientes_resumen),
+    ("0006_cubo_investigacion", "Cubo de efectividad por cluster, estado, microacción y semana", _cubo_investigacion),
+    ("0007_trabajo_archivo_unico", "Un único trabajo de archivado activo y token de propietario", _trabajo_archivo_unico),
+    ("0008_microaccion_interaccion", "Microacción tipada desde microaccion_sugerida", _microaccion_interaccion),
+    ("0009_marca_cubo_propia", "Marca de agua del cubo fuera de progreso_archivo", _marca_cubo_propia),
+    ("0010_archivo_autoincrement", "Ids del archivo sin reutilizar tras sellar segmentos", _archivo_autoincrement),
+]
+
+
+def aplicar_migraciones(engine=None) -> List[str]:
+    """
+    Aplica las migraciones pendientes en orden
+
+    Args:
+        engine: Engine de SQLAlchemy (por defecto el de database.py)
+
+    Returns:
+        Lista de ids de las migraciones aplicadas en esta llamada
+    """
+    from models.db_models import MigracionEsquemaDB
+
+    if engine is None:
+        from database import engine
+
+    tabla = MigracionEsquemaDB.__table__
+    tabla.create(bind=engine, checkfirst=True)
+
+    with engine.connect() as conexion:
+        aplicadas = set(conexion.execute(select(tabla.c.id)).scalars())
+
+    nuevas = []
+    for id_migracion, descripcion, funcion in MIGRACIONES:
+        if id_migracion in aplicadas:
+            continue
+
+        print(f"🔧 Migración {id_migracion}: {descripcion}")
+        funcion(engine)
+
+        try:
+            with engine.begin() as conexion:
+                conexion.execute(insert(tabla).values(id=id_migracion, descripcion=descripcion))
+        except IntegrityError:
+            # Otro worker la registró a la vez
+            logger.info(f"Migración {id_migracion} ya registrada por otro proceso")
+
+        nuevas.append(id_migracion)
+
+    return nuevas
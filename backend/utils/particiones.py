@@ -0,0 +1,614 @@
+"""
+Particionado mensual de las tablas de mayor volumen
+(historico_interacciones y feedbacks), activado con DB_PARTICIONES=true
+
+Con particiones, la retención deja de ser un DELETE masivo (bloqueos,
+fragmentación y VACUUM posterior) y pasa a ser borrar particiones
+completas. Las consultas por rango de fechas solo leen los meses afectados.
+
+- PostgreSQL: particionado nativo PARTITION BY RANGE. La tabla existente
+  se convierte una sola vez en la primera partición (legado) y se crean
+  particiones mensuales por adelantado, más una partición DEFAULT vacía.
+  Las consultas de la aplicación no cambian; la poda la hace el planner.
+- SQLite: la aplicación sigue escribiendo en la tabla original (tabla
+  caliente). El día 1 de cada mes los meses cerrados se rotan a tablas
+  <tabla>_pAAAA_MM (un ALTER TABLE RENAME en el caso normal) y la vista
+  <tabla>_todo las une todas (para SQL manual). La aplicación lee con
+  seleccionar_rango() / contar_filas(), que solo tocan las particiones que
+  solapan el rango, y borra con borrar_filas_usuario().
+
+El catálogo particiones_tiempo guarda el rango real de cada partición.
+"""
+
+import os
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from sqlalchemy import Column, MetaData, Table, delete, func, select, text, union_all, update
+from sqlalchemy.schema import CreateIndex, CreateTable
+import logging
+
+logger = logging.getLogger(__name__)
+
+PARTICIONES_ACTIVAS = os.getenv("DB_PARTICIONES", "false").lower() == "true"
+MESES_ADELANTADOS = int(os.getenv("DB_PARTICIONES_MESES_ADELANTADOS", "2"))
+
+# Tabla → columna de fecha por la que se particiona
+TABLAS_PARTICIONADAS = {
+    "historico_interacciones": "fecha",
+    "feedbacks": "timestamp",
+}
+
+# Formato con el que SQLAlchemy guarda DateTime en SQLite
+FORMATO_SQLITE = "%Y-%m-%d %H:%M:%S.%f"
+
+
+def inicio_mes(fecha: datetime) -> datetime:
+    """Primer instante del mes de la fecha"""
+    return fecha.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+
+def mes_siguiente(fecha: datetime) -> datetime:
+    """Primer instante del mes siguiente"""
+    inicio = inicio_mes(fecha)
+    if inicio.month == 12:
+        return inicio.replace(year=inicio.year + 1, month=1)
+    return inicio.replace(month=inicio.month + 1)
+
+
+def nombre_particion(tabla: str, mes: datetime) -> str:
+    """Nombre de la partición mensual: historico_interacciones_p2026_01"""
+    return f"{tabla}_p{mes:%Y_%m}"
+
+
+def _tabla_modelo(tabla: str) -> Table:
+    import models.db_models  # noqa: F401 (registra los modelos en Base)
+    from database import Base
+    return Base.metadata.tables[tabla]
+
+
+def _tabla_fisica(tabla: str, nombre: str) -> Table:
+    """Copia de las columnas del modelo con otro nombre (sin índices)"""
+    modelo = _tabla_modelo(tabla)
+    return Table(nombre, MetaData(), *[Column(c.name, c.type, primary_key=c.primary_key) for c in modelo.columns])
+
+
+def _fecha_sqlite(valor) -> Optional[datetime]:
+    if valor is None or isinstance(valor, datetime):
+        return valor
+    return datetime.fromisoformat(valor)
+
+
+# ============================================================
+# CATÁLOGO
+# ============================================================
+
+def particiones(conexion, tabla: str) -> List[Dict]:
+    """
+    Particiones registradas de una tabla, de la más antigua a la más reciente
+
+    Returns:
+        Lista de diccionarios con particion, desde, hasta y filas
+    """
+    from models.db_models import ParticionTiempoDB
+
+    catalogo = ParticionTiempoDB.__table__
+    filas = conexion.execute(
+        select(catalogo.c.particion, catalogo.c.desde, catalogo.c.hasta, catalogo.c.filas)
+        .where(catalogo.c.tabla == tabla)
+        .order_by(catalogo.c.hasta)
+    ).mappings().all()
+    return [dict(fila) for fila in filas]
+
+
+def tablas_en_rango(conexion, tabla: str, desde: datetime = None, hasta: datetime = None) -> List[str]:
+    """
+    Tablas físicas que pueden contener filas en [desde, hasta)
+
+    En PostgreSQL es siempre la tabla padre (la poda es nativa).
+    """
+    if conexion.dialect.name != "sqlite" or not PARTICIONES_ACTIVAS:
+        return [tabla]
+
+    nombres = [tabla]
+    for particion in particiones(conexion, tabla):
+        if desde is not None and particion["hasta"] <= desde:
+            continue
+        if hasta is not None and particion["desde"] is not None and particion["desde"] >= hasta:
+            continue
+        nombres.append(particion["particion"])
+    return nombres
+
+
+def seleccionar_rango(conexion, tabla: str, desde: datetime = None, hasta: datetime = None, usuario_id: int = None):
+    """
+    SELECT sobre las filas de la tabla en un rango de fechas, incluidas las
+    particiones rotadas (solo las que solapan el rango)
+
+    Args:
+        conexion: Conexión o sesión de SQLAlchemy
+        tabla: Nombre de una tabla de TABLAS_PARTICIONADAS
+        desde: Fecha mínima (inclusive)
+        hasta: Fecha máxima (exclusiva)
+        usuario_id: Filtrar por usuario (opcional)
+
+    Returns:
+        Subconsulta con las columnas del modelo
+    """
+    columna = TABLAS_PARTICIONADAS[tabla]
+    consultas = []
+    for nombre in tablas_en_rango(conexion, tabla, desde, hasta):
+        fisica = _tabla_modelo(tabla) if nombre == tabla else _tabla_fisica(tabla, nombre)
+        consulta = select(*[fisica.c[c.name] for c in _tabla_modelo(tabla).columns])
+        if desde is not None:
+            consulta = consulta.where(fisica.c[columna] >= desde)
+        if hasta is not None:
+            consulta = consulta.where(fisica.c[columna] < hasta)
+        if usuario_id is not None:
+            consulta = consulta.where(fisica.c.usuario_id == usuario_id)
+        consultas.append(consulta)
+
+    if len(consultas) == 1:
+        return consultas[0].subquery()
+    return union_all(*consultas).subquery()
+
+
+def contar_filas(conexion, tabla: str, desde: datetime = None, hasta: datetime = None, usuario_id: int = None) -> int:
+    """
+    COUNT(*) de la tabla en un rango de fechas, incluidas las particiones rotadas
+
+    Args:
+        conexion: Conexión de SQLAlchemy
+        tabla: Nombre de una tabla de TABLAS_PARTICIONADAS
+        desde: Fecha mínima (inclusive)
+        hasta: Fecha máxima (exclusiva)
+        usuario_id: Filtrar por usuario (opcional)
+
+    Returns:
+        Número de filas
+    """
+    subconsulta = seleccionar_rango(conexion, tabla, desde, hasta, usuario_id)
+    return conexion.execute(select(func.count()).select_from(subconsulta)).scalar()
+
+
+def borrar_filas_usuario(conexion, tabla: str, usuario_id: int) -> int:
+    """
+    Borra las filas de un usuario de la tabla caliente y de sus particiones rotadas
+    (en la transacción de la conexión)
+
+    Args:
+        conexion: Conexión de SQLAlchemy
+        tabla: Nombre de una tabla de TABLAS_PARTICIONADAS
+        usuario_id: ID del usuario
+
+    Returns:
+        Filas borradas
+    """
+    from models.db_models import ParticionTiempoDB
+
+    catalogo = ParticionTiempoDB.__table__
+    borradas = 0
+    for nombre in tablas_en_rango(conexion, tabla):
+        fisica = _tabla_modelo(tabla) if nombre == tabla else _tabla_fisica(tabla, nombre)
+        filas = conexion.execute(delete(fisica).where(fisica.c.usuario_id == usuario_id)).rowcount
+        if filas and nombre != tabla:
+            conexion.execute(
+                update(catalogo).where(catalogo.c.particion == nombre).values(filas=catalogo.c.filas - filas)
+            )
+        borradas += filas
+    return borradas
+
+
+# ============================================================
+# POSTGRESQL: PARTICIONADO NATIVO
+# ============================================================
+
+def _pg_es_particionada(conexion, tabla: str) -> bool:
+    tipo = conexion.execute(
+        text("SELECT relkind FROM pg_class WHERE oid = to_regclass(:tabla)"), {"tabla": tabla}
+    ).scalar()
+    return tipo == "p"
+
+
+def _pg_registrar(conexion, tabla: str, particion: str, desde, hasta, filas=None):
+    from models.db_models import ParticionTiempoDB
+
+    catalogo = ParticionTiempoDB.__table__
+    existe = conexion.execute(
+        select(catalogo.c.id).where(catalogo.c.particion == particion)
+    ).scalar()
+    if existe is None:
+        conexion.execute(catalogo.insert().values(
+            tabla=tabla, particion=particion, desde=desde, hasta=hasta,
+            filas=filas, fecha_creacion=datetime.now()
+        ))
+
+
+def _pg_convertir(engine, tabla: str, columna: str):
+    """
+    Convierte una tabla normal en particionada (una sola vez)
+
+    La tabla existente pasa a ser la partición <tabla>_legado con rango
+    [MINVALUE, mes siguiente a su última fila). Se valida primero un CHECK
+    con ese rango para que el ATTACH no tenga que recorrer la tabla.
+    """
+    legado = f"{tabla}_legado"
+    modelo = _tabla_modelo(tabla)
+
+    with engine.begin() as conexion:
+        if _pg_es_particionada(conexion, tabla):
+            return
+
+        print(f"🔧 Convirtiendo {tabla} en tabla particionada por {columna}")
+        conexion.execute(text(f"LOCK TABLE {tabla} IN ACCESS EXCLUSIVE MODE"))
+        conexion.execute(text(f"UPDATE {tabla} SET {columna} = now() WHERE {columna} IS NULL"))
+
+        maximo = conexion.execute(text(f"SELECT max({columna}) FROM {tabla}")).scalar()
+        limite = mes_siguiente(maximo or datetime.now())
+        filas = conexion.execute(
+            text("SELECT reltuples::bigint FROM pg_class WHERE oid = to_regclass(:tabla)"), {"tabla": tabla}
+        ).scalar()
+        secuencia = conexion.execute(
+            text("SELECT pg_get_serial_sequence(:tabla, 'id')"), {"tabla": tabla}
+        ).scalar()
+
+        # Liberar los nombres de tabla e índices para la tabla padre
+        conexion.execute(text(f"ALTER TABLE {tabla} RENAME TO {legado}"))
+        indices = conexion.execute(
+            text("SELECT indexname FROM pg_indexes WHERE tablename = :tabla"), {"tabla": legado}
+        ).scalars().all()
+        for indice in indices:
+            conexion.execute(text(f'ALTER INDEX "{indice}" RENAME TO "{indice}_legado"'))
+
+        conexion.execute(text(
+            f"CREATE TABLE {tabla} (LIKE {legado} INCLUDING DEFAULTS) PARTITION BY RANGE ({columna})"
+        ))
+        # La clave primaria de una tabla particionada debe incluir la columna de partición
+        conexion.execute(text(f"ALTER TABLE {tabla} ADD PRIMARY KEY (id, {columna})"))
+        for indice in modelo.indexes:
+            conexion.execute(CreateIndex(indice))
+
+        # La secuencia de ids pasa a pertenecer a la tabla padre (sobrevive al legado)
+        if secuencia:
+            conexion.execute(text(f"ALTER SEQUENCE {secuencia} OWNED BY {tabla}.id"))
+
+        literal_limite = limite.strftime("%Y-%m-%d %H:%M:%S")
+        conexion.execute(text(
+            f"ALTER TABLE {legado} ADD CONSTRAINT {legado}_rango "
+            f"CHECK ({columna} IS NOT NULL AND {columna} < '{literal_limite}') NOT VALID"
+        ))
+        conexion.execute(text(f"ALTER TABLE {legado} VALIDATE CONSTRAINT {legado}_rango"))
+        conexion.execute(text(
+            f"ALTER TABLE {tabla} ATTACH PARTITION {legado} FOR VALUES FROM (MINVALUE) TO ('{literal_limite}')"
+        ))
+
+        _pg_registrar(conexion, tabla, legado, None, limite, filas)
+
+    print(f"  ✓ {tabla}: datos existentes en {legado} (hasta {limite:%Y-%m})")
+
+
+def _pg_crear_particiones(engine, tabla: str, columna: str) -> List[str]:
+    """Crea las particiones mensuales que falten hasta MESES_ADELANTADOS meses vista"""
+    creadas = []
+
+    with engine.begin() as conexion:
+        existentes = particiones(conexion, tabla)
+        mes = max(
+            [inicio_mes(datetime.now())] + [p["hasta"] for p in existentes]
+        )
+        fin = inicio_mes(datetime.now())
+        for _ in range(MESES_ADELANTADOS + 1):
+            fin = mes_siguiente(fin)
+
+        while mes < fin:
+            siguiente = mes_siguiente(mes)
+            nombre = nombre_particion(tabla, mes)
+            conexion.execute(text(
+                f"CREATE TABLE IF NOT EXISTS {nombre} PARTITION OF {tabla} "
+                f"FOR VALUES FROM ('{mes:%Y-%m-%d}') TO ('{siguiente:%Y-%m-%d}')"
+            ))
+            _pg_registrar(conexion, tabla, nombre, mes, siguiente, 0)
+            creadas.append(nombre)
+            mes = siguiente
+
+        # Red de seguridad para filas fuera de rango (debe quedar vacía)
+        conexion.execute(text(f"CREATE TABLE IF NOT EXISTS {tabla}_pdefecto PARTITION OF {tabla} DEFAULT"))
+
+    return creadas
+
+
+def _pg_eliminar(engine, tabla: str, fecha_limite: datetime) -> Dict:
+    from models.db_models import ParticionTiempoDB
+
+    catalogo = ParticionTiempoDB.__table__
+    eliminadas, filas = [], 0
+
+    with engine.begin() as conexion:
+        for particion in particiones(conexion, tabla):
+            if particion["hasta"] > fecha_limite:
+                continue
+            nombre = particion["particion"]
+            filas += conexion.execute(
+                text("SELECT greatest(reltuples, 0)::bigint FROM pg_class WHERE oid = to_regclass(:p)"), {"p": nombre}
+            ).scalar() or 0
+            conexion.execute(text(f"ALTER TABLE {tabla} DETACH PARTITION {nombre}"))
+            conexion.execute(text(f"DROP TABLE {nombre}"))
+            conexion.execute(catalogo.delete().where(catalogo.c.particion == nombre))
+            eliminadas.append(nombre)
+
+    return {"particiones": eliminadas, "filas": filas}
+
+
+# ============================================================
+# SQLITE: ROTACIÓN MENSUAL + VISTA
+# ============================================================
+
+class _TransaccionSQLite:
+    """BEGIN IMMEDIATE explícito sobre una conexión sqlite3 (DDL incluido)"""
+
+    def __init__(self, engine):
+        self._raw = engine.raw_connection()
+        self._conexion = self._raw.driver_connection
+
+    def __enter__(self):
+        self._nivel = self._conexion.isolation_level
+        self._conexion.isolation_level = None
+        self.cursor = self._conexion.cursor()
+        self.cursor.execute("BEGIN IMMEDIATE")
+        return self.cursor
+
+    def __exit__(self, tipo, valor, traza):
+        try:
+            self.cursor.execute("ROLLBACK" if tipo else "COMMIT")
+        finally:
+            self._conexion.isolation_level = self._nivel
+            self._raw.close()
+
+
+def _sqlite_existe(cursor, nombre: str) -> bool:
+    return cursor.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (nombre,)
+    ).fetchone() is not None
+
+
+def _sqlite_recrear_vista(cursor, tabla: str):
+    """<tabla>_todo = tabla caliente UNION ALL particiones"""
+    columnas = ", ".join(c.name for c in _tabla_modelo(tabla).columns)
+    nombres = [tabla] + [
+        fila[0] for fila in cursor.execute(
+            "SELECT particion FROM particiones_tiempo WHERE tabla = ? ORDER BY hasta", (tabla,)
+        )
+    ]
+    cursor.execute(f"DROP VIEW IF EXISTS {tabla}_todo")
+    cursor.execute(
+        f"CREATE VIEW {tabla}_todo AS "
+        + " UNION ALL ".join(f"SELECT {columnas} FROM {nombre}" for nombre in nombres)
+    )
+
+
+def _sqlite_rotar(engine, tabla: str, columna: str) -> List[str]:
+    """
+    Mueve los meses cerrados de la tabla caliente a particiones mensuales
+
+    Caso normal (la tabla solo tiene el mes anterior y los primeros minutos
+    del actual): las filas del mes en curso se copian a una tabla caliente
+    nueva y la anterior se renombra a partición, sin reescribir el mes.
+    """
+    modelo = _tabla_modelo(tabla)
+    dialecto = engine.dialect
+    columnas = ", ".join(c.name for c in modelo.columns)
+    mes_actual = inicio_mes(datetime.now())
+    corte = mes_actual.strftime(FORMATO_SQLITE)
+    rotando = f"{tabla}__rotando"
+    tocadas = []
+
+    with _TransaccionSQLite(engine) as cursor:
+        minimo = _fecha_sqlite(cursor.execute(f"SELECT min({columna}) FROM {tabla}").fetchone()[0])
+        if minimo is None or minimo >= mes_actual:
+            _sqlite_recrear_vista(cursor, tabla)
+            return []
+
+        print(f"🔧 Rotando {tabla}: meses anteriores a {mes_actual:%Y-%m}")
+        maximo_id = cursor.execute(f"SELECT max(id) FROM {tabla}").fetchone()[0] or 0
+
+        # 1. Nueva tabla caliente con las filas del mes en curso
+        cursor.execute(f"ALTER TABLE {tabla} RENAME TO {rotando}")
+        cursor.execute(str(CreateTable(modelo).compile(dialect=dialecto)))
+        cursor.execute(
+            "INSERT INTO sqlite_sequence (name, seq) VALUES (?, ?)", (tabla, maximo_id)
+        )
+        cursor.execute(
+            f"INSERT INTO {tabla} ({columnas}) SELECT {columnas} FROM {rotando} WHERE {columna} >= ?", (corte,)
+        )
+        cursor.execute(f"DELETE FROM {rotando} WHERE {columna} >= ? OR {columna} IS NULL", (corte,))
+
+        # 2. Liberar los nombres de índices y crearlos en la tabla caliente
+        indices = [
+            fila[0] for fila in cursor.execute(
+                "SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = ? AND sql IS NOT NULL",
+                (rotando,)
+            )
+        ]
+        for indice in indices:
+            cursor.execute(f'DROP INDEX "{indice}"')
+        for indice in modelo.indexes:
+            cursor.execute(str(CreateIndex(indice).compile(dialect=dialecto)))
+
+        # 3. Repartir los meses cerrados en particiones
+        meses = []
+        mes = inicio_mes(minimo)
+        while mes < mes_actual:
+            meses.append(mes)
+            mes = mes_siguiente(mes)
+
+        particion_unica = nombre_particion(tabla, meses[0])
+        if len(meses) == 1 and not _sqlite_existe(cursor, particion_unica):
+            filas = cursor.execute(f"SELECT count(*) FROM {rotando}").fetchone()[0]
+            cursor.execute(f"ALTER TABLE {rotando} RENAME TO {particion_unica}")
+            repartidas = [(meses[0], particion_unica, filas)]
+        else:
+            repartidas = []
+            for mes in meses:
+                nombre = nombre_particion(tabla, mes)
+                if not _sqlite_existe(cursor, nombre):
+                    cursor.execute(str(CreateTable(_tabla_fisica(tabla, nombre)).compile(dialect=dialecto)))
+                cursor.execute(
+                    f"INSERT INTO {nombre} ({columnas}) SELECT {columnas} FROM {rotando} "
+                    f"WHERE {columna} >= ? AND {columna} < ?",
+                    (mes.strftime(FORMATO_SQLITE), mes_siguiente(mes).strftime(FORMATO_SQLITE))
+                )
+                if cursor.rowcount:
+                    repartidas.append((mes, nombre, cursor.rowcount))
+            cursor.execute(f"DROP TABLE {rotando}")
+
+        # 4. Índices de las particiones y catálogo
+        for mes, nombre, filas in repartidas:
+            cursor.execute(
+                f"CREATE INDEX IF NOT EXISTS ix_{nombre}_usuario_{columna} ON {nombre} (usuario_id, {columna})"
+            )
+            cursor.execute(f"CREATE INDEX IF NOT EXISTS ix_{nombre}_{columna} ON {nombre} ({columna})")
+            actualizada = cursor.execute(
+                "UPDATE particiones_tiempo SET filas = filas + ? WHERE particion = ?", (filas, nombre)
+            ).rowcount
+            if not actualizada:
+                cursor.execute(
+                    "INSERT INTO particiones_tiempo (tabla, particion, desde, hasta, filas, fecha_creacion) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    (
+                        tabla, nombre, mes.strftime(FORMATO_SQLITE),
+                        mes_siguiente(mes).strftime(FORMATO_SQLITE), filas,
+                        datetime.now().strftime(FORMATO_SQLITE)
+                    )
+                )
+            tocadas.append(nombre)
+            print(f"  ✓ {nombre}: {filas} filas")
+
+        _sqlite_recrear_vista(cursor, tabla)
+
+    return tocadas
+
+
+def _sqlite_eliminar(engine, tabla: str, fecha_limite: datetime) -> Dict:
+    eliminadas, filas = [], 0
+
+    with _TransaccionSQLite(engine) as cursor:
+        candidatas = cursor.execute(
+            "SELECT particion, filas FROM particiones_tiempo WHERE tabla = ? AND hasta <= ?",
+            (tabla, fecha_limite.strftime(FORMATO_SQLITE))
+        ).fetchall()
+        for nombre, num_filas in candidatas:
+            cursor.execute(f"DROP TABLE IF EXISTS {nombre}")
+            cursor.execute("DELETE FROM particiones_tiempo WHERE particion = ?", (nombre,))
+            eliminadas.append(nombre)
+            filas += num_filas or 0
+        if eliminadas:
+            _sqlite_recrear_vista(cursor, tabla)
+
+    return {"particiones": eliminadas, "filas": filas}
+
+
+# ============================================================
+# API
+# ============================================================
+
+def mantener_particiones(engine=None) -> Dict[str, List[str]]:
+    """
+    Tarea mensual (y al arrancar): conversión inicial, particiones futuras
+    en PostgreSQL y rotación de meses cerrados en SQLite
+
+    Returns:
+        {tabla: particiones creadas o actualizadas}
+    """
+    from models.db_models import ParticionTiempoDB
+
+    if engine is None:
+        from database import engine
+
+    ParticionTiempoDB.__table__.create(bind=engine, checkfirst=True)
+    resultado = {}
+
+    for tabla, columna in TABLAS_PARTICIONADAS.items():
+        if engine.dialect.name == "postgresql":
+            _pg_convertir(engine, tabla, columna)
+            resultado[tabla] = _pg_crear_particiones(engine, tabla, columna)
+        elif engine.dialect.name == "sqlite":
+            resultado[tabla] = _sqlite_rotar(engine, tabla, columna)
+        else:
+            logger.warning(f"⚠️ Particionado no soportado en {engine.dialect.name}")
+
+    return resultado
+
+
+def eliminar_particiones_antiguas(tabla: str, fecha_limite: datetime, engine=None) -> Dict:
+    """
+    Retención por particiones: borra las que solo contienen filas
+    anteriores a fecha_limite (las que lo cruzan se conservan enteras)
+
+    Args:
+        tabla: Nombre de una tabla de TABLAS_PARTICIONADAS
+        fecha_limite: Fecha de corte de la retención
+        engine: Engine (por defecto el de database.py)
+
+    Returns:
+        Diccionario con las particiones eliminadas y sus filas
+        (estimadas en PostgreSQL)
+    """
+    if engine is None:
+        from database import engine
+
+    if engine.dialect.name == "postgresql":
+        resultado = _pg_eliminar(engine, tabla, fecha_limite)
+    elif engine.dialect.name == "sqlite":
+        resultado = _sqlite_eliminar(engine, tabla, fecha_limite)
+    else:
+        return {"particiones": [], "filas": 0}
+
+    if resultado["particiones"]:
+        print(f"✓ {tabla}: {len(resultado['particiones'])} particiones eliminadas ({resultado['filas']} filas)")
+    return resultado
+
+
+def agregar_columnas(tabla: str, nombres: List[str], engine=None) -> List[str]:
+    """
+    ALTER TABLE ADD COLUMN para columnas nuevas del modelo, en la tabla y
+    (SQLite) en sus particiones rotadas; recrea la vista <tabla>_todo.
+    En PostgreSQL el cambio del padre se propaga a las particiones.
+
+    Args:
+        tabla: Nombre de la tabla del modelo
+        nombres: Columnas del modelo a añadir si faltan
+        engine: Engine (por defecto el de database.py)
+
+    Returns:
+        Tablas físicas modificadas
+    """
+    from sqlalchemy import inspect
+
+    if engine is None:
+        from database import engine
+
+    modelo = _tabla_modelo(tabla)
+    fisicas = [tabla]
+    if engine.dialect.name == "sqlite":
+        with engine.connect() as conexion:
+            fisicas += [particion["particion"] for particion in particiones(conexion, tabla)]
+
+    inspector = inspect(engine)
+    si_no_existe = "IF NOT EXISTS " if engine.dialect.name == "postgresql" else ""
+    modificadas = []
+    for fisica in fisicas:
+        existentes = {columna["name"] for columna in inspector.get_columns(fisica)}
+        faltan = [nombre for nombre in nombres if nombre not in existentes]
+        if not faltan:
+            continue
+        with engine.begin() as conexion:
+            for nombre in faltan:
+                tipo = modelo.c[nombre].type.compile(dialect=engine.dialect)
+                conexion.execute(text(f"ALTER TABLE {fisica} ADD COLUMN {si_no_existe}{nombre} {tipo}"))
+        modificadas.append(fisica)
+
+    if engine.dialect.name == "sqlite" and f"{tabla}_todo" in inspector.get_view_names():
+        with _TransaccionSQLite(engine) as cursor:
+            _sqlite_recrear_vista(cursor, tabla)
+
+    return modificadas
@@ -0,0 +1,492 @@
+"""
+Segmentos columnares del archivo de investigación (ARCHIVO_SEGMENTOS=true)
+
+archivo_emocional y archivo_alma_board nunca se borran y crecen sin límite
+dentro de la misma base de datos que el tráfico en vivo. sellar_segmentos()
+mueve cada mes cerrado con más de ARCHIVO_SEGMENTOS_MESES de antigüedad a
+un segmento inmutable en disco y borra esas filas de la base de datos:
+
+    <ARCHIVO_SEGMENTOS_DIR>/<tabla>/<AAAA-MM>_<id_min>-<id_max>/
+        indice.json            filas, rango de ids y fechas, usuarios, columnas
+        <columna>.bin          valores (little-endian; texto en UTF-8)
+        <columna>.offsets      int64, para columnas de longitud variable
+        <columna>.validos      uint8, 0 = NULL
+        _orden_fecha.bin       permutación de filas por (fecha_registro, id)
+
+Solo usa la biblioteca estándar. Las columnas numéricas son arrays planos
+que también se pueden abrir con numpy.memmap (tipos en indice.json).
+
+Las lecturas (utils/exportacion.py) abren los ficheros con mmap: solo se
+tocan las páginas de las columnas pedidas, y los segmentos que no pueden
+contener filas del filtro (usuario, fechas, after_id) se descartan por su
+índice sin abrirlos.
+
+El sellado es idempotente: el segmento se escribe en un directorio temporal,
+se renombra y después se borran sus filas. Si el proceso cae entre ambos
+pasos, la siguiente ejecución borra las filas que ya están selladas.
+
+Las tablas de archivo usan AUTOINCREMENT en SQLite (migración 0010): los ids
+sellados y borrados no se reutilizan, así que las paginaciones por after_id
+y la recuperación por id siguen siendo válidas.
+
+Los resúmenes semanales de las semanas que tocan un mes sellado no se
+recalculan (semanas_selladas): sus filas ya no están en la base de datos.
+"""
+
+import bisect
+import heapq
+import json
+import mmap
+import os
+import shutil
+import sys
+from array import array
+from datetime import datetime, timedelta
+from typing import Dict, Iterator, List, Optional, Set
+
+from sqlalchemy import DateTime, Float, Integer, JSON, and_, delete, func, select
+import logging
+
+from models.db_models import ArchivoEmocionalDB, ArchivoAlmaBoardDB
+
+logger = logging.getLogger(__name__)
+
+SEGMENTOS_ACTIVOS = os.getenv("ARCHIVO_SEGMENTOS", "false").lower() == "true"
+DIRECTORIO_SEGMENTOS = os.getenv(
+    "ARCHIVO_SEGMENTOS_DIR",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "archivo_segmentos")
+)
+MESES_CALIENTES = int(os.getenv("ARCHIVO_SEGMENTOS_MESES", "12"))
+LOTE_SELLADO = 5000
+
+# Tablas que se sellan por meses de fecha_registro
+TABLAS_SEGMENTADAS = {
+    "archivo_emocional": ArchivoEmocionalDB,
+    "archivo_alma_board": ArchivoAlmaBoardDB,
+}
+COLUMNAS_VECTOR = ("embedding_latente", "embedding_texto")
+EPOCA = datetime(1970, 1, 1)
+
+# Tipo de columna → código de array para los valores
+CODIGOS = {"int64": "q", "float64": "d", "fecha": "q", "texto": "B", "json": "B", "vector": "f"}
+VARIABLES = ("texto", "json", "vector")
+LITTLE_ENDIAN = sys.byteorder == "little"
+
+
+def _tipo_columna(columna) -> str:
+    """Tipo de almacenamiento de una columna del modelo"""
+    if columna.name in COLUMNAS_VECTOR:
+        return "vector"
+    if isinstance(columna.type, Integer):
+        return "int64"
+    if isinstance(columna.type, Float):
+        return "float64"
+    if isinstance(columna.type, DateTime):
+        return "fecha"
+    if isinstance(columna.type, JSON):
+        return "json"
+    return "texto"
+
+
+def _fecha(valor) -> Optional[datetime]:
+    """min()/max() de SQLite devuelven las fechas como texto"""
+    if valor is None or isinstance(valor, datetime):
+        return valor
+    return datetime.fromisoformat(str(valor))
+
+
+def _a_microsegundos(valor: datetime) -> int:
+    return (valor - EPOCA) // timedelta(microseconds=1)
+
+
+def _volcar(archivo, datos: array):
+    if not LITTLE_ENDIAN and datos.itemsize > 1:
+        datos = array(datos.typecode, datos)
+        datos.byteswap()
+    datos.tofile(archivo)
+
+
+# ============================================================
+# ESCRITURA
+# ============================================================
+
+class _EscritorColumna:
+    """Añade lotes de valores a los ficheros de una columna"""
+
+    def __init__(self, directorio: str, nombre: str, tipo: str):
+        self.tipo = tipo
+        self._archivos = [open(os.path.join(directorio, f"{nombre}.bin"), "wb")]
+        self._archivos.append(open(os.path.join(directorio, f"{nombre}.validos"), "wb"))
+        self._posicion = 0
+        if tipo in VARIABLES:
+            self._archivos.append(open(os.path.join(directorio, f"{nombre}.offsets"), "wb"))
+            _volcar(self._archivos[2], array("q", [0]))
+
+    def escribir(self, valores: List):
+        datos, validos = self._archivos[0], self._archivos[1]
+        _volcar(validos, array("B", [valor is not None for valor in valores]))
+
+        if self.tipo not in VARIABLES:
+            if self.tipo == "fecha":
+                valores = [_a_microsegundos(valor) if valor is not None else 0 for valor in valores]
+            _volcar(datos, array(CODIGOS[self.tipo], [valor if valor is not None else 0 for valor in valores]))
+            return
+
+        offsets = array("q")
+        contenido = array(CODIGOS[self.tipo])
+        for valor in valores:
+            if valor is not None:
+                if self.tipo == "vector":
+                    contenido.extend(float(x) for x in valor)
+                else:
+                    texto = valor if self.tipo == "texto" else json.dumps(valor, ensure_ascii=False)
+                    contenido.frombytes(texto.encode("utf-8"))
+            offsets.append(len(contenido) + self._posicion)
+        self._posicion += len(contenido)
+        _volcar(datos, contenido)
+        _volcar(self._archivos[2], offsets)
+
+    def cerrar(self):
+        for archivo in self._archivos:
+            archivo.flush()
+            os.fsync(archivo.fileno())
+            archivo.close()
+
+
+def _escribir_segmento(conexion, tabla, condicion, directorio: str, filas: int) -> Dict:
+    """Escribe las filas que cumplen la condición (por id) en un directorio nuevo"""
+    os.makedirs(directorio)
+    tipos = {columna.name: _tipo_columna(columna) for columna in tabla.columns}
+    escritores = {nombre: _EscritorColumna(directorio, nombre, tipo) for nombre, tipo in tipos.items()}
+
+    claves_fecha = []  # (fecha, id, posición) para la permutación por fecha
+    usuarios = set()
+    escritas = 0
+    try:
+        resultado = conexion.execute(
+            select(tabla).where(condicion).order_by(tabla.c.id).execution_options(yield_per=LOTE_SELLADO)
+        )
+        for particion in resultado.partitions():
+            columnas = list(zip(*particion))
+            for nombre, valores in zip(resultado.keys(), columnas):
+                escritores[nombre].escribir(list(valores))
+            for fila in particion:
+                claves_fecha.append((fila.fecha_registro, fila.id, escritas))
+                escritas += 1
+                if fila.usuario_id is not None:
+                    usuarios.add(fila.usuario_id)
+    finally:
+        for escritor in escritores.values():
+            escritor.cerrar()
+
+    if escritas != filas:
+        raise RuntimeError(f"Segmento incompleto: {escritas} de {filas} filas")
+
+    claves_fecha.sort()
+    orden = _EscritorColumna(directorio, "_orden_fecha", "int64")
+    orden.escribir([posicion for _, _, posicion in claves_fecha])
+    orden.cerrar()
+
+    indice = {
+        "tabla": tabla.name,
+        "filas": escritas,
+        "id_min": min(clave[1] for clave in claves_fecha) if claves_fecha else None,
+        "id_max": max(clave[1] for clave in claves_fecha) if claves_fecha else None,
+        "fecha_min": claves_fecha[0][0].isoformat() if claves_fecha else None,
+        "fecha_max": claves_fecha[-1][0].isoformat() if claves_fecha else None,
+        "usuarios": sorted(usuarios),
+        "columnas": tipos,
+        "orden_bytes": "little",
+        "sellado": datetime.now().isoformat()
+    }
+    with open(os.path.join(directorio, "indice.json"), "w", encoding="utf-8") as archivo:
+        json.dump(indice, archivo)
+        archivo.flush()
+        os.fsync(archivo.fileno())
+    return indice
+
+
+def _sellar_mes(engine, nombre: str, tabla, inicio: datetime, fin: datetime, sellados: List["Segmento"]) -> Optional[str]:
+    """Sella las filas de un mes; devuelve el nombre del segmento creado"""
+    mes = f"{inicio:%Y-%m}"
+    en_mes = and_(tabla.c.fecha_registro >= inicio, tabla.c.fecha_registro < fin)
+
+    # Recuperación: filas ya selladas que siguen en la BD (caída tras renombrar).
+    # Solo se borran los ids que el segmento contiene de verdad
+    for segmento in sellados:
+        if segmento.mes == mes:
+            try:
+                ids = list(segmento.columna("id").datos)
+            finally:
+                segmento.cerrar()
+            with engine.begin() as conexion:
+                for inicio in range(0, len(ids), LOTE_SELLADO):
+                    conexion.execute(delete(tabla).where(
+                        en_mes, tabla.c.id.in_(ids[inicio:inicio + LOTE_SELLADO])
+                    ))
+
+    with engine.connect() as conexion:
+        id_min, id_max, filas = conexion.execute(
+            select(func.min(tabla.c.id), func.max(tabla.c.id), func.count()).where(en_mes)
+        ).one()
+    if not filas:
+        return None
+
+    condicion = and_(en_mes, tabla.c.id.between(id_min, id_max))
+    final = os.path.join(DIRECTORIO_SEGMENTOS, nombre, f"{mes}_{id_min}-{id_max}")
+    temporal = final + ".tmp"
+    shutil.rmtree(temporal, ignore_errors=True)
+
+    with engine.connect() as conexion:
+        _escribir_segmento(conexion, tabla, condicion, temporal, filas)
+    os.rename(temporal, final)
+
+    with engine.begin() as conexion:
+        borradas = conexion.execute(delete(tabla).where(condicion)).rowcount
+    if borradas != filas:
+        logger.warning(f"⚠️ Segmento {nombre}/{mes}: {filas} filas selladas, {borradas} borradas")
+
+    logger.info(f"📦 Segmento sellado: {nombre}/{os.path.basename(final)} ({filas} filas)")
+    return os.path.basename(final)
+
+
+def sellar_segmentos(meses_calientes: Optional[int] = None, engine=None) -> Dict[str, List[str]]:
+    """
+    Sella en segmentos los meses completos anteriores a los últimos meses_calientes
+
+    Args:
+        meses_calientes: Meses que se quedan en la base de datos (ARCHIVO_SEGMENTOS_MESES)
+        engine: Engine de SQLAlchemy (por defecto el de database.py)
+
+    Returns:
+        {tabla: [segmentos creados]}
+    """
+    if engine is None:
+        from database import engine
+    if meses_calientes is None:
+        meses_calientes = MESES_CALIENTES
+
+    hoy = datetime.now()
+    indice_mes = hoy.year * 12 + hoy.month - 1 - meses_calientes
+    corte = datetime(indice_mes // 12, indice_mes % 12 + 1, 1)
+
+    creados: Dict[str, List[str]] = {}
+    for nombre, modelo in TABLAS_SEGMENTADAS.items():
+        tabla = modelo.__table__
+        os.makedirs(os.path.join(DIRECTORIO_SEGMENTOS, nombre), exist_ok=True)
+        creados[nombre] = []
+
+        with engine.connect() as conexion:
+            minimo = _fecha(conexion.execute(
+                select(func.min(tabla.c.fecha_registro)).where(tabla.c.fecha_registro < corte)
+            ).scalar())
+        if minimo is None:
+            continue
+
+        sellados = listar_segmentos(nombre)
+        inicio = datetime(minimo.year, minimo.month, 1)
+        while inicio < corte:
+            fin = datetime(inicio.year + inicio.month // 12, inicio.month % 12 + 1, 1)
+            segmento = _sellar_mes(engine, nombre, tabla, inicio, fin, sellados)
+            if segmento:
+                creados[nombre].append(segmento)
+            inicio = fin
+
+    return creados
+
+
+# ============================================================
+# LECTURA
+# ============================================================
+
+class Segmento:
+    """Segmento sellado, leído con mmap columna a columna"""
+
+    def __init__(self, ruta: str):
+        self.ruta = ruta
+        self.nombre = os.path.basename(ruta)
+        self.mes = self.nombre.split("_")[0]
+        with open(os.path.join(ruta, "indice.json"), encoding="utf-8") as archivo:
+            self.indice = json.load(archivo)
+        self._mapas = []
+        self._vistas = []
+        self._columnas = {}
+
+    def _vista(self, archivo: str, codigo: str):
+        """Contenido de un fichero del segmento como secuencia de valores"""
+        ruta = os.path.join(self.ruta, archivo)
+        if os.path.getsize(ruta) == 0:
+            return array(codigo)
+        with open(ruta, "rb") as fichero:
+            mapa = mmap.mmap(fichero.fileno(), 0, access=mmap.ACCESS_READ)
+        self._mapas.append(mapa)
+        if not LITTLE_ENDIAN and codigo != "B":
+            valores = array(codigo, mapa[:])
+            valores.byteswap()
+            return valores
+        vista = memoryview(mapa)
+        self._vistas.append(vista)
+        if codigo == "B":
+            return vista
+        vista = vista.cast(codigo)
+        self._vistas.append(vista)
+        return vista
+
+    def columna(self, nombre: str) -> "_Columna":
+        if nombre not in self._columnas:
+            tipo = self.indice["columnas"][nombre] if nombre != "_orden_fecha" else "int64"
+            self._columnas[nombre] = _Columna(self, nombre, tipo)
+        return self._columnas[nombre]
+
+    def cerrar(self):
+        for vista in reversed(self._vistas):
+            vista.release()
+        for mapa in self._mapas:
+            mapa.close()
+        self._vistas, self._mapas, self._columnas = [], [], {}
+
+
+class _Columna:
+    def __init__(self, segmento: Segmento, nombre: str, tipo: str):
+        self.tipo = tipo
+        self.datos = segmento._vista(f"{nombre}.bin", CODIGOS[tipo])
+        self.validos = segmento._vista(f"{nombre}.validos", "B")
+        self.offsets = segmento._vista(f"{nombre}.offsets", "q") if tipo in VARIABLES else None
+
+    def valor(self, fila: int):
+        if not self.validos[fila]:
+            return None
+        if self.offsets is None:
+            valor = self.datos[fila]
+            return EPOCA + timedelta(microseconds=valor) if self.tipo == "fecha" else valor
+        inicio, fin = self.offsets[fila], self.offsets[fila + 1]
+        if self.tipo == "vector":
+            return list(self.datos[inicio:fin])
+        texto = bytes(self.datos[inicio:fin]).decode("utf-8")
+        return json.loads(texto) if self.tipo == "json" else texto
+
+
+def listar_segmentos(tabla: str) -> List[Segmento]:
+    """Segmentos sellados de una tabla, por mes y rango de ids"""
+    directorio = os.path.join(DIRECTORIO_SEGMENTOS, tabla)
+    if not os.path.isdir(directorio):
+        return []
+    segmentos = [
+        Segmento(os.path.join(directorio, nombre))
+        for nombre in os.listdir(directorio)
+        if not nombre.endswith(".tmp") and os.path.exists(os.path.join(directorio, nombre, "indice.json"))
+    ]
+    return sorted(segmentos, key=lambda segmento: (segmento.mes, segmento.indice["id_min"]))
+
+
+def _descartable(indice: Dict, filtros: Dict, after_id: Optional[int]) -> bool:
+    """True si el índice garantiza que el segmento no tiene filas del filtro"""
+    if after_id is not None and indice["id_max"] <= after_id:
+        return True
+    if filtros.get("usuario_id") and filtros["usuario_id"] not in indice["usuarios"]:
+        return True
+    if filtros.get("fecha_desde") and datetime.fromisoformat(indice["fecha_max"]) < filtros["fecha_desde"]:
+        return True
+    if filtros.get("fecha_hasta") and datetime.fromisoformat(indice["fecha_min"]) > filtros["fecha_hasta"]:
+        return True
+    return False
+
+
+def _filas_segmento(
+    segmento: Segmento, campos: Dict[str, str], filtros: Dict, after_id: Optional[int], por_id: bool
+) -> Iterator[Dict]:
+    try:
+        ids = segmento.columna("id").datos
+        if por_id:
+            # Filas en orden de id: se salta directamente a after_id
+            inicio = bisect.bisect_right(ids, after_id) if after_id is not None else 0
+            orden = range(inicio, segmento.indice["filas"])
+        else:
+            orden = segmento.columna("_orden_fecha").datos
+
+        comprobaciones = []
+        if filtros.get("usuario_id"):
+            comprobaciones.append((segmento.columna("usuario_id"), lambda v: v == filtros["usuario_id"]))
+        if filtros.get("tipo"):
+            comprobaciones.append((segmento.columna("tipo"), lambda v: v == filtros["tipo"]))
+        if filtros.get("fecha_desde"):
+            comprobaciones.append((segmento.columna("fecha_registro"), lambda v: v >= filtros["fecha_desde"]))
+        if filtros.get("fecha_hasta"):
+            comprobaciones.append((segmento.columna("fecha_registro"), lambda v: v <= filtros["fecha_hasta"]))
+        columnas = {campo: segmento.columna(columna) for campo, columna in campos.items()}
+
+        for fila in orden:
+            if after_id is not None and ids[fila] <= after_id:
+                continue
+            if all(condicion(columna.valor(fila)) for columna, condicion in comprobaciones):
+                yield {campo: columna.valor(fila) for campo, columna in columnas.items()}
+    finally:
+        segmento.cerrar()
+
+
+def leer_segmentos(
+    tabla: str,
+    campos: Dict[str, str],
+    filtros: Optional[Dict] = None,
+    after_id: Optional[int] = None,
+    por_id: bool = False
+) -> Iterator[Dict]:
+    """
+    Filas selladas de una tabla que cumplen los filtros
+
+    Args:
+        tabla: Tabla de archivo
+        campos: {nombre en el resultado: columna}
+        filtros: usuario_id, tipo, fecha_desde, fecha_hasta
+        after_id: Solo filas con id mayor
+        por_id: Orden por id (paginación); si no, por fecha_registro
+
+    Yields:
+        Diccionarios {campo: valor}
+    """
+    filtros = filtros or {}
+    segmentos = [
+        segmento for segmento in listar_segmentos(tabla)
+        if not _descartable(segmento.indice, filtros, after_id)
+    ]
+    iteradores = [_filas_segmento(segmento, campos, filtros, after_id, por_id) for segmento in segmentos]
+    if por_id:
+        yield from heapq.merge(*iteradores, key=lambda fila: fila["id"])
+    else:
+        for iterador in iteradores:
+            yield from iterador
+
+
+def semanas_selladas() -> Set[str]:
+    """
+    Semanas ISO ("2026-W02") que tocan algún mes sellado en segmentos
+
+    Sus filas ya no están (o no todas) en la base de datos, así que sus
+    resúmenes semanales no se pueden recalcular con GROUP BY.
+    """
+    meses = {segmento.mes for tabla in TABLAS_SEGMENTADAS for segmento in listar_segmentos(tabla)}
+    semanas = set()
+    for mes in meses:
+        dia = datetime.strptime(mes, "%Y-%m")
+        while f"{dia:%Y-%m}" == mes:
+            año, semana, _ = dia.isocalendar()
+            semanas.add(f"{año}-W{semana:02d}")
+            dia += timedelta(days=1)
+    return semanas
+
+
+def estadisticas_segmentos() -> Dict:
+    """Segmentos, filas y bytes en disco por tabla"""
+    estadisticas = {}
+    for tabla in TABLAS_SEGMENTADAS:
+        segmentos = listar_segmentos(tabla)
+        estadisticas[tabla] = {
+            "segmentos": len(segmentos),
+            "filas": sum(segmento.indice["filas"] for segmento in segmentos),
+            "bytes": sum(
+                os.path.getsize(os.path.join(segmento.ruta, archivo))
+                for segmento in segmentos for archivo in os.listdir(segmento.ruta)
+            ),
+            "meses": [segmento.mes for segmento in segmentos]
+        }
+    return estadisticas
@@ -14,8 +14,9 @@ import logging
 from models.db_models import (
     UsuarioDB, UsuarioTestDB, MoodMapDB, FeedbackDB, 
     HistoricoInteraccionDB, EmocionLiberadaDB, GratitudDB, 
-    DestelloDB, ConfiguracionRLDB
+    DestelloDB, ConfiguracionRLDB, ContadoresUsuarioDB
 )
+from utils.contadores import COLUMNAS
 
 logger = logging.getLogger(__name__)
 
@@ -118,15 +119,12 @@ def eliminar_usuario_test(db: Session, usuario_id: int) -> Dict[str, int]:
             MoodMapDB.usuario_id == usuario_id
         ).delete(synchronize_session=False)
         
-        # 2. Feedbacks
-        resultado["feedbacks"] = db.query(FeedbackDB).filter(
-            FeedbackDB.usuario_id == usuario_id
-        ).delete(synchronize_session=False)
+        # 2. Feedbacks (incluidas las particiones mensuales rotadas)
+        from utils.particiones import borrar_filas_usuario
+        resultado["feedbacks"] = borrar_filas_usuario(db.connection(), "feedbacks", usuario_id)
         
-        # 3. Histórico de interacciones
-        resultado["interacciones"] = db.query(HistoricoInteraccionDB).filter(
-            HistoricoInteraccionDB.usuario_id == usuario_id
-        ).delete(synchronize_session=False)
+        # 3. Histórico de interacciones (incluidas las particiones mensuales rotadas)
+        resultado["interacciones"] = borrar_filas_usuario(db.connection(), "historico_interacciones", usuario_id)
         
         # 4. Emociones liberadas
         resultado["emociones_liberadas"] = db.query(EmocionLiberadaDB).filter(
@@ -148,12 +146,17 @@ def eliminar_usuario_test(db: Session, usuario_id: int) -> Dict[str, int]:
             ConfiguracionRLDB.estado_discretizado.like(f"%{usuario_id}%")
         ).delete(synchronize_session=False)
         
-        # 8. Registro de test
+        # 8. Contadores del usuario
+        db.query(ContadoresUsuarioDB).filter(
+            ContadoresUsuarioDB.usuario_id == usuario_id
+        ).delete(synchronize_session=False)
+        
+        # 9. Registro de test
         resultado["registro_test"] = db.query(UsuarioTestDB).filter(
             UsuarioTestDB.usuario_id == usuario_id
         ).delete(synchronize_session=False)
         
-        # 9. Usuario (al final)
+        # 10. Usuario (al final)
         resultado["usuario"] = db.query(UsuarioDB).filter(
             UsuarioDB.id == usuario_id
         ).delete(synchronize_session=False)
@@ -236,25 +239,31 @@ def listar_usuarios_test(db: Session) -> List[Dict]:
         Lista de usuarios de test con sus datos
     """
     try:
-        usuarios_test = db.query(UsuarioTestDB).join(
+        # Registros asociados desde contadores_usuario (una fila por usuario)
+        usuarios_test = db.query(UsuarioTestDB, UsuarioDB.nombre, ContadoresUsuarioDB).join(
             UsuarioDB, UsuarioTestDB.usuario_id == UsuarioDB.id
+        ).outerjoin(
+            ContadoresUsuarioDB, ContadoresUsuarioDB.usuario_id == UsuarioTestDB.usuario_id
         ).all()
         
         resultado = []
-        for ut in usuarios_test:
-            # Contar registros asociados
+        for ut, nombre, contadores in usuarios_test:
+            totales = {
+                columna: getattr(contadores, columna) if contadores else 0
+                for columna in COLUMNAS
+            }
             counts = {
-                "moodmaps": db.query(MoodMapDB).filter(MoodMapDB.usuario_id == ut.usuario_id).count(),
-                "feedbacks": db.query(FeedbackDB).filter(FeedbackDB.usuario_id == ut.usuario_id).count(),
-                "interacciones": db.query(HistoricoInteraccionDB).filter(HistoricoInteraccionDB.usuario_id == ut.usuario_id).count(),
-                "emociones": db.query(EmocionLiberadaDB).filter(EmocionLiberadaDB.usuario_id == ut.usuario_id).count(),
-                "gratitudes": db.query(GratitudDB).filter(GratitudDB.usuario_id == ut.usuario_id).count(),
-                "destellos": db.query(DestelloDB).filter(DestelloDB.usuario_id == ut.usuario_id).count()
+                "moodmaps": totales["moodmaps"],
+                "feedbacks": totales["feedbacks"],
+                "interacciones": totales["interacciones"],
+                "emociones": totales["emociones_liberadas"],
+                "gratitudes": totales["gratitudes"],
+                "destellos": totales["destellos"]
             }
             
             resultado.append({
                 "usuario_id": ut.usuario_id,
-                "nombre": ut.usuario.nombre,
+                "nombre": nombre,
                 "tipo_test": ut.tipo_test,
                 "fecha_creacion": ut.fecha_creacion.isoformat(),
                 "descripcion": ut.descripcion,
@@ -0,0 +1,336 @@
+"""
+Trabajos de archivado en segundo plano (tabla trabajos_archivo)
+
+POST /investigacion/archivar ejecutaba archivar_todo dentro de la petición
+HTTP: un timeout dejaba al cliente sin respuesta ni avance. Ahora crea un
+trabajo que corre en el scheduler:
+
+- Cada lote de LOTE_ARCHIVO ids se confirma junto con la marca de agua de
+  su tabla (progreso_archivo) y el avance del trabajo: tras una caída no se
+  pierde ni se repite nada de lo ya confirmado.
+- El trabajo renueva fecha_actualizacion (latido) con cada lote y, desde
+  un hilo propio, cada ARCHIVO_LATIDO_S/3 (resúmenes, lotes lentos). Si un
+  trabajo sin terminar lleva más de ARCHIVO_LATIDO_S sin latir, su proceso
+  murió: reanudar_trabajos() lo retoma con la misma fecha_limite.
+- Quien reclama el trabajo guarda un token en propietario y cada
+  actualización lo comprueba: si otro proceso lo reclamó, el lote en curso
+  se deshace y este proceso abandona el trabajo.
+- Solo puede haber un trabajo activo (índice único sobre activo).
+- estado_trabajo() calcula filas/s y el tiempo restante estimado.
+"""
+
+import os
+import threading
+import uuid
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Set
+
+from sqlalchemy import case, func, or_, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+import logging
+
+from models.db_models import TrabajoArchivoDB
+from utils.archivado import archivar_fase, estimar_pendientes, generar_resumen_semanal
+
+logger = logging.getLogger(__name__)
+
+FASES = ("emocionales", "alma_board", "resumenes")
+ESTADOS_ACTIVOS = ("pendiente", "en_curso")
+LATIDO_S = int(os.getenv("ARCHIVO_LATIDO_S", "120"))
+
+# Trabajos que ejecuta este proceso (reanudar_trabajos no los toca)
+_en_curso: Set[int] = set()
+_cerrojo_en_curso = threading.Lock()
+
+
+class TrabajoReclamado(Exception):
+    """Otro proceso reclamó el trabajo: este deja de ejecutarlo"""
+
+
+def trabajo_activo(db: Session) -> Optional[TrabajoArchivoDB]:
+    """Último trabajo pendiente o en curso, si lo hay"""
+    return db.query(TrabajoArchivoDB).filter(
+        TrabajoArchivoDB.estado.in_(ESTADOS_ACTIVOS)
+    ).order_by(TrabajoArchivoDB.id.desc()).first()
+
+
+def crear_trabajo(db: Session, dias_antiguedad: int = 30) -> TrabajoArchivoDB:
+    """
+    Registra un trabajo de archivado (o devuelve el que ya está activo)
+
+    Args:
+        db: Sesión de base de datos
+        dias_antiguedad: Solo archivar datos más antiguos que estos días
+
+    Returns:
+        Trabajo pendiente de ejecutar, o el activo
+    """
+    activo = trabajo_activo(db)
+    if activo is not None:
+        return activo
+
+    fecha_limite = datetime.now() - timedelta(days=dias_antiguedad)
+    trabajo = TrabajoArchivoDB(
+        estado="pendiente",
+        dias_antiguedad=dias_antiguedad,
+        fecha_limite=fecha_limite,
+        filas_estimadas=sum(estimar_pendientes(db, fase, fecha_limite) for fase in FASES[:2]),
+        resultado={},
+        activo=True
+    )
+    db.add(trabajo)
+    try:
+        db.commit()
+    except IntegrityError:
+        # Otra petición creó su trabajo entre la consulta y el INSERT
+        db.rollback()
+        return trabajo_activo(db)
+    db.refresh(trabajo)
+    return trabajo
+
+
+def _reclamar(db: Session, trabajo_id: int, propietario: str) -> bool:
+    """
+    Marca el trabajo como en curso a nombre de propietario si está libre:
+    pendiente sin propietario, o con el latido caducado (su proceso murió)
+    """
+    tabla = TrabajoArchivoDB.__table__
+    ahora = datetime.now()
+    reclamado = db.execute(
+        update(tabla).where(
+            tabla.c.id == trabajo_id,
+            tabla.c.estado.in_(ESTADOS_ACTIVOS),
+            or_(tabla.c.propietario.is_(None), tabla.c.fecha_actualizacion < ahora - timedelta(seconds=LATIDO_S))
+        ).values(
+            estado="en_curso",
+            propietario=propietario,
+            fecha_inicio=func.coalesce(tabla.c.fecha_inicio, ahora),
+            fecha_actualizacion=ahora,
+            reanudaciones=tabla.c.reanudaciones + case((tabla.c.estado == "en_curso", 1), else_=0)
+        )
+    ).rowcount
+    db.commit()
+    return reclamado == 1
+
+
+def _actualizar(db: Session, trabajo_id: int, propietario: str, **valores):
+    """
+    Actualiza el trabajo solo si propietario sigue siendo su dueño (sin confirmar)
+
+    Raises:
+        TrabajoReclamado: Si otro proceso lo reclamó
+    """
+    tabla = TrabajoArchivoDB.__table__
+    actualizado = db.execute(
+        update(tabla).where(
+            tabla.c.id == trabajo_id,
+            tabla.c.propietario == propietario,
+            tabla.c.estado == "en_curso"
+        ).values(**valores)
+    ).rowcount
+    if actualizado != 1:
+        raise TrabajoReclamado(f"El trabajo {trabajo_id} ya no pertenece a este proceso")
+
+
+class _Latido:
+    """
+    Renueva fecha_actualizacion cada LATIDO_S/3 desde su propia sesión,
+    también mientras una fase no confirma nada (resúmenes, lotes lentos)
+    """
+
+    def __init__(self, trabajo_id: int, propietario: str, SessionFactory):
+        self.trabajo_id = trabajo_id
+        self.propietario = propietario
+        self.SessionFactory = SessionFactory
+        self.perdido = False
+        self._parar = threading.Event()
+        self._hilo = threading.Thread(target=self._latir, name=f"latido_archivo_{trabajo_id}", daemon=True)
+
+    def _latir(self):
+        while not self._parar.wait(LATIDO_S / 3):
+            db = self.SessionFactory()
+            try:
+                _actualizar(db, self.trabajo_id, self.propietario, fecha_actualizacion=datetime.now())
+                db.commit()
+            except TrabajoReclamado:
+                self.perdido = True
+                return
+            except Exception as e:
+                # p. ej. SQLite bloqueado por la transacción de la fase: se reintenta
+                db.rollback()
+                logger.warning(f"⚠️ Latido del trabajo de archivado {self.trabajo_id} fallido: {e}")
+            finally:
+                db.close()
+
+    def __enter__(self):
+        self._hilo.start()
+        return self
+
+    def __exit__(self, *excepcion):
+        self._parar.set()
+        self._hilo.join()
+
+
+def ejecutar_trabajo(trabajo_id: int, SessionFactory=None):
+    """
+    Ejecuta (o reanuda) un trabajo de archivado. Pensado para el scheduler:
+    abre su propia sesión y nunca lanza excepciones.
+
+    Args:
+        trabajo_id: ID del trabajo
+        SessionFactory: Fábrica de sesiones (por defecto SessionLocal)
+    """
+    if SessionFactory is None:
+        from database import SessionLocal as SessionFactory
+
+    with _cerrojo_en_curso:
+        if trabajo_id in _en_curso:
+            return
+        _en_curso.add(trabajo_id)
+
+    propietario = uuid.uuid4().hex
+    db = SessionFactory()
+    try:
+        if not _reclamar(db, trabajo_id, propietario):
+            return
+        trabajo = db.get(TrabajoArchivoDB, trabajo_id)
+        logger.info(f"📦 Trabajo de archivado {trabajo.id} en curso (reanudaciones: {trabajo.reanudaciones})")
+
+        tabla = TrabajoArchivoDB.__table__
+        resultado = dict(trabajo.resultado or {})
+        with _Latido(trabajo_id, propietario, SessionFactory) as latido:
+
+            def progreso(filas: int):
+                # Se confirma con el lote, en la misma transacción: si el
+                # trabajo cambió de dueño, el lote se deshace
+                if latido.perdido:
+                    raise TrabajoReclamado(f"El trabajo {trabajo_id} ya no pertenece a este proceso")
+                _actualizar(
+                    db, trabajo_id, propietario,
+                    filas_archivadas=tabla.c.filas_archivadas + filas,
+                    lotes=tabla.c.lotes + 1,
+                    fecha_actualizacion=datetime.now()
+                )
+
+            for fase in FASES:
+                if fase in resultado:
+                    continue
+                _actualizar(db, trabajo_id, propietario, fase=fase, fecha_actualizacion=datetime.now())
+                db.commit()
+
+                if fase == "resumenes":
+                    filas = generar_resumen_semanal(db, solo_pendientes=True, propagar_errores=True)
+                else:
+                    filas = archivar_fase(db, fase, trabajo.fecha_limite, progreso)
+                resultado = {**resultado, fase: filas}
+                _actualizar(db, trabajo_id, propietario, resultado=resultado, fecha_actualizacion=datetime.now())
+                db.commit()
+
+            ahora = datetime.now()
+            _actualizar(
+                db, trabajo_id, propietario,
+                estado="completado", activo=None, fase=None, fecha_fin=ahora, fecha_actualizacion=ahora
+            )
+            db.commit()
+
+        db.refresh(trabajo)
+        logger.info(f"✓ Trabajo de archivado {trabajo.id} completado: {trabajo.filas_archivadas} filas")
+
+    except TrabajoReclamado as e:
+        logger.warning(f"⚠️ {e}: se abandona")
+        db.rollback()
+    except Exception as e:
+        logger.error(f"❌ Error en el trabajo de archivado {trabajo_id}: {e}")
+        db.rollback()
+        try:
+            ahora = datetime.now()
+            _actualizar(
+                db, trabajo_id, propietario,
+                estado="error", activo=None, error=str(e), fecha_fin=ahora, fecha_actualizacion=ahora
+            )
+            db.commit()
+        except Exception:
+            db.rollback()
+    finally:
+        db.close()
+        with _cerrojo_en_curso:
+            _en_curso.discard(trabajo_id)
+
+
+def trabajos_interrumpidos(db: Session) -> List[int]:
+    """IDs de trabajos activos cuyo latido superó ARCHIVO_LATIDO_S"""
+    limite = datetime.now() - timedelta(seconds=LATIDO_S)
+    return [
+        trabajo_id for (trabajo_id,) in db.query(TrabajoArchivoDB.id).filter(
+            TrabajoArchivoDB.estado.in_(ESTADOS_ACTIVOS),
+            TrabajoArchivoDB.fecha_actualizacion < limite
+        ).order_by(TrabajoArchivoDB.id)
+    ]
+
+
+def reanudar_trabajos(SessionFactory=None) -> List[int]:
+    """
+    Retoma los trabajos interrumpidos (al arrancar y periódicamente)
+
+    Returns:
+        IDs de los trabajos reanudados
+    """
+    if SessionFactory is None:
+        from database import SessionLocal as SessionFactory
+
+    db = SessionFactory()
+    try:
+        pendientes = trabajos_interrumpidos(db)
+    finally:
+        db.close()
+
+    with _cerrojo_en_curso:
+        pendientes = [trabajo_id for trabajo_id in pendientes if trabajo_id not in _en_curso]
+
+    for trabajo_id in pendientes:
+        logger.warning(f"⚠️ Reanudando trabajo de archivado interrumpido {trabajo_id}")
+        ejecutar_trabajo(trabajo_id, SessionFactory)
+    return pendientes
+
+
+def estado_trabajo(trabajo: TrabajoArchivoDB) -> Dict:
+    """
+    Estado de un trabajo con velocidad (filas/s) y tiempo restante estimado
+
+    Args:
+        trabajo: Trabajo de archivado
+
+    Returns:
+        Diccionario listo para la respuesta JSON
+    """
+    velocidad = 0.0
+    restante = None
+    if trabajo.fecha_inicio is not None:
+        fin = trabajo.fecha_fin or datetime.now()
+        segundos = (fin - trabajo.fecha_inicio).total_seconds()
+        if segundos > 0:
+            velocidad = trabajo.filas_archivadas / segundos
+        if trabajo.estado == "completado":
+            restante = 0.0
+        elif velocidad > 0:
+            restante = max(trabajo.filas_estimadas - trabajo.filas_archivadas, 0) / velocidad
+
+    return {
+        "id": trabajo.id,
+        "estado": trabajo.estado,
+        "fase": trabajo.fase,
+        "dias_antiguedad": trabajo.dias_antiguedad,
+        "fecha_limite": trabajo.fecha_limite.isoformat(),
+        "filas_estimadas": trabajo.filas_estimadas,
+        "filas_archivadas": trabajo.filas_archivadas,
+        "lotes": trabajo.lotes,
+        "filas_por_segundo": round(velocidad, 2),
+        "segundos_restantes_estimados": round(restante, 1) if restante is not None else None,
+        "resultado": trabajo.resultado,
+        "reanudaciones": trabajo.reanudaciones,
+        "error": trabajo.error,
+        "fecha_creacion": trabajo.fecha_creacion.isoformat() if trabajo.fecha_creacion else None,
+        "fecha_inicio": trabajo.fecha_inicio.isoformat() if trabajo.fecha_inicio else None,
+        "fecha_fin": trabajo.fecha_fin.isoformat() if trabajo.fecha_fin else None
+    }